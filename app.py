@@ -1,29 +1,50 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for, session, flash, Response
-import smtplib
-from email.message import EmailMessage
-import sqlite3
+from flask import Flask, render_template, request, jsonify, redirect, url_for, session, flash, Response, send_file, g, has_request_context, make_response, stream_template, stream_with_context
 import os
+import time
+import queue
+import threading
+import hashlib
+import hmac
+import zlib
+from contextlib import contextmanager
+from functools import wraps
 from datetime import datetime, timedelta
 import csv
 import io
-try:
-    import mysql.connector as mysql
-except Exception:
-    mysql = None
-
+import passwords
+import database as dbmod
+import schedules
+import routing
+import seat_events
+import metrics
+import replicas
+import archive
+import assets
+import compression
+import coupons
+import waitlist
+import manifest
+import event_log
+import data_versions
+import profiling
 app = Flask(__name__)
 app.secret_key = os.getenv('SECRET_KEY', 'dev-secret-key')
+metrics.init_app(app)
+profiling.init_app(app)
+assets.init_app(app)
+compression.init_app(app)
+
+@app.before_request
+def initialize_on_first_request():
+    ensure_initialized()  # schema setup is deferred to here (or create_app); see STARTUP below
 
 # -------------------- DATABASE CONNECTION --------------------
 def is_mysql_enabled():
-    return (
-        mysql is not None and
-        os.getenv('MYSQL_HOST') and os.getenv('MYSQL_DB') and os.getenv('MYSQL_USER')
-    )
+    return dbmod.is_mysql_enabled()
 
 def get_db_connection():
     if is_mysql_enabled():
-        return mysql.connect(
+        return dbmod.mysql.connect(
             host=os.getenv('MYSQL_HOST'),
             port=int(os.getenv('MYSQL_PORT', '3306')),
             database=os.getenv('MYSQL_DB'),
@@ -31,46 +52,96 @@ def get_db_connection():
             password=os.getenv('MYSQL_PASSWORD', ''),
             autocommit=True,
         )
-    conn = sqlite3.connect('bus_booking.db')
-    conn.row_factory = sqlite3.Row
-    return conn
+    return dbmod.connect_sqlite()
 
 def to_mysql_placeholders(query: str) -> str:
     return query.replace('?', '%s')
 
-def db_fetch_all(query: str, params=()):
+# -------------------- READ REPLICAS --------------------
+# Reads on endpoints marked @replica_reads go to a replica (see replicas.py); all
+# writes and every other read stay on the primary. A session that wrote recently
+# reads from the primary for REPLICA_STICKY_SECONDS so it sees its own booking.
+# The cached route graph, fare calendar and page cache stay on the primary: built
+# from a lagging replica they would hold stale rows under an up-to-date data version.
+REPLICAS = replicas.from_env(bool(is_mysql_enabled()))
+REPLICA_STICKY_SECONDS = float(os.getenv('REPLICA_STICKY_SECONDS') or 10)
+REPLICA_ENDPOINTS = set()
+
+def replica_reads(view):
+    REPLICA_ENDPOINTS.add(view.__name__)
+    return view
+
+def replica_reads_allowed():
+    if not REPLICAS or not has_request_context() or request.endpoint not in REPLICA_ENDPOINTS:
+        return False
+    if g.get('db_wrote'):
+        return False
+    wrote_at = session.get('db_wrote_at')
+    return not wrote_at or time.time() - wrote_at >= REPLICA_STICKY_SECONDS
+
+def _replica_metrics():
+    lines = ['# HELP db_replica_healthy Whether a read replica is currently in rotation.',
+             '# TYPE db_replica_healthy gauge']
+    for r in REPLICAS.status():
+        lines.append(f'db_replica_healthy{{replica="{r["name"]}"}} {int(r["healthy"])}')
+    lines += ['# HELP db_replica_reads_total Reads served by each replica.', '# TYPE db_replica_reads_total counter']
+    for r in REPLICAS.status():
+        lines.append(f'db_replica_reads_total{{replica="{r["name"]}"}} {r["reads"]}')
+    return lines
+
+if REPLICAS:
+    metrics.collectors.append(_replica_metrics)
+
+def _note_write():
+    if has_request_context():
+        g.db_wrote = True
+
+@app.after_request
+def remember_db_write(response):
+    if g.get('db_wrote'):
+        session['db_wrote_at'] = time.time()
+    return response
+
+def _fetch(conn, query: str, params, one: bool):
+    if is_mysql_enabled():
+        cur = conn.cursor(dictionary=True)
+        cur.execute(to_mysql_placeholders(query), params)
+        result = cur.fetchone() if one else cur.fetchall()
+        cur.close()
+        return result
+    cur = conn.execute(query, params)
+    return cur.fetchone() if one else cur.fetchall()
+
+def _read(query: str, params, one: bool):
+    if replica_reads_allowed():
+        replica, conn = REPLICAS.connect()
+        if conn is not None:
+            try:
+                result = _fetch(conn, query, params, one)
+                REPLICAS.mark_ok(replica)
+                g.replica_read = True
+                return result
+            except dbmod.connection_errors():
+                REPLICAS.mark_failed(replica)  # fall through to the primary
+            finally:
+                conn.close()
     conn = get_db_connection()
     try:
-        if is_mysql_enabled():
-            cur = conn.cursor(dictionary=True)
-            cur.execute(to_mysql_placeholders(query), params)
-            rows = cur.fetchall()
-            cur.close()
-            return rows
-        else:
-            cur = conn.execute(query, params)
-            rows = cur.fetchall()
-            return rows
+        return _fetch(conn, query, params, one)
     finally:
         conn.close()
 
+@metrics.timed_query
+def db_fetch_all(query: str, params=()):
+    return _read(query, params, False)
+
+@metrics.timed_query
 def db_fetch_one(query: str, params=()):
-    conn = get_db_connection()
-    try:
-        if is_mysql_enabled():
-            cur = conn.cursor(dictionary=True)
-            cur.execute(to_mysql_placeholders(query), params)
-            row = cur.fetchone()
-            cur.close()
-            return row
-        else:
-            cur = conn.execute(query, params)
-            row = cur.fetchone()
-            return row
-    finally:
-        conn.close()
+    return _read(query, params, True)
 
+@metrics.timed_query
 def db_execute(query: str, params=()):
+    _note_write()
     conn = get_db_connection()
     try:
         if is_mysql_enabled():
@@ -84,14 +155,279 @@ def db_execute(query: str, params=()):
     finally:
         conn.close()
 
+# Schema steps re-run their DDL on every migration; on a database that already has the
+# column, index, table or trigger it fails with one of these, which is fine. Any other
+# error is a real failure and must stop the schema stamp (see STARTUP).
+ALREADY_APPLIED = ('duplicate column', 'already exists', 'duplicate key name')
+
+def run_ddl(*statements):
+    for stmt in statements:
+        try:
+            db_execute(stmt)
+        except Exception as e:
+            if not any(marker in str(e).lower() for marker in ALREADY_APPLIED):
+                raise
+
+class DbTransaction:
+    """Statements on one connection, committed together; each counts as a query in metrics."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.mysql = bool(is_mysql_enabled())
+        self.cur = conn.cursor()
+        self.events = []
+
+    def record_event(self, kind, booking_id, **data):
+        """Append to the event log when this transaction commits (one insert for all of its events)."""
+        actor = session.get('user_id') if has_request_context() else None
+        self.events.append(event_log.event_row(kind, booking_id, actor, data))
+
+    def execute(self, query: str, params=()):
+        t0 = time.perf_counter()
+        try:
+            self.cur.execute(to_mysql_placeholders(query) if self.mysql else query, params)
+            return self.cur.lastrowid
+        finally:
+            metrics.record_query(query, params, time.perf_counter() - t0)
+
+    def executemany(self, query: str, seq_of_params):
+        seq_of_params = list(seq_of_params)
+        if not seq_of_params:
+            return 0
+        t0 = time.perf_counter()
+        try:
+            self.cur.executemany(to_mysql_placeholders(query) if self.mysql else query, seq_of_params)
+            return self.cur.rowcount
+        finally:
+            metrics.record_query(query, seq_of_params[0], time.perf_counter() - t0)
+
+    def fetch_all(self, query: str, params=()):
+        """Read inside the transaction, seeing its own uncommitted writes."""
+        t0 = time.perf_counter()
+        try:
+            return _fetch(self.conn, query, params, False)
+        finally:
+            metrics.record_query(query, params, time.perf_counter() - t0)
+
+    @property
+    def rowcount(self):
+        """Rows changed by the last execute(), e.g. to see whether a guarded UPDATE matched."""
+        return self.cur.rowcount
+
+@contextmanager
+def db_transaction(immediate=False):
+    """immediate=True takes SQLite's write lock up front, for transactions that read before writing
+    (a deferred transaction cannot upgrade if another writer committed in between)."""
+    _note_write()
+    conn = get_db_connection()
+    try:
+        if is_mysql_enabled():
+            conn.start_transaction()
+        elif immediate:
+            conn.execute('BEGIN IMMEDIATE')
+        tx = DbTransaction(conn)
+        yield tx
+        if tx.events:
+            tx.executemany(event_log.INSERT_SQL, event_log.stamped(tx.events))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    if tx.events:
+        event_log.signal.notify()
+
+def db_fetch_booking_shard(month, query: str, params=(), one=False):
+    """Read booking data from the live tables (month=None) or an archived journey month.
+
+    The query names its tables as {bookings}, {booked_seats} and {bookings_passengers}.
+    """
+    if month is None:
+        query = query.format(**archive.LIVE_TABLES)
+        return db_fetch_one(query, params) if one else db_fetch_all(query, params)
+    t0 = time.perf_counter()
+    conn = get_db_connection()
+    try:
+        tables = archive.attach(conn, month)
+        if tables is None:
+            return None if one else []
+        return _fetch(conn, query.format(**tables), params, one)
+    finally:
+        conn.close()
+        metrics.record_query(query, params, time.perf_counter() - t0)
+
+def archived_booking_month(booking_id: int):
+    row = db_fetch_one('SELECT month FROM archived_bookings WHERE booking_id = ?', (booking_id,))
+    return row['month'] if row else None
+
+# Services/trips tables (and migration of a legacy buses table) before the column tweaks below
+def ensure_service_trip_schema():
+    conn = get_db_connection()
+    try:
+        dbmod.setup_schema(conn)
+    finally:
+        conn.close()
+
+# -------------------- DATA VERSIONS --------------------
+# Bumped after a commit changes a table's contents; in-process caches compare against
+# these. The counters are shared by every worker through the database (see
+# data_versions.py) and checked at most once per request: a request sees one snapshot
+# unless it bumps a version itself.
+def ensure_data_versions_table():
+    run_ddl(*data_versions.schema_statements(bool(is_mysql_enabled())))
+
+def data_version_snapshot():
+    if not has_request_context():
+        return data_versions.shared.snapshot()
+    if 'data_versions' not in g:
+        g.data_versions = data_versions.shared.snapshot()
+    return g.data_versions
+
+def bump_data_version(*names):
+    data_versions.shared.bump(*names)
+    if has_request_context():
+        g.pop('data_versions', None)
+
+def get_data_version(name):
+    return data_version_snapshot().get(name, 0)
+
+# -------------------- IDEMPOTENCY KEYS --------------------
+# POSTs marked @idempotent honour an `Idempotency-Key` header. The first request
+# claims the key with a primary-key insert (so simultaneous duplicates race in the
+# database, across workers) and stores its response; a replay within
+# IDEMPOTENCY_TTL_SECONDS gets that response back without running the view again.
+# A replay while the first is still running waits up to IDEMPOTENCY_WAIT_SECONDS,
+# then gets 409. Reusing a key for a different body is a 422. 5xx responses are
+# not stored, so those can be retried; a claim whose worker died lapses after
+# IDEMPOTENCY_LEASE_SECONDS. Expired keys are purged every few minutes.
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv('IDEMPOTENCY_TTL_SECONDS') or 24 * 3600)
+IDEMPOTENCY_WAIT_SECONDS = float(os.getenv('IDEMPOTENCY_WAIT_SECONDS') or 5)
+IDEMPOTENCY_LEASE_SECONDS = 60
+IDEMPOTENCY_PURGE_SECONDS = 300
+_idempotency_purged_at = [0.0]
+
+def ensure_idempotency_table():
+    if is_mysql_enabled():
+        run_ddl('''
+            CREATE TABLE IF NOT EXISTS idempotency_keys (
+                key_hash CHAR(64) PRIMARY KEY,
+                request_hash CHAR(64) NOT NULL,
+                status_code INT,
+                content_type VARCHAR(128),
+                body MEDIUMTEXT,
+                expires_at DOUBLE NOT NULL,
+                INDEX idx_idempotency_expires (expires_at)
+            )''')
+    else:
+        run_ddl('''
+            CREATE TABLE IF NOT EXISTS idempotency_keys (
+                key_hash TEXT PRIMARY KEY,
+                request_hash TEXT NOT NULL,
+                status_code INTEGER,
+                content_type TEXT,
+                body TEXT,
+                expires_at REAL NOT NULL
+            )''')
+        run_ddl('CREATE INDEX IF NOT EXISTS idx_idempotency_expires ON idempotency_keys (expires_at)')
+
+def _purge_idempotency_keys(now):
+    if now - _idempotency_purged_at[0] < IDEMPOTENCY_PURGE_SECONDS:
+        return
+    _idempotency_purged_at[0] = now
+    try:
+        db_execute('DELETE FROM idempotency_keys WHERE expires_at < ?', (now,))
+    except Exception:
+        pass
+
+def _claim_idempotency_key(key_hash, request_hash):
+    """None if this request now owns the key, else the response to send instead of running the view."""
+    deadline = time.monotonic() + IDEMPOTENCY_WAIT_SECONDS
+    while True:
+        now = time.time()
+        _purge_idempotency_keys(now)
+        try:
+            db_execute('INSERT INTO idempotency_keys (key_hash, request_hash, expires_at) VALUES (?, ?, ?)',
+                       (key_hash, request_hash, now + IDEMPOTENCY_LEASE_SECONDS))
+            return None
+        except dbmod.integrity_errors():
+            pass
+        row = db_fetch_one('SELECT request_hash, status_code, content_type, body, expires_at FROM idempotency_keys WHERE key_hash = ?', (key_hash,))
+        if row is None:
+            continue  # released in the meantime; claim it
+        if row['expires_at'] < now:
+            db_execute('DELETE FROM idempotency_keys WHERE key_hash = ? AND expires_at < ?', (key_hash, now))
+            continue
+        if row['request_hash'] != request_hash:
+            return jsonify({'status': 'error', 'message': 'Idempotency-Key was already used for a different request'}), 422
+        if row['status_code'] is not None:
+            resp = Response(row['body'], status=row['status_code'], content_type=row['content_type'])
+            resp.headers['Idempotent-Replayed'] = 'true'
+            return resp
+        if time.monotonic() >= deadline:
+            resp = jsonify({'status': 'error', 'message': 'A request with this Idempotency-Key is still in progress'})
+            resp.headers['Retry-After'] = '1'
+            return resp, 409
+        time.sleep(0.05)
+
+def idempotent(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        key = (request.headers.get('Idempotency-Key') or '').strip()
+        if not key:
+            return view(*args, **kwargs)
+        if len(key) > 255:
+            return jsonify({'status': 'error', 'message': 'Idempotency-Key is too long'}), 400
+        owner = session.get('user_id') or request.remote_addr
+        key_hash = hashlib.sha256(f'{owner}|{request.method} {request.path}|{key}'.encode()).hexdigest()
+        request_hash = hashlib.sha256(request.get_data()).hexdigest()
+        replay = _claim_idempotency_key(key_hash, request_hash)
+        if replay is not None:
+            return replay
+        try:
+            response = make_response(view(*args, **kwargs))
+        except Exception:
+            db_execute('DELETE FROM idempotency_keys WHERE key_hash = ?', (key_hash,))
+            raise
+        if response.status_code >= 500:
+            db_execute('DELETE FROM idempotency_keys WHERE key_hash = ?', (key_hash,))
+        else:
+            db_execute('UPDATE idempotency_keys SET status_code = ?, content_type = ?, body = ?, expires_at = ? WHERE key_hash = ?',
+                       (response.status_code, response.content_type, response.get_data(as_text=True),
+                        time.time() + IDEMPOTENCY_TTL_SECONDS, key_hash))
+        return response
+    return wrapper
+
+# -------------------- PAGE CACHE --------------------
+# Rendered HTML for pages that depend only on data versions and on who is looking
+# (role, logged in or not). Each (template, viewer) keeps its last render and
+# re-renders once one of its data versions has moved; the view's queries run only
+# then. Requests with pending flash messages render normally, as the messages are
+# part of the page. PAGE_CACHE=0 turns it off.
+PAGE_CACHE_ENABLED = (os.getenv('PAGE_CACHE') or '1') != '0'
+_PAGE_CACHE = {}
+
+def render_cached(template, versions=(), context=None):
+    """render_template(template, **context()) reusing the last render while the named data versions are unchanged."""
+    if not PAGE_CACHE_ENABLED or session.get('_flashes'):
+        return render_template(template, **(context() if context else {}))
+    key = (template, session.get('role'), bool(session.get('user_email')))
+    stamp = tuple(get_data_version(v) for v in versions)  # read before the data, so a concurrent bump re-renders
+    hit = _PAGE_CACHE.get(key)
+    if hit and hit[0] == stamp:
+        return hit[1]
+    html = render_template(template, **(context() if context else {}))
+    _PAGE_CACHE[key] = (stamp, html)
+    return html
+
 # -------------------- ROUTES --------------------
 @app.route('/')
 def index():
-    return render_template('index.html')
+    return render_cached('index.html')
 
 @app.before_request
 def require_login():
-    allowed_endpoints = {'login', 'register', 'logout'}
+    allowed_endpoints = {'login', 'register', 'logout', 'admin_metrics', 'admin_events'}
     if request.endpoint in allowed_endpoints:
         return
     if request.path.startswith('/static/'):
@@ -99,69 +435,121 @@ def require_login():
     if 'user_id' not in session:
         return redirect(url_for('login'))
 
+# -------------------- CONDITIONAL GET --------------------
+# Views marked @versioned_etag(names) get a weak ETag built from the data versions
+# they depend on and the query string, so no body is hashed, and a matching
+# If-None-Match is answered with 304 here, before the view runs any query. Data
+# versions are shared by all workers, so any worker can answer a tag another one
+# issued; the database's version epoch keeps tags from a rebuilt database apart.
+# Responses read from a replica get no ETag: lagging rows must not be tagged
+# with the current version.
+ETAG_ENDPOINTS = {}
+
+def versioned_etag(*names):
+    def register(view):
+        ETAG_ENDPOINTS[view.__name__] = names
+        return view
+    return register
+
+def data_etag(names, query_string=b'', snapshot=None):
+    """Weak ETag for data `names`; pass `snapshot` (data_versions.shared.snapshot()) outside a Flask request."""
+    snapshot = data_version_snapshot() if snapshot is None else snapshot
+    versions = '.'.join(str(snapshot.get(n, 0)) for n in names)
+    return f'{snapshot.get(data_versions.EPOCH, 0):x}-{versions}-{zlib.crc32(query_string):x}'
+
+@app.before_request
+def answer_not_modified():
+    names = ETAG_ENDPOINTS.get(request.endpoint)
+    if names is None or request.method != 'GET':
+        return
+    g.data_etag = data_etag(names, request.query_string)
+    if request.if_none_match.contains_weak(g.data_etag):
+        response = Response(status=304)
+        response.set_etag(g.data_etag, weak=True)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+
+@app.after_request
+def tag_data_response(response):
+    etag = g.get('data_etag')
+    if etag and response.status_code == 200 and not g.get('replica_read'):
+        response.set_etag(etag, weak=True)
+        response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
 def ensure_booking_status_column():
-    try:
-        if is_mysql_enabled():
-            db_execute("ALTER TABLE bookings ADD COLUMN status VARCHAR(16) DEFAULT 'confirmed'")
-        else:
-            db_execute("ALTER TABLE bookings ADD COLUMN status TEXT DEFAULT 'confirmed'")
-    except Exception:
-        pass
+    if is_mysql_enabled():
+        run_ddl("ALTER TABLE bookings ADD COLUMN status VARCHAR(16) DEFAULT 'confirmed'")
+    else:
+        run_ddl("ALTER TABLE bookings ADD COLUMN status TEXT DEFAULT 'confirmed'")
 
     # Payment columns (mock payment flow)
-    try:
-        if is_mysql_enabled():
-            db_execute("ALTER TABLE bookings ADD COLUMN payment_status VARCHAR(16) DEFAULT 'unpaid'")
-        else:
-            db_execute("ALTER TABLE bookings ADD COLUMN payment_status TEXT DEFAULT 'unpaid'")
-    except Exception:
-        pass
-    try:
-        if is_mysql_enabled():
-            db_execute("ALTER TABLE bookings ADD COLUMN payment_ref VARCHAR(64)")
-        else:
-            db_execute("ALTER TABLE bookings ADD COLUMN payment_ref TEXT")
-    except Exception:
-        pass
+    if is_mysql_enabled():
+        run_ddl("ALTER TABLE bookings ADD COLUMN payment_status VARCHAR(16) DEFAULT 'unpaid'",
+                "ALTER TABLE bookings ADD COLUMN payment_ref VARCHAR(64)")
+    else:
+        run_ddl("ALTER TABLE bookings ADD COLUMN payment_status TEXT DEFAULT 'unpaid'",
+                "ALTER TABLE bookings ADD COLUMN payment_ref TEXT")
 
-# Ensure schema tweak at startup (compatible across Flask versions)
-ensure_booking_status_column()
 
 def ensure_booking_user_column():
-    try:
-        if is_mysql_enabled():
-            db_execute("ALTER TABLE bookings ADD COLUMN user_id INT NULL")
-        else:
-            db_execute("ALTER TABLE bookings ADD COLUMN user_id INTEGER NULL")
-    except Exception:
-        pass
+    if is_mysql_enabled():
+        run_ddl("ALTER TABLE bookings ADD COLUMN user_id INT NULL")
+    else:
+        run_ddl("ALTER TABLE bookings ADD COLUMN user_id INTEGER NULL")
+
+
+# Coupon columns and per-passenger details, created here rather than on every booking
+def ensure_booking_extras():
+    mysql_on = is_mysql_enabled()
+    statements = [
+        "ALTER TABLE bookings ADD COLUMN coupon_code VARCHAR(32)" if mysql_on else "ALTER TABLE bookings ADD COLUMN coupon_code TEXT",
+        "ALTER TABLE bookings ADD COLUMN discount_amount DECIMAL(10,2) DEFAULT 0" if mysql_on else "ALTER TABLE bookings ADD COLUMN discount_amount REAL DEFAULT 0",
+        '''
+        CREATE TABLE IF NOT EXISTS bookings_passengers (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            booking_id INT NOT NULL,
+            seat_no VARCHAR(8),
+            name VARCHAR(255),
+            phone VARCHAR(32),
+            email VARCHAR(255),
+            age INT,
+            gender VARCHAR(16),
+            INDEX idx_bp_booking (booking_id)
+        )''' if mysql_on else '''
+        CREATE TABLE IF NOT EXISTS bookings_passengers (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            booking_id INTEGER NOT NULL,
+            seat_no TEXT,
+            name TEXT,
+            phone TEXT,
+            email TEXT,
+            age INTEGER,
+            gender TEXT
+        )''',
+        # Tables created before the phone column existed
+        "ALTER TABLE bookings_passengers ADD COLUMN phone VARCHAR(32)" if mysql_on else "ALTER TABLE bookings_passengers ADD COLUMN phone TEXT",
+    ]
+    if not mysql_on:
+        statements.append("CREATE INDEX IF NOT EXISTS idx_bp_booking ON bookings_passengers (booking_id)")
+    run_ddl(*statements)
+
+
+# Journey-month shard key and the archived-booking index (see archive.py)
+def ensure_booking_shards():
+    run_ddl(*archive.schema_statements(bool(is_mysql_enabled())))
 
-ensure_booking_user_column()
 
 def ensure_user_profile_and_roles():
-    try:
-        if is_mysql_enabled():
-            db_execute("ALTER TABLE users ADD COLUMN role VARCHAR(32) DEFAULT 'customer'")
-        else:
-            db_execute("ALTER TABLE users ADD COLUMN role TEXT DEFAULT 'customer'")
-    except Exception:
-        pass
-    try:
-        if is_mysql_enabled():
-            db_execute("ALTER TABLE users ADD COLUMN name VARCHAR(255)")
-        else:
-            db_execute("ALTER TABLE users ADD COLUMN name TEXT")
-    except Exception:
-        pass
-    try:
-        if is_mysql_enabled():
-            db_execute("ALTER TABLE users ADD COLUMN phone VARCHAR(32)")
-        else:
-            db_execute("ALTER TABLE users ADD COLUMN phone TEXT")
-    except Exception:
-        pass
+    if is_mysql_enabled():
+        run_ddl("ALTER TABLE users ADD COLUMN role VARCHAR(32) DEFAULT 'customer'",
+                "ALTER TABLE users ADD COLUMN name VARCHAR(255)",
+                "ALTER TABLE users ADD COLUMN phone VARCHAR(32)")
+    else:
+        run_ddl("ALTER TABLE users ADD COLUMN role TEXT DEFAULT 'customer'",
+                "ALTER TABLE users ADD COLUMN name TEXT",
+                "ALTER TABLE users ADD COLUMN phone TEXT")
 
-ensure_user_profile_and_roles()
 
 # Seed an admin user if ENV provided
 def ensure_admin_seed():
@@ -175,26 +563,40 @@ def ensure_admin_seed():
             # ensure role is admin
             db_execute('UPDATE users SET role = ? WHERE email = ?', ('admin', admin_email))
             return
-        from werkzeug.security import generate_password_hash
         db_execute('INSERT INTO users (email, password_hash, created_at, role, name, phone) VALUES (?, ?, ?, ?, ?, ?)', (
-            admin_email, generate_password_hash(admin_pwd), datetime.now(), 'admin', 'Admin', None
+            admin_email, passwords.hash_password(admin_pwd), datetime.now(), 'admin', 'Admin', None
         ))
     except Exception:
         pass
 
-ensure_admin_seed()
 
-@app.route('/api/buses')
-def list_buses():
-    from_city = request.args.get('from', '').strip()
-    to_city = request.args.get('to', '').strip()
-    date = request.args.get('date', '').strip()
-    operator = request.args.get('operator', '').strip()
-    bus_type = (request.args.get('type', '') or '').strip().lower()  # ac, nonac, sleeper, seater, luxury
-    fare_min = request.args.get('fare_min', '').strip()
-    fare_max = request.args.get('fare_max', '').strip()
-
-    query = 'SELECT * FROM buses WHERE 1=1'
+# Query building and row shaping for the read-only JSON APIs live in plain functions
+# so the async variants in asgi.py run exactly the same SQL.
+
+# Name keywords behind the ?type= filter; 'nonac' excludes its list instead of matching it
+BUS_TYPE_KEYWORDS = {
+    'ac': ('ac', 'a/c', 'garuda', 'rajadhani', 'lux'),
+    'nonac': ('ac', 'a/c', 'garuda', 'rajadhani'),
+    'sleeper': ('sleeper', 'berth', 'rajadhani'),
+    'seater': ('seater', 'express', 'super'),
+    'luxury': ('lux', 'garuda', 'rajadhani', 'volvo'),
+}
+
+def build_bus_search(args):
+    from_city = (args.get('from') or '').strip()
+    to_city = (args.get('to') or '').strip()
+    date = (args.get('date') or '').strip()
+    operator = (args.get('operator') or '').strip()
+    bus_type = (args.get('type') or '').strip().lower()  # ac, nonac, sleeper, seater, luxury
+    fare_min = (args.get('fare_min') or '').strip()
+    fare_max = (args.get('fare_max') or '').strip()
+
+    # Trips join their service template; a date search is an indexed lookup on trips.journey_date
+    query = '''
+        SELECT t.id, t.journey_date, s.name, s.from_city, s.to_city, s.depart_clock, s.arrive_clock,
+               s.arrive_day_offset, s.fare
+        FROM trips t JOIN services s ON s.id = t.service_id
+        WHERE 1=1'''
     params = []
     if from_city:
         query += ' AND LOWER(from_city) LIKE LOWER(?)'
@@ -202,10 +604,13 @@ def list_buses():
     if to_city:
         query += ' AND LOWER(to_city) LIKE LOWER(?)'
         params.append(f"%{to_city}%")
-    # Optional: if depart_time contains a date string, naive filter
     if date:
-        query += ' AND depart_time LIKE ?'
-        params.append(f"%{date}%")
+        if len(date) == 10:
+            query += ' AND t.journey_date = ?'
+            params.append(date)
+        else:
+            query += ' AND t.journey_date LIKE ?'
+            params.append(f"%{date}%")
     if operator:
         query += ' AND LOWER(name) LIKE LOWER(?)'
         params.append(f"%{operator}%")
@@ -224,91 +629,543 @@ def list_buses():
             params.append(fare_max)
         except Exception:
             pass
-    # Type keyword filters on name (best-effort)
-    if bus_type in {'ac','nonac','sleeper','seater','luxury'}:
-        if bus_type == 'ac':
-            query += " AND (LOWER(name) LIKE '%ac%' OR LOWER(name) LIKE '%a/c%' OR LOWER(name) LIKE '%garuda%' OR LOWER(name) LIKE '%rajadhani%' OR LOWER(name) LIKE '%lux%')"
-        elif bus_type == 'nonac':
-            query += " AND (LOWER(name) NOT LIKE '%ac%' AND LOWER(name) NOT LIKE '%a/c%' AND LOWER(name) NOT LIKE '%garuda%' AND LOWER(name) NOT LIKE '%rajadhani%')"
-        elif bus_type == 'sleeper':
-            query += " AND (LOWER(name) LIKE '%sleeper%' OR LOWER(name) LIKE '%berth%' OR LOWER(name) LIKE '%rajadhani%')"
-        elif bus_type == 'seater':
-            query += " AND (LOWER(name) LIKE '%seater%' OR LOWER(name) LIKE '%express%' OR LOWER(name) LIKE '%super%')"
-        elif bus_type == 'luxury':
-            query += " AND (LOWER(name) LIKE '%lux%' OR LOWER(name) LIKE '%garuda%' OR LOWER(name) LIKE '%rajadhani%' OR LOWER(name) LIKE '%volvo%')"
-    rows = db_fetch_all(query, params)
-    return jsonify([
-        {
+    # Type keyword filters on name (best-effort); bound like every other filter, since
+    # a literal '%' in the SQL breaks drivers that format parameters with % (aiomysql)
+    keywords = BUS_TYPE_KEYWORDS.get(bus_type)
+    if keywords:
+        if bus_type == 'nonac':
+            query += ' AND (' + ' AND '.join(['LOWER(name) NOT LIKE ?'] * len(keywords)) + ')'
+        else:
+            query += ' AND (' + ' OR '.join(['LOWER(name) LIKE ?'] * len(keywords)) + ')'
+        params += [f'%{k}%' for k in keywords]
+    query += ' ORDER BY t.journey_date, s.depart_clock'
+    return query, params
+
+def bus_rows_to_json(rows):
+    result = []
+    for r in rows:
+        depart_time, arrive_time = dbmod.trip_times(r['journey_date'], r['depart_clock'], r['arrive_clock'], r['arrive_day_offset'])
+        result.append({
             'id': r['id'],
             'name': r['name'],
             'from_city': r['from_city'],
             'to_city': r['to_city'],
-            'depart_time': r['depart_time'],
-            'arrive_time': r['arrive_time'],
-            'fare': r['fare']
-        } for r in rows
-    ])
+            'depart_time': depart_time,
+            'arrive_time': arrive_time,
+            'fare': float(r['fare']) if r['fare'] is not None else None
+        })
+    return result
 
-@app.route('/api/buses/<int:bus_id>/seats')
-def get_seats(bus_id: int):
-    date = (request.args.get('date') or '').strip()
-    # Fallback to date part of depart_time if not provided
-    if not date:
-        row = db_fetch_one('SELECT depart_time FROM buses WHERE id = ?', (bus_id,))
-        if row:
-            dt = row['depart_time'] if isinstance(row, dict) else row['depart_time']
-            date = (str(dt)[:10])
-    # Determine total seats
-    bus = db_fetch_one('SELECT seats_total, fare FROM buses WHERE id = ?', (bus_id,))
-    seats_total = int((bus['seats_total'] if isinstance(bus, dict) else bus['seats_total']) or 40)
-    fare = float((bus['fare'] if isinstance(bus, dict) else bus['fare']) or 0)
+# A trip is one dated run, so its own journey_date decides the inventory
+SEAT_TRIP_QUERY = '''
+    SELECT t.journey_date, s.seats_total, s.fare
+    FROM trips t JOIN services s ON s.id = t.service_id
+    WHERE t.id = ?
+'''
+SEAT_BOOKED_QUERY = 'SELECT seat_no FROM booked_seats WHERE bus_id = ? AND journey_date = ?'
+
+def seat_map_payload(bus, booked_rows):
+    seats_total = int(bus['seats_total'] or 40)
+    fare = float(bus['fare'] or 0)
     # Build seat labels 1..seats_total
     seats = [str(i) for i in range(1, seats_total + 1)]
-    # Fetch booked seats for that date
-    rows = db_fetch_all('SELECT seat_no FROM booked_seats WHERE bus_id = ? AND journey_date = ?', (bus_id, date))
-    booked = set([(r['seat_no'] if isinstance(r, dict) else r['seat_no']) for r in rows])
-    return jsonify({
+    booked = set(r['seat_no'] for r in booked_rows)
+    return {
         'layout': '2x2',
-        'date': date,
+        'date': bus['journey_date'],
         'fare': fare,
         'seats_total': seats_total,
         'booked': sorted(list(booked)),
         'seats': seats,
-    })
+    }
 
-@app.route('/api/locations')
-def list_locations():
-    q = (request.args.get('q') or '').strip().lower()
+def build_locations_query(q):
     if q:
-        rows = db_fetch_all(
-            '''
-            SELECT DISTINCT from_city AS city FROM buses WHERE LOWER(from_city) LIKE ?
+        return '''
+            SELECT DISTINCT from_city AS city FROM services WHERE LOWER(from_city) LIKE ?
             UNION
-            SELECT DISTINCT to_city   AS city FROM buses WHERE LOWER(to_city) LIKE ?
+            SELECT DISTINCT to_city   AS city FROM services WHERE LOWER(to_city) LIKE ?
             ORDER BY city
             ''', (f"{q}%", f"{q}%")
+    return '''
+        SELECT DISTINCT from_city AS city FROM services
+        UNION
+        SELECT DISTINCT to_city   AS city FROM services
+        ORDER BY city
+        ''', ()
+
+@app.route('/api/buses')
+@replica_reads
+@versioned_etag('buses')
+def list_buses():
+    query, params = build_bus_search(request.args)
+    rows = db_fetch_all(query, params)
+    return jsonify(bus_rows_to_json(rows))
+
+@app.route('/api/buses/<int:bus_id>/seats')
+def get_seats(bus_id: int):
+    bus = db_fetch_one(SEAT_TRIP_QUERY, (bus_id,))
+    if not bus:
+        return jsonify({'status': 'error', 'message': 'Trip not found'}), 404
+    rows = db_fetch_all(SEAT_BOOKED_QUERY, (bus_id, bus['journey_date']))
+    return jsonify(seat_map_payload(bus, rows))
+
+# ---------------- Live seat-map stream ----------------
+# text/event-stream per trip; a client opens it after loading /api/buses/<id>/seats
+# and applies 'booked' / 'released' events, refetching on 'resync'. Each WSGI
+# stream pins a worker thread, so large fan-outs should go through asgi.py.
+def publish_seats(kind, bus_id, journey_date, seat_numbers, booking_id=None):
+    if seat_numbers:
+        try:
+            seat_events.broadcaster.publish(bus_id, journey_date, kind, seat_numbers, booking_id)
+        except Exception:
+            pass
+
+def seat_stream_start(bus_id: int, last_event_id):
+    """Return (key, cursor) for a trip, or None if it does not exist."""
+    trip = db_fetch_one('SELECT journey_date FROM trips WHERE id = ?', (bus_id,))
+    if not trip:
+        return None
+    key = (bus_id, str(trip['journey_date']))
+    try:
+        cursor = int(last_event_id)
+    except (TypeError, ValueError):
+        cursor = seat_events.broadcaster.cursor(key)
+    return key, cursor
+
+SSE_HEADERS = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+
+@app.route('/api/buses/<int:bus_id>/seats/stream')
+def stream_seats(bus_id: int):
+    start = seat_stream_start(bus_id, request.headers.get('Last-Event-ID'))
+    if not start:
+        return jsonify({'status': 'error', 'message': 'Trip not found'}), 404
+    key, cursor = start
+
+    def generate(cursor):
+        yield 'retry: 3000\n\n'
+        while True:
+            events, cursor, lost = seat_events.broadcaster.wait(key, cursor)
+            yield seat_events.format_sse(events, lost) if (events or lost) else ': ping\n\n'
+
+    return Response(generate(cursor), mimetype='text/event-stream', headers=SSE_HEADERS)
+
+# ---------------- Multi-leg route search ----------------
+_ROUTE_GRAPH = {'version': None, 'graph': None}
+
+def get_route_graph():
+    version = get_data_version('buses')
+    if _ROUTE_GRAPH['version'] != version:
+        rows = db_fetch_all('''
+            SELECT t.id, t.journey_date, s.name, s.from_city, s.to_city, s.depart_clock, s.arrive_clock,
+                   s.arrive_day_offset, s.fare
+            FROM trips t JOIN services s ON s.id = t.service_id
+        ''')
+        trips = []
+        for r in rows:
+            depart_time, arrive_time = dbmod.trip_times(r['journey_date'], r['depart_clock'], r['arrive_clock'], r['arrive_day_offset'])
+            trips.append({'id': r['id'], 'name': r['name'], 'from_city': r['from_city'], 'to_city': r['to_city'],
+                          'depart_time': depart_time, 'arrive_time': arrive_time, 'fare': r['fare']})
+        _ROUTE_GRAPH['graph'] = routing.build_graph(trips)
+        _ROUTE_GRAPH['version'] = version
+    return _ROUTE_GRAPH['graph']
+
+def _int_arg(name, default, lo, hi):
+    try:
+        return max(lo, min(hi, int(request.args.get(name, default))))
+    except (TypeError, ValueError):
+        return default
+
+@app.route('/api/routes')
+def search_routes():
+    from_city = (request.args.get('from') or '').strip()
+    to_city = (request.args.get('to') or '').strip()
+    date = (request.args.get('date') or '').strip()
+    if not from_city or not to_city:
+        return jsonify({'status': 'error', 'message': 'from and to are required'}), 400
+    depart_after = depart_before = None
+    if date:
+        try:
+            depart_after = datetime.strptime(date, '%Y-%m-%d')
+        except ValueError:
+            return jsonify({'status': 'error', 'message': 'date must be YYYY-MM-DD'}), 400
+        depart_before = depart_after + timedelta(hours=23, minutes=59)
+    itineraries, complete = routing.search(
+        get_route_graph(), from_city, to_city,
+        depart_after=depart_after, depart_before=depart_before,
+        max_legs=_int_arg('max_legs', 3, 1, 4),
+        min_transfer=_int_arg('min_transfer', 30, 0, 720),
+        max_wait=_int_arg('max_wait', 24 * 60, 30, 72 * 60),
+        limit=_int_arg('limit', 5, 1, 20),
+    )
+    return jsonify({'itineraries': itineraries, 'complete': complete})
+
+# ---------------- Fare calendar ----------------
+_CALENDAR_CACHE = {}
+CALENDAR_CACHE_MAX = 512
+
+@app.route('/api/calendar')
+@versioned_etag('buses', 'bookings')
+def fare_calendar():
+    from_city = (request.args.get('from') or '').strip()
+    to_city = (request.args.get('to') or '').strip()
+    month = (request.args.get('month') or datetime.now().strftime('%Y-%m')).strip()
+    if not from_city or not to_city:
+        return jsonify({'status': 'error', 'message': 'from and to are required'}), 400
+    try:
+        first = datetime.strptime(month, '%Y-%m')
+    except ValueError:
+        return jsonify({'status': 'error', 'message': 'month must be YYYY-MM'}), 400
+    key = (from_city.lower(), to_city.lower(), month)
+    versions = (get_data_version('buses'), get_data_version('bookings'))
+    cached = _CALENDAR_CACHE.get(key)
+    if cached and cached[0] == versions:
+        return jsonify(cached[1])
+    next_month = (first + timedelta(days=32)).replace(day=1)
+    start, end = first.strftime('%Y-%m-%d'), next_month.strftime('%Y-%m-%d')
+    # One pass: per-trip seats left via the (bus_id, journey_date, seat_no) unique index, rolled up per day
+    rows = db_fetch_all('''
+        SELECT journey_date,
+               MIN(CASE WHEN seats_left > 0 THEN fare END) AS min_fare,
+               SUM(CASE WHEN seats_left > 0 THEN seats_left ELSE 0 END) AS seats_left,
+               COUNT(*) AS trips
+        FROM (
+            SELECT t.journey_date, s.fare,
+                   s.seats_total - (SELECT COUNT(*) FROM booked_seats bs
+                                    WHERE bs.bus_id = t.id AND bs.journey_date = t.journey_date) AS seats_left
+            FROM trips t JOIN services s ON s.id = t.service_id
+            WHERE LOWER(s.from_city) = ? AND LOWER(s.to_city) = ?
+              AND t.journey_date >= ? AND t.journey_date < ?
+        ) x
+        GROUP BY journey_date
+        ORDER BY journey_date
+    ''', (key[0], key[1], start, end))
+    by_date = {r['journey_date']: r for r in rows}
+    days = []
+    d = first
+    while d < next_month:
+        ds = d.strftime('%Y-%m-%d')
+        r = by_date.get(ds)
+        days.append({
+            'date': ds,
+            'min_fare': float(r['min_fare']) if r and r['min_fare'] is not None else None,
+            'seats_left': int(r['seats_left'] or 0) if r else 0,
+            'trips': int(r['trips']) if r else 0,
+        })
+        d += timedelta(days=1)
+    payload = {'from': from_city, 'to': to_city, 'month': month, 'days': days}
+    if len(_CALENDAR_CACHE) >= CALENDAR_CACHE_MAX:
+        _CALENDAR_CACHE.pop(next(iter(_CALENDAR_CACHE)))
+    _CALENDAR_CACHE[key] = (versions, payload)
+    return jsonify(payload)
+
+@app.route('/api/locations')
+@replica_reads
+@versioned_etag('buses')
+def list_locations():
+    q = (request.args.get('q') or '').strip().lower()
+    query, params = build_locations_query(q)
+    rows = db_fetch_all(query, params)
+    return jsonify([r['city'] for r in rows])
+
+# ---------------- Coupons ----------------
+# Active rules are cached per 'coupons' data version; capped coupons count usage on
+# sharded counters (see coupons.py). Shards found sold out are remembered until the
+# rules change, so a nearly exhausted coupon does not retry every shard each time.
+_COUPON_RULES = {'version': None, 'rules': {}, 'exhausted': set()}
+
+COUPON_TRIP_QUERY = '''
+    SELECT t.journey_date, s.fare, s.from_city, s.to_city
+    FROM trips t JOIN services s ON s.id = t.service_id
+    WHERE t.id = ?
+'''
+
+def ensure_coupon_tables():
+    run_ddl(*coupons.schema_statements(bool(is_mysql_enabled())))
+
+def get_coupon_rules():
+    version = get_data_version('coupons')
+    if _COUPON_RULES['version'] != version:
+        rules = [coupons.rule_from_row(r) for r in db_fetch_all('SELECT * FROM coupons WHERE active = 1')]
+        _COUPON_RULES['rules'] = {r['code']: r for r in rules}
+        _COUPON_RULES['exhausted'] = set()
+        _COUPON_RULES['version'] = version
+    return _COUPON_RULES['rules']
+
+def _live_shards(rule):
+    quotas = coupons.shard_quotas(rule['usage_cap'])
+    exhausted = {shard for code, shard in _COUPON_RULES['exhausted'] if code == rule['code']}
+    return coupons.shard_order(quotas, exhausted)
+
+def quote_coupon(code, trip, seats, user_id):
+    """(rule, discount) for a booking of `seats` on `trip`; raises coupons.CouponError."""
+    rule = get_coupon_rules().get(code)
+    discount = coupons.check(rule, float(trip['fare'] or 0) * seats, trip['from_city'], trip['to_city'])
+    if rule['usage_cap'] is not None and not _live_shards(rule):
+        raise coupons.CouponError('Coupon usage limit reached')
+    if rule['per_user_limit'] is not None:
+        row = db_fetch_one('SELECT COUNT(*) AS n FROM coupon_redemptions WHERE code = ? AND user_id = ?', (code, user_id))
+        if int(row['n'] or 0) >= rule['per_user_limit']:
+            raise coupons.CouponError('You have already used this coupon')
+    return rule, discount
+
+def redeem_coupon(tx, rule, booking_id, user_id, discount):
+    """Take one use of the coupon inside the booking transaction; CouponError rolls the booking back."""
+    if rule['usage_cap'] is not None:
+        for shard in _live_shards(rule):
+            tx.execute('UPDATE coupon_counters SET used = used + 1 WHERE code = ? AND shard = ? AND used < quota',
+                       (rule['code'], shard))
+            if tx.rowcount:
+                break
+            _COUPON_RULES['exhausted'].add((rule['code'], shard))
+        else:
+            raise coupons.CouponError('Coupon usage limit reached')
+    if rule['per_user_limit'] is not None:
+        # quote_coupon counted before the transaction; count again now that the booking holds the
+        # write lock (SQLite) or a lock on this user's redemptions (MySQL), so parallel bookings can't all pass
+        lock = ' FOR UPDATE' if tx.mysql else ''
+        row = tx.fetch_all('SELECT COUNT(*) AS n FROM coupon_redemptions WHERE code = ? AND user_id = ?' + lock,
+                           (rule['code'], user_id))[0]
+        if int(row['n'] or 0) >= rule['per_user_limit']:
+            raise coupons.CouponError('You have already used this coupon')
+    tx.execute('INSERT INTO coupon_redemptions (booking_id, code, user_id, discount_amount, redeemed_at) VALUES (?, ?, ?, ?, ?)',
+               (booking_id, rule['code'], user_id, discount, datetime.now()))
+
+def save_coupon_rule(rule):
+    """Insert or replace a coupon; a new cap re-splits the counters, keeping what was already used."""
+    row = db_fetch_one('SELECT COALESCE(SUM(used), 0) AS used FROM coupon_counters WHERE code = ?', (rule['code'],))
+    used = int(row['used'] or 0) if row else 0
+    counters = []
+    if rule['usage_cap'] is not None:
+        for shard, quota in enumerate(coupons.shard_quotas(rule['usage_cap'])):
+            taken = min(used, quota)
+            used -= taken
+            counters.append((rule['code'], shard, taken, quota))
+    with db_transaction() as tx:
+        tx.execute('DELETE FROM coupons WHERE code = ?', (rule['code'],))
+        tx.execute('''
+            INSERT INTO coupons (code, kind, amount, max_discount, min_fare, valid_from, valid_until,
+                                 from_city, to_city, per_user_limit, usage_cap, active, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''', (
+            rule['code'], rule['kind'], rule['amount'], rule['max_discount'], rule['min_fare'],
+            rule['valid_from'], rule['valid_until'], rule['from_city'], rule['to_city'],
+            rule['per_user_limit'], rule['usage_cap'], 1 if rule['active'] else 0, datetime.now()))
+        tx.execute('DELETE FROM coupon_counters WHERE code = ?', (rule['code'],))
+        tx.executemany('INSERT INTO coupon_counters (code, shard, used, quota) VALUES (?, ?, ?, ?)', counters)
+    bump_data_version('coupons')
+
+@app.route('/api/coupons/<code>')
+def check_coupon(code):
+    """Preview a code for the seat picker; save_booking re-checks and redeems it."""
+    try:
+        bus_id = int(request.args.get('bus_id') or 0)
+        seats = max(1, int(request.args.get('seats') or 1))
+    except ValueError:
+        return jsonify({'status': 'error', 'message': 'Invalid input'}), 400
+    trip = db_fetch_one(COUPON_TRIP_QUERY, (bus_id,))
+    if not trip:
+        return jsonify({'status': 'error', 'message': 'Trip not found'}), 404
+    try:
+        rule, discount = quote_coupon(coupons.normalize_code(code), trip, seats, session.get('user_id'))
+    except coupons.CouponError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    return jsonify({'status': 'success', 'code': rule['code'], 'kind': rule['kind'], 'amount': rule['amount'],
+                    'max_discount': rule['max_discount'], 'discount': discount})
+
+@app.route('/admin/coupons', methods=['GET', 'POST'])
+def admin_coupons():
+    if session.get('role') != 'admin':
+        flash('Access denied', 'error')
+        return redirect(url_for('index'))
+    if request.method == 'POST':
+        try:
+            rule = coupons.rule_from_form(request.form)
+            save_coupon_rule(rule)
+            flash(f"Coupon {rule['code']} saved", 'success')
+        except coupons.CouponError as e:
+            flash(str(e), 'error')
+        return redirect(url_for('admin_coupons'))
+    rows = db_fetch_all('''
+        SELECT c.*, (SELECT COUNT(*) FROM coupon_redemptions r WHERE r.code = c.code) AS used
+        FROM coupons c ORDER BY c.active DESC, c.code
+    ''')
+    return render_template('admin_coupons.html', coupons=[dict(coupons.rule_from_row(r), used=r['used']) for r in rows])
+
+@app.route('/admin/coupons/<code>/toggle', methods=['POST'])
+def admin_coupon_toggle(code):
+    if session.get('role') != 'admin':
+        flash('Access denied', 'error')
+        return redirect(url_for('index'))
+    db_execute('UPDATE coupons SET active = 1 - active WHERE code = ?', (coupons.normalize_code(code),))
+    bump_data_version('coupons')
+    return redirect(url_for('admin_coupons'))
+
+# ---------------- Waitlist ----------------
+# Cancelling (or an admin releasing seats) frees the seats and books them for the
+# trip's waitlist in the same transaction, so a released seat is never up for grabs
+# while someone is queued for it. See waitlist.py for the queue rules.
+WAITLIST_QUEUE_QUERY = '''
+    SELECT id, user_id, passenger_name, passenger_phone, seats FROM waitlist
+    WHERE bus_id = ? AND journey_date = ? AND status = 'waiting'
+    ORDER BY id LIMIT ?
+'''
+
+def ensure_waitlist_table():
+    run_ddl(*waitlist.schema_statements(bool(is_mysql_enabled())))
+
+def _lock_trip(tx, bus_id):
+    # MySQL: promotions of one trip run one at a time (SQLite's BEGIN IMMEDIATE already serialises writers)
+    if tx.mysql:
+        tx.fetch_all('SELECT id FROM trips WHERE id = ? FOR UPDATE', (bus_id,))
+
+def _promote_waitlist(tx, bus_id, journey_date):
+    """Book the trip's free seats for its queue inside tx; returns [(bus_id, journey_date, entry, booking_id, seats)]."""
+    promoted = []
+    while True:
+        entries = tx.fetch_all(WAITLIST_QUEUE_QUERY, (bus_id, journey_date, waitlist.PROMOTE_BATCH))
+        if not entries:
+            break
+        trip = tx.fetch_all(SEAT_TRIP_QUERY, (bus_id,))[0]
+        taken = [r['seat_no'] for r in tx.fetch_all(SEAT_BOOKED_QUERY, (bus_id, journey_date))]
+        allocations = waitlist.allocate(waitlist.free_seats(trip['seats_total'], taken), entries)
+        if not allocations:
+            break
+        now = datetime.now()
+        batch = []
+        for entry, seats in allocations:
+            booking_id = tx.execute(
+                'INSERT INTO bookings (bus_id, journey_date, passenger_name, passenger_phone, seats_booked, booked_at, status, payment_status, user_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (bus_id, journey_date, entry['passenger_name'], entry['passenger_phone'], len(seats), now, 'confirmed', 'unpaid', entry['user_id'])
+            )
+            batch.append((bus_id, journey_date, entry, booking_id, seats))
+            tx.record_event('booking.created', booking_id, bus_id=bus_id, journey_date=journey_date, seats=seats,
+                            source='waitlist', waitlist_id=entry['id'])
+        tx.executemany(
+            'INSERT INTO booked_seats (bus_id, journey_date, seat_no, booking_id) VALUES (?, ?, ?, ?)',
+            [(bus_id, journey_date, seat, booking_id) for _, _, _, booking_id, seats in batch for seat in seats]
         )
-    else:
-        rows = db_fetch_all(
-            '''
-            SELECT DISTINCT from_city AS city FROM buses
-            UNION
-            SELECT DISTINCT to_city   AS city FROM buses
-            ORDER BY city
-            '''
+        tx.executemany(
+            "UPDATE waitlist SET status = 'promoted', booking_id = ?, promoted_at = ? WHERE id = ?",
+            [(booking_id, now, entry['id']) for _, _, entry, booking_id, _ in batch]
         )
-    # rows may be list of dicts (MySQL) or sqlite3.Row
-    return jsonify([ (r['city'] if isinstance(r, dict) else r['city']) for r in rows ])
+        promoted.extend(batch)
+        if len(allocations) < len(entries) or len(entries) < waitlist.PROMOTE_BATCH:
+            break
+    return promoted
+
+def _announce_promotions(promoted):
+    for bus_id, journey_date, _, booking_id, seats in promoted:
+        publish_seats('booked', bus_id, journey_date, seats, booking_id)
+        queue_notification('promoted', booking_id)
+
+def release_booking_seats(booking_id: int, cancel=False):
+    """Free a booking's seats (cancelling it too if asked) and promote the waitlist, all in one transaction.
+
+    Returns ({(bus_id, journey_date): [seat_no]}, promoted entries), or None when
+    cancel is set and the booking was already cancelled, so callers notify once.
+    """
+    for attempt in range(3):
+        try:
+            with db_transaction(immediate=True) as tx:
+                if cancel:
+                    tx.execute("UPDATE bookings SET status = 'cancelled' WHERE id = ? AND status <> 'cancelled'", (booking_id,))
+                    if not tx.rowcount:
+                        return None
+                    tx.record_event('booking.cancelled', booking_id)
+                rows = tx.fetch_all('SELECT bus_id, journey_date, seat_no FROM booked_seats WHERE booking_id = ?', (booking_id,))
+                released, promoted = {}, []
+                for r in rows:
+                    released.setdefault((r['bus_id'], r['journey_date']), []).append(r['seat_no'])
+                if rows:
+                    tx.execute('DELETE FROM booked_seats WHERE booking_id = ?', (booking_id,))
+                    for (bus_id, journey_date), seat_list in released.items():
+                        tx.record_event('booking.seats_released', booking_id, bus_id=bus_id, journey_date=journey_date, seats=seat_list)
+                    for bus_id, journey_date in released:
+                        _lock_trip(tx, bus_id)
+                        promoted += _promote_waitlist(tx, bus_id, journey_date)
+            break
+        except dbmod.integrity_errors():
+            # MySQL only: a direct booking took a seat between our read and insert; start over
+            if attempt == 2:
+                raise
+    bump_data_version('bookings')
+    for (bus_id, journey_date), seat_list in released.items():
+        publish_seats('released', bus_id, journey_date, seat_list, booking_id)
+    _announce_promotions(promoted)
+    return released, promoted
+
+def _waitlist_position(entry):
+    row = db_fetch_one(
+        "SELECT COUNT(*) AS n FROM waitlist WHERE bus_id = ? AND journey_date = ? AND status = 'waiting' AND id <= ?",
+        (entry['bus_id'], entry['journey_date'], entry['id'])
+    )
+    return int(row['n'] or 0)
+
+@app.route('/api/buses/<int:bus_id>/waitlist', methods=['POST'])
+@idempotent
+def join_waitlist(bus_id: int):
+    data = request.get_json(silent=True) or {}
+    name = (data.get('name') or '').strip()
+    phone = (data.get('phone') or '').strip()
+    try:
+        seats = int(data.get('seats') or 1)
+    except (TypeError, ValueError):
+        seats = 0
+    if not name or not 1 <= seats <= waitlist.MAX_SEATS:
+        return jsonify({'status': 'error', 'message': f'Name and 1-{waitlist.MAX_SEATS} seats are required'}), 400
+    trip = db_fetch_one(SEAT_TRIP_QUERY, (bus_id,))
+    if not trip:
+        return jsonify({'status': 'error', 'message': 'Trip not found'}), 404
+    journey_date = trip['journey_date']
+    taken = [r['seat_no'] for r in db_fetch_all(SEAT_BOOKED_QUERY, (bus_id, journey_date))]
+    if len(waitlist.free_seats(trip['seats_total'], taken)) >= seats:
+        return jsonify({'status': 'error', 'message': 'Seats are available, book them directly'}), 409
+    # Promote in the same transaction: seats released since the check above go to the queue, us included
+    with db_transaction(immediate=True) as tx:
+        _lock_trip(tx, bus_id)
+        entry_id = tx.execute(
+            'INSERT INTO waitlist (bus_id, journey_date, user_id, passenger_name, passenger_phone, seats, status, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            (bus_id, journey_date, session.get('user_id'), name, phone, seats, 'waiting', datetime.now())
+        )
+        promoted = _promote_waitlist(tx, bus_id, journey_date)
+    if promoted:
+        bump_data_version('bookings')
+        _announce_promotions(promoted)
+    return waitlist_status(entry_id)
+
+@app.route('/api/waitlist/<int:entry_id>')
+def waitlist_status(entry_id: int):
+    entry = db_fetch_one('SELECT id, bus_id, journey_date, user_id, seats, status, booking_id FROM waitlist WHERE id = ?', (entry_id,))
+    if not entry or (entry['user_id'] != session.get('user_id') and session.get('role') != 'admin'):
+        return jsonify({'status': 'error', 'message': 'Not found'}), 404
+    payload = {'status': 'success', 'waitlist_id': entry['id'], 'bus_id': entry['bus_id'], 'seats': entry['seats'],
+               'state': entry['status'], 'booking_id': entry['booking_id']}
+    if entry['status'] == 'waiting':
+        payload['position'] = _waitlist_position(entry)
+    return jsonify(payload)
+
+@app.route('/api/waitlist/<int:entry_id>/cancel', methods=['POST'])
+def leave_waitlist(entry_id: int):
+    entry = db_fetch_one('SELECT user_id FROM waitlist WHERE id = ?', (entry_id,))
+    if not entry or (entry['user_id'] != session.get('user_id') and session.get('role') != 'admin'):
+        return jsonify({'status': 'error', 'message': 'Not found'}), 404
+    db_execute("UPDATE waitlist SET status = 'left' WHERE id = ? AND status = 'waiting'", (entry_id,))
+    return jsonify({'status': 'success'})
 
 # ---------------- Notifications (Email via SMTP) ----------------
+def smtp_configured():
+    return bool(os.getenv('SMTP_HOST') and os.getenv('SMTP_USER') and os.getenv('SMTP_PASS'))
+
 def send_email(to_email: str, subject: str, body: str):
     host = os.getenv('SMTP_HOST')
     port = int(os.getenv('SMTP_PORT') or 0) or 587
     user = os.getenv('SMTP_USER')
     pwd = os.getenv('SMTP_PASS')
     from_addr = os.getenv('SMTP_FROM') or (user or '')
-    if not host or not user or not pwd or not to_email:
+    if not smtp_configured() or not to_email:
         return  # silently skip if not configured
+    import smtplib  # loaded on the first mail, not at startup
+    from email.message import EmailMessage
     try:
         msg = EmailMessage()
         msg['Subject'] = subject
@@ -366,8 +1223,10 @@ def _get_booking_snapshot(booking_id: int):
         'coupon_code': (row.get('coupon_code') if isinstance(row, dict) else (row['coupon_code'] if 'coupon_code' in (row.keys() if hasattr(row,'keys') else []) else None)),
     }
 
-def notify_booking(event: str, booking_id: int):
-    # event in {'created','confirmed','cancelled','paid','refunded','unpaid'}
+def notify_booking(event: str, booking_id: int, base_url=None):
+    # event in {'created','confirmed','cancelled','paid','refunded','unpaid','promoted'}
+    if not smtp_configured():
+        return  # nothing would be sent, so skip the snapshot query
     snap = _get_booking_snapshot(booking_id)
     if not snap:
         return
@@ -382,6 +1241,7 @@ def notify_booking(event: str, booking_id: int):
         'paid': f"Mee Payment Vijayavantam – Ticket #{snap['id']}",
         'refunded': f"Mee Refund Process ayyindi – Ticket #{snap['id']}",
         'unpaid': f"Mee Payment Unpaid ga set chesam – Ticket #{snap['id']}",
+        'promoted': f"Waitlist nundi Mee Seat Confirm ayyindi – Ticket #{snap['id']}",
     }
     subject = subjects.get(event, f"Booking Update – #{snap['id']}")
     body = (
@@ -393,12 +1253,61 @@ def notify_booking(event: str, booking_id: int):
         f"Seats: {snap.get('seats_booked')}\n"
         f"Payment: {snap.get('payment_status')}"
         + (f" (Ref: {snap.get('payment_ref')})" if snap.get('payment_ref') else '') + "\n\n"
-        f"Mee ticket ni ikkadachi chudavachu: {request.host_url.rstrip('/')}/ticket/{snap['id']}\n"
+        f"Mee ticket ni ikkadachi chudavachu: {(base_url or request.host_url).rstrip('/')}/ticket/{snap['id']}\n"
         f"Dhanyavadalu,\nTripWheels"
     )
     send_email(to_email, subject, body)
 
+# Notifications that should not hold up the request (waitlist promotions, cancellations)
+# go through NOTIFY_QUEUE to one background thread per process. Only queued when SMTP
+# is configured; the ticket link uses the host of the request that queued it.
+NOTIFY_QUEUE = queue.Queue()
+_notify_thread = [None]
+_notify_lock = threading.Lock()
+
+def queue_notification(event: str, booking_id: int):
+    if not smtp_configured():
+        return
+    base_url = request.host_url if has_request_context() else (os.getenv('PUBLIC_BASE_URL') or 'http://localhost:5000/')
+    NOTIFY_QUEUE.put((event, booking_id, base_url))
+    with _notify_lock:
+        if _notify_thread[0] is None or not _notify_thread[0].is_alive():
+            _notify_thread[0] = threading.Thread(target=_notification_worker, name='notifications', daemon=True)
+            _notify_thread[0].start()
+
+def _notification_worker():
+    while True:
+        event, booking_id, base_url = NOTIFY_QUEUE.get()
+        try:
+            notify_booking(event, booking_id, base_url)
+        except Exception:
+            pass
+        finally:
+            NOTIFY_QUEUE.task_done()
+
+# ---------------- Booking ownership ----------------
+# A booking belongs to the user who made it, or to a user whose phone matches its
+# passenger_phone (bookings made before login). The list, the ticket and cancel
+# all go through these two helpers so they agree on who sees and acts on what.
+def session_phone():
+    if 'user_id' not in session:
+        return ''
+    user = db_fetch_one('SELECT phone FROM users WHERE id = ?', (session['user_id'],))
+    return (user['phone'] if user else None) or ''
+
+def owns_booking(booking, phone=None):
+    """booking needs user_id and passenger_phone; admins own everything."""
+    if session.get('role') == 'admin':
+        return True
+    if 'user_id' not in session:
+        return False
+    if booking['user_id'] and booking['user_id'] == session['user_id']:
+        return True
+    phone = session_phone() if phone is None else phone
+    return bool(phone) and booking['passenger_phone'] == phone
+
 @app.route('/bookings')
+@replica_reads
 def view_bookings():
     # Admin: show all
     if session.get('role') == 'admin':
@@ -411,11 +1320,10 @@ def view_bookings():
             ORDER BY b.id DESC
         ''')
         return render_template('bookings.html', bookings=bookings)
-    # Customer: show own bookings (by user_id, with phone fallback for legacy rows)
+    # Customer: the owns_booking() rule as a query (user_id, or a phone match for legacy rows)
     if 'user_id' not in session:
         return redirect(url_for('login'))
-    user = db_fetch_one('SELECT phone FROM users WHERE id = ?', (session['user_id'],))
-    phone = (user['phone'] if isinstance(user, dict) else (user['phone'] if user else None)) or ''
+    phone = session_phone()
     # Backfill user_id for historic bookings made without login
     if phone:
         try:
@@ -447,40 +1355,32 @@ def view_bookings():
 
 @app.route('/ticket/<int:booking_id>')
 def view_ticket(booking_id: int):
-    # Fetch booking + bus
-    row = db_fetch_one('''
+    # Fetch booking + bus; completed journeys may have moved to a month archive
+    ticket_query = '''
         SELECT b.id, b.bus_id, b.passenger_name, b.passenger_phone, b.seats_booked, b.booked_at,
                b.status, b.payment_status, b.payment_ref, b.user_id,
                bus.name AS bus_name, bus.from_city, bus.to_city, bus.depart_time, bus.arrive_time, bus.fare,
                COALESCE(b.discount_amount, 0) AS discount_amount, b.coupon_code
-        FROM bookings b JOIN buses bus ON b.bus_id = bus.id
+        FROM {bookings} b JOIN buses bus ON b.bus_id = bus.id
         WHERE b.id = ?
-    ''', (booking_id,))
+    '''
+    month = None
+    row = db_fetch_booking_shard(None, ticket_query, (booking_id,), one=True)
+    if not row:
+        month = archived_booking_month(booking_id)
+        if month:
+            row = db_fetch_booking_shard(month, ticket_query, (booking_id,), one=True)
     if not row:
         flash('Ticket not found', 'error')
         return redirect(url_for('index'))
-    # Access check: admin or owner (by user_id or phone fallback)
-    is_admin = session.get('role') == 'admin'
-    owner_ok = False
-    if 'user_id' in session:
-        bid_uid = row['user_id'] if isinstance(row, dict) else row['user_id']
-        if bid_uid and bid_uid == session['user_id']:
-            owner_ok = True
-        else:
-            # fallback match by phone
-            u = db_fetch_one('SELECT phone FROM users WHERE id = ?', (session['user_id'],))
-            uphone = (u['phone'] if isinstance(u, dict) else (u['phone'] if u else None))
-            bphone = row['passenger_phone'] if isinstance(row, dict) else row['passenger_phone']
-            if uphone and bphone and uphone == bphone:
-                owner_ok = True
-    if not (is_admin or owner_ok):
+    if not owns_booking(row):
         flash('Access denied', 'error')
         return redirect(url_for('index'))
     # Get seat numbers if present
-    seats = db_fetch_all('SELECT seat_no FROM booked_seats WHERE booking_id = ? ORDER BY CAST(seat_no AS INT)', (booking_id,))
+    seats = db_fetch_booking_shard(month, 'SELECT seat_no FROM {booked_seats} WHERE booking_id = ? ORDER BY CAST(seat_no AS INT)', (booking_id,))
     seat_list = [ (s['seat_no'] if isinstance(s, dict) else s['seat_no']) for s in seats ]
     # Get passengers list if present
-    passengers_rows = db_fetch_all('SELECT seat_no, name, phone, email, age, gender FROM bookings_passengers WHERE booking_id = ? ORDER BY id', (booking_id,)) or []
+    passengers_rows = db_fetch_booking_shard(month, 'SELECT seat_no, name, phone, email, age, gender FROM {bookings_passengers} WHERE booking_id = ? ORDER BY id', (booking_id,)) or []
     passengers = []
     for pr in passengers_rows:
         if isinstance(pr, dict):
@@ -532,6 +1432,7 @@ def view_ticket(booking_id: int):
     return render_template('ticket.html', b=booking)
 
 @app.route('/api/bookings', methods=['POST'])
+@idempotent
 def save_booking():
     try:
         data = request.get_json(force=True, silent=False)
@@ -539,126 +1440,67 @@ def save_booking():
         name = (data.get('name') or '').strip()
         phone = (data.get('phone') or '').strip()
         seat_numbers = data.get('seat_numbers') or []
-        coupon_code = (data.get('coupon_code') or '').strip().upper()
-        discount_amount = 100.0 if coupon_code == 'TRIP100' else 0.0
+        coupon_code = coupons.normalize_code(data.get('coupon_code'))
         passengers = data.get('passengers') or []
         if isinstance(seat_numbers, str):
             seat_numbers = [s.strip() for s in seat_numbers.split(',') if s.strip()]
         seats = int(data.get('seats') or (len(seat_numbers) if seat_numbers else 0))
-        journey_date = (data.get('date') or '').strip()
         if not bus_id or seats <= 0:
             return jsonify({'status': 'error', 'message': 'Invalid input'}), 400
-        # Validate seat availability if seat_numbers provided
-        if seat_numbers and journey_date:
-            # Check if any requested seat already booked
-            placeholders = ','.join(['?'] * len(seat_numbers))
-            conflict_query = f"SELECT seat_no FROM booked_seats WHERE bus_id = ? AND journey_date = ? AND seat_no IN ({placeholders})"
-            rows = db_fetch_all(conflict_query, (bus_id, journey_date, *seat_numbers))
-            if rows:
-                taken = [r['seat_no'] if isinstance(r, dict) else r['seat_no'] for r in rows]
-                return jsonify({'status': 'error', 'message': f'Seats already booked: {", ".join(taken)}'}), 409
-
-        # Create booking
-        booking_created = False
-        try:
-            # Try insert with user_id if logged in
-            uid = session.get('user_id')
-            if uid:
-                try:
-                    db_execute(
-                        'INSERT INTO bookings (bus_id, passenger_name, passenger_phone, seats_booked, booked_at, status, payment_status, user_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
-                        (bus_id, name, phone, seats, datetime.now(), 'confirmed', 'unpaid', uid)
-                    )
-                    booking_created = True
-                except Exception:
-                    pass
-            if not booking_created:
-                db_execute(
-                    'INSERT INTO bookings (bus_id, passenger_name, passenger_phone, seats_booked, booked_at, status, payment_status) VALUES (?, ?, ?, ?, ?, ?, ?)',
-                    (bus_id, name, phone, seats, datetime.now(), 'confirmed', 'unpaid')
-                )
-                booking_created = True
-        except Exception:
-            db_execute(
-                'INSERT INTO bookings (bus_id, passenger_name, passenger_phone, seats_booked, booked_at) VALUES (?, ?, ?, ?, ?)',
-                (bus_id, name, phone, seats, datetime.now())
-            )
-            booking_created = True
-
-        # Retrieve last inserted booking id (SQLite last_insert_rowid or MySQL last insert id)
-        # Simple approach: get max id for this passenger & time window
-        row = db_fetch_one(
-            'SELECT id FROM bookings WHERE passenger_name = ? AND passenger_phone = ? ORDER BY id DESC LIMIT 1',
-            (name, phone)
-        )
-        booking_id = (row['id'] if isinstance(row, dict) else row['id']) if row else None
-
-        # Try to persist coupon and discount (add columns if missing)
-        try:
-            db_execute('ALTER TABLE bookings ADD COLUMN coupon_code TEXT')
-        except Exception:
-            pass
-        try:
-            db_execute('ALTER TABLE bookings ADD COLUMN discount_amount REAL DEFAULT 0')
-        except Exception:
-            pass
-        if booking_id:
+        trip = db_fetch_one(COUPON_TRIP_QUERY, (bus_id,))
+        if not trip:
+            return jsonify({'status': 'error', 'message': 'Trip not found'}), 404
+        journey_date = trip['journey_date']
+        rule, discount_amount = None, 0.0
+        if coupon_code:
             try:
-                db_execute('UPDATE bookings SET coupon_code = ?, discount_amount = ? WHERE id = ?', (coupon_code or None, discount_amount or 0.0, booking_id))
-            except Exception:
-                pass
-        # Persist per-passenger details
+                rule, discount_amount = quote_coupon(coupon_code, trip, seats, session.get('user_id'))
+            except coupons.CouponError as e:
+                return jsonify({'status': 'error', 'message': str(e)}), 400
+        seat_numbers = list(dict.fromkeys(str(x) for x in seat_numbers)) if journey_date else []
+        passenger_rows = []
+        for idx, p in enumerate(passengers):
+            passenger_rows.append((
+                seat_numbers[idx] if idx < len(seat_numbers) else None,
+                (p.get('name') or None),
+                (p.get('phone') or None),
+                (p.get('email') or None),
+                (int(p.get('age')) if p.get('age') else None),
+                (p.get('gender') or None)
+            ))
+
+        # One transaction: booking row, seat holds, passengers. The unique index on
+        # booked_seats rejects a seat someone else holds, which rolls everything back.
         try:
-            db_execute('''
-                CREATE TABLE IF NOT EXISTS bookings_passengers (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    booking_id INTEGER NOT NULL,
-                    seat_no TEXT,
-                    name TEXT,
-                    phone TEXT,
-                    email TEXT,
-                    age INTEGER,
-                    gender TEXT
+            with db_transaction() as tx:
+                booking_id = tx.execute(
+                    'INSERT INTO bookings (bus_id, journey_date, passenger_name, passenger_phone, seats_booked, booked_at, status, payment_status, user_id, coupon_code, discount_amount) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    (bus_id, journey_date, name, phone, seats, datetime.now(), 'confirmed', 'unpaid', session.get('user_id'), coupon_code or None, discount_amount or 0.0)
                 )
-            ''')
-        except Exception:
-            pass
-        # Add phone column if table already existed without it
-        try:
-            db_execute('ALTER TABLE bookings_passengers ADD COLUMN phone TEXT')
-        except Exception:
-            pass
-        if booking_id and passengers:
-            try:
-                # Map seat numbers if provided; else None
-                for idx, p in enumerate(passengers):
-                    s_no = None
-                    try:
-                        s_no = str(seat_numbers[idx]) if idx < len(seat_numbers) else None
-                    except Exception:
-                        s_no = None
-                    db_execute(
-                        'INSERT INTO bookings_passengers (booking_id, seat_no, name, phone, email, age, gender) VALUES (?, ?, ?, ?, ?, ?, ?)',
-                        (
-                            booking_id,
-                            s_no,
-                            (p.get('name') or None),
-                            (p.get('phone') or None),
-                            (p.get('email') or None),
-                            (int(p.get('age')) if p.get('age') else None),
-                            (p.get('gender') or None)
-                        )
-                    )
-            except Exception:
-                pass
-
-        # Persist seat selections
-        if seat_numbers and journey_date and booking_id:
-            for s in seat_numbers:
-                try:
-                    db_execute('INSERT INTO booked_seats (bus_id, journey_date, seat_no, booking_id) VALUES (?, ?, ?, ?)', (bus_id, journey_date, str(s), booking_id))
-                except Exception:
-                    pass
+                tx.executemany(
+                    'INSERT INTO booked_seats (bus_id, journey_date, seat_no, booking_id) VALUES (?, ?, ?, ?)',
+                    [(bus_id, journey_date, s, booking_id) for s in seat_numbers]
+                )
+                tx.executemany(
+                    'INSERT INTO bookings_passengers (booking_id, seat_no, name, phone, email, age, gender) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    [(booking_id,) + r for r in passenger_rows]
+                )
+                if rule:
+                    redeem_coupon(tx, rule, booking_id, session.get('user_id'), discount_amount)
+                tx.record_event('booking.created', booking_id, bus_id=bus_id, journey_date=journey_date, seats=seat_numbers,
+                                seats_booked=seats, coupon_code=coupon_code or None, discount_amount=discount_amount or 0.0)
+        except coupons.CouponError as e:
+            return jsonify({'status': 'error', 'message': str(e)}), 409
+        except dbmod.integrity_errors():
+            placeholders = ','.join(['?'] * len(seat_numbers))
+            rows = db_fetch_all(
+                f"SELECT seat_no FROM booked_seats WHERE bus_id = ? AND journey_date = ? AND seat_no IN ({placeholders})",
+                (bus_id, journey_date, *seat_numbers)
+            ) if seat_numbers else []
+            taken = [r['seat_no'] for r in rows]
+            return jsonify({'status': 'error', 'message': f'Seats already booked: {", ".join(taken)}'}), 409
+        bump_data_version('bookings')
+        publish_seats('booked', bus_id, journey_date, seat_numbers, booking_id)
         # Notify booking created (and effectively confirmed in current flow)
         try:
             if booking_id:
@@ -670,11 +1512,16 @@ def save_booking():
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
 @app.route('/api/bookings/<int:booking_id>/pay', methods=['POST'])
+@idempotent
 def mock_pay_booking(booking_id: int):
     """Mock payment endpoint: marks the booking as paid with a fake reference."""
     try:
         ref = f"TXN{int(datetime.now().timestamp())}{booking_id}"
-        db_execute('UPDATE bookings SET payment_status = ?, payment_ref = ? WHERE id = ?', ('paid', ref, booking_id))
+        with db_transaction() as tx:
+            tx.execute('UPDATE bookings SET payment_status = ?, payment_ref = ? WHERE id = ?', ('paid', ref, booking_id))
+            if tx.rowcount:
+                tx.record_event('booking.paid', booking_id, payment_ref=ref)
+        bump_data_version('bookings')
         try:
             notify_booking('paid', booking_id)
         except Exception:
@@ -685,19 +1532,22 @@ def mock_pay_booking(booking_id: int):
 
 @app.route('/api/bookings/<int:booking_id>/cancel', methods=['POST'])
 def cancel_booking(booking_id: int):
+    booking = db_fetch_one('SELECT user_id, passenger_phone FROM bookings WHERE id = ?', (booking_id,))
+    if not booking or not owns_booking(booking):
+        return jsonify({'status': 'error', 'message': 'Not found'}), 404
     try:
-        db_execute('UPDATE bookings SET status = ? WHERE id = ?', ('cancelled', booking_id))
-        try:
-            notify_booking('cancelled', booking_id)
-        except Exception:
-            pass
-        return jsonify({'status': 'success'})
+        result = release_booking_seats(booking_id, cancel=True)
+        if result is None:  # cancelled already: nothing to release or announce
+            return jsonify({'status': 'success', 'released': 0, 'promoted': 0})
+        released, promoted = result
+        queue_notification('cancelled', booking_id)
+        return jsonify({'status': 'success', 'released': sum(len(v) for v in released.values()), 'promoted': len(promoted)})
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
 @app.route('/help')
 def help_page():
-    return render_template('help.html')
+    return render_cached('help.html')
 
 @app.route('/account')
 def account_page():
@@ -709,7 +1559,6 @@ def account_page():
 
 @app.route('/register', methods=['GET', 'POST'])
 def register():
-    from werkzeug.security import generate_password_hash
     if request.method == 'GET':
         return render_template('register.html')
     data = request.form
@@ -722,7 +1571,7 @@ def register():
     existing = db_fetch_one('SELECT id FROM users WHERE email = ?', (email,))
     if existing:
         return render_template('register.html', error='Email already registered', email=email, name=name, phone=phone)
-    pwd_hash = generate_password_hash(password)
+    pwd_hash = passwords.hash_password(password)
     # Default role is customer; admins can be set manually in DB
     try:
         db_execute('INSERT INTO users (email, password_hash, created_at, role, name, phone) VALUES (?, ?, ?, ?, ?, ?)', (email, pwd_hash, datetime.now(), 'customer', name or None, phone or None))
@@ -733,7 +1582,6 @@ def register():
 
 @app.route('/login', methods=['GET', 'POST'])
 def login():
-    from werkzeug.security import check_password_hash
     if request.method == 'GET':
         return render_template('login.html')
     data = request.form
@@ -743,9 +1591,15 @@ def login():
     if not user:
         return render_template('login.html', error='Invalid email or password', email=email)
     pwd_hash = user['password_hash'] if isinstance(user, dict) else user['password_hash']
-    from werkzeug.security import check_password_hash
-    if not check_password_hash(pwd_hash, password):
+    ok, new_hash = passwords.verify_and_upgrade(pwd_hash, password)
+    if not ok:
         return render_template('login.html', error='Invalid email or password', email=email)
+    # Transparently move the stored hash to the configured method/cost
+    if new_hash:
+        try:
+            db_execute('UPDATE users SET password_hash = ? WHERE id = ?', (new_hash, user['id']))
+        except Exception:
+            pass
     session['user_id'] = (user['id'] if isinstance(user, dict) else user['id'])
     session['user_email'] = (user['email'] if isinstance(user, dict) else user['email'])
     session['role'] = (user.get('role') if isinstance(user, dict) else None) or 'customer'
@@ -778,8 +1632,53 @@ def profile():
         pass
     return redirect(url_for('profile'))
 
+# ---------------- Admin: Metrics ----------------
+# Prometheus text format. Scrapers without a session send METRICS_TOKEN as a bearer token.
+def bearer_token_ok(token):
+    """Whether the request carries `Authorization: Bearer <token>`; constant-time, False if no token is configured."""
+    bearer = request.headers.get('Authorization', '')
+    return bool(token) and hmac.compare_digest(bearer.encode(), f'Bearer {token}'.encode())
+
+@app.route('/admin/metrics')
+def admin_metrics():
+    if session.get('role') != 'admin' and not bearer_token_ok(os.getenv('METRICS_TOKEN')):
+        return jsonify({'status': 'error', 'message': 'Forbidden'}), 403
+    return Response(metrics.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/admin/metrics/slow-queries')
+def admin_slow_queries():
+    if session.get('role') != 'admin':
+        return jsonify({'status': 'error', 'message': 'Forbidden'}), 403
+    return jsonify({'threshold_ms': metrics.SLOW_QUERY_MS, 'queries': metrics.slow_queries()})
+
+# ---------------- Admin: Profiles ----------------
+# Single-request cProfile captures (see profiling.py): as an admin, add ?_profile=1 or an
+# `X-Profile: 1` header to any request, then open the result here.
+@app.route('/admin/profiles')
+def admin_profiles():
+    if session.get('role') != 'admin':
+        flash('Access denied', 'error')
+        return redirect(url_for('index'))
+    profiles = [p for p in (profiling.load(i) for i in profiling.list_ids()) if p]
+    return render_template('admin_profiles.html', profiles=profiles, sample_rate=profiling.SAMPLE_RATE)
+
+@app.route('/admin/profiles/<profile_id>.<any(prof, txt):fmt>')
+def admin_profile_download(profile_id, fmt):
+    if session.get('role') != 'admin':
+        return jsonify({'status': 'error', 'message': 'Forbidden'}), 403
+    if fmt == 'txt':
+        summary = profiling.load(profile_id)
+        if summary is None:
+            return jsonify({'status': 'error', 'message': 'Profile not found'}), 404
+        return Response(summary['report'], mimetype='text/plain')
+    path = profiling.path_for(profile_id, '.prof')
+    if path is None:
+        return jsonify({'status': 'error', 'message': 'Profile not found'}), 404
+    return send_file(path, mimetype='application/octet-stream', as_attachment=True, download_name=f'{profile_id}.prof')
+
 # ---------------- Admin: Dashboard and CSV Exports ----------------
 @app.route('/admin/dashboard')
+@replica_reads
 def admin_dashboard():
     if session.get('role') != 'admin':
         flash('Access denied', 'error')
@@ -824,6 +1723,7 @@ def admin_dashboard():
                            date_to=date_to)
 
 @app.route('/admin/export/buses.csv')
+@replica_reads
 def export_buses_csv():
     if session.get('role') != 'admin':
         return jsonify({'status': 'error', 'message': 'Forbidden'}), 403
@@ -837,6 +1737,7 @@ def export_buses_csv():
     return Response(output.getvalue(), mimetype='text/csv', headers={'Content-Disposition': 'attachment; filename=buses.csv'})
 
 @app.route('/admin/export/bookings.csv')
+@replica_reads
 def export_bookings_csv():
     if session.get('role') != 'admin':
         return jsonify({'status': 'error', 'message': 'Forbidden'}), 403
@@ -859,8 +1760,66 @@ def export_bookings_csv():
         writer.writerow([get('id'), get('bus_name'), get('from_city'), get('to_city'), get('passenger_name'), get('passenger_phone'), seats, get('booked_at'), get('status'), get('payment_status'), get('payment_ref'), fare, disc, (r.get('coupon_code') if isinstance(r, dict) else (r['coupon_code'] if 'coupon_code' in r.keys() else None)), amt])
     return Response(output.getvalue(), mimetype='text/csv', headers={'Content-Disposition': 'attachment; filename=bookings.csv'})
 
+# ---------------- Admin: Event feed ----------------
+# Changes since a cursor, oldest first (see event_log.py). Consumers keep the returned
+# cursor and ask again; `more` says another page is ready right away. wait=N long-polls
+# an empty feed for up to N seconds. Sync clients without a session send EVENTS_TOKEN
+# as a bearer token.
+def ensure_event_table():
+    run_ddl(*event_log.schema_statements(bool(is_mysql_enabled())))
+
+@app.route('/admin/events')
+def admin_events():
+    if session.get('role') != 'admin' and not bearer_token_ok(os.getenv('EVENTS_TOKEN')):
+        return jsonify({'status': 'error', 'message': 'Forbidden'}), 403
+    try:
+        after = max(0, int(request.args.get('after') or 0))
+        limit = min(max(1, int(request.args.get('limit') or 100)), event_log.PAGE_LIMIT)
+        wait = min(max(0.0, float(request.args.get('wait') or 0)), event_log.MAX_WAIT_SECONDS)
+    except ValueError:
+        return jsonify({'status': 'error', 'message': 'after, limit and wait must be numbers'}), 400
+    deadline = time.monotonic() + wait
+    while True:
+        seen = event_log.signal.seq
+        rows = db_fetch_all(event_log.PAGE_QUERY, (after, time.time() - event_log.settle_seconds(), limit + 1))
+        remaining = deadline - time.monotonic()
+        if rows or remaining <= 0:
+            break
+        # Woken by a commit in this process; other workers' commits show up on the next poll
+        event_log.signal.wait(seen, min(remaining, event_log.POLL_SECONDS))
+    page = [event_log.to_json(r) for r in rows[:limit]]
+    return jsonify({'events': page, 'cursor': page[-1]['id'] if page else after, 'more': len(rows) > limit})
+
+# ---------------- Admin: Boarding manifests ----------------
+def _manifest_departures(journey_date, bus_id=None):
+    """The day's departures (see manifest.py) on one connection, closed when the response has been sent."""
+    t0 = time.perf_counter()
+    conn = get_db_connection()
+    try:
+        yield from manifest.departures(manifest.stream_rows(conn, bool(is_mysql_enabled()), journey_date, bus_id))
+    finally:
+        conn.close()
+        metrics.record_query(manifest.MANIFEST_QUERY, (journey_date,), time.perf_counter() - t0)
+
+@app.route('/admin/manifests/<journey_date>.<any(csv, html):fmt>')
+def admin_manifest(journey_date, fmt):
+    if session.get('role') != 'admin':
+        return jsonify({'status': 'error', 'message': 'Forbidden'}), 403
+    try:
+        journey_date = manifest.parse_date(journey_date)
+        bus_id = int(request.args['bus_id']) if request.args.get('bus_id') else None
+    except ValueError:
+        return jsonify({'status': 'error', 'message': 'Expected /admin/manifests/YYYY-MM-DD.csv and a numeric bus_id'}), 400
+    departures = _manifest_departures(journey_date, bus_id)
+    if fmt == 'csv':
+        filename = f'manifest-{journey_date}' + (f'-{bus_id}' if bus_id else '') + '.csv'
+        return Response(stream_with_context(manifest.csv_chunks(departures)), mimetype='text/csv',
+                        headers={'Content-Disposition': f'attachment; filename={filename}'})
+    return Response(stream_template(manifest.TEMPLATE, departures=departures, journey_date=journey_date), mimetype='text/html')
+
 # ---------------- Admin: Booking actions ----------------
 @app.route('/admin/bookings')
+@replica_reads
 def admin_bookings():
     if session.get('role') != 'admin':
         flash('Access denied', 'error')
@@ -907,11 +1866,25 @@ def admin_booking_status(booking_id: int):
     if status not in {'confirmed', 'cancelled'}:
         return jsonify({'status': 'error', 'message': 'Invalid status'}), 400
     try:
-        db_execute('UPDATE bookings SET status = ? WHERE id = ?', (status, booking_id))
-        try:
-            notify_booking('confirmed' if status == 'confirmed' else 'cancelled', booking_id)
-        except Exception:
-            pass
+        if status == 'cancelled':
+            if release_booking_seats(booking_id, cancel=True) is None:
+                return jsonify({'status': 'success'})
+        else:
+            # A cancelled booking's seats went back on sale (maybe to the waitlist), so it
+            # cannot simply be confirmed again; the customer books afresh instead.
+            with db_transaction() as tx:
+                tx.execute("UPDATE bookings SET status = ? WHERE id = ? AND status <> 'cancelled'", (status, booking_id))
+                changed = tx.rowcount
+                if changed:
+                    tx.record_event('booking.status_changed', booking_id, status=status)
+                else:
+                    exists = tx.fetch_all('SELECT id FROM bookings WHERE id = ?', (booking_id,))
+            if not changed:
+                if not exists:
+                    return jsonify({'status': 'error', 'message': 'Booking not found'}), 404
+                return jsonify({'status': 'error', 'message': 'Cancelled bookings cannot be confirmed again'}), 409
+            bump_data_version('bookings')
+        queue_notification(status, booking_id)
         return jsonify({'status': 'success'})
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)}), 500
@@ -928,7 +1901,11 @@ def admin_booking_payment(booking_id: int):
         ref = None
         if pstat == 'paid':
             ref = f"TXN{int(datetime.now().timestamp())}{booking_id}"
-        db_execute('UPDATE bookings SET payment_status = ?, payment_ref = ? WHERE id = ?', (pstat, ref, booking_id))
+        with db_transaction() as tx:
+            tx.execute('UPDATE bookings SET payment_status = ?, payment_ref = ? WHERE id = ?', (pstat, ref, booking_id))
+            if tx.rowcount:
+                tx.record_event('booking.payment_changed', booking_id, payment_status=pstat, payment_ref=ref)
+        bump_data_version('bookings')
         try:
             notify_booking('paid' if pstat == 'paid' else ('refunded' if pstat == 'refunded' else 'unpaid'), booking_id)
         except Exception:
@@ -942,7 +1919,7 @@ def admin_booking_release_seats(booking_id: int):
     if session.get('role') != 'admin':
         return jsonify({'status': 'error', 'message': 'Forbidden'}), 403
     try:
-        db_execute('DELETE FROM booked_seats WHERE booking_id = ?', (booking_id,))
+        release_booking_seats(booking_id)
         return jsonify({'status': 'success'})
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)}), 500
@@ -983,8 +1960,7 @@ def reset_password():
     if not new1 or new1 != new2:
         flash('Passwords match avvaledu', 'error')
         return render_template('reset_password.html', email=email)
-    from werkzeug.security import generate_password_hash
-    db_execute('UPDATE users SET password_hash = ? WHERE email = ?', (generate_password_hash(new1), email))
+    db_execute('UPDATE users SET password_hash = ? WHERE email = ?', (passwords.hash_password(new1), email))
     RESET_TOKENS.pop(email, None)
     flash('Password reset ayindi. Daya chesi login avvandi.', 'success')
     return redirect(url_for('login'))
@@ -995,8 +1971,20 @@ def admin_buses():
     if session.get('role') != 'admin':
         flash('Access denied', 'error')
         return redirect(url_for('index'))
-    buses = db_fetch_all('SELECT id, name, from_city, to_city, depart_time, arrive_time, seats_total, fare FROM buses ORDER BY id DESC')
-    return render_template('admin_buses.html', buses=buses)
+    return render_cached('admin_buses.html', ('buses',), lambda: {
+        'buses': db_fetch_all('SELECT id, name, from_city, to_city, depart_time, arrive_time, seats_total, fare FROM buses ORDER BY id DESC')
+    })
+
+def _bus_from_form(data):
+    return (
+        (data.get('name') or '').strip(),
+        (data.get('from_city') or '').strip(),
+        (data.get('to_city') or '').strip(),
+        (data.get('depart_time') or '').strip(),
+        (data.get('arrive_time') or '').strip(),
+        int(data.get('seats_total') or 40),
+        float(data.get('fare') or 0),
+    )
 
 @app.route('/admin/buses/new', methods=['GET', 'POST'])
 def admin_bus_new():
@@ -1006,24 +1994,50 @@ def admin_bus_new():
     if request.method == 'GET':
         return render_template('bus_form.html', bus=None, mode='new')
     data = request.form
+    conn = get_db_connection()
     try:
-        db_execute(
-            'INSERT INTO buses (name, from_city, to_city, depart_time, arrive_time, seats_total, fare) VALUES (?, ?, ?, ?, ?, ?, ?)',
-            (
-                (data.get('name') or '').strip(),
-                (data.get('from_city') or '').strip(),
-                (data.get('to_city') or '').strip(),
-                (data.get('depart_time') or '').strip(),
-                (data.get('arrive_time') or '').strip(),
-                int(data.get('seats_total') or 40),
-                float(data.get('fare') or 0),
-            ),
-        )
+        inserted = dbmod.insert_buses(conn, [_bus_from_form(data)])
+        bump_data_version('buses')
+        if not inserted:
+            flash('Ee trip already undi', 'error')
+            return render_template('bus_form.html', bus=data, mode='new')
         flash('Bus created successfully', 'success')
         return redirect(url_for('admin_buses'))
     except Exception as e:
         flash(f'Failed to create bus: {e}', 'error')
         return render_template('bus_form.html', bus=data, mode='new')
+    finally:
+        conn.close()
+
+@app.route('/admin/buses/import', methods=['GET', 'POST'])
+def admin_bus_import():
+    if session.get('role') != 'admin':
+        flash('Access denied', 'error')
+        return redirect(url_for('index'))
+    if request.method == 'GET':
+        return render_template('bus_import.html')
+    upload = request.files.get('file')
+    csv_text = request.form.get('csv_text') or ''
+    data = upload.read() if upload and upload.filename else csv_text
+    if not data or not data.strip():
+        flash('CSV file leda text ivvandi', 'error')
+        return render_template('bus_import.html', csv_text=csv_text)
+    conn = get_db_connection()
+    try:
+        report = schedules.import_csv(conn, data)
+    except ValueError as e:
+        # Rows are all parsed before the first insert, so a bad row leaves nothing behind
+        flash(f'Import failed, no trips were imported: {e}', 'error')
+        return render_template('bus_import.html', csv_text=csv_text)
+    except Exception as e:
+        flash(f'Import failed: {e}', 'error')
+        return render_template('bus_import.html', csv_text=csv_text)
+    finally:
+        conn.close()
+        bump_data_version('buses')  # a failed import may still have committed some batches
+    flash(f"Imported {report['inserted']} of {report['rows']} trips ({report['skipped']} duplicates) "
+          f"in {report['seconds']}s – {report['rows_per_sec']} rows/sec", 'success')
+    return redirect(url_for('admin_buses'))
 
 @app.route('/admin/buses/<int:bus_id>/edit', methods=['GET', 'POST'])
 def admin_bus_edit(bus_id: int):
@@ -1035,19 +2049,12 @@ def admin_bus_edit(bus_id: int):
         return render_template('bus_form.html', bus=row, mode='edit')
     data = request.form
     try:
-        db_execute(
-            'UPDATE buses SET name=?, from_city=?, to_city=?, depart_time=?, arrive_time=?, seats_total=?, fare=? WHERE id=?',
-            (
-                (data.get('name') or '').strip(),
-                (data.get('from_city') or '').strip(),
-                (data.get('to_city') or '').strip(),
-                (data.get('depart_time') or '').strip(),
-                (data.get('arrive_time') or '').strip(),
-                int(data.get('seats_total') or 40),
-                float(data.get('fare') or 0),
-                bus_id,
-            ),
-        )
+        conn = get_db_connection()
+        try:
+            dbmod.update_trip(conn, bus_id, _bus_from_form(data))
+        finally:
+            conn.close()
+        bump_data_version('buses', 'bookings')  # a date edit moves the trip's bookings too
         flash('Bus updated', 'success')
         return redirect(url_for('admin_buses'))
     except Exception as e:
@@ -1060,7 +2067,12 @@ def admin_bus_delete(bus_id: int):
     if session.get('role') != 'admin':
         return jsonify({'status': 'error', 'message': 'Forbidden'}), 403
     try:
-        db_execute('DELETE FROM buses WHERE id = ?', (bus_id,))
+        conn = get_db_connection()
+        try:
+            dbmod.delete_trip(conn, bus_id)
+        finally:
+            conn.close()
+        bump_data_version('buses')
         return jsonify({'status': 'success'})
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)}), 500
@@ -1072,7 +2084,6 @@ def change_password():
         return redirect(url_for('login'))
     if request.method == 'GET':
         return render_template('change_password.html')
-    from werkzeug.security import check_password_hash, generate_password_hash
     curr = request.form.get('current_password') or ''
     new1 = request.form.get('new_password') or ''
     new2 = request.form.get('confirm_password') or ''
@@ -1081,12 +2092,102 @@ def change_password():
         return render_template('change_password.html')
     row = db_fetch_one('SELECT password_hash FROM users WHERE id = ?', (session['user_id'],))
     pwd_hash = row['password_hash'] if isinstance(row, dict) else row['password_hash']
-    if not check_password_hash(pwd_hash, curr):
+    if not passwords.verify_password(pwd_hash, curr):
         flash('Current password incorrect', 'error')
         return render_template('change_password.html')
-    db_execute('UPDATE users SET password_hash = ? WHERE id = ?', (generate_password_hash(new1), session['user_id']))
+    db_execute('UPDATE users SET password_hash = ? WHERE id = ?', (passwords.hash_password(new1), session['user_id']))
     flash('Password updated', 'success')
     return redirect(url_for('profile'))
 
+# -------------------- STARTUP --------------------
+# Importing this module only builds the Flask app and its routes: no database
+# connection, no MySQL driver, no SMTP. The schema steps below run once per
+# process, from create_app() or the first request, and are skipped entirely when
+# the database's app_meta row already carries the current SCHEMA_VERSION, so a
+# restarted worker does not replay a dozen ALTER TABLEs. Bump SCHEMA_VERSION
+# whenever a step is added or changed; `flask --app app init-db` runs them all.
+# The stamp is written only when every step succeeded (run_ddl tolerates nothing
+# but "already applied" errors); a failed step is logged and the whole set runs
+# again on the next start or request.
+# Template bytecode is cached on disk (TEMPLATE_CACHE_DIR, default the system temp
+# dir; TEMPLATE_BYTECODE_CACHE=0 disables it) so precompiling is cheap on restart.
+SCHEMA_VERSION = 5
+INIT_STEPS = [
+    ensure_service_trip_schema,
+    ensure_data_versions_table,
+    ensure_idempotency_table,
+    ensure_booking_status_column,
+    ensure_booking_user_column,
+    ensure_booking_extras,
+    ensure_booking_shards,
+    ensure_user_profile_and_roles,
+    ensure_coupon_tables,
+    ensure_waitlist_table,
+    ensure_event_table,
+]
+_init_lock = threading.Lock()
+_initialized = [False]
+
+# Compiled templates persist across restarts (keyed by source checksum, so edits recompile)
+if (os.getenv('TEMPLATE_BYTECODE_CACHE') or '1') != '0':
+    import jinja2
+    app.jinja_env.bytecode_cache = jinja2.FileSystemBytecodeCache(os.getenv('TEMPLATE_CACHE_DIR') or None)
+
+def ensure_app_meta_table():
+    if is_mysql_enabled():
+        run_ddl('CREATE TABLE IF NOT EXISTS app_meta (name VARCHAR(64) PRIMARY KEY, value VARCHAR(255))')
+    else:
+        run_ddl('CREATE TABLE IF NOT EXISTS app_meta (name TEXT PRIMARY KEY, value TEXT)')
+
+def schema_stamp():
+    try:
+        row = db_fetch_one("SELECT value FROM app_meta WHERE name = 'schema_version'")
+    except Exception:
+        return None  # fresh database: no app_meta yet
+    return row['value'] if row else None
+
+class SchemaInitError(Exception):
+    pass
+
+def init_db():
+    """Run every step, then stamp SCHEMA_VERSION, but only if all of them succeeded;
+    otherwise the next start (or request) tries again."""
+    failures = []
+    for step in INIT_STEPS:
+        try:
+            step()
+        except Exception as e:
+            app.logger.exception('Schema step %s failed', step.__name__)
+            failures.append(f'{step.__name__}: {e}')
+    if failures:
+        raise SchemaInitError('Schema not stamped, failed steps: ' + '; '.join(failures))
+    ensure_app_meta_table()
+    db_execute("DELETE FROM app_meta WHERE name = 'schema_version'")
+    db_execute("INSERT INTO app_meta (name, value) VALUES ('schema_version', ?)", (str(SCHEMA_VERSION),))
+
+def ensure_initialized():
+    if _initialized[0]:
+        return
+    with _init_lock:
+        if _initialized[0]:
+            return
+        if schema_stamp() != str(SCHEMA_VERSION):
+            init_db()
+        ensure_admin_seed()  # follows ADMIN_EMAIL/ADMIN_PASSWORD on every start
+        _initialized[0] = True
+
+def create_app(initialize=True):
+    """Finish setting up the module's app: schema, then templates compiled ahead of the first request."""
+    if initialize:
+        ensure_initialized()
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+    return app
+
+@app.cli.command('init-db')
+def init_db_command():
+    init_db()
+    print(f'Schema at version {SCHEMA_VERSION}')
+
 if __name__ == '__main__':
-    app.run(debug=True)
+    create_app().run(debug=True)
@@ -0,0 +1,353 @@
+import os
+import re
+import argparse
+from datetime import date, timedelta
+
+import database as dbmod
+
+# ---------- Journey-month shards ----------
+# Bookings, their seat holds and passengers are keyed by journey month (YYYY-MM,
+# bookings.journey_date is a copy of the trip's date). Once every journey in a
+# month is ARCHIVE_AFTER_DAYS in the past, `python archive.py run` moves that
+# month out of the live tables so dashboards, exports and searches stop
+# scanning it:
+#   MySQL  - bookings and booked_seats are RANGE COLUMNS partitioned on
+#            journey_date (one partition per month, set up by
+#            `python archive.py partition`); a month's partition is EXCHANGEd
+#            into bookings_YYYY_MM / booked_seats_YYYY_MM and then dropped.
+#   SQLite - the month's rows move into <archive dir>/bookings_YYYY_MM.db, which
+#            is ATTACHed to read them back.
+# archived_bookings (booking_id -> month) in the primary routes ticket reads to
+# the right month.
+
+ARCHIVED_TABLES = ('bookings', 'booked_seats', 'bookings_passengers')
+LIVE_TABLES = {t: t for t in ARCHIVED_TABLES}
+ARCHIVE_AFTER_DAYS = int(os.getenv('ARCHIVE_AFTER_DAYS') or 30)
+
+
+def schema_statements(mysql_on):
+    """Re-runnable DDL: once applied, statements fail only as "already exists" (app.run_ddl and main() skip those)."""
+    if mysql_on:
+        return [
+            "ALTER TABLE bookings ADD COLUMN journey_date VARCHAR(10)",
+            "CREATE INDEX idx_bookings_journey ON bookings (journey_date)",
+            "CREATE TABLE IF NOT EXISTS archived_bookings (booking_id INT PRIMARY KEY, month CHAR(7) NOT NULL)",
+            BACKFILL_SQL,
+        ]
+    return [
+        "ALTER TABLE bookings ADD COLUMN journey_date TEXT",
+        "CREATE INDEX IF NOT EXISTS idx_bookings_journey ON bookings (journey_date)",
+        "CREATE TABLE IF NOT EXISTS archived_bookings (booking_id INTEGER PRIMARY KEY, month TEXT NOT NULL)",
+        BACKFILL_SQL,
+    ]
+
+
+# Rows written before the column existed (or by bulk loaders) take their trip's date
+BACKFILL_SQL = (
+    "UPDATE bookings SET journey_date = (SELECT t.journey_date FROM trips t WHERE t.id = bookings.bus_id) "
+    "WHERE journey_date IS NULL"
+)
+
+
+def next_month(month):
+    year, mon = int(month[:4]), int(month[5:7])
+    return f'{year + mon // 12:04d}-{mon % 12 + 1:02d}'
+
+
+def _suffix(month):
+    return month.replace('-', '_')
+
+
+def archive_dir():
+    default = os.path.join(os.path.dirname(os.path.abspath(dbmod.sqlite_path())), 'archive')
+    return os.getenv('SQLITE_ARCHIVE_DIR') or default
+
+
+def archive_path(month):
+    return os.path.join(archive_dir(), f'bookings_{_suffix(month)}.db')
+
+
+def cutoff(today=None, keep_days=None):
+    """First journey date that stays live: months ending before today - keep_days are archivable."""
+    today = today or date.today()
+    keep_days = ARCHIVE_AFTER_DAYS if keep_days is None else keep_days
+    return (today - timedelta(days=keep_days)).replace(day=1).isoformat()
+
+
+def attach(conn, month):
+    """Make an archived month readable on conn and return its table names, or None if it was never archived."""
+    if dbmod.is_mysql_enabled():
+        return {t: f'{t}_{_suffix(month)}' for t in ARCHIVED_TABLES}
+    path = archive_path(month)
+    if not os.path.exists(path):
+        return None
+    conn.execute('ATTACH DATABASE ? AS arc', (path,))
+    return {t: f'arc.{t}' for t in ARCHIVED_TABLES}
+
+
+def archivable_months(conn, keep_days=None, today=None):
+    ph = '%s' if dbmod.is_mysql_enabled() else '?'
+    cur = conn.cursor()
+    cur.execute(
+        f"SELECT DISTINCT SUBSTR(journey_date, 1, 7) FROM bookings WHERE journey_date < {ph} ORDER BY 1",
+        (cutoff(today, keep_days),)
+    )
+    months = [r[0] for r in cur.fetchall() if r[0]]
+    cur.close()
+    return months
+
+
+def _columns(conn, schema, table):
+    return [r[1] for r in conn.execute(f'PRAGMA {schema}.table_info({table})')]
+
+
+def _sync_archive_schema(conn):
+    """Create the attached file's tables from the live definitions and add columns added since."""
+    for table in ARCHIVED_TABLES:
+        row = conn.execute("SELECT sql FROM main.sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone()
+        conn.execute(re.sub(r'^CREATE TABLE\s+"?\w+"?', f'CREATE TABLE IF NOT EXISTS arc.{table}', row[0]))
+        have = set(_columns(conn, 'arc', table))
+        for _, name, ctype, _, default, _ in conn.execute(f'PRAGMA main.table_info({table})'):
+            if name not in have:
+                extra = f' DEFAULT {default}' if default is not None else ''
+                conn.execute(f'ALTER TABLE arc.{table} ADD COLUMN {name} {ctype}{extra}')
+    conn.execute('CREATE INDEX IF NOT EXISTS arc.idx_arc_seats_booking ON booked_seats (booking_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS arc.idx_arc_passengers_booking ON bookings_passengers (booking_id)')
+    conn.commit()
+
+
+def _archive_month_sqlite(conn, month):
+    os.makedirs(archive_dir(), exist_ok=True)
+    lo, hi = f'{month}-01', f'{next_month(month)}-01'
+    in_month = 'SELECT id FROM main.bookings WHERE journey_date >= ? AND journey_date < ?'
+    conn.execute('ATTACH DATABASE ? AS arc', (archive_path(month),))
+    try:
+        _sync_archive_schema(conn)
+        # Copy first and commit: ids are preserved, so a rerun after a crash just skips what landed.
+        # (Separate commits because WAL mode does not make multi-file transactions atomic.)
+        for table, key in (('bookings', 'id'), ('booked_seats', 'booking_id'), ('bookings_passengers', 'booking_id')):
+            cols = ', '.join(_columns(conn, 'main', table))
+            conn.execute(
+                f'INSERT OR IGNORE INTO arc.{table} ({cols}) SELECT {cols} FROM main.{table} WHERE {key} IN ({in_month})',
+                (lo, hi)
+            )
+        conn.commit()
+        # Then route reads to the archive and drop the live rows in one primary transaction
+        conn.execute(
+            'INSERT OR IGNORE INTO main.archived_bookings (booking_id, month) '
+            'SELECT id, ? FROM main.bookings WHERE journey_date >= ? AND journey_date < ?',
+            (month, lo, hi)
+        )
+        conn.execute(f'DELETE FROM main.booked_seats WHERE booking_id IN ({in_month})', (lo, hi))
+        conn.execute(f'DELETE FROM main.bookings_passengers WHERE booking_id IN ({in_month})', (lo, hi))
+        moved = conn.execute('DELETE FROM main.bookings WHERE journey_date >= ? AND journey_date < ?', (lo, hi)).rowcount
+        conn.commit()
+        return moved
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.execute('DETACH DATABASE arc')
+
+
+def _partitions(cur, table):
+    cur.execute(
+        "SELECT PARTITION_NAME FROM information_schema.PARTITIONS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND PARTITION_NAME IS NOT NULL",
+        (table,)
+    )
+    return {r[0] for r in cur.fetchall()}
+
+
+def _has_rows(cur, table, partition=None):
+    cur.execute(f"SELECT 1 FROM {table}{f' PARTITION ({partition})' if partition else ''} LIMIT 1")
+    return bool(cur.fetchall())
+
+
+def _archive_month_mysql(conn, month):
+    # DDL commits implicitly, so order the steps so that a ticket is readable at every point:
+    # index first, then passengers copied, then the partitions swapped out, then live passengers removed.
+    # A run that died part-way resumes each step on its own: every table is checked, not just bookings.
+    suffix = _suffix(month)
+    part = f'p{suffix}'
+    cur = conn.cursor()
+    try:
+        pending = [t for t in ('bookings', 'booked_seats') if part in _partitions(cur, t)]
+        cur.execute("SELECT 1 FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s",
+                    (f'bookings_passengers_{suffix}',))
+        if not pending and not cur.fetchall():
+            return 0  # tables not partitioned yet, or no such month
+        moved = 0
+        if 'bookings' in pending:
+            cur.execute(f'INSERT IGNORE INTO archived_bookings (booking_id, month) SELECT id, %s FROM bookings PARTITION ({part})', (month,))
+            moved = cur.rowcount
+            conn.commit()
+        cur.execute(f'CREATE TABLE IF NOT EXISTS bookings_passengers_{suffix} LIKE bookings_passengers')
+        join = 'JOIN archived_bookings a ON a.booking_id = p.booking_id AND a.month = %s'
+        cur.execute(f'INSERT IGNORE INTO bookings_passengers_{suffix} SELECT p.* FROM bookings_passengers p {join}', (month,))
+        conn.commit()
+        for table in pending:  # the others were swapped out by an earlier run
+            archived = f'{table}_{suffix}'
+            cur.execute(f'CREATE TABLE IF NOT EXISTS {archived} LIKE {table}')
+            if _partitions(cur, archived):
+                cur.execute(f'ALTER TABLE {archived} REMOVE PARTITIONING')
+            # An empty partition next to a filled archive table was already exchanged (the run
+            # died before DROP PARTITION); exchanging again would swap the month back in.
+            if _has_rows(cur, table, part) or not _has_rows(cur, archived):
+                cur.execute(f'ALTER TABLE {table} EXCHANGE PARTITION {part} WITH TABLE {archived}')
+            cur.execute(f'ALTER TABLE {table} DROP PARTITION {part}')
+            try:
+                cur.execute(f'ALTER TABLE {archived} ROW_FORMAT=COMPRESSED')
+            except Exception:
+                pass  # needs innodb_file_per_table; the month is archived either way
+        cur.execute(f'DELETE p FROM bookings_passengers p {join}', (month,))
+        conn.commit()
+        return moved
+    finally:
+        cur.close()
+
+
+def _unfinished_months_mysql(conn, before):
+    """Months a failed run left part-way: a partition still in place, or live passengers of archived bookings."""
+    cur = conn.cursor()
+    try:
+        months = set()
+        for table in ('bookings', 'booked_seats'):
+            months |= {f'{p[1:5]}-{p[6:8]}' for p in _partitions(cur, table) if re.match(r'^p\d{4}_\d{2}$', p)}
+        # Only months a run has started on (it creates the passengers table before any swap)
+        cur.execute("SELECT TABLE_NAME FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE() "
+                    "AND TABLE_NAME LIKE 'bookings\\_passengers\\_%'")
+        started = {r[0] for r in cur.fetchall()}
+        months = {m for m in months if f'{m}-01' < before and f'bookings_passengers_{_suffix(m)}' in started}
+        cur.execute('SELECT DISTINCT a.month FROM archived_bookings a JOIN bookings_passengers p ON p.booking_id = a.booking_id')
+        months |= {r[0] for r in cur.fetchall()}
+        return months
+    finally:
+        cur.close()
+
+
+def archive_month(conn, month):
+    """Move one journey month out of the live tables; returns the number of bookings moved."""
+    if dbmod.is_mysql_enabled():
+        return _archive_month_mysql(conn, month)
+    return _archive_month_sqlite(conn, month)
+
+
+def _month_bound(month):
+    return f"'{next_month(month)}-01'"
+
+
+def partition_ddl(table, months):
+    parts = [f'PARTITION p{_suffix(m)} VALUES LESS THAN ({_month_bound(m)})' for m in months]
+    parts.append('PARTITION pmax VALUES LESS THAN (MAXVALUE)')
+    return f"ALTER TABLE {table} PARTITION BY RANGE COLUMNS (journey_date) (\n    " + ',\n    '.join(parts) + '\n)'
+
+
+def _months_between(first, last):
+    months, m = [], first
+    while m <= last:
+        months.append(m)
+        m = next_month(m)
+    return months
+
+
+def partition_mysql(conn, months_ahead=3, today=None):
+    """Partition bookings/booked_seats by journey month, or add partitions up to months_ahead if already done.
+
+    InnoDB partitioning rules: no foreign keys, and journey_date must be in every
+    unique key, so fk_trip goes and the primary keys become (id, journey_date).
+    """
+    today = today or date.today()
+    last = today.strftime('%Y-%m')
+    for _ in range(months_ahead):
+        last = next_month(last)
+    cur = conn.cursor()
+    try:
+        for table in ('bookings', 'booked_seats'):
+            existing = _partitions(cur, table)
+            if existing:
+                cur.execute(f'SELECT MAX(PARTITION_DESCRIPTION) FROM information_schema.PARTITIONS '
+                            f"WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND PARTITION_NAME <> 'pmax'", (table,))
+                bound = (cur.fetchone()[0] or "'0000-01-01'").strip("'")
+                for month in _months_between(bound[:7], last):
+                    cur.execute(
+                        f'ALTER TABLE {table} REORGANIZE PARTITION pmax INTO ('
+                        f'PARTITION p{_suffix(month)} VALUES LESS THAN ({_month_bound(month)}), '
+                        f'PARTITION pmax VALUES LESS THAN (MAXVALUE))'
+                    )
+                continue
+            if table == 'bookings':
+                try:
+                    cur.execute('ALTER TABLE bookings DROP FOREIGN KEY fk_trip')
+                except Exception:
+                    pass
+                cur.execute(BACKFILL_SQL)
+                conn.commit()
+                cur.execute('ALTER TABLE bookings MODIFY journey_date VARCHAR(10) NOT NULL')
+            cur.execute(f'ALTER TABLE {table} DROP PRIMARY KEY, ADD PRIMARY KEY (id, journey_date)')
+            cur.execute(f'SELECT MIN(journey_date) FROM {table}')
+            first = (cur.fetchone()[0] or today.isoformat())[:7]
+            cur.execute(partition_ddl(table, _months_between(first, last)))
+        conn.commit()
+    finally:
+        cur.close()
+
+
+def run(conn, keep_days=None, dry_run=False, log=print):
+    months = archivable_months(conn, keep_days)
+    if dbmod.is_mysql_enabled():
+        # Once bookings' partition is gone a month no longer shows up above; finish what a failed run left
+        months = sorted(set(months) | _unfinished_months_mysql(conn, cutoff(None, keep_days)))
+    total = 0
+    for month in months:
+        if dry_run:
+            log(f'{month}: would archive')
+            continue
+        moved = archive_month(conn, month)
+        total += moved
+        log(f'{month}: archived {moved} bookings')
+    if dbmod.is_mysql_enabled() and not dry_run:
+        partition_mysql(conn)  # keep partitions ahead of new journeys
+    return total
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Journey-month archival of bookings')
+    sub = parser.add_subparsers(dest='command', required=True)
+    run_p = sub.add_parser('run', help='move completed months to the archive')
+    run_p.add_argument('--keep-days', type=int, default=ARCHIVE_AFTER_DAYS)
+    run_p.add_argument('--dry-run', action='store_true')
+    part_p = sub.add_parser('partition', help='(MySQL) partition the live tables by journey month')
+    part_p.add_argument('--months-ahead', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    conn = dbmod.get_conn()
+    try:
+        mysql_on = bool(dbmod.is_mysql_enabled())
+        dbmod.setup_schema(conn)
+        for stmt in schema_statements(mysql_on):
+            try:
+                cur = conn.cursor()
+                cur.execute(stmt)
+                conn.commit()
+                cur.close()
+            except Exception:
+                conn.rollback()
+        if args.command == 'partition':
+            if not mysql_on:
+                parser.error('partition needs MySQL; SQLite months are split by `run`')
+            partition_mysql(conn, args.months_ahead)
+            print('Partitions ready.')
+        else:
+            try:
+                total = run(conn, args.keep_days, args.dry_run)
+            finally:
+                if not args.dry_run:
+                    dbmod.bump_data_versions(conn, 'bookings')  # months done before a failure count too
+            print(f'Archived {total} bookings.')
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,327 @@
+import os
+import re
+import json
+import time
+import asyncio
+from urllib.parse import parse_qs
+from http.cookies import SimpleCookie
+
+import app as webapp
+import database as dbmod
+import seat_events
+import metrics
+import compression
+import data_versions
+from werkzeug.http import parse_accept_header, parse_etags
+from app import app as flask_app
+
+try:
+    import aiosqlite
+except Exception:
+    aiosqlite = None
+try:
+    import aiomysql
+except Exception:
+    aiomysql = None
+try:
+    from asgiref.wsgi import WsgiToAsgi
+except Exception:
+    WsgiToAsgi = None
+
+# -------------------- ASYNC READ-ONLY APIS --------------------
+# Async variants of /api/buses, /api/buses/<id>/seats, /api/locations and the
+# /api/buses/<id>/seats/stream event feed. They run
+# the same SQL as the Flask handlers (see build_bus_search & co. in app.py) on an
+# async driver, and trust the Flask session cookie, so both stacks can sit behind
+# one domain. Everything else is handed to the Flask app.
+#
+#   uvicorn asgi:application      # async APIs + Flask for all other routes
+#   uvicorn asgi:api              # async APIs only, mount next to gunicorn app:app
+#
+# Without aiosqlite/aiomysql installed the queries fall back to a worker thread.
+# `application` needs asgiref to hand requests to Flask; without it startup fails
+# (and, on servers that skip the lifespan protocol, other routes answer 500)
+# rather than every page quietly turning into a 404.
+
+POOL_SIZE = int(os.getenv('ASGI_DB_POOL_SIZE') or 8)
+SEATS_PATH = re.compile(r'^/api/buses/(\d+)/seats$')
+STREAM_PATH = re.compile(r'^/api/buses/(\d+)/seats/stream$')
+
+
+class _SqlitePool:
+    def __init__(self, path, size):
+        self.path = path
+        self.size = size
+        self.idle = None
+        self.opened = []
+
+    async def acquire(self):
+        if self.idle is None:
+            self.idle = asyncio.Queue()
+        if self.idle.empty() and len(self.opened) < self.size:
+            conn = await aiosqlite.connect(self.path)
+            conn.row_factory = aiosqlite.Row
+            for pragma in dbmod.sqlite_pragmas():
+                await conn.execute(pragma)
+            self.opened.append(conn)
+            return conn
+        return await self.idle.get()
+
+    def release(self, conn):
+        self.idle.put_nowait(conn)
+
+    async def close(self):
+        for conn in self.opened:
+            await conn.close()
+        self.opened = []
+        self.idle = None
+
+
+_sqlite_pool = None
+_mysql_pool = None
+_mysql_pool_lock = asyncio.Lock()
+
+
+async def _get_mysql_pool():
+    global _mysql_pool
+    async with _mysql_pool_lock:
+        if _mysql_pool is None:
+            _mysql_pool = await aiomysql.create_pool(
+                host=os.getenv('MYSQL_HOST'),
+                port=int(os.getenv('MYSQL_PORT', '3306')),
+                db=os.getenv('MYSQL_DB'),
+                user=os.getenv('MYSQL_USER'),
+                password=os.getenv('MYSQL_PASSWORD', ''),
+                autocommit=True,
+                maxsize=POOL_SIZE,
+            )
+    return _mysql_pool
+
+
+async def adb_fetch_all(query: str, params=()):
+    global _sqlite_pool
+    if webapp.is_mysql_enabled():
+        if aiomysql is None:
+            return await asyncio.to_thread(webapp.db_fetch_all, query, params)
+        pool = await _get_mysql_pool()
+        t0 = time.perf_counter()
+        async with pool.acquire() as conn:
+            async with conn.cursor(aiomysql.DictCursor) as cur:
+                await cur.execute(webapp.to_mysql_placeholders(query), params)
+                rows = await cur.fetchall()
+        metrics.record_query(query, params, time.perf_counter() - t0)
+        return rows
+    if aiosqlite is None:
+        return await asyncio.to_thread(webapp.db_fetch_all, query, params)
+    if _sqlite_pool is None:
+        _sqlite_pool = _SqlitePool(dbmod.sqlite_path(), POOL_SIZE)
+    conn = await _sqlite_pool.acquire()
+    t0 = time.perf_counter()
+    try:
+        cur = await conn.execute(query, params)
+        rows = await cur.fetchall()
+        await cur.close()
+        return rows
+    finally:
+        _sqlite_pool.release(conn)
+        metrics.record_query(query, params, time.perf_counter() - t0)
+
+
+async def adb_fetch_one(query: str, params=()):
+    rows = await adb_fetch_all(query, params)
+    return rows[0] if rows else None
+
+
+async def close_pools():
+    global _sqlite_pool, _mysql_pool
+    if _sqlite_pool is not None:
+        await _sqlite_pool.close()
+        _sqlite_pool = None
+    if _mysql_pool is not None:
+        _mysql_pool.close()
+        await _mysql_pool.wait_closed()
+        _mysql_pool = None
+
+
+# ---------------- Session (shared with Flask) ----------------
+_serializer = flask_app.session_interface.get_signing_serializer(flask_app)
+
+
+def read_session(scope):
+    cookie_name = flask_app.config.get('SESSION_COOKIE_NAME', 'session')
+    for name, value in scope.get('headers') or []:
+        if name == b'cookie':
+            jar = SimpleCookie()
+            jar.load(value.decode('latin-1'))
+            if cookie_name in jar:
+                try:
+                    max_age = int(flask_app.permanent_session_lifetime.total_seconds())
+                    return _serializer.loads(jar[cookie_name].value, max_age=max_age)
+                except Exception:
+                    return {}
+    return {}
+
+
+# ---------------- Handlers ----------------
+class _Args(dict):
+    def get(self, key, default=None):
+        values = super().get(key)
+        return values[0] if values else default
+
+
+async def list_buses(args):
+    query, params = webapp.build_bus_search(args)
+    rows = await adb_fetch_all(query, params)
+    return 200, webapp.bus_rows_to_json(rows)
+
+
+async def get_seats(bus_id):
+    bus = await adb_fetch_one(webapp.SEAT_TRIP_QUERY, (bus_id,))
+    if not bus:
+        return 404, {'status': 'error', 'message': 'Trip not found'}
+    rows = await adb_fetch_all(webapp.SEAT_BOOKED_QUERY, (bus_id, bus['journey_date']))
+    return 200, webapp.seat_map_payload(bus, rows)
+
+
+async def list_locations(args):
+    q = (args.get('q') or '').strip().lower()
+    query, params = webapp.build_locations_query(q)
+    rows = await adb_fetch_all(query, params)
+    return 200, [r['city'] for r in rows]
+
+
+async def stream_seats(scope, receive, send, bus_id):
+    # An idle subscriber is one suspended task awaiting the channel's shared future
+    trip = await adb_fetch_one('SELECT journey_date FROM trips WHERE id = ?', (bus_id,))
+    if not trip:
+        return await _send(send, 404, b'{"message":"Trip not found","status":"error"}')
+    key = (bus_id, str(trip['journey_date']))
+    last_id = None
+    for name, value in scope.get('headers') or []:
+        if name == b'last-event-id':
+            last_id = value.decode('latin-1')
+    try:
+        cursor = int(last_id)
+    except (TypeError, ValueError):
+        cursor = seat_events.broadcaster.cursor(key)
+    headers = [(b'content-type', b'text/event-stream'), (b'cache-control', b'no-cache'), (b'x-accel-buffering', b'no')]
+    await send({'type': 'http.response.start', 'status': 200, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': b'retry: 3000\n\n', 'more_body': True})
+    disconnected = asyncio.ensure_future(_wait_disconnect(receive))
+    try:
+        while not disconnected.done():
+            waiter = asyncio.ensure_future(seat_events.broadcaster.wait_async(key, cursor))
+            await asyncio.wait({waiter, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+            if not waiter.done():
+                waiter.cancel()
+                break
+            events, cursor, lost = waiter.result()
+            frame = seat_events.format_sse(events, lost) if (events or lost) else ': ping\n\n'
+            await send({'type': 'http.response.body', 'body': frame.encode(), 'more_body': True})
+    except OSError:
+        pass  # client went away mid-write
+    finally:
+        disconnected.cancel()
+
+
+async def _wait_disconnect(receive):
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return
+
+
+async def _send(send, status, body, content_type=b'application/json', extra_headers=()):
+    headers = [(b'content-type', content_type), (b'content-length', str(len(body)).encode())]
+    headers.extend(extra_headers)
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+MISSING_ASGIREF = 'asgi.application needs asgiref to serve the Flask routes: pip install asgiref, or run asgi:api'
+
+
+class AsyncAPI:
+    def __init__(self, wsgi_app=None):
+        self.fallback = WsgiToAsgi(wsgi_app) if (wsgi_app is not None and WsgiToAsgi is not None) else None
+        self.broken = MISSING_ASGIREF if (wsgi_app is not None and WsgiToAsgi is None) else None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self._lifespan(receive, send)
+        if scope['type'] != 'http':
+            return
+        if not webapp._initialized[0]:
+            await asyncio.to_thread(webapp.ensure_initialized)
+        path = scope.get('path') or ''
+        handler = rule = endpoint = None
+        if scope.get('method') == 'GET':
+            args = _Args(parse_qs((scope.get('query_string') or b'').decode('latin-1')))
+            if path == '/api/buses':
+                handler, rule, endpoint = (lambda: list_buses(args)), '/api/buses', 'list_buses'
+            elif path == '/api/locations':
+                handler, rule, endpoint = (lambda: list_locations(args)), '/api/locations', 'list_locations'
+            else:
+                m = SEATS_PATH.match(path)
+                if m:
+                    handler, rule = (lambda: get_seats(int(m.group(1)))), '/api/buses/<int:bus_id>/seats'
+                stream = STREAM_PATH.match(path)
+                if stream:
+                    if 'user_id' not in read_session(scope):
+                        return await _send(send, 302, b'', b'text/html', [(b'location', b'/login')])
+                    return await stream_seats(scope, receive, send, int(stream.group(1)))
+        if handler is None:
+            if self.fallback is not None:
+                return await self.fallback(scope, receive, send)
+            if self.broken:
+                return await _send(send, 500, self.broken.encode(), b'text/plain; charset=utf-8')
+            return await _send(send, 404, b'{"message":"Not found","status":"error"}')
+        # Same rule as app.require_login
+        if 'user_id' not in read_session(scope):
+            return await _send(send, 302, b'', b'text/html', [(b'location', b'/login')])
+        # Conditional GET and compression as in app.answer_not_modified / compression.py
+        request_headers = dict(scope.get('headers') or [])
+        extra = []
+        etag = None
+        if endpoint in webapp.ETAG_ENDPOINTS:
+            # One snapshot per request, read off the event loop (on MySQL it is a query)
+            snapshot = await asyncio.to_thread(data_versions.shared.snapshot)
+            etag = webapp.data_etag(webapp.ETAG_ENDPOINTS[endpoint], scope.get('query_string') or b'', snapshot)
+            extra = [(b'etag', f'W/"{etag}"'.encode()), (b'cache-control', b'private, no-cache')]
+            if parse_etags(request_headers.get(b'if-none-match', b'').decode('latin-1')).contains_weak(etag):
+                return await _send(send, 304, b'', extra_headers=extra)
+        stats, token = metrics.begin(rule, 'GET')
+        status = 500
+        try:
+            try:
+                status, payload = await handler()
+            except Exception as e:
+                status, payload = 500, {'status': 'error', 'message': str(e)}
+            body = json.dumps(payload, sort_keys=True, separators=(',', ':')).encode()
+            headers = list(extra) if status == 200 else []
+            encoding = compression.choose_encoding(parse_accept_header(request_headers.get(b'accept-encoding', b'').decode('latin-1')))
+            headers.append((b'vary', b'Accept-Encoding'))
+            if encoding and len(body) >= compression.COMPRESS_MIN_BYTES and compression.ENABLED:
+                body = compression.compress(body, encoding)
+                headers.append((b'content-encoding', encoding.encode()))
+            await _send(send, status, body, extra_headers=headers)
+        finally:
+            metrics.finish(stats, token, status)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                if self.broken:
+                    await send({'type': 'lifespan.startup.failed', 'message': self.broken})
+                    return
+                await asyncio.to_thread(webapp.create_app)
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await close_pools()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+api = AsyncAPI()
+application = AsyncAPI(flask_app)
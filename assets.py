@@ -0,0 +1,239 @@
+import io
+import os
+import re
+import gzip
+import json
+import hashlib
+import argparse
+import mimetypes
+try:
+    import brotli
+except Exception:
+    brotli = None
+try:
+    from PIL import Image
+except Exception:
+    Image = None
+
+# ---------- Static asset pipeline ----------
+# build() writes every file under static/ to static/dist/<name>.<hash>.<ext>
+# (hash of the content, so a changed file gets a new URL) together with .gz and,
+# when the brotli package is installed, .br copies of text assets. With Pillow,
+# raster images also get resized JPEG + WebP variants, which the stylesheet
+# picks up through image-set() and max-width media queries. manifest.json maps
+# the plain names to the built ones; init_app() rebuilds it when the sources
+# changed, makes url_for('static', ...) return the hashed name and serves dist/
+# files precompressed with an immutable Cache-Control.
+
+DIST = 'dist'
+COMPRESSIBLE = ('.css', '.js', '.svg', '.json', '.txt', '.html')
+RESIZABLE = ('.jpg', '.jpeg', '.png')
+IMAGE_WIDTHS = (1920, 1280, 768)
+IMMUTABLE = 'public, max-age=31536000, immutable'
+URL_RE = re.compile(r'''url\(\s*(['"]?)/static/([^'")]+)\1\s*\)''')
+RULE_RE = re.compile(r'([^{}]+)\{([^{}]*)\}')
+BG_RE = re.compile(r'''background-image\s*:\s*url\(\s*(['"]?)/static/([^'")]+)\1\s*\)\s*;''')
+
+
+def _digest(data):
+    return hashlib.sha256(data).hexdigest()[:12]
+
+
+def _hashed_name(rel, data):
+    root, ext = os.path.splitext(rel)
+    return f'{root}.{_digest(data)}{ext}'
+
+
+def _sources(static_dir):
+    found = []
+    for dirpath, dirnames, filenames in os.walk(static_dir):
+        if os.path.abspath(dirpath) == os.path.abspath(static_dir):
+            dirnames[:] = [d for d in dirnames if d != DIST]
+        for name in filenames:
+            found.append(os.path.relpath(os.path.join(dirpath, name), static_dir).replace(os.sep, '/'))
+    return sorted(found)
+
+
+def source_key(static_dir):
+    h = hashlib.sha256(f'brotli={bool(brotli)} pillow={bool(Image)}'.encode())
+    for rel in _sources(static_dir):
+        with open(os.path.join(static_dir, rel), 'rb') as f:
+            h.update(rel.encode() + b'\0' + f.read())
+    return h.hexdigest()
+
+
+def _write(path, data):
+    # Write-then-rename so a worker never serves a half-written file while another builds
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def _emit(out_dir, rel, data):
+    path = os.path.join(out_dir, rel)
+    _write(path, data)
+    if os.path.splitext(rel)[1].lower() in COMPRESSIBLE:
+        _write(path + '.gz', gzip.compress(data, 9, mtime=0))
+        if brotli is not None:
+            _write(path + '.br', brotli.compress(data, quality=11))
+
+
+def _image_variants(data):
+    """[(width, jpeg bytes, webp bytes)], widest first; [] without Pillow."""
+    if Image is None:
+        return []
+    img = Image.open(io.BytesIO(data)).convert('RGB')
+    variants = []
+    for width in sorted({min(w, img.width) for w in IMAGE_WIDTHS}, reverse=True):
+        resized = img if width == img.width else img.resize((width, round(img.height * width / img.width)), Image.LANCZOS)
+        jpeg, webp = io.BytesIO(), io.BytesIO()
+        resized.save(jpeg, 'JPEG', quality=80, optimize=True, progressive=True)
+        resized.save(webp, 'WEBP', quality=75, method=6)
+        variants.append((width, jpeg.getvalue(), webp.getvalue()))
+    return variants
+
+
+def _image_set(variant):
+    return (f'image-set(url("/static/{variant["webp"]}") type("image/webp"), '
+            f'url("/static/{variant["jpeg"]}") type("image/jpeg"))')
+
+
+def rewrite_css(css, manifest):
+    """Point /static/ urls at built files; background images with variants get WebP and per-width rules."""
+    files, images = manifest['files'], manifest['images']
+    media = []
+
+    def rule(m):
+        selector, body = m.group(1), m.group(2)
+
+        def background(d):
+            variants = images.get(d.group(2))
+            if not variants:
+                return d.group(0)
+            widest = variants[0]
+            plain_selector = re.sub(r'/\*.*?\*/', '', selector, flags=re.S).strip()
+            for v in variants[1:]:
+                media.append(f'@media (max-width: {v["width"]}px) {{\n    {plain_selector} {{ '
+                             f'background-image: url("/static/{v["jpeg"]}"); background-image: {_image_set(v)}; }}\n}}')
+            return f'background-image: url("/static/{widest["jpeg"]}"); background-image: {_image_set(widest)};'
+        return f'{selector}{{{BG_RE.sub(background, body)}}}'
+
+    css = RULE_RE.sub(rule, css)
+    css = URL_RE.sub(lambda m: f'url("/static/{files[m.group(2)]}")' if m.group(2) in files else m.group(0), css)
+    if media:
+        css += '\n\n/* Smaller background variants (generated by assets.py) */\n' + '\n'.join(media) + '\n'
+    return css
+
+
+def build(static_dir):
+    out_dir = os.path.join(static_dir, DIST)
+    manifest = {'source': source_key(static_dir), 'files': {}, 'images': {}}
+    # Stylesheets last: they embed the hashed names of the images they use
+    for rel in sorted(_sources(static_dir), key=lambda r: r.lower().endswith('.css')):
+        with open(os.path.join(static_dir, rel), 'rb') as f:
+            data = f.read()
+        ext = os.path.splitext(rel)[1].lower()
+        if ext == '.css':
+            data = rewrite_css(data.decode('utf-8'), manifest).encode('utf-8')
+        hashed = _hashed_name(rel, data)
+        _emit(out_dir, hashed, data)
+        manifest['files'][rel] = f'{DIST}/{hashed}'
+        if ext in RESIZABLE:
+            root = os.path.splitext(rel)[0]
+            variants = []
+            for width, jpeg, webp in _image_variants(data):
+                jpeg_name = _hashed_name(f'{root}-{width}.jpg', jpeg)
+                webp_name = _hashed_name(f'{root}-{width}.webp', webp)
+                _emit(out_dir, jpeg_name, jpeg)
+                _emit(out_dir, webp_name, webp)
+                variants.append({'width': width, 'jpeg': f'{DIST}/{jpeg_name}', 'webp': f'{DIST}/{webp_name}'})
+            if variants:
+                manifest['images'][rel] = variants
+    _write(os.path.join(out_dir, 'manifest.json'), json.dumps(manifest, indent=2, sort_keys=True).encode())
+    return manifest
+
+
+def load(static_dir, rebuild=True):
+    """The current manifest, rebuilding it first if the sources changed since the last build."""
+    try:
+        with open(os.path.join(static_dir, DIST, 'manifest.json')) as f:
+            manifest = json.load(f)
+        if not rebuild or manifest.get('source') == source_key(static_dir):
+            return manifest
+    except (OSError, ValueError):
+        if not rebuild:
+            return None
+    return build(static_dir)
+
+
+def prune(static_dir, manifest):
+    """Delete built files no longer in the manifest (old hashes); returns how many were removed."""
+    keep = set(manifest['files'].values())
+    for variants in manifest['images'].values():
+        for v in variants:
+            keep.update((v['jpeg'], v['webp']))
+    keep = {p for k in keep for p in (k, k + '.gz', k + '.br')} | {f'{DIST}/manifest.json'}
+    removed = 0
+    for rel in os.listdir(os.path.join(static_dir, DIST)):
+        if f'{DIST}/{rel}' not in keep:
+            os.remove(os.path.join(static_dir, DIST, rel))
+            removed += 1
+    return removed
+
+
+def init_app(app):
+    if (os.getenv('ASSET_PIPELINE') or '1') == '0':
+        return
+    from flask import request, send_from_directory
+    static_dir = app.static_folder
+    try:
+        manifest = load(static_dir)
+    except OSError:
+        return  # read-only checkout without a build: serve the plain files
+    files = manifest['files']
+
+    @app.url_defaults
+    def hashed_static_url(endpoint, values):
+        if endpoint == 'static' and values.get('filename') in files:
+            values['filename'] = files[values['filename']]
+
+    plain_static = app.view_functions['static']
+
+    def static(filename):
+        if not filename.startswith(DIST + '/'):
+            return plain_static(filename=filename)
+        response = None
+        for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+            if request.accept_encodings[encoding] and os.path.isfile(os.path.join(static_dir, filename + suffix)):
+                response = send_from_directory(static_dir, filename + suffix,
+                                               mimetype=mimetypes.guess_type(filename)[0])
+                response.headers['Content-Encoding'] = encoding
+                response.headers.pop('Content-Disposition', None)  # would name the .gz file
+                break
+        if response is None:
+            response = plain_static(filename=filename)
+        response.headers['Cache-Control'] = IMMUTABLE
+        response.headers['Vary'] = 'Accept-Encoding'
+        return response
+
+    app.view_functions['static'] = static
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Build hashed, precompressed static assets into static/dist')
+    parser.add_argument('--static', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static'))
+    args = parser.parse_args(argv)
+    manifest = build(args.static)
+    removed = prune(args.static, manifest)
+    for rel, built in sorted(manifest['files'].items()):
+        print(f'{rel} -> {built}')
+    for rel, variants in sorted(manifest['images'].items()):
+        print(f'{rel}: ' + ', '.join(f"{v['width']}px" for v in variants))
+    print(f'brotli: {"yes" if brotli else "no (pip install brotli)"}  '
+          f'image variants: {"yes" if Image else "no (pip install Pillow)"}  pruned: {removed}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,20 @@
+"""Benchmarks and load tests.
+
+    python -m benchmarks.datagen --help     # synthetic dataset at a chosen scale
+    python -m benchmarks.loadtest --help    # concurrent clients against the real endpoints
+    python benchmarks/bench_*.py            # focused micro-benchmarks
+
+Nothing here touches the repository's bus_booking.db: every run works in its
+own directory.
+"""
+import os
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines')
+
+
+def pct(values, p):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * p))]
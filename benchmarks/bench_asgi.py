@@ -0,0 +1,110 @@
+"""Compare the async ASGI read APIs (asgi.py) with the Flask WSGI handlers.
+
+Usage: python benchmarks/bench_asgi.py [--requests 2000] [--concurrency 50]
+
+Both stacks are driven in-process against a copy of bus_booking.db in a temp
+directory: the ASGI app through asyncio tasks, the WSGI app through a thread
+pool of Flask test clients (one worker thread per in-flight request, as with a
+threaded WSGI server). Reports requests/sec and p50/p99 latency per stack.
+"""
+import os
+import sys
+import time
+import shutil
+import asyncio
+import argparse
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+PATHS = [
+    ('/api/buses', 'from=Hyd'),
+    ('/api/buses/12/seats', ''),
+    ('/api/locations', 'q=h'),
+    ('/api/buses', 'date=2025-11-06'),
+]
+
+
+def pct(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def report(label, elapsed, timings):
+    print(f"{label:<6} {len(timings) / elapsed:>10.1f} req/s   p50={pct(timings, 0.5) * 1000:.2f} ms   "
+          f"p99={pct(timings, 0.99) * 1000:.2f} ms")
+
+
+async def run_asgi(application, cookie, total, concurrency):
+    sem = asyncio.Semaphore(concurrency)
+    timings = []
+
+    async def one(i):
+        path, qs = PATHS[i % len(PATHS)]
+        scope = {'type': 'http', 'method': 'GET', 'path': path, 'query_string': qs.encode(),
+                 'headers': [(b'cookie', f'session={cookie}'.encode())]}
+        status = {}
+
+        async def receive():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                status['code'] = message['status']
+
+        async with sem:
+            t0 = time.perf_counter()
+            await application(scope, receive, send)
+            timings.append(time.perf_counter() - t0)
+        assert status['code'] == 200, status
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total)))
+    return time.perf_counter() - started, timings
+
+
+def run_wsgi(flask_app, cookie, total, concurrency):
+    def one(i):
+        path, qs = PATHS[i % len(PATHS)]
+        client = flask_app.test_client()
+        client.set_cookie('session', cookie)
+        t0 = time.perf_counter()
+        resp = client.get(f'{path}?{qs}' if qs else path)
+        elapsed = time.perf_counter() - t0
+        assert resp.status_code == 200, resp.status_code
+        return elapsed
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        timings = list(pool.map(one, range(total)))
+    return time.perf_counter() - started, timings
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=50)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench_asgi_')
+    os.environ['SQLITE_PATH'] = shutil.copy(os.path.join(ROOT, 'bus_booking.db'), workdir)
+    from app import app as flask_app
+    import asgi
+
+    cookie = flask_app.session_interface.get_signing_serializer(flask_app).dumps({'user_id': 1})
+    print(f"driver: {'aiosqlite' if asgi.aiosqlite else 'thread fallback'}  "
+          f"requests={args.requests} concurrency={args.concurrency}")
+    report('wsgi', *run_wsgi(flask_app, cookie, args.requests, args.concurrency))
+
+    async def asgi_run():
+        try:
+            return await run_asgi(asgi.api, cookie, args.requests, args.concurrency)
+        finally:
+            await asgi.close_pools()
+    report('asgi', *asyncio.run(asgi_run()))
+
+
+if __name__ == '__main__':
+    main()
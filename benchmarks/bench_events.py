@@ -0,0 +1,85 @@
+"""Event feed deltas versus re-downloading the full bookings export.
+
+Usage: python benchmarks/bench_events.py [--bookings 50000] [--changes 10,100,1000] [--limit 1000]
+
+Generates a dataset, then simulates a downstream consumer syncing after each
+burst of --changes payments (made through /api/bookings/<id>/pay, so each one
+writes an event). Per burst it times pulling the delta from /admin/events
+(paging with --limit from the consumer's cursor until `more` is false) and
+one full /admin/export/bookings.csv, the way finance and CRM sync today, and
+reports bytes moved and wall time for each. Finally it replays the whole log
+from cursor 0 for raw feed throughput in events/s. Sizes are uncompressed
+(the test client sends no Accept-Encoding).
+"""
+import os
+import sys
+import time
+import random
+import shutil
+import argparse
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def pull(client, cursor, limit):
+    """Drain the feed from cursor; returns (events, bytes, new cursor)."""
+    events = size = 0
+    while True:
+        resp = client.get(f'/admin/events?after={cursor}&limit={limit}')
+        page = resp.get_json()
+        size += len(resp.data)
+        events += len(page['events'])
+        cursor = page['cursor']
+        if not page['more']:
+            return events, size, cursor
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--bookings', type=int, default=50000)
+    parser.add_argument('--changes', default='10,100,1000')
+    parser.add_argument('--limit', type=int, default=1000, help='feed page size')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    from benchmarks import datagen
+    workdir = tempfile.mkdtemp(prefix='bench_events_')
+    try:
+        info = datagen.generate(workdir, services=200, days=30, users=1000, bookings=args.bookings, log=lambda *_: None)
+        os.environ['SQLITE_PATH'] = info['path']
+        import app as webapp
+        webapp.create_app()
+        client = webapp.app.test_client()
+        with client.session_transaction() as sess:
+            sess['user_id'] = 1
+            sess['role'] = 'admin'
+        booking_ids = [r['id'] for r in webapp.db_fetch_all('SELECT id FROM bookings')]
+        rnd = random.Random(args.seed)
+        _, _, cursor = pull(client, 0, args.limit)
+
+        print(f"bookings={len(booking_ids)} page limit={args.limit}")
+        print(f"{'changes':>8} {'feed events':>11} {'feed bytes':>11} {'feed ms':>8} {'export bytes':>13} {'export ms':>10} {'bytes x':>8} {'time x':>7}")
+        for changes in (int(x) for x in args.changes.split(',')):
+            for booking_id in rnd.sample(booking_ids, min(changes, len(booking_ids))):
+                client.post(f'/api/bookings/{booking_id}/pay')
+            t0 = time.perf_counter()
+            events, feed_bytes, cursor = pull(client, cursor, args.limit)
+            feed_s = time.perf_counter() - t0
+            t0 = time.perf_counter()
+            export_bytes = len(client.get('/admin/export/bookings.csv').data)
+            export_s = time.perf_counter() - t0
+            print(f"{changes:>8} {events:>11} {feed_bytes:>11} {feed_s * 1000:>8.1f} {export_bytes:>13} {export_s * 1000:>10.1f} "
+                  f"{export_bytes / max(feed_bytes, 1):>7.0f}x {export_s / max(feed_s, 1e-9):>6.0f}x")
+
+        t0 = time.perf_counter()
+        events, size, _ = pull(client, 0, args.limit)
+        elapsed = time.perf_counter() - t0
+        print(f"full replay: {events} events, {size / 1024:.0f} KB in {elapsed:.2f}s = {events / elapsed:.0f} events/s")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""Peak memory and time of a day's boarding manifest as the fleet grows.
+
+Usage: python benchmarks/bench_manifest.py [--fleets 200,800,3200] [--occupancy 0.8]
+
+For each fleet size generates one day of trips (one per service) with about
+--occupancy of the seats booked, then writes the day's CSV manifest two ways:
+streamed (manifest.stream_rows + departures + csv_chunks, what the endpoint
+and CLI do) and the all-in-memory way (fetchall, then build the file). Peak
+Python allocations come from tracemalloc. Streamed memory should stay flat
+while the fetchall column grows with the fleet.
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def measure(fn):
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    size = fn()
+    elapsed = time.perf_counter() - t0
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return size, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--fleets', default='200,800,3200')
+    parser.add_argument('--occupancy', type=float, default=0.8)
+    args = parser.parse_args()
+
+    import database as dbmod
+    import manifest
+    from benchmarks import datagen
+    print(f"{'departures':>10} {'seats':>8} {'streamed peak':>14} {'fetchall peak':>14} {'streamed':>9} {'fetchall':>9}")
+    for fleet in (int(x) for x in args.fleets.split(',')):
+        workdir = tempfile.mkdtemp(prefix='bench_manifest_')
+        try:
+            info = datagen.generate(workdir, services=fleet, days=1, users=100,
+                                    bookings=int(fleet * 40 * args.occupancy / 2), log=lambda *_: None)
+            conn = dbmod.connect_sqlite(info['path'])
+            day = conn.execute('SELECT MIN(journey_date) FROM trips').fetchone()[0]
+
+            def streamed():
+                size = 0  # stands in for the socket / file: only the length is kept
+                for chunk in manifest.csv_chunks(manifest.departures(manifest.stream_rows(conn, False, day))):
+                    size += len(chunk)
+                return size
+
+            def fetchall():
+                sql, params = manifest.query(day)
+                rows = conn.execute(sql, params).fetchall()
+                text = ''.join(manifest.csv_chunks(list(manifest.departures(iter(rows)))))
+                return len(text)
+
+            seats = conn.execute('SELECT COUNT(*) FROM booked_seats WHERE journey_date = ?', (day,)).fetchone()[0]
+            size_a, time_a, peak_a = measure(streamed)
+            size_b, time_b, peak_b = measure(fetchall)
+            assert size_a == size_b
+            conn.close()
+            print(f"{fleet:>10} {seats:>8} {peak_a / 1024:>11.0f} KB {peak_b / 1024:>11.0f} KB "
+                  f"{time_a * 1000:>6.0f} ms {time_b * 1000:>6.0f} ms")
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""Render time of the cached HTML pages with the page cache on and off.
+
+Usage: python benchmarks/bench_page_cache.py [--services 200] [--days 30] [--requests 300]
+
+Generates a dataset (services x days trips, so /admin/buses lists that many
+rows), then times GET /, /help and /admin/buses through the Flask test client
+with PAGE_CACHE_ENABLED off and on. Also reports the first render of each
+template in a fresh process, i.e. what precompiling at startup takes off the
+first request.
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks import pct
+
+PAGES = ['/', '/help', '/admin/buses']
+COMPILE_PROBE = """
+import time, jinja2
+t0 = time.perf_counter()
+env = jinja2.Environment(loader=jinja2.FileSystemLoader('templates'))
+for name in ('index.html', 'help.html', 'admin_buses.html'):
+    env.get_template(name)
+print((time.perf_counter() - t0) * 1000)
+"""
+
+
+def time_pages(client, requests):
+    results = {}
+    for path in PAGES:
+        client.get(path)  # settle: fills the cache when it is on
+        timings = []
+        for _ in range(requests):
+            t0 = time.perf_counter()
+            resp = client.get(path)
+            timings.append(time.perf_counter() - t0)
+            assert resp.status_code == 200, (path, resp.status_code)
+        results[path] = timings
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--services', type=int, default=200)
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--requests', type=int, default=300)
+    args = parser.parse_args()
+
+    from benchmarks import datagen
+    workdir = tempfile.mkdtemp(prefix='bench_pages_')
+    try:
+        info = datagen.generate(workdir, services=args.services, days=args.days, users=10, bookings=0, log=lambda *_: None)
+        os.environ['SQLITE_PATH'] = info['path']
+        import app as webapp
+        client = webapp.app.test_client()
+        with client.session_transaction() as sess:
+            sess['user_id'] = 1
+            sess['user_email'] = 'admin@example.com'
+            sess['role'] = 'admin'
+
+        print(f"trips={info['trips']} requests/page={args.requests}")
+        print(f"{'page':<14} {'uncached p50':>13} {'cached p50':>11} {'uncached p99':>13} {'cached p99':>11} {'speedup':>8}")
+        webapp.PAGE_CACHE_ENABLED = False
+        off = time_pages(client, args.requests)
+        webapp.PAGE_CACHE_ENABLED = True
+        on = time_pages(client, args.requests)
+        for path in PAGES:
+            a, b = off[path], on[path]
+            print(f"{path:<14} {pct(a, 0.5) * 1000:>10.2f} ms {pct(b, 0.5) * 1000:>8.2f} ms "
+                  f"{pct(a, 0.99) * 1000:>10.2f} ms {pct(b, 0.99) * 1000:>8.2f} ms {sum(a) / sum(b):>7.1f}x")
+
+        compile_ms = float(subprocess.check_output([sys.executable, '-c', COMPILE_PROBE], cwd=ROOT, text=True))
+        print(f"template compile moved to startup: {compile_ms:.1f} ms for the three templates")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""Login throughput at each password hashing cost.
+
+Usage: python benchmarks/bench_password_hashing.py [--logins 40] [--threads 4] [method ...]
+
+Runs against a throwaway SQLite database in a temp directory so the real
+bus_booking.db is never touched.
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+DEFAULT_METHODS = [
+    'pbkdf2:sha256:100000',
+    'pbkdf2:sha256:600000',
+    'scrypt:16384:8:1',
+    'scrypt:32768:8:1',
+]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('methods', nargs='*', default=DEFAULT_METHODS)
+    parser.add_argument('--logins', type=int, default=40)
+    parser.add_argument('--threads', type=int, default=4)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench_pwhash_')
+    os.environ['SQLITE_PATH'] = os.path.join(workdir, 'bus_booking.db')
+    import database as dbmod
+    conn = dbmod.get_conn()
+    dbmod.setup_schema(conn)
+    conn.close()
+
+    import passwords
+    from app import app
+    app.config['TESTING'] = True
+    passwords.configure(workers=args.threads)
+
+    print(f"{'method':<24} {'logins/s':>10} {'avg ms':>10}")
+    for idx, method in enumerate(args.methods):
+        passwords.configure(method=method)
+        email = f'bench{idx}@example.com'
+        conn = dbmod.get_conn()
+        conn.execute(
+            'INSERT INTO users (email, password_hash, created_at, role) VALUES (?, ?, ?, ?)',
+            (email, passwords.hash_password('secret123'), datetime.now().isoformat(), 'customer')
+        )
+        conn.commit()
+        conn.close()
+
+        def one_login(_):
+            with app.test_client() as c:
+                t0 = time.perf_counter()
+                resp = c.post('/login', data={'email': email, 'password': 'secret123'})
+                assert resp.status_code in (302, 303), resp.status_code
+                return time.perf_counter() - t0
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.threads) as pool:
+            timings = list(pool.map(one_login, range(args.logins)))
+        elapsed = time.perf_counter() - started
+        print(f"{method:<24} {args.logins / elapsed:>10.1f} {1000 * sum(timings) / len(timings):>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""Cost of the request profiler when it is off, and of a profiled request.
+
+Usage: python benchmarks/bench_profiler.py [--requests 300] [--paths /api/buses,/admin/dashboard]
+
+Generates a small dataset, then times each path through the Flask test client
+three ways: without the profiling hooks registered, with the hooks registered
+but not triggered (the normal production state), and with ?_profile=1 (a full
+cProfile capture, including saving it). The off-vs-unregistered difference is
+the per-request overhead the profiler adds when nobody asked for it.
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks import pct
+
+
+def timed(client, path, n):
+    latencies = []
+    for _ in range(n):
+        t0 = time.perf_counter()
+        client.get(path).close()
+        latencies.append(time.perf_counter() - t0)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=300)
+    parser.add_argument('--paths', default='/api/buses,/admin/dashboard')
+    args = parser.parse_args()
+
+    from benchmarks import datagen
+    workdir = tempfile.mkdtemp(prefix='bench_profiler_')
+    try:
+        info = datagen.generate(workdir, services=100, days=7, users=100, bookings=2000, log=lambda *_: None)
+        os.environ['SQLITE_PATH'] = info['path']
+        import app as webapp
+        import profiling
+        profiling.PROFILE_DIR = os.path.join(workdir, 'profiles')
+        profiling.KEEP = 1000
+        webapp.create_app()
+        client = webapp.app.test_client()
+        with client.session_transaction() as sess:
+            sess['user_id'] = 1
+            sess['role'] = 'admin'
+
+        funcs = webapp.app.before_request_funcs, webapp.app.after_request_funcs
+        registered = [list(f[None]) for f in funcs]
+        unregistered = [[h for h in hooks if h.__name__ not in ('_profile_begin', '_profile_end')] for hooks in registered]
+        print(f"{'path':<20} {'unregistered p50':>17} {'off p50':>9} {'overhead':>9} {'profiled p50':>13}")
+        for path in args.paths.split(','):
+            timed(client, path, 20)  # warm caches
+            for f, hooks in zip(funcs, unregistered):
+                f[None] = hooks
+            bare = pct(timed(client, path, args.requests), 0.5)
+            for f, hooks in zip(funcs, registered):
+                f[None] = hooks
+            off = pct(timed(client, path, args.requests), 0.5)
+            sep = '&' if '?' in path else '?'
+            profiled = pct(timed(client, f'{path}{sep}_profile=1', max(10, args.requests // 10)), 0.5)
+            print(f"{path:<20} {bare * 1000:>14.3f} ms {off * 1000:>6.3f} ms {(off - bare) * 1e6:>6.0f} us {profiled * 1000:>10.2f} ms")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""Multi-leg route search over a synthetic network.
+
+Usage: python benchmarks/bench_routes.py [--cities 60] [--trips 5000] [--days 7] [--queries 200]
+
+Builds routing.RouteGraph from generated trips (no database needed) and reports
+graph build time plus search latency percentiles and how often the per-query
+latency budget was hit.
+"""
+import os
+import sys
+import time
+import random
+import argparse
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import routing
+
+
+def synthetic_trips(cities, trips, days, seed=7):
+    rnd = random.Random(seed)
+    names = [f'City{i:03d}' for i in range(cities)]
+    # A few hubs get most of the traffic, like Hyderabad/Vijayawada in the seed data
+    hubs = names[:max(2, cities // 10)]
+    start = datetime(2025, 11, 1)
+    rows = []
+    for i in range(trips):
+        a = rnd.choice(hubs) if rnd.random() < 0.5 else rnd.choice(names)
+        b = rnd.choice(names)
+        while b == a:
+            b = rnd.choice(names)
+        dep = start + timedelta(days=rnd.randrange(days), minutes=rnd.randrange(0, 24 * 60, 15))
+        arr = dep + timedelta(minutes=rnd.randrange(90, 12 * 60, 15))
+        rows.append({
+            'id': i + 1, 'name': f'Operator{i % 40}', 'from_city': a, 'to_city': b,
+            'depart_time': dep.strftime('%Y-%m-%d %H:%M'), 'arrive_time': arr.strftime('%Y-%m-%d %H:%M'),
+            'fare': rnd.randrange(200, 1500, 10),
+        })
+    return names, start, rows
+
+
+def pct(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--cities', type=int, default=60)
+    parser.add_argument('--trips', type=int, default=5000)
+    parser.add_argument('--days', type=int, default=7)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--max-legs', type=int, default=3)
+    parser.add_argument('--budget-ms', type=int, default=250)
+    args = parser.parse_args()
+
+    names, start, rows = synthetic_trips(args.cities, args.trips, args.days)
+    t0 = time.perf_counter()
+    graph = routing.build_graph(rows)
+    build_ms = (time.perf_counter() - t0) * 1000
+
+    rnd = random.Random(11)
+    timings, found, truncated = [], 0, 0
+    for _ in range(args.queries):
+        a, b = rnd.sample(names, 2)
+        day = start + timedelta(days=rnd.randrange(args.days))
+        t0 = time.perf_counter()
+        itineraries, complete = routing.search(
+            graph, a, b, depart_after=day, depart_before=day + timedelta(hours=23, minutes=59),
+            max_legs=args.max_legs, budget_ms=args.budget_ms,
+        )
+        timings.append((time.perf_counter() - t0) * 1000)
+        found += bool(itineraries)
+        truncated += not complete
+
+    print(f"graph: {graph.size} trips, {len(graph.cities)} cities, built in {build_ms:.1f} ms")
+    print(f"queries: {args.queries}  with results: {found}  budget hit: {truncated}")
+    print(f"latency ms  p50={pct(timings, 0.50):.2f}  p95={pct(timings, 0.95):.2f}  "
+          f"p99={pct(timings, 0.99):.2f}  max={max(timings):.2f}")
+
+
+if __name__ == '__main__':
+    main()
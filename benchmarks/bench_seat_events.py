@@ -0,0 +1,117 @@
+"""Broadcast latency of the seat-map pub/sub (seat_events.py).
+
+Usage: python benchmarks/bench_seat_events.py [--subscribers 5000] [--events 50] [--threads 200]
+
+A publisher thread pushes --events seat updates into one (bus_id, date) channel
+that --subscribers asyncio tasks are waiting on (the asgi.py stream path), then
+the same with --threads blocking subscribers (the Flask stream path). Latency is
+publish() call to the subscriber holding the event; reports p50/p99/max and the
+time for the whole fan-out of one event to land.
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import threading
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import seat_events
+
+KEY = (1, '2025-11-06')
+
+
+def pct(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def report(label, latencies, fanout):
+    print(f"{label:<7} deliveries={len(latencies):>7}   p50={pct(latencies, 0.5) * 1000:.2f} ms   "
+          f"p99={pct(latencies, 0.99) * 1000:.2f} ms   max={max(latencies) * 1000:.2f} ms   "
+          f"full fan-out p50={pct(fanout, 0.5) * 1000:.2f} ms")
+
+
+def publisher(broadcaster, events, published, ready, interval):
+    ready.wait()
+    for i in range(events):
+        time.sleep(interval)
+        published[broadcaster.cursor(KEY) + 1] = time.perf_counter()
+        broadcaster.publish(KEY[0], KEY[1], 'booked', [str(i % 40 + 1)])
+
+
+def collect(published, received):
+    latencies, fanout = [], []
+    by_seq = {}
+    for seq, at in received:
+        latencies.append(at - published[seq])
+        by_seq[seq] = max(by_seq.get(seq, 0), at)
+    for seq, last in by_seq.items():
+        fanout.append(last - published[seq])
+    return latencies, fanout
+
+
+async def run_async(broadcaster, subscribers, events, interval):
+    published, received = {}, []
+    ready = threading.Event()
+    connected = 0
+
+    async def subscriber():
+        nonlocal connected
+        cursor = broadcaster.cursor(KEY)
+        connected += 1
+        if connected == subscribers:
+            ready.set()
+        while cursor < events:
+            evs, cursor, _ = await broadcaster.wait_async(KEY, cursor, timeout=30)
+            now = time.perf_counter()
+            received.extend((seq, now) for seq, _ in evs)
+
+    pub = threading.Thread(target=publisher, args=(broadcaster, events, published, ready, interval))
+    pub.start()
+    await asyncio.gather(*(subscriber() for _ in range(subscribers)))
+    pub.join()
+    return collect(published, received)
+
+
+def run_threads(broadcaster, subscribers, events, interval):
+    published, received = {}, []
+    lock = threading.Lock()
+    ready = threading.Event()
+    barrier = threading.Barrier(subscribers, action=ready.set)
+
+    def subscriber():
+        cursor = broadcaster.cursor(KEY)
+        barrier.wait()
+        while cursor < events:
+            evs, cursor, _ = broadcaster.wait(KEY, cursor, timeout=30)
+            now = time.perf_counter()
+            with lock:
+                received.extend((seq, now) for seq, _ in evs)
+
+    workers = [threading.Thread(target=subscriber) for _ in range(subscribers)]
+    for w in workers:
+        w.start()
+    publisher(broadcaster, events, published, ready, interval)
+    for w in workers:
+        w.join()
+    return collect(published, received)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--subscribers', type=int, default=5000)
+    parser.add_argument('--threads', type=int, default=200)
+    parser.add_argument('--events', type=int, default=50)
+    parser.add_argument('--interval', type=float, default=0.02, help='seconds between publishes')
+    args = parser.parse_args()
+
+    print(f"events={args.events} interval={args.interval}s")
+    report('asyncio', *asyncio.run(run_async(seat_events.SeatBroadcaster(), args.subscribers, args.events, args.interval)))
+    report('threads', *run_threads(seat_events.SeatBroadcaster(), args.threads, args.events, args.interval))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+"""Concurrent bookings against SQLite under each runtime profile (database.SQLITE_PROFILES).
+
+Usage: python benchmarks/bench_sqlite_writes.py [--writers 4] [--readers 2] [--bookings 150]
+                                                [--profiles default,production,production:FULL]
+
+Each profile gets a fresh copy of one generated dataset. --writers processes
+POST /api/bookings (distinct trips per writer, so failures are lock errors and
+not seat conflicts) while --readers processes search /api/buses until the
+writers finish, i.e. separate gunicorn workers sharing one file. 'profile:SYNC'
+overrides synchronous for that run. Reports bookings/sec, write p50/p99, failed
+writes and reader throughput.
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import multiprocessing as mp
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks import pct
+
+
+def _client(db_path, profile, synchronous):
+    os.environ['SQLITE_PATH'] = db_path
+    os.environ['SQLITE_PROFILE'] = profile
+    if synchronous:
+        os.environ['SQLITE_SYNCHRONOUS'] = synchronous
+    from app import app as flask_app
+    client = flask_app.test_client()
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+    return client
+
+
+def writer(db_path, profile, synchronous, trips, bookings, start, results):
+    client = _client(db_path, profile, synchronous)
+    start.wait()
+    latencies, failed = [], 0
+    for i in range(bookings):
+        trip = trips[i % len(trips)]
+        seat = str(i // len(trips) + 1)
+        t0 = time.perf_counter()
+        resp = client.post('/api/bookings', json={'bus_id': trip, 'name': 'Bench', 'phone': '9000000000',
+                                                  'seat_numbers': [seat], 'passengers': [{'name': 'Bench'}]})
+        latencies.append(time.perf_counter() - t0)
+        if resp.status_code != 200:
+            failed += 1
+    results.put(('w', latencies, failed))
+
+
+def reader(db_path, profile, synchronous, start, stop, results):
+    client = _client(db_path, profile, synchronous)
+    start.wait()
+    done = failed = 0
+    while not stop.is_set():
+        if client.get('/api/buses?from=Hyd').status_code != 200:
+            failed += 1
+        done += 1
+    results.put(('r', done, failed))
+
+
+def run_profile(base_db, label, writers, readers, bookings):
+    profile, _, synchronous = label.partition(':')
+    workdir = tempfile.mkdtemp(prefix='bench_sqlite_')
+    db_path = shutil.copy(base_db, os.path.join(workdir, 'bus_booking.db'))
+    import sqlite3
+    conn = sqlite3.connect(db_path)
+    trip_ids = [r[0] for r in conn.execute('SELECT id FROM trips ORDER BY id')]
+    conn.close()
+
+    ctx = mp.get_context('spawn')
+    start, stop, results = ctx.Barrier(writers + readers + 1), ctx.Event(), ctx.Queue()
+    procs = []
+    for w in range(writers):
+        mine = trip_ids[w::writers][:50]
+        procs.append(ctx.Process(target=writer, args=(db_path, profile, synchronous, mine, bookings, start, results)))
+    for _ in range(readers):
+        procs.append(ctx.Process(target=reader, args=(db_path, profile, synchronous, start, stop, results)))
+    for p in procs:
+        p.start()
+    start.wait()
+    t0 = time.perf_counter()
+    latencies, failed_writes = [], 0
+    for _ in range(writers):
+        _, lat, failed = results.get()
+        latencies.extend(lat)
+        failed_writes += failed
+    elapsed = time.perf_counter() - t0
+    stop.set()
+    reads = failed_reads = 0
+    for _ in range(readers):
+        _, done, failed = results.get()
+        reads += done
+        failed_reads += failed
+    for p in procs:
+        p.join()
+    shutil.rmtree(workdir, ignore_errors=True)
+    ok = len(latencies) - failed_writes
+    print(f"{label:<20} {ok / elapsed:>9.1f} {pct(latencies, 0.5) * 1000:>9.2f} {pct(latencies, 0.99) * 1000:>9.2f} "
+          f"{failed_writes:>7} {reads / elapsed:>10.1f} {failed_reads:>7}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--readers', type=int, default=2)
+    parser.add_argument('--bookings', type=int, default=150, help='bookings per writer')
+    parser.add_argument('--profiles', default='default,production,production:FULL')
+    args = parser.parse_args()
+
+    from benchmarks import datagen
+    base = tempfile.mkdtemp(prefix='bench_sqlite_base_')
+    datagen.generate(base, services=100, days=10, users=50, bookings=0, log=lambda *_: None)
+    base_db = os.path.join(base, 'bus_booking.db')
+
+    print(f"writers={args.writers} readers={args.readers} bookings/writer={args.bookings}")
+    print(f"{'profile':<20} {'writes/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'failed':>7} {'reads/s':>10} {'failed':>7}")
+    for label in args.profiles.split(','):
+        run_profile(base_db, label.strip(), args.writers, args.readers, args.bookings)
+    shutil.rmtree(base, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""Cold-start time: importing app, create_app() and the first request.
+
+Usage: python benchmarks/bench_startup.py [--runs 5]
+
+Each run is a fresh interpreter against a copy of bus_booking.db. "unstamped"
+is a database that has never been initialised, so the schema steps run;
+"stamped" is the same copy after a first start, the usual restart case, where
+create_app() only reads the app_meta stamp. Reports medians in milliseconds.
+"""
+import os
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks import pct
+
+PROBE = """
+import json, time
+t0 = time.perf_counter()
+import app
+t1 = time.perf_counter()
+app.create_app()
+t2 = time.perf_counter()
+client = app.app.test_client()
+with client.session_transaction() as sess:
+    sess['user_id'] = 1
+    sess['role'] = 'admin'
+assert client.get('/api/buses').status_code == 200
+t3 = time.perf_counter()
+print(json.dumps({'import': t1 - t0, 'create_app': t2 - t1, 'first_request': t3 - t2}))
+"""
+
+
+def run_probe(db_path):
+    env = dict(os.environ, SQLITE_PATH=db_path)
+    out = subprocess.check_output([sys.executable, '-c', PROBE], cwd=ROOT, env=env, text=True)
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench_startup_')
+    try:
+        results = {'unstamped': [], 'stamped': []}
+        for i in range(args.runs):
+            path = shutil.copy(os.path.join(ROOT, 'bus_booking.db'), os.path.join(workdir, f'run{i}.db'))
+            results['unstamped'].append(run_probe(path))
+            results['stamped'].append(run_probe(path))
+        print(f"runs={args.runs}")
+        print(f"{'database':<10} {'import':>9} {'create_app':>11} {'1st request':>12} {'total':>9}")
+        for label, runs in results.items():
+            cols = [pct([r[k] for r in runs], 0.5) * 1000 for k in ('import', 'create_app', 'first_request')]
+            total = pct([sum(r.values()) for r in runs], 0.5) * 1000
+            print(f"{label:<10} {cols[0]:>6.1f} ms {cols[1]:>8.1f} ms {cols[2]:>9.1f} ms {total:>6.1f} ms")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
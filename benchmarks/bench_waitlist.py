@@ -0,0 +1,138 @@
+"""Waitlist promotion throughput while many bookings are cancelled at once.
+
+Usage: python benchmarks/bench_waitlist.py [--trips 20] [--waiters 60] [--threads 8]
+
+Generates a dataset, sells out --trips trips with one single-seat booking per
+seat, queues --waiters entries (1-3 seats each) per trip, then cancels every
+booking from --threads concurrent clients (a mass cancellation such as a
+service disruption refund). Each cancel frees its seat and promotes the queue
+in the same transaction. Reports cancels/s, promotions/s and cancel latency,
+and checks the outcome: no seat held twice, no seat left free while its
+trip's queue head fits, and promotions in queue order per trip.
+"""
+import os
+import sys
+import time
+import random
+import shutil
+import sqlite3
+import argparse
+import tempfile
+import threading
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks import pct
+
+
+def sell_out(path, trips, waiters, seed):
+    """Fill the first `trips` trips and queue waiters directly in SQLite; returns the booking ids to cancel."""
+    rnd = random.Random(seed)
+    conn = sqlite3.connect(path)
+    rows = conn.execute('''
+        SELECT t.id, t.journey_date, s.seats_total FROM trips t JOIN services s ON s.id = t.service_id
+        ORDER BY t.id LIMIT ?
+    ''', (trips,)).fetchall()
+    now = datetime.now().isoformat(sep=' ')
+    booking_ids = []
+    for trip_id, journey_date, seats_total in rows:
+        conn.execute('DELETE FROM booked_seats WHERE bus_id = ?', (trip_id,))
+        for seat in range(1, int(seats_total) + 1):
+            cur = conn.execute(
+                'INSERT INTO bookings (bus_id, journey_date, passenger_name, passenger_phone, seats_booked, booked_at, status, payment_status, user_id) '
+                'VALUES (?, ?, ?, ?, 1, ?, ?, ?, 1)', (trip_id, journey_date, 'Bench', '9000000000', now, 'confirmed', 'paid'))
+            conn.execute('INSERT INTO booked_seats (bus_id, journey_date, seat_no, booking_id) VALUES (?, ?, ?, ?)',
+                         (trip_id, journey_date, str(seat), cur.lastrowid))
+            booking_ids.append(cur.lastrowid)
+        conn.executemany(
+            'INSERT INTO waitlist (bus_id, journey_date, user_id, passenger_name, passenger_phone, seats, status, created_at) '
+            'VALUES (?, ?, 1, ?, ?, ?, ?, ?)',
+            [(trip_id, journey_date, f'Waiter {i}', '9000000001', rnd.choice((1, 1, 2, 3)), 'waiting', now) for i in range(waiters)])
+    conn.commit()
+    conn.close()
+    rnd.shuffle(booking_ids)
+    return [r[0] for r in rows], booking_ids
+
+
+def check(path, trip_ids):
+    conn = sqlite3.connect(path)
+    problems = []
+    for trip_id, seats_total in conn.execute(
+            f"SELECT t.id, s.seats_total FROM trips t JOIN services s ON s.id = t.service_id WHERE t.id IN ({','.join('?' * len(trip_ids))})",
+            trip_ids):
+        held = conn.execute('SELECT COUNT(*), COUNT(DISTINCT seat_no) FROM booked_seats WHERE bus_id = ?', (trip_id,)).fetchone()
+        if held[0] != held[1] or held[0] > seats_total:
+            problems.append(f'trip {trip_id}: {held[0]} holds on {held[1]} seats of {seats_total}')
+        head = conn.execute("SELECT seats FROM waitlist WHERE bus_id = ? AND status = 'waiting' ORDER BY id LIMIT 1", (trip_id,)).fetchone()
+        if head and seats_total - held[0] >= head[0]:
+            problems.append(f'trip {trip_id}: {seats_total - held[0]} seats free while the queue head wants {head[0]}')
+        order = [r[0] for r in conn.execute("SELECT booking_id FROM waitlist WHERE bus_id = ? AND status = 'promoted' ORDER BY id", (trip_id,))]
+        if order != sorted(order):
+            problems.append(f'trip {trip_id}: promotions out of queue order')
+    conn.close()
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--trips', type=int, default=20)
+    parser.add_argument('--waiters', type=int, default=60, help='queue entries per trip')
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    from benchmarks import datagen
+    workdir = tempfile.mkdtemp(prefix='bench_waitlist_')
+    try:
+        info = datagen.generate(workdir, services=max(args.trips, 10), days=1, users=10, bookings=0, log=lambda *_: None)
+        os.environ['SQLITE_PATH'] = info['path']
+        trip_ids, booking_ids = sell_out(info['path'], args.trips, args.waiters, args.seed)
+        import app as webapp
+        webapp.create_app()
+
+        todo = list(booking_ids)
+        lock = threading.Lock()
+        latencies, promoted, errors = [], [0], []
+
+        def worker():
+            client = webapp.app.test_client()
+            with client.session_transaction() as sess:
+                sess['user_id'] = 1
+                sess['role'] = 'customer'
+            while True:
+                with lock:
+                    if not todo:
+                        return
+                    booking_id = todo.pop()
+                t0 = time.perf_counter()
+                resp = client.post(f'/api/bookings/{booking_id}/cancel')
+                elapsed = time.perf_counter() - t0
+                with lock:
+                    latencies.append(elapsed)
+                    if resp.status_code == 200:
+                        promoted[0] += resp.get_json()['promoted']
+                    else:
+                        errors.append(resp.status_code)
+
+        threads = [threading.Thread(target=worker) for _ in range(args.threads)]
+        t0 = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        wall = time.perf_counter() - t0
+
+        print(f"trips={args.trips} seats={len(booking_ids)} waiters={args.trips * args.waiters} threads={args.threads}")
+        print(f"cancels: {len(latencies)} in {wall:.2f}s = {len(latencies) / wall:.0f}/s  errors: {len(errors)}")
+        print(f"promotions: {promoted[0]} = {promoted[0] / wall:.0f}/s")
+        print(f"cancel latency p50 {pct(latencies, 0.5) * 1000:.1f} ms  p99 {pct(latencies, 0.99) * 1000:.1f} ms")
+        problems = check(info['path'], trip_ids)
+        print('consistency: ' + ('ok' if not problems else '\n  '.join(['FAILED'] + problems)))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
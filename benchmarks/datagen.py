@@ -0,0 +1,197 @@
+"""Synthetic dataset generator.
+
+Usage: python -m benchmarks.datagen WORKDIR [--services 500] [--days 30] [--users 10000]
+                                            [--bookings 200000] [--seed 42]
+
+Creates WORKDIR/bus_booking.db with the app's own schema (app.init_db runs
+the startup migrations), trips through database.insert_buses, then users,
+bookings, booked_seats and passengers in large executemany batches. The same
+seed always yields the same data. User 1 is an admin (admin@bench.local).
+For millions of bookings raise --services/--days too: the trips need the seats
+(e.g. --services 2000 --days 60 --bookings 2000000).
+"""
+import os
+import sys
+import time
+import random
+import sqlite3
+import argparse
+import importlib
+from datetime import date, datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import database as dbmod
+
+CITIES = [
+    'Hyderabad', 'Vijayawada', 'Visakhapatnam', 'Tirupati', 'Guntur', 'Warangal', 'Karimnagar',
+    'Kurnool', 'Nellore', 'Rajahmundry', 'Kakinada', 'Anantapur', 'Kadapa', 'Ongole', 'Eluru',
+    'Khammam', 'Nizamabad', 'Srikakulam', 'Chittoor', 'Bengaluru', 'Chennai', 'Coimbatore',
+    'Mumbai', 'Pune', 'Nagpur', 'Madurai', 'Mysuru', 'Mangaluru', 'Hubballi', 'Belagavi',
+]
+OPERATORS = [
+    'APSRTC Garuda', 'APSRTC Express', 'TSRTC Rajadhani', 'TSRTC Super Luxury', 'Orange Travels',
+    'Kaveri Travels', 'Morning Star', 'Diwakar Travels', 'Jabbar Travels', 'SRS Travels',
+    'VRL Travels', 'Megha Travels', 'Neeta Travels', 'Komitla', 'SVKDT Travels', 'IntrCity',
+]
+FIRST_NAMES = ['Ravi', 'Sita', 'Kiran', 'Lakshmi', 'Arjun', 'Priya', 'Suresh', 'Anitha', 'Mahesh', 'Divya']
+LAST_NAMES = ['Reddy', 'Rao', 'Naidu', 'Sharma', 'Varma', 'Kumar', 'Chowdary', 'Goud']
+START_DATE = date(2025, 11, 1)
+BATCH = 50000
+PASSWORD = 'bench1234'
+
+
+def _batched(conn, sql, rows):
+    batch = []
+    for r in rows:
+        batch.append(r)
+        if len(batch) >= BATCH:
+            conn.executemany(sql, batch)
+            batch = []
+    if batch:
+        conn.executemany(sql, batch)
+
+
+def bootstrap_schema(workdir):
+    """Create workdir/bus_booking.db with the schema the app ensures at startup."""
+    os.makedirs(workdir, exist_ok=True)
+    path = os.path.join(workdir, 'bus_booking.db')
+    if os.path.exists(path):
+        os.remove(path)
+    previous = os.environ.get('SQLITE_PATH')
+    os.environ['SQLITE_PATH'] = path
+    try:
+        if 'app' in sys.modules:
+            webapp = importlib.reload(sys.modules['app'])
+        else:
+            webapp = importlib.import_module('app')
+        webapp.init_db()
+    finally:
+        if previous is None:
+            os.environ.pop('SQLITE_PATH', None)
+        else:
+            os.environ['SQLITE_PATH'] = previous
+    return path
+
+
+def trip_rows(rnd, services, days):
+    """Yield insert_buses rows: `services` recurring services, one trip per day for `days` days."""
+    for i in range(services):
+        a, b = rnd.sample(CITIES, 2)
+        hours = 2 + (abs(CITIES.index(a) - CITIES.index(b)) % 12)
+        depart = datetime.combine(START_DATE, datetime.min.time()) + timedelta(minutes=rnd.randrange(0, 24 * 60, 15))
+        seats = rnd.choice((36, 40, 40, 44, 48))
+        fare = 150 + hours * rnd.randrange(60, 110, 5)
+        name = f"{rnd.choice(OPERATORS)} {i + 1:04d}"
+        for d in range(days):
+            dep = depart + timedelta(days=d)
+            arr = dep + timedelta(hours=hours)
+            yield (name, a, b, dep.strftime('%Y-%m-%d %H:%M'), arr.strftime('%Y-%m-%d %H:%M'), seats, fare)
+
+
+def generate(workdir, services=500, days=30, users=10000, bookings=200000, seed=42, log=print):
+    rnd = random.Random(seed)
+    started = time.perf_counter()
+    path = bootstrap_schema(workdir)
+    conn = sqlite3.connect(path)
+    conn.execute('PRAGMA synchronous=OFF')
+    conn.execute('PRAGMA journal_mode=MEMORY')
+
+    trips = dbmod.insert_buses(conn, trip_rows(rnd, services, days), batch_size=5000)
+    log(f'trips: {trips} ({services} services x {days} days)')
+
+    from werkzeug.security import generate_password_hash
+    pwd_hash = generate_password_hash(PASSWORD, method='pbkdf2:sha256:1000')  # cheap on purpose
+    now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+    def user_rows():
+        yield ('admin@bench.local', pwd_hash, now, 'admin', 'Bench Admin', '9000000000')
+        for i in range(2, users + 1):
+            first, last = rnd.choice(FIRST_NAMES), rnd.choice(LAST_NAMES)
+            yield (f'user{i}@bench.local', pwd_hash, now, 'customer', f'{first} {last}', f'9{rnd.randrange(10**8, 10**9)}')
+    _batched(conn, 'INSERT INTO users (email, password_hash, created_at, role, name, phone) VALUES (?, ?, ?, ?, ?, ?)', user_rows())
+    conn.commit()
+    log(f'users: {users}')
+
+    trip_info = conn.execute(
+        'SELECT t.id, t.journey_date, s.seats_total FROM trips t JOIN services s ON s.id = t.service_id ORDER BY t.id'
+    ).fetchall()
+    next_seat = {}
+    # A fifth of the trips take most of the demand, as busy routes do
+    popular = trip_info[:max(1, len(trip_info) // 5)]
+    first_booking = (conn.execute('SELECT COALESCE(MAX(id), 0) FROM bookings').fetchone()[0]) + 1
+    booking_rows, seat_rows, passenger_rows = [], [], []
+    made = seats_made = full = 0
+
+    def flush():
+        conn.executemany(
+            'INSERT INTO bookings (id, bus_id, journey_date, passenger_name, passenger_phone, seats_booked, booked_at, status, '
+            'payment_status, payment_ref, user_id, coupon_code, discount_amount) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            booking_rows)
+        conn.executemany('INSERT INTO booked_seats (bus_id, journey_date, seat_no, booking_id) VALUES (?, ?, ?, ?)', seat_rows)
+        conn.executemany(
+            'INSERT INTO bookings_passengers (booking_id, seat_no, name, phone, email, age, gender) VALUES (?, ?, ?, ?, ?, ?, ?)',
+            passenger_rows)
+        booking_rows.clear(); seat_rows.clear(); passenger_rows.clear()
+
+    while made < bookings:
+        for _ in range(8):
+            trip_id, journey_date, seats_total = rnd.choice(popular) if rnd.random() < 0.7 else rnd.choice(trip_info)
+            taken = next_seat.get(trip_id, 0)
+            if taken < seats_total:
+                break
+        else:
+            if full >= len(trip_info):
+                log(f'every trip is full after {made} bookings')
+                break
+            continue
+        count = min(rnd.choice((1, 1, 2, 2, 3, 4)), seats_total - taken)
+        next_seat[trip_id] = taken + count
+        if taken + count >= seats_total:
+            full += 1
+        booking_id = first_booking + made
+        user_id = rnd.randrange(1, users + 1)
+        first, last = rnd.choice(FIRST_NAMES), rnd.choice(LAST_NAMES)
+        phone = f'9{rnd.randrange(10**8, 10**9)}'
+        booked_at = datetime.strptime(str(journey_date), '%Y-%m-%d') - timedelta(days=rnd.randrange(1, 30), minutes=rnd.randrange(1440))
+        status = 'cancelled' if rnd.random() < 0.08 else 'confirmed'
+        paid = rnd.random() < 0.7
+        coupon = 'TRIP100' if rnd.random() < 0.05 else None
+        booking_rows.append((
+            booking_id, trip_id, journey_date, f'{first} {last}', phone, count, booked_at.strftime('%Y-%m-%d %H:%M:%S'), status,
+            'paid' if paid else 'unpaid', f'TXN{booking_id}' if paid else None, user_id, coupon, 100.0 if coupon else 0.0,
+        ))
+        for n in range(taken + 1, taken + count + 1):
+            seat_rows.append((trip_id, journey_date, str(n), booking_id))
+            passenger_rows.append((booking_id, str(n), f'{rnd.choice(FIRST_NAMES)} {last}', None, None,
+                                   rnd.randrange(5, 80), rnd.choice(('M', 'F'))))
+        made += 1
+        seats_made += count
+        if len(booking_rows) >= BATCH:
+            flush()
+    flush()
+    conn.commit()
+    conn.execute('ANALYZE')
+    conn.close()
+    log(f'bookings: {made}  booked_seats: {seats_made}  in {time.perf_counter() - started:.1f}s -> {path}')
+    return {
+        'path': path, 'trips': trips, 'users': users, 'bookings': made, 'booked_seats': seats_made,
+        'first_booking': first_booking, 'seed': seed,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Generate a synthetic bus_booking.db for benchmarks.')
+    parser.add_argument('workdir')
+    parser.add_argument('--services', type=int, default=500)
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--bookings', type=int, default=200000)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args(argv)
+    generate(args.workdir, args.services, args.days, args.users, args.bookings, args.seed)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,333 @@
+"""Concurrent load test against the real endpoints.
+
+Usage:
+    python -m benchmarks.loadtest [--workdir DIR | --scale small|medium|large]
+                                  [--clients 16] [--requests 4000] [--mix search=40,seats=25,...]
+                                  [--url http://127.0.0.1:5000] [--save NAME] [--compare NAME]
+
+Without --workdir a dataset is generated with benchmarks.datagen at --scale.
+Requests go through Flask test clients in --clients threads (like a threaded
+WSGI server), or over HTTP to --url when a server is already running against
+the same workdir. Per scenario it reports throughput, p50/p95/p99 latency and
+DB queries per request (read from the Server-Timing header, so HTTP mode gets
+them too).
+
+--save NAME writes benchmarks/baselines/NAME.json; --compare NAME prints the
+deltas against it and exits 1 when p95 grows past --tolerance or a scenario
+issues more queries than before.
+"""
+import os
+import re
+import sys
+import json
+import time
+import logging
+import random
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks import BASELINE_DIR, pct
+from benchmarks import datagen
+
+SCALES = {
+    'small': dict(services=100, days=10, users=500, bookings=10000),
+    'medium': dict(services=500, days=30, users=10000, bookings=200000),
+    'large': dict(services=2000, days=60, users=100000, bookings=2000000),
+}
+DEFAULT_MIX = 'search=40,seats=25,booking=10,ticket=15,dashboard=5,export=5'
+QUERIES = re.compile(r'desc="(\d+) queries"')
+
+
+class Scenarios:
+    """Each scenario returns (method, path, json_body or None, role); ids come from the generated dataset."""
+
+    def __init__(self, info, cities, dates, rnd):
+        self.info = info
+        self.cities = cities
+        self.dates = dates
+        self.rnd = rnd
+        self.first_trip, self.last_trip = info['trip_range']
+
+    def search(self):
+        r = self.rnd
+        params = [f'from={r.choice(self.cities)[:4]}']
+        if r.random() < 0.5:
+            params.append(f'to={r.choice(self.cities)}')
+        if r.random() < 0.7:
+            params.append(f'date={r.choice(self.dates)}')
+        return 'GET', '/api/buses?' + '&'.join(params), None, 'customer'
+
+    def seats(self):
+        return 'GET', f'/api/buses/{self.rnd.randint(self.first_trip, self.last_trip)}/seats', None, 'customer'
+
+    def booking(self):
+        r = self.rnd
+        seat = str(r.randint(1, 36))
+        body = {'bus_id': r.randint(self.first_trip, self.last_trip), 'name': 'Load Test', 'phone': '9000000009',
+                'seat_numbers': [seat], 'passengers': [{'name': 'Load Test'}]}
+        return 'POST', '/api/bookings', body, 'customer'
+
+    def ticket(self):
+        first = self.info['first_booking']
+        return 'GET', f"/ticket/{self.rnd.randint(first, first + max(0, self.info['bookings'] - 1))}", None, 'admin'
+
+    def dashboard(self):
+        return 'GET', '/admin/dashboard', None, 'admin'
+
+    def export(self):
+        return 'GET', self.rnd.choice(('/admin/export/bookings.csv', '/admin/export/buses.csv')), None, 'admin'
+
+
+def parse_mix(spec):
+    mix = []
+    for part in spec.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if not hasattr(Scenarios, name):
+            raise SystemExit(f'unknown scenario: {name}')
+        mix.append((name, float(weight or 1)))
+    return mix
+
+
+def dataset_facts(workdir):
+    import sqlite3
+    conn = sqlite3.connect(os.path.join(workdir, 'bus_booking.db'))
+    try:
+        trip_range = conn.execute('SELECT MIN(id), MAX(id) FROM trips').fetchone()
+        first_booking, last_booking = conn.execute('SELECT MIN(id), MAX(id) FROM bookings').fetchone()
+        cities = [r[0] for r in conn.execute('SELECT DISTINCT from_city FROM services')]
+        dates = [r[0] for r in conn.execute('SELECT DISTINCT journey_date FROM trips')]
+        counts = {t: conn.execute(f'SELECT COUNT(*) FROM {t}').fetchone()[0]
+                  for t in ('trips', 'users', 'bookings', 'booked_seats')}
+    finally:
+        conn.close()
+    info = {
+        'trip_range': trip_range,
+        'first_booking': first_booking or 1,
+        'bookings': (last_booking - first_booking + 1) if first_booking else 0,
+        'counts': counts,
+    }
+    return info, cities, dates
+
+
+class InProcessClient:
+    def __init__(self, flask_app, cookies):
+        self.clients = {}
+        for role, cookie in cookies.items():
+            c = flask_app.test_client()
+            c.set_cookie('session', cookie)
+            self.clients[role] = c
+
+    def request(self, method, path, body, role):
+        resp = self.clients[role].open(path, method=method, json=body)
+        resp.get_data()
+        return resp.status_code, resp.headers.get('Server-Timing', '')
+
+
+class HttpClient:
+    def __init__(self, base_url, cookies):
+        self.base = base_url.rstrip('/')
+        self.cookies = cookies
+
+    def request(self, method, path, body, role):
+        data = json.dumps(body).encode() if body is not None else None
+        req = urllib.request.Request(self.base + path, data=data, method=method)
+        req.add_header('Cookie', f'session={self.cookies[role]}')
+        if data is not None:
+            req.add_header('Content-Type', 'application/json')
+        try:
+            with urllib.request.urlopen(req, timeout=60) as resp:
+                resp.read()
+                return resp.status, resp.headers.get('Server-Timing', '')
+        except urllib.error.HTTPError as e:
+            e.read()
+            return e.code, e.headers.get('Server-Timing', '')
+
+
+def run(make_client, scenarios, mix, clients, total, seed):
+    names = [m[0] for m in mix]
+    weights = [m[1] for m in mix]
+    results = {name: {'latencies': [], 'queries': [], 'errors': 0, 'conflicts': 0} for name in names}
+    lock = threading.Lock()
+    counter = iter(range(total))
+    local = threading.local()
+
+    def worker(worker_id):
+        local.client = make_client()
+        rnd = random.Random(seed + worker_id)
+        plan = Scenarios(scenarios.info, scenarios.cities, scenarios.dates, rnd)
+        while True:
+            with lock:
+                if next(counter, None) is None:
+                    return
+            name = rnd.choices(names, weights)[0]
+            method, path, body, role = getattr(plan, name)()
+            t0 = time.perf_counter()
+            status, timing = local.client.request(method, path, body, role)
+            elapsed = time.perf_counter() - t0
+            m = QUERIES.search(timing)
+            with lock:
+                bucket = results[name]
+                bucket['latencies'].append(elapsed)
+                if m:
+                    bucket['queries'].append(int(m.group(1)))
+                if status == 409:
+                    bucket['conflicts'] += 1
+                elif status >= 400:
+                    bucket['errors'] += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        list(pool.map(worker, range(clients)))
+    return time.perf_counter() - started, results
+
+
+def summarize(elapsed, results):
+    summary = {}
+    total = 0
+    for name, r in results.items():
+        lat = r['latencies']
+        if not lat:
+            continue
+        total += len(lat)
+        summary[name] = {
+            'requests': len(lat),
+            'rps': round(len(lat) / elapsed, 1),
+            'p50_ms': round(pct(lat, 0.50) * 1000, 2),
+            'p95_ms': round(pct(lat, 0.95) * 1000, 2),
+            'p99_ms': round(pct(lat, 0.99) * 1000, 2),
+            'queries_avg': round(sum(r['queries']) / len(r['queries']), 2) if r['queries'] else None,
+            'queries_max': max(r['queries']) if r['queries'] else None,
+            'errors': r['errors'],
+            'conflicts': r['conflicts'],
+        }
+    summary['_total'] = {'requests': total, 'rps': round(total / elapsed, 1), 'seconds': round(elapsed, 2)}
+    return summary
+
+
+def print_summary(summary):
+    print(f"{'scenario':<10} {'reqs':>6} {'rps':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'q/req':>6} {'q max':>6} {'err':>5} {'409':>5}")
+    for name, s in summary.items():
+        if name.startswith('_'):
+            continue
+        print(f"{name:<10} {s['requests']:>6} {s['rps']:>8} {s['p50_ms']:>8} {s['p95_ms']:>8} {s['p99_ms']:>8} "
+              f"{s['queries_avg'] if s['queries_avg'] is not None else '-':>6} "
+              f"{s['queries_max'] if s['queries_max'] is not None else '-':>6} {s['errors']:>5} {s['conflicts']:>5}")
+    t = summary['_total']
+    print(f"total      {t['requests']:>6} {t['rps']:>8}   in {t['seconds']}s")
+
+
+def compare(summary, baseline, tolerance):
+    """Print deltas against a saved baseline; return the list of regressions."""
+    regressions = []
+    print(f"\nvs baseline {baseline['meta'].get('name')} ({baseline['meta'].get('git')}, {baseline['meta'].get('when')})")
+    for name, s in summary.items():
+        old = baseline['results'].get(name)
+        if name.startswith('_') or not old:
+            continue
+        dp95 = (s['p95_ms'] - old['p95_ms']) / old['p95_ms'] if old['p95_ms'] else 0.0
+        drps = (s['rps'] - old['rps']) / old['rps'] if old['rps'] else 0.0
+        line = f"{name:<10} p95 {old['p95_ms']:>8} -> {s['p95_ms']:<8} ({dp95:+.0%})   rps {drps:+.0%}"
+        if s['queries_max'] is not None and old.get('queries_max') is not None:
+            line += f"   queries max {old['queries_max']} -> {s['queries_max']}"
+            if s['queries_max'] > old['queries_max']:
+                regressions.append(f'{name}: queries per request went from {old["queries_max"]} to {s["queries_max"]}')
+        if dp95 > tolerance:
+            regressions.append(f'{name}: p95 {dp95:+.0%} exceeds tolerance {tolerance:.0%}')
+        print(line)
+    return regressions
+
+
+def _git_rev():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Load test the booking app with concurrent clients.')
+    parser.add_argument('--workdir', help='directory holding a generated bus_booking.db (default: generate one)')
+    parser.add_argument('--scale', choices=sorted(SCALES), default='small')
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=4000)
+    parser.add_argument('--mix', default=DEFAULT_MIX)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--url', help='drive a running server instead of in-process test clients')
+    parser.add_argument('--save', metavar='NAME')
+    parser.add_argument('--compare', metavar='NAME')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed p95 growth vs baseline (0.25 = 25%%)')
+    parser.add_argument('--slow', type=int, default=5, help='print the N slowest queries seen (in-process only)')
+    args = parser.parse_args(argv)
+    mix = parse_mix(args.mix)
+
+    workdir = args.workdir
+    if not workdir:
+        workdir = tempfile.mkdtemp(prefix='bench_load_')
+        datagen.generate(workdir, **SCALES[args.scale])
+    info, cities, dates = dataset_facts(workdir)
+
+    os.environ['SQLITE_PATH'] = os.path.join(workdir, 'bus_booking.db')
+    import metrics
+    from app import app as flask_app
+    # Slow queries are summarised at the end instead of logged one by one
+    logging.getLogger('bus_booking.slow_query').disabled = True
+    metrics.registry.reset()
+    serializer = flask_app.session_interface.get_signing_serializer(flask_app)
+    cookies = {
+        'admin': serializer.dumps({'user_id': 1, 'role': 'admin', 'user_email': 'admin@bench.local'}),
+        'customer': serializer.dumps({'user_id': 2, 'role': 'customer', 'user_email': 'user2@bench.local'}),
+    }
+    if args.url:
+        make_client = lambda: HttpClient(args.url, cookies)
+    else:
+        flask_app.config['TESTING'] = True
+        make_client = lambda: InProcessClient(flask_app, cookies)
+
+    print(f"dataset: {info['counts']}  clients={args.clients} requests={args.requests} "
+          f"mode={'http ' + args.url if args.url else 'in-process'}")
+    elapsed, results = run(make_client, Scenarios(info, cities, dates, None), mix, args.clients, args.requests, args.seed)
+    summary = summarize(elapsed, results)
+    print_summary(summary)
+    if args.slow and not args.url:
+        worst = sorted(metrics.slow_queries(), key=lambda q: q['ms'], reverse=True)[:args.slow]
+        if worst:
+            print(f'\nslowest queries (>= {metrics.SLOW_QUERY_MS} ms):')
+            for q in worst:
+                print(f"  {q['ms']:>8} ms  {q['endpoint']:<32} {q['sql'][:110]}")
+
+    if args.save:
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        path = os.path.join(BASELINE_DIR, f'{args.save}.json')
+        meta = {
+            'name': args.save, 'git': _git_rev(), 'when': time.strftime('%Y-%m-%d %H:%M'),
+            'python': platform.python_version(), 'machine': platform.machine(), 'cpus': os.cpu_count(),
+            'dataset': info['counts'], 'scale': None if args.workdir else args.scale,
+            'clients': args.clients, 'requests': args.requests, 'mix': args.mix,
+            'mode': 'http' if args.url else 'in-process',
+        }
+        with open(path, 'w') as f:
+            json.dump({'meta': meta, 'results': summary}, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f'saved baseline {path}')
+
+    if args.compare:
+        with open(os.path.join(BASELINE_DIR, f'{args.compare}.json')) as f:
+            baseline = json.load(f)
+        regressions = compare(summary, baseline, args.tolerance)
+        if regressions:
+            print('\nREGRESSIONS:\n  ' + '\n  '.join(regressions))
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+import os
+import gzip
+try:
+    import brotli
+except Exception:
+    brotli = None
+
+# ---------- Response compression ----------
+# Compresses buffered text responses (JSON, HTML, CSS, JS, CSV) of at least
+# COMPRESS_MIN_BYTES with brotli (when installed) or gzip, whichever the client
+# prefers. Streamed responses (SSE, file downloads) and responses that already
+# carry a Content-Encoding, such as the precompressed static files, are left
+# alone. COMPRESS_MIN_BYTES=0 compresses everything; COMPRESSION=0 turns it off.
+
+ENABLED = (os.getenv('COMPRESSION') or '1') != '0'
+COMPRESS_MIN_BYTES = int(os.getenv('COMPRESS_MIN_BYTES') or 1024)
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5  # per-request: much faster than 11 and still smaller than gzip -6
+COMPRESSIBLE_TYPES = {
+    'application/json', 'text/html', 'text/css', 'text/javascript', 'application/javascript',
+    'text/csv', 'text/plain', 'image/svg+xml',
+}
+
+
+def choose_encoding(accept_encodings):
+    """'br', 'gzip' or None for a werkzeug Accept-Encoding header."""
+    best, best_q = None, 0
+    for encoding in (('br', 'gzip') if brotli is not None else ('gzip',)):
+        q = accept_encodings[encoding]
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return gzip.compress(data, GZIP_LEVEL, mtime=0)
+
+
+def init_app(app):
+    if not ENABLED:
+        return
+    from flask import request
+
+    @app.after_request
+    def compress_response(response):
+        if (response.status_code < 200 or response.status_code in (204, 304) or response.is_streamed
+                or response.direct_passthrough or 'Content-Encoding' in response.headers
+                or response.mimetype not in COMPRESSIBLE_TYPES or request.method == 'HEAD'):
+            return response
+        response.vary.add('Accept-Encoding')
+        encoding = choose_encoding(request.accept_encodings)
+        if encoding is None:
+            return response
+        data = response.get_data()
+        if len(data) < COMPRESS_MIN_BYTES:
+            return response
+        response.set_data(compress(data, encoding))
+        response.headers['Content-Encoding'] = encoding
+        if response.headers.get('ETag', '').startswith('"'):
+            # A strong validator names exact bytes; these are different bytes
+            response.headers['ETag'] = 'W/' + response.headers['ETag']
+        return response
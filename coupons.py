@@ -0,0 +1,233 @@
+import os
+import random
+from datetime import datetime
+
+# ---------- Coupons ----------
+# A coupon is one row in `coupons`: a flat (rupees) or percent discount, an
+# optional validity window, route (from/to city, NULL = any), minimum fare,
+# percent ceiling, per-user limit and global usage cap. The app keeps the active
+# rules in memory and reloads them when the 'coupons' data version moves.
+#
+# Global caps are enforced without a single hot counter row: a capped coupon's
+# cap is split into COUNTER_SHARDS rows of coupon_counters, each with its own
+# quota. A redemption increments one randomly chosen shard with
+# `used = used + 1 WHERE used < quota`, so concurrent redemptions lock different
+# rows, the total can never pass the cap, and a sold-out shard just sends the
+# redemption to the next one. coupon_redemptions records who used what (per-user
+# limits and the admin totals read it).
+
+COUNTER_SHARDS = int(os.getenv('COUPON_COUNTER_SHARDS') or 16)
+KINDS = ('flat', 'percent')
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Replaces the old hardcoded TRIP100 check in save_booking
+DEFAULT_COUPONS = [
+    {'code': 'TRIP100', 'kind': 'flat', 'amount': 100},
+]
+
+
+class CouponError(Exception):
+    """The code does not apply to this booking; the message is shown to the customer."""
+
+
+def schema_statements(mysql_on):
+    """Re-runnable DDL: once applied, statements fail only as "already exists" (see app.run_ddl)."""
+    if mysql_on:
+        return [
+            '''
+            CREATE TABLE IF NOT EXISTS coupons (
+                code VARCHAR(32) PRIMARY KEY,
+                kind VARCHAR(8) NOT NULL DEFAULT 'flat',
+                amount DECIMAL(10,2) NOT NULL,
+                max_discount DECIMAL(10,2),
+                min_fare DECIMAL(10,2),
+                valid_from VARCHAR(19),
+                valid_until VARCHAR(19),
+                from_city VARCHAR(255),
+                to_city VARCHAR(255),
+                per_user_limit INT,
+                usage_cap INT,
+                active TINYINT NOT NULL DEFAULT 1,
+                created_at DATETIME
+            )''',
+            '''
+            CREATE TABLE IF NOT EXISTS coupon_counters (
+                code VARCHAR(32) NOT NULL,
+                shard INT NOT NULL,
+                used INT NOT NULL DEFAULT 0,
+                quota INT NOT NULL,
+                PRIMARY KEY (code, shard)
+            )''',
+            '''
+            CREATE TABLE IF NOT EXISTS coupon_redemptions (
+                booking_id INT PRIMARY KEY,
+                code VARCHAR(32) NOT NULL,
+                user_id INT,
+                discount_amount DECIMAL(10,2) NOT NULL,
+                redeemed_at DATETIME,
+                INDEX idx_redemptions_user (code, user_id)
+            )''',
+        ] + [f"INSERT IGNORE INTO coupons (code, kind, amount, active) VALUES ('{c['code']}', '{c['kind']}', {c['amount']}, 1)"
+             for c in DEFAULT_COUPONS]
+    return [
+        '''
+        CREATE TABLE IF NOT EXISTS coupons (
+            code TEXT PRIMARY KEY,
+            kind TEXT NOT NULL DEFAULT 'flat',
+            amount REAL NOT NULL,
+            max_discount REAL,
+            min_fare REAL,
+            valid_from TEXT,
+            valid_until TEXT,
+            from_city TEXT,
+            to_city TEXT,
+            per_user_limit INTEGER,
+            usage_cap INTEGER,
+            active INTEGER NOT NULL DEFAULT 1,
+            created_at TEXT
+        )''',
+        '''
+        CREATE TABLE IF NOT EXISTS coupon_counters (
+            code TEXT NOT NULL,
+            shard INTEGER NOT NULL,
+            used INTEGER NOT NULL DEFAULT 0,
+            quota INTEGER NOT NULL,
+            PRIMARY KEY (code, shard)
+        )''',
+        '''
+        CREATE TABLE IF NOT EXISTS coupon_redemptions (
+            booking_id INTEGER PRIMARY KEY,
+            code TEXT NOT NULL,
+            user_id INTEGER,
+            discount_amount REAL NOT NULL,
+            redeemed_at TEXT
+        )''',
+        "CREATE INDEX IF NOT EXISTS idx_redemptions_user ON coupon_redemptions (code, user_id)",
+    ] + [f"INSERT OR IGNORE INTO coupons (code, kind, amount, active) VALUES ('{c['code']}', '{c['kind']}', {c['amount']}, 1)"
+         for c in DEFAULT_COUPONS]
+
+
+def normalize_code(code):
+    return (code or '').strip().upper()
+
+
+def _float(value):
+    return float(value) if value not in (None, '') else None
+
+
+def _int(value):
+    return int(value) if value not in (None, '') else None
+
+
+def _text(value):
+    if value in (None, ''):
+        return None
+    return value.strftime(TIME_FORMAT) if isinstance(value, datetime) else str(value).strip()
+
+
+def rule_from_row(row):
+    """A coupons row (dict or sqlite3.Row) as a plain dict with typed values."""
+    return {
+        'code': normalize_code(row['code']),
+        'kind': row['kind'],
+        'amount': float(row['amount']),
+        'max_discount': _float(row['max_discount']),
+        'min_fare': _float(row['min_fare']),
+        'valid_from': _text(row['valid_from']),
+        'valid_until': _text(row['valid_until']),
+        'from_city': _text(row['from_city']),
+        'to_city': _text(row['to_city']),
+        'per_user_limit': _int(row['per_user_limit']),
+        'usage_cap': _int(row['usage_cap']),
+        'active': bool(row['active']),
+    }
+
+
+def rule_from_form(form):
+    """Validate the admin form; raises CouponError with a message to flash."""
+    code = normalize_code(form.get('code'))
+    if not code or len(code) > 32 or not code.isalnum():
+        raise CouponError('Code must be 1-32 letters or digits')
+    kind = (form.get('kind') or 'flat').strip()
+    if kind not in KINDS:
+        raise CouponError('Kind must be flat or percent')
+    try:
+        rule = {
+            'code': code,
+            'kind': kind,
+            'amount': float(form.get('amount') or 0),
+            'max_discount': _float(form.get('max_discount')),
+            'min_fare': _float(form.get('min_fare')),
+            'valid_from': _parse_time(form.get('valid_from')),
+            'valid_until': _parse_time(form.get('valid_until'), end_of_day=True),
+            'from_city': _text(form.get('from_city')),
+            'to_city': _text(form.get('to_city')),
+            'per_user_limit': _int(form.get('per_user_limit')),
+            'usage_cap': _int(form.get('usage_cap')),
+            'active': True,
+        }
+    except ValueError as e:
+        raise CouponError(f'Invalid value: {e}')
+    if rule['amount'] <= 0 or (kind == 'percent' and rule['amount'] > 100):
+        raise CouponError('Amount must be positive (and at most 100 for percent)')
+    if rule['usage_cap'] is not None and rule['usage_cap'] < 0:
+        raise CouponError('Usage cap cannot be negative')
+    return rule
+
+
+def _parse_time(value, end_of_day=False):
+    value = (value or '').strip().replace('T', ' ')
+    if not value:
+        return None
+    if len(value) == 10:
+        datetime.strptime(value, '%Y-%m-%d')
+        return value + (' 23:59:59' if end_of_day else ' 00:00:00')
+    if len(value) == 16:
+        value += ':00'
+    datetime.strptime(value, TIME_FORMAT)
+    return value
+
+
+def discount_for(rule, fare_total):
+    if rule['kind'] == 'percent':
+        amount = round(fare_total * rule['amount'] / 100.0, 2)
+        if rule['max_discount'] is not None:
+            amount = min(amount, rule['max_discount'])
+    else:
+        amount = rule['amount']
+    return max(0.0, min(amount, fare_total))
+
+
+def check(rule, fare_total, from_city, to_city, now=None):
+    """Discount in rupees for this booking, or CouponError saying why the code does not apply.
+
+    Per-user limits and the global cap need the database and are checked by the caller.
+    """
+    if rule is None or not rule['active']:
+        raise CouponError('Invalid coupon')
+    stamp = (now or datetime.now()).strftime(TIME_FORMAT)
+    if rule['valid_from'] and stamp < rule['valid_from']:
+        raise CouponError('Coupon is not active yet')
+    if rule['valid_until'] and stamp > rule['valid_until']:
+        raise CouponError('Coupon has expired')
+    if rule['from_city'] and (from_city or '').lower() != rule['from_city'].lower():
+        raise CouponError(f"Coupon is only valid from {rule['from_city']}")
+    if rule['to_city'] and (to_city or '').lower() != rule['to_city'].lower():
+        raise CouponError(f"Coupon is only valid to {rule['to_city']}")
+    if rule['min_fare'] and fare_total < rule['min_fare']:
+        raise CouponError(f"Coupon needs a fare of at least {rule['min_fare']:g}")
+    return discount_for(rule, fare_total)
+
+
+def shard_quotas(cap, shards=COUNTER_SHARDS):
+    """Split cap across at most `shards` counters; fewer counters when the cap is small."""
+    shards = max(1, min(shards, cap)) if cap else 1
+    base, extra = divmod(cap, shards)
+    return [base + (1 if i < extra else 0) for i in range(shards)]
+
+
+def shard_order(quotas, exhausted=()):
+    """Shards to try for one redemption: random start so concurrent redemptions spread out."""
+    live = [i for i in range(len(quotas)) if i not in exhausted and quotas[i] > 0]
+    random.shuffle(live)
+    return live
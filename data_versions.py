@@ -0,0 +1,96 @@
+import time
+import threading
+
+import database as dbmod
+
+# ---------- Shared data versions ----------
+# One counter per kind of data ('buses', 'bookings', 'coupons', ...) lives in the
+# data_versions table, so a write on any worker invalidates every worker's
+# in-process caches (page cache, route graph, fare calendar, coupon rules,
+# ETags). Writers bump the counter after their transaction commits. Readers
+# validate their snapshot of the table in O(1):
+#   SQLite - each thread keeps a watcher connection and asks it for
+#            PRAGMA data_version, which changes only when another connection
+#            has committed. The table is re-read only then, so a process pays
+#            one pragma per check and one small SELECT per foreign commit.
+#   MySQL  - no such pragma; the table (a handful of primary-key rows) is read
+#            once per check. The app checks once per request.
+# The 'epoch' row is set when the table is created and tells one database's
+# versions apart from another's (a rebuilt database restarts its counters).
+
+EPOCH = 'epoch'
+SELECT_SQL = 'SELECT name, version FROM data_versions'
+
+
+def schema_statements(mysql_on):
+    """Re-runnable DDL: once applied, statements fail only as "already exists" (see app.run_ddl)."""
+    epoch = int(time.time() * 1000)
+    if mysql_on:
+        return [
+            'CREATE TABLE IF NOT EXISTS data_versions (name VARCHAR(64) PRIMARY KEY, version BIGINT NOT NULL DEFAULT 0)',
+            f"INSERT IGNORE INTO data_versions (name, version) VALUES ('{EPOCH}', {epoch})",
+        ]
+    return [
+        'CREATE TABLE IF NOT EXISTS data_versions (name TEXT PRIMARY KEY, version INTEGER NOT NULL DEFAULT 0)',
+        f"INSERT OR IGNORE INTO data_versions (name, version) VALUES ('{EPOCH}', {epoch})",
+    ]
+
+
+def _read(conn, mysql_on):
+    cur = conn.cursor()
+    try:
+        cur.execute(SELECT_SQL)
+        return {name: int(version) for name, version in cur.fetchall()}
+    except Exception:
+        return {}  # table not created yet: everything at 0
+    finally:
+        cur.close()
+
+
+class SharedVersions:
+    """This process's view of data_versions."""
+
+    def __init__(self):
+        self._local = threading.local()
+        self.reloads = 0  # times the table was actually read
+
+    def _watcher(self, path):
+        local = self._local
+        if getattr(local, 'path', None) != path:
+            if getattr(local, 'conn', None) is not None:
+                local.conn.close()
+            local.conn = dbmod.connect_sqlite(path)
+            local.conn.row_factory = None
+            local.path, local.mark, local.versions = path, None, {}
+        return local
+
+    def snapshot(self):
+        """{name: version} as of now; treat the dict as read-only."""
+        if dbmod.is_mysql_enabled():
+            conn = dbmod.get_conn()
+            try:
+                self.reloads += 1
+                return _read(conn, True)
+            finally:
+                conn.close()
+        local = self._watcher(dbmod.sqlite_path())
+        mark = local.conn.execute('PRAGMA data_version').fetchone()[0]
+        if mark != local.mark:
+            # Read after the pragma: a commit in between only makes the next check reload again
+            local.versions = _read(local.conn, False)
+            local.mark = mark
+            self.reloads += 1
+        return local.versions
+
+    def bump(self, *names):
+        """Advance each counter by one, on the primary, in one commit."""
+        if not names:
+            return
+        conn = dbmod.get_conn()
+        try:
+            dbmod.bump_data_versions(conn, *names)
+        finally:
+            conn.close()
+
+
+shared = SharedVersions()
@@ -1,18 +1,131 @@
 import os
+import re
+import sys
+import time
 import sqlite3
-try:
-    import mysql.connector as mysql
-except Exception:
-    mysql = None
+import argparse
+import logging
+from decimal import Decimal
+from datetime import date, datetime, timedelta
+from itertools import islice
+from urllib.request import pathname2url
+
+log = logging.getLogger('bus_booking.migrate')
+
+# mysql.connector is only imported once MySQL is configured and first asked for
+mysql = None
+_mysql_missing = False
+
+
+def load_mysql():
+    global mysql, _mysql_missing
+    if mysql is None and not _mysql_missing:
+        try:
+            import mysql.connector as connector
+            mysql = connector
+        except Exception:
+            _mysql_missing = True
+    return mysql
 
 
 def is_mysql_enabled():
     return (
-        mysql is not None and
-        os.getenv('MYSQL_HOST') and os.getenv('MYSQL_DB') and os.getenv('MYSQL_USER')
+        bool(os.getenv('MYSQL_HOST') and os.getenv('MYSQL_DB') and os.getenv('MYSQL_USER')) and
+        load_mysql() is not None
     )
 
 
+def integrity_errors():
+    return (sqlite3.IntegrityError,) + ((mysql.IntegrityError,) if mysql is not None else ())
+
+
+def connection_errors():
+    return (sqlite3.OperationalError,) + ((mysql.OperationalError, mysql.InterfaceError) if mysql is not None else ())
+
+
+# ---------- SQLite runtime profile ----------
+# SQLITE_PATH picks the database file (default bus_booking.db in the working dir).
+# SQLITE_PROFILE=production switches to WAL with synchronous=NORMAL, a busy
+# timeout, mmap and a larger page cache; each setting can be overridden with
+# SQLITE_JOURNAL_MODE, SQLITE_SYNCHRONOUS, SQLITE_BUSY_TIMEOUT_MS,
+# SQLITE_MMAP_SIZE and SQLITE_CACHE_SIZE. The default profile keeps SQLite's
+# own settings (rollback journal, synchronous=FULL).
+SQLITE_PROFILES = {
+    'default': {
+        'journal_mode': None,
+        'synchronous': None,
+        'busy_timeout_ms': 5000,
+        'mmap_size': None,
+        'cache_size': None,
+    },
+    'production': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout_ms': 5000,
+        'mmap_size': 256 * 1024 * 1024,
+        'cache_size': -64000,  # negative = KiB, so ~64 MB
+    },
+}
+_wal_checked = set()
+
+
+def sqlite_path():
+    return os.getenv('SQLITE_PATH') or 'bus_booking.db'
+
+
+def sqlite_settings():
+    profile = (os.getenv('SQLITE_PROFILE') or 'default').strip().lower()
+    settings = dict(SQLITE_PROFILES.get(profile, SQLITE_PROFILES['default']))
+    overrides = {
+        'journal_mode': os.getenv('SQLITE_JOURNAL_MODE'),
+        'synchronous': os.getenv('SQLITE_SYNCHRONOUS'),
+        'busy_timeout_ms': os.getenv('SQLITE_BUSY_TIMEOUT_MS'),
+        'mmap_size': os.getenv('SQLITE_MMAP_SIZE'),
+        'cache_size': os.getenv('SQLITE_CACHE_SIZE'),
+    }
+    for key, value in overrides.items():
+        if value:
+            settings[key] = value.strip().upper() if key in ('journal_mode', 'synchronous') else int(value)
+    return settings
+
+
+def sqlite_pragmas(settings=None):
+    """Per-connection PRAGMA statements for the active profile (journal_mode is handled separately)."""
+    settings = settings or sqlite_settings()
+    pragmas = [f"PRAGMA busy_timeout = {int(settings['busy_timeout_ms'])}"]
+    if settings['synchronous']:
+        pragmas.append(f"PRAGMA synchronous = {settings['synchronous']}")
+    if settings['mmap_size'] is not None:
+        pragmas.append(f"PRAGMA mmap_size = {int(settings['mmap_size'])}")
+    if settings['cache_size'] is not None:
+        pragmas.append(f"PRAGMA cache_size = {int(settings['cache_size'])}")
+    return pragmas
+
+
+def readonly_uri(path):
+    """file: URI opening `path` read-only; the path is quoted, so '?', '#' and '%' in it stay part of the name."""
+    return f'file:{pathname2url(path)}?mode=ro'
+
+
+def connect_sqlite(path=None, readonly=False):
+    path = path or sqlite_path()
+    settings = sqlite_settings()
+    timeout = int(settings['busy_timeout_ms']) / 1000.0
+    if readonly:
+        conn = sqlite3.connect(readonly_uri(path), uri=True, timeout=timeout)
+    else:
+        conn = sqlite3.connect(path, timeout=timeout)
+        # journal_mode is stored in the file; set it once per process rather than per connection
+        mode = settings['journal_mode']
+        if mode and (path, mode) not in _wal_checked:
+            conn.execute(f'PRAGMA journal_mode = {mode}')
+            _wal_checked.add((path, mode))
+    for pragma in sqlite_pragmas(settings):
+        conn.execute(pragma)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
 def get_conn():
     if is_mysql_enabled():
         return mysql.connect(
@@ -22,9 +135,7 @@ def get_conn():
             user=os.getenv('MYSQL_USER'),
             password=os.getenv('MYSQL_PASSWORD', ''),
         )
-    conn = sqlite3.connect('bus_booking.db')
-    conn.row_factory = sqlite3.Row
-    return conn
+    return connect_sqlite()
 
 
 def setup_schema(conn):
@@ -32,15 +143,30 @@ def setup_schema(conn):
         cur = conn.cursor()
         cur.execute(
             """
-            CREATE TABLE IF NOT EXISTS buses (
+            CREATE TABLE IF NOT EXISTS services (
                 id INT AUTO_INCREMENT PRIMARY KEY,
                 name VARCHAR(255) NOT NULL,
                 from_city VARCHAR(255) NOT NULL,
                 to_city VARCHAR(255) NOT NULL,
-                depart_time VARCHAR(64) NOT NULL,
-                arrive_time VARCHAR(64) NOT NULL,
-                seats_total INT,
-                fare DECIMAL(10,2)
+                depart_clock VARCHAR(8) NOT NULL,
+                arrive_clock VARCHAR(8) NOT NULL,
+                arrive_day_offset INT NOT NULL DEFAULT 0,
+                seats_total INT NOT NULL DEFAULT 40,
+                fare DECIMAL(10,2) NOT NULL DEFAULT 0,
+                UNIQUE KEY uniq_service (name(100), from_city(100), to_city(100), depart_clock, arrive_clock, arrive_day_offset, seats_total, fare),
+                KEY idx_services_route (from_city(100), to_city(100))
+            )
+            """
+        )
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS trips (
+                id INT AUTO_INCREMENT PRIMARY KEY,
+                service_id INT NOT NULL,
+                journey_date VARCHAR(10) NOT NULL,
+                UNIQUE KEY uniq_trip (service_id, journey_date),
+                KEY idx_trips_date (journey_date),
+                CONSTRAINT fk_trip_service FOREIGN KEY (service_id) REFERENCES services(id)
             )
             """
         )
@@ -53,7 +179,7 @@ def setup_schema(conn):
                 passenger_phone VARCHAR(32) NOT NULL,
                 seats_booked INT NOT NULL,
                 booked_at VARCHAR(64) NOT NULL,
-                CONSTRAINT fk_bus FOREIGN KEY (bus_id) REFERENCES buses(id)
+                CONSTRAINT fk_trip FOREIGN KEY (bus_id) REFERENCES trips(id)
             )
             """
         )
@@ -84,22 +210,38 @@ def setup_schema(conn):
         )
         conn.commit()
         cur.close()
+        migrate_buses_to_trips(conn)
     else:
         cur = conn.cursor()
         cur.execute(
             """
-            CREATE TABLE IF NOT EXISTS buses (
+            CREATE TABLE IF NOT EXISTS services (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 name TEXT NOT NULL,
                 from_city TEXT NOT NULL,
                 to_city TEXT NOT NULL,
-                depart_time TEXT NOT NULL,
-                arrive_time TEXT NOT NULL,
-                seats_total INTEGER,
-                fare REAL
+                depart_clock TEXT NOT NULL,
+                arrive_clock TEXT NOT NULL,
+                arrive_day_offset INTEGER NOT NULL DEFAULT 0,
+                seats_total INTEGER NOT NULL DEFAULT 40,
+                fare REAL NOT NULL DEFAULT 0,
+                UNIQUE (name, from_city, to_city, depart_clock, arrive_clock, arrive_day_offset, seats_total, fare)
+            )
+            """
+        )
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_services_route ON services (from_city, to_city)")
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS trips (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                service_id INTEGER NOT NULL,
+                journey_date TEXT NOT NULL,
+                UNIQUE (service_id, journey_date),
+                FOREIGN KEY (service_id) REFERENCES services (id)
             )
             """
         )
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_trips_date ON trips (journey_date)")
         cur.execute(
             """
             CREATE TABLE IF NOT EXISTS bookings (
@@ -109,7 +251,7 @@ def setup_schema(conn):
                 passenger_phone TEXT NOT NULL,
                 seats_booked INTEGER NOT NULL,
                 booked_at TEXT NOT NULL,
-                FOREIGN KEY (bus_id) REFERENCES buses (id)
+                FOREIGN KEY (bus_id) REFERENCES trips (id)
             )
             """
         )
@@ -139,6 +281,7 @@ def setup_schema(conn):
             """
         )
         conn.commit()
+        migrate_buses_to_trips(conn)
 
 
 def seed_if_empty(conn):
@@ -160,20 +303,546 @@ def seed_if_empty(conn):
         ('Megha Travels', 'Vijayawada', 'Hyderabad', '2025-11-04 09:00', '2025-11-04 14:00', 38, 580),
         ('Neeta Travels', 'Bengaluru', 'Coimbatore', '2025-11-05 10:00', '2025-11-05 15:30', 45, 620)
     ]
+    insert_buses(conn, buses)
+
+
+# ---------- Services and trips ----------
+# A service is the recurring template (operator, route, clock times, seats, fare);
+# a trip is one dated run of it. The `buses` view joins them back into the legacy
+# row shape (id = trip id) so reporting queries and bookings.bus_id keep working.
+BUS_COLUMNS = ('name', 'from_city', 'to_city', 'depart_time', 'arrive_time', 'seats_total', 'fare')
+SERVICE_COLUMNS = ('name', 'from_city', 'to_city', 'depart_clock', 'arrive_clock', 'arrive_day_offset', 'seats_total', 'fare')
+
+BUSES_VIEW_SQLITE = """
+    CREATE VIEW IF NOT EXISTS buses AS
+    SELECT t.id, s.name, s.from_city, s.to_city,
+           t.journey_date || ' ' || s.depart_clock AS depart_time,
+           date(t.journey_date, '+' || s.arrive_day_offset || ' day') || ' ' || s.arrive_clock AS arrive_time,
+           s.seats_total, s.fare, t.service_id, t.journey_date
+    FROM trips t JOIN services s ON s.id = t.service_id
+"""
+BUSES_VIEW_MYSQL = """
+    CREATE OR REPLACE VIEW buses AS
+    SELECT t.id, s.name, s.from_city, s.to_city,
+           CONCAT(t.journey_date, ' ', s.depart_clock) AS depart_time,
+           CONCAT(DATE_FORMAT(DATE_ADD(t.journey_date, INTERVAL s.arrive_day_offset DAY), '%Y-%m-%d'), ' ', s.arrive_clock) AS arrive_time,
+           s.seats_total, s.fare, t.service_id, t.journey_date
+    FROM trips t JOIN services s ON s.id = t.service_id
+"""
+
+
+def _parse_dt(value):
+    if isinstance(value, datetime):
+        return value
+    text = str(value or '').strip().replace('T', ' ')
+    for fmt in ('%Y-%m-%d %H:%M', '%Y-%m-%d %H:%M:%S'):
+        try:
+            return datetime.strptime(text, fmt)
+        except ValueError:
+            pass
+    raise ValueError(f'Expected YYYY-MM-DD HH:MM, got {value!r}')
+
+
+def split_bus_times(depart_time, arrive_time):
+    """Split legacy departure/arrival strings into (journey_date, depart_clock, arrive_clock, day_offset).
+
+    arrive_time may be a full datetime or just HH:MM (next day when earlier than departure).
+    """
+    dep = _parse_dt(depart_time)
+    arr_text = str(arrive_time or '').strip()
+    if len(arr_text) <= 5 and ':' in arr_text:
+        arr_clock = datetime.strptime(arr_text, '%H:%M').time()
+        offset = 1 if arr_clock <= dep.time() else 0
+        return dep.strftime('%Y-%m-%d'), dep.strftime('%H:%M'), arr_clock.strftime('%H:%M'), offset
+    arr = _parse_dt(arrive_time)
+    offset = (arr.date() - dep.date()).days
+    if offset < 0:
+        raise ValueError('Arrival is before departure')
+    return dep.strftime('%Y-%m-%d'), dep.strftime('%H:%M'), arr.strftime('%H:%M'), offset
+
+
+def bus_to_service_trip(bus):
+    """(name, from, to, depart_time, arrive_time, seats_total, fare) -> (service tuple, journey_date)."""
+    name, from_city, to_city, depart_time, arrive_time, seats_total, fare = bus
+    journey_date, depart_clock, arrive_clock, offset = split_bus_times(depart_time, arrive_time)
+    service = (
+        (name or '').strip(), (from_city or '').strip(), (to_city or '').strip(),
+        depart_clock, arrive_clock, offset,
+        int(seats_total or 40), float(fare or 0),
+    )
+    return service, journey_date
+
+
+def trip_times(journey_date, depart_clock, arrive_clock, day_offset):
+    """Rebuild the legacy 'YYYY-MM-DD HH:MM' departure/arrival strings for a trip."""
+    depart_time = f"{journey_date} {depart_clock}"
+    try:
+        arrive_date = (datetime.strptime(str(journey_date), '%Y-%m-%d') + timedelta(days=int(day_offset or 0))).strftime('%Y-%m-%d')
+    except ValueError:
+        arrive_date = journey_date
+    return depart_time, f"{arrive_date} {arrive_clock}"
+
+
+def _table_type(conn, name):
     if is_mysql_enabled():
         cur = conn.cursor()
-        cur.executemany(
-            "INSERT INTO buses (name, from_city, to_city, depart_time, arrive_time, seats_total, fare) VALUES (%s, %s, %s, %s, %s, %s, %s)",
-            buses
+        cur.execute(
+            "SELECT TABLE_TYPE FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s",
+            (name,)
         )
+        row = cur.fetchone()
+        cur.close()
+        if not row:
+            return None
+        return 'view' if row[0] == 'VIEW' else 'table'
+    row = conn.execute("SELECT type FROM sqlite_master WHERE name = ? AND type IN ('table', 'view')", (name,)).fetchone()
+    return row[0] if row else None
+
+
+def migrate_buses_to_trips(conn):
+    """Fold a legacy `buses` table into services + trips (keeping ids) and replace it with the view."""
+    mysql_on = is_mysql_enabled()
+    if not mysql_on:
+        # Take the write lock before looking, so concurrent workers don't both migrate
+        conn.execute('BEGIN IMMEDIATE')
+    try:
+        kind = _table_type(conn, 'buses')
+        if kind == 'table':
+            _copy_legacy_buses(conn)
+            cur = conn.cursor()
+            if mysql_on:
+                try:
+                    cur.execute("ALTER TABLE bookings DROP FOREIGN KEY fk_bus")
+                except Exception:
+                    pass
+            cur.execute("DROP TABLE buses")
+            if mysql_on:
+                # The constraint a fresh schema gets; archive.partition_mysql drops it again when partitioning
+                cur.execute("ALTER TABLE bookings ADD CONSTRAINT fk_trip FOREIGN KEY (bus_id) REFERENCES trips(id)")
+            cur.close()
+            kind = None
+        if kind is None:
+            cur = conn.cursor()
+            cur.execute(BUSES_VIEW_MYSQL if mysql_on else BUSES_VIEW_SQLITE)
+            cur.close()
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def _copy_legacy_buses(conn):
+    mysql_on = is_mysql_enabled()
+    ph = '%s' if mysql_on else '?'
+    cur = conn.cursor()
+    cur.execute("SELECT id, name, from_city, to_city, depart_time, arrive_time, seats_total, fare FROM buses ORDER BY id")
+    legacy = cur.fetchall()
+    service_ids = {}
+    trip_ids = {}
+    svc_sql = (
+        f"INSERT {'IGNORE' if mysql_on else 'OR IGNORE'} INTO services ({', '.join(SERVICE_COLUMNS)}) "
+        f"VALUES ({', '.join([ph] * len(SERVICE_COLUMNS))})"
+    )
+    svc_lookup = f"SELECT id FROM services WHERE {' AND '.join(c + ' = ' + ph for c in SERVICE_COLUMNS)}"
+    clash_sql = (
+        f"SELECT a.seat_no FROM booked_seats a JOIN booked_seats b ON b.journey_date = a.journey_date AND b.seat_no = a.seat_no "
+        f"WHERE a.bus_id = {ph} AND b.bus_id = {ph}"
+    )
+
+    def service_id(service):
+        sid = service_ids.get(service)
+        if sid is None:
+            cur.execute(svc_sql, service)
+            cur.execute(svc_lookup, service)
+            sid = service_ids[service] = cur.fetchone()[0]
+        return sid
+
+    for r in legacy:
+        r = tuple(r)
+        bus_id = r[0]
+        try:
+            service, journey_date = bus_to_service_trip(r[1:])
+        except ValueError:
+            # Free-text times from old admin edits: keep the raw pieces rather than lose the row
+            dep, arr = str(r[4] or ''), str(r[5] or '')
+            service = (r[1], r[2], r[3], dep[11:16] or dep, arr[11:16] or arr, 0, int(r[6] or 40), float(r[7] or 0))
+            journey_date = dep[:10]
+        sid = service_id(service)
+        keep_id = trip_ids.get((sid, journey_date))
+        if keep_id is not None:
+            cur.execute(clash_sql, (keep_id, bus_id))
+            clash = sorted(row[0] for row in cur.fetchall())
+            if not clash:
+                # Exact duplicate departure: collapse it into the surviving trip, bookings and all
+                cur.execute(f"UPDATE bookings SET bus_id = {ph} WHERE bus_id = {ph}", (keep_id, bus_id))
+                cur.execute(f"UPDATE booked_seats SET bus_id = {ph} WHERE bus_id = {ph}", (keep_id, bus_id))
+                continue
+            # Both copies sold the same seat: keep this one as its own trip, under a service
+            # named after its old id, so no booking loses its seat and an admin can sort it out
+            log.warning('buses %s and %s are the same departure but both sold seats %s; keeping %s as its own trip',
+                        keep_id, bus_id, ', '.join(map(str, clash)), bus_id)
+            sid = service_id((f'{service[0]} #{bus_id}',) + tuple(service[1:]))
+        else:
+            trip_ids[(sid, journey_date)] = bus_id
+        cur.execute(f"INSERT INTO trips (id, service_id, journey_date) VALUES ({ph}, {ph}, {ph})", (bus_id, sid, journey_date))
+    cur.close()
+
+
+def insert_buses(conn, buses, batch_size=1000):
+    """Insert (name, from_city, to_city, depart_time, arrive_time, seats_total, fare) rows as trips.
+
+    Every row is parsed before the first write, so a malformed row raises
+    ValueError with nothing imported. Services are created on demand; each batch
+    is two executemany calls committed together. Trips already present (same
+    service and date) are skipped. Returns the number of new trips.
+    """
+    mysql_on = is_mysql_enabled()
+    ph = '%s' if mysql_on else '?'
+    ignore = 'IGNORE' if mysql_on else 'OR IGNORE'
+    svc_sql = (
+        f"INSERT {ignore} INTO services ({', '.join(SERVICE_COLUMNS)}) "
+        f"VALUES ({', '.join([ph] * len(SERVICE_COLUMNS))})"
+    )
+    trip_sql = (
+        f"INSERT {ignore} INTO trips (service_id, journey_date) "
+        f"SELECT id, {ph} FROM services WHERE {' AND '.join(c + ' = ' + ph for c in SERVICE_COLUMNS)}"
+    )
+    parsed = []
+    for n, bus in enumerate(buses, start=1):
+        try:
+            parsed.append(bus_to_service_trip(bus))
+        except (TypeError, ValueError) as e:
+            raise ValueError(f'Row {n}: {e}')
+    cur = conn.cursor()
+    inserted = 0
+    seen_services = set()
+    rows = iter(parsed)
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            break
+        new_services = []
+        for service, _ in batch:
+            if service not in seen_services:
+                seen_services.add(service)
+                new_services.append(service)
+        if new_services:
+            cur.executemany(svc_sql, new_services)
+        cur.executemany(trip_sql, [(journey_date, *service) for service, journey_date in batch])
+        inserted += max(cur.rowcount, 0)
         conn.commit()
+    cur.close()
+    return inserted
+
+
+def _service_id(cur, service):
+    ph = '%s' if is_mysql_enabled() else '?'
+    ignore = 'IGNORE' if is_mysql_enabled() else 'OR IGNORE'
+    cur.execute(
+        f"INSERT {ignore} INTO services ({', '.join(SERVICE_COLUMNS)}) VALUES ({', '.join([ph] * len(SERVICE_COLUMNS))})",
+        service
+    )
+    cur.execute(f"SELECT id FROM services WHERE {' AND '.join(c + ' = ' + ph for c in SERVICE_COLUMNS)}", service)
+    return cur.fetchone()[0]
+
+
+# Rows keyed by (bus_id, journey_date) that follow a trip when its date is edited
+TRIP_DATED_TABLES = ('booked_seats', 'bookings', 'waitlist')
+
+
+def update_trip(conn, trip_id, bus):
+    """Re-point one trip at the service matching the edited fields; other dates of the old service are untouched.
+
+    A new date carries the trip's held seats, bookings and waitlist with it in
+    the same transaction; if a seat is already taken on the new date nothing
+    changes and ValueError is raised.
+    """
+    ph = '%s' if is_mysql_enabled() else '?'
+    service, journey_date = bus_to_service_trip(bus)
+    cur = conn.cursor()
+    try:
+        sid = _service_id(cur, service)
+        for table in TRIP_DATED_TABLES:
+            cur.execute(
+                f"UPDATE {table} SET journey_date = {ph} "
+                f"WHERE bus_id = {ph} AND journey_date = (SELECT journey_date FROM trips WHERE id = {ph})",
+                (journey_date, trip_id, trip_id)
+            )
+        cur.execute(f"UPDATE trips SET service_id = {ph}, journey_date = {ph} WHERE id = {ph}", (sid, journey_date, trip_id))
+        conn.commit()
+    except integrity_errors() as e:
+        conn.rollback()
+        if 'booked_seats' in str(e) or 'uniq_bus_date_seat' in str(e):
+            raise ValueError(f'Seats already held on {journey_date}; trip left unchanged') from e
+        raise
+    finally:
         cur.close()
-    else:
-        conn.executemany(
-            "INSERT INTO buses (name, from_city, to_city, depart_time, arrive_time, seats_total, fare) VALUES (?, ?, ?, ?, ?, ?, ?)",
-            buses
-        )
+
+
+def delete_trip(conn, trip_id):
+    ph = '%s' if is_mysql_enabled() else '?'
+    cur = conn.cursor()
+    cur.execute(f"DELETE FROM trips WHERE id = {ph}", (trip_id,))
+    conn.commit()
+    cur.close()
+
+
+# ---------- Data versions ----------
+# Every write to buses, bookings or coupons must advance that name's counter in
+# data_versions, or other workers keep serving cached pages, ETags and routes
+# (see data_versions.py). The app does it through bump_data_version(); scripts
+# that write directly (imports, archival, seeders) call this after committing.
+BUMP_SQLITE = 'INSERT INTO data_versions (name, version) VALUES (?, 1) ON CONFLICT(name) DO UPDATE SET version = version + 1'
+BUMP_MYSQL = 'INSERT INTO data_versions (name, version) VALUES (%s, 1) ON DUPLICATE KEY UPDATE version = version + 1'
+
+
+def bump_data_versions(conn, *names):
+    """Advance each counter by one in a single commit on `conn`."""
+    if not names:
+        return
+    cur = conn.cursor()
+    try:
+        cur.executemany(BUMP_MYSQL if is_mysql_enabled() else BUMP_SQLITE, [(n,) for n in names])
         conn.commit()
+    except Exception as e:
+        conn.rollback()
+        # The app creates the table on its first start; before that nothing is cached anywhere
+        if 'no such table' not in str(e) and "doesn't exist" not in str(e):
+            raise
+    finally:
+        cur.close()
+
+
+# ---------- Backups ----------
+# `python database.py backup DEST` takes a consistent copy while the app keeps
+# taking bookings.
+#   SQLite - the online backup API copies BACKUP_PAGES pages per step. It holds the
+#            source's read lock only inside a step and sleeps BACKUP_SLEEP_MS
+#            between steps, so writers get in between. A commit from another
+#            connection makes SQLite restart the copy. After BACKUP_MAX_RESTARTS
+#            restarts the rest is copied in one step, which blocks writers only
+#            briefly (not at all in WAL mode). The copy is written to DEST.partial,
+#            passes PRAGMA integrity_check, and is then renamed into place.
+#            Archived months (archive.py keeps them in their own files under
+#            SQLITE_ARCHIVE_DIR) are copied the same way into DEST's stem plus
+#            .archive/, e.g. bus_booking-20250101-0300.archive/bookings_2024_06.db;
+#            restore them by copying that directory's files back.
+#   MySQL  - a mysqldump-compatible logical export (DROP/CREATE TABLE plus
+#            batched INSERTs) read inside one consistent-snapshot transaction,
+#            so InnoDB writers are never blocked. It sleeps BACKUP_SLEEP_MS
+#            between batches. Each table's row count is checked against the
+#            snapshot. Each table's triggers follow its rows (so the restore's
+#            INSERTs do not fire them). Restore with `mysql DB < DEST`.
+BACKUP_PAGES = int(os.getenv('BACKUP_PAGES') or 64)
+BACKUP_SLEEP_MS = float(os.getenv('BACKUP_SLEEP_MS') or 5)
+BACKUP_MAX_RESTARTS = int(os.getenv('BACKUP_MAX_RESTARTS') or 3)
+DUMP_BATCH = 500
+
+
+class BackupError(Exception):
+    pass
+
+
+class _Restarted(Exception):
+    pass
+
+
+def backup_sqlite(dest, path=None, pages=None, sleep_ms=None, max_restarts=None, verify=True):
+    """Copy the SQLite database at `path` to `dest` online; returns a summary dict."""
+    path = path or sqlite_path()
+    pages = pages or BACKUP_PAGES
+    sleep_s = (BACKUP_SLEEP_MS if sleep_ms is None else sleep_ms) / 1000.0
+    max_restarts = BACKUP_MAX_RESTARTS if max_restarts is None else max_restarts
+    partial = f'{dest}.partial'
+    if os.path.exists(partial):
+        os.remove(partial)
+    stats = {'path': dest, 'steps': 0, 'restarts': 0, 'pages': 0, 'single_step': False}
+    last = [None]
+
+    def progress(status, remaining, total):
+        stats['steps'] += 1
+        stats['pages'] = total
+        if last[0] is not None and remaining > last[0]:
+            stats['restarts'] += 1
+            if stats['restarts'] > max_restarts:
+                raise _Restarted()
+        last[0] = remaining
+        if remaining and sleep_s:
+            time.sleep(sleep_s)  # between steps: no lock held on the source
+
+    t0 = time.perf_counter()
+    src = connect_sqlite(path)
+    try:
+        target = sqlite3.connect(partial)
+        try:
+            try:
+                src.backup(target, pages=pages, progress=progress, sleep=max(sleep_s, 0.01))
+            except _Restarted:
+                # Writes keep landing between steps: copy what is left in one go
+                stats['single_step'] = True
+                src.backup(target, pages=-1)
+        finally:
+            target.close()
+        if verify:
+            stats['pages'] = verify_sqlite(partial)
+    except Exception:
+        if os.path.exists(partial):
+            os.remove(partial)
+        raise
+    finally:
+        src.close()
+    os.replace(partial, dest)
+    stats['bytes'] = os.path.getsize(dest)
+    stats['seconds'] = time.perf_counter() - t0
+    return stats
+
+
+def verify_sqlite(path):
+    """PRAGMA integrity_check on a database file; returns its page count or raises BackupError."""
+    conn = sqlite3.connect(readonly_uri(path), uri=True)
+    try:
+        result = [r[0] for r in conn.execute('PRAGMA integrity_check')]
+        if result != ['ok']:
+            raise BackupError(f'integrity check failed on {path}: {"; ".join(result[:5])}')
+        return conn.execute('PRAGMA page_count').fetchone()[0]
+    except sqlite3.DatabaseError as e:
+        raise BackupError(f'integrity check failed on {path}: {e}')
+    finally:
+        conn.close()
+
+
+def _mysql_literal(value):
+    if value is None:
+        return 'NULL'
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, (int, float, Decimal)):
+        return str(value)
+    if isinstance(value, (bytes, bytearray)):
+        return "X'" + bytes(value).hex() + "'" if value else "''"
+    if isinstance(value, datetime):
+        value = value.isoformat(sep=' ')
+    elif isinstance(value, (date, timedelta)):
+        value = str(value)
+    text = str(value)
+    for raw, escaped in (('\\', '\\\\'), ("'", "\\'"), ('\0', '\\0'), ('\n', '\\n'), ('\r', '\\r'), ('\x1a', '\\Z')):
+        text = text.replace(raw, escaped)
+    return f"'{text}'"
+
+
+_DEFINER = re.compile(r'\s+DEFINER\s*=\s*\S+@\S+', re.IGNORECASE)  # restorable by any account
+
+
+def dump_mysql(out, conn, tables=None, batch=DUMP_BATCH, sleep_ms=None):
+    """Write a mysqldump-compatible export of `tables` (default all base tables) to the text stream `out`.
+
+    Views follow the tables: app_meta's schema stamp tells a restored database
+    its migrations are done, so the `buses` view has to come back with it.
+    """
+    sleep_s = (BACKUP_SLEEP_MS if sleep_ms is None else sleep_ms) / 1000.0
+    stats = {'tables': {}, 'rows': 0}
+    t0 = time.perf_counter()
+    cur = conn.cursor()
+    cur.execute('SET SESSION TRANSACTION ISOLATION LEVEL REPEATABLE READ')
+    cur.execute('START TRANSACTION WITH CONSISTENT SNAPSHOT')
+    try:
+        if tables is None:
+            cur.execute("SHOW FULL TABLES WHERE Table_type = 'BASE TABLE'")
+            tables = [r[0] for r in cur.fetchall()]
+        cur.execute("SHOW FULL TABLES WHERE Table_type = 'VIEW'")
+        views = [r[0] for r in cur.fetchall()]
+        cur.execute('SHOW TRIGGERS')
+        triggers = {}
+        for row in cur.fetchall():
+            triggers.setdefault(row[2], []).append(row[0])  # Trigger, Event, Table, ...
+        out.write(f"-- Bus booking logical backup, {datetime.now().isoformat(sep=' ', timespec='seconds')}\n")
+        out.write('SET NAMES utf8mb4;\nSET FOREIGN_KEY_CHECKS=0;\nSET UNIQUE_CHECKS=0;\n\n')
+        for table in tables:
+            cur.execute(f'SHOW CREATE TABLE `{table}`')
+            create = cur.fetchall()[0][1]
+            cur.execute(f'SELECT COUNT(*) FROM `{table}`')
+            expected = cur.fetchall()[0][0]
+            out.write(f'DROP TABLE IF EXISTS `{table}`;\n{create};\n')
+            read = conn.cursor()
+            read.execute(f'SELECT * FROM `{table}`')
+            columns = ', '.join(f'`{d[0]}`' for d in read.description)
+            written = 0
+            while True:
+                rows = read.fetchmany(batch)
+                if not rows:
+                    break
+                values = ',\n'.join('(' + ','.join(_mysql_literal(v) for v in row) + ')' for row in rows)
+                out.write(f'INSERT INTO `{table}` ({columns}) VALUES\n{values};\n')
+                written += len(rows)
+                if sleep_s:
+                    time.sleep(sleep_s)
+            read.close()
+            if written != expected:
+                raise BackupError(f'{table}: wrote {written} rows, snapshot has {expected}')
+            for trigger in triggers.get(table, ()):
+                cur.execute(f'SHOW CREATE TRIGGER `{trigger}`')
+                create = _DEFINER.sub('', cur.fetchall()[0][2])
+                out.write(f'DROP TRIGGER IF EXISTS `{trigger}`;\nDELIMITER ;;\n{create};;\nDELIMITER ;\n')
+            out.write('\n')
+            stats['tables'][table] = written
+            stats['rows'] += written
+        for view in views:
+            cur.execute(f'SHOW CREATE VIEW `{view}`')
+            create = _DEFINER.sub('', cur.fetchall()[0][1])  # View, Create View, ...
+            out.write(f'DROP VIEW IF EXISTS `{view}`;\n{create};\n\n')
+        stats['views'] = views
+        out.write('SET UNIQUE_CHECKS=1;\nSET FOREIGN_KEY_CHECKS=1;\n-- Dump completed\n')
+    finally:
+        conn.rollback()
+        cur.close()
+    stats['seconds'] = time.perf_counter() - t0
+    return stats
+
+
+def backup(dest, **options):
+    """Back up the configured database (SQLite file copy or MySQL dump) to `dest`.
+
+    A directory gets a timestamped bus_booking-YYYYMMDD-HHMMSS.db / .sql inside it.
+    """
+    mysql_on = is_mysql_enabled()
+    if os.path.isdir(dest):
+        stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+        dest = os.path.join(dest, f"bus_booking-{stamp}.{'sql' if mysql_on else 'db'}")
+    if not mysql_on:
+        stats = backup_sqlite(dest, **options)
+        stats['archives'] = _backup_sqlite_archives(dest, **options)
+        stats['bytes'] += sum(os.path.getsize(p) for p in stats['archives'])
+        return stats
+    partial = f'{dest}.partial'
+    conn = get_conn()
+    try:
+        with open(partial, 'w', encoding='utf-8') as f:
+            stats = dump_mysql(f, conn, sleep_ms=options.get('sleep_ms'))
+    except Exception:
+        os.remove(partial)
+        raise
+    finally:
+        conn.close()
+    os.replace(partial, dest)
+    stats['path'] = dest
+    stats['bytes'] = os.path.getsize(dest)
+    return stats
+
+
+def _backup_sqlite_archives(dest, **options):
+    import archive  # archive imports this module
+    source = archive.archive_dir()
+    months = sorted(n for n in os.listdir(source) if n.startswith('bookings_') and n.endswith('.db')) if os.path.isdir(source) else []
+    if not months:
+        return []
+    target = os.path.splitext(dest)[0] + '.archive'
+    os.makedirs(target, exist_ok=True)
+    copies = []
+    for name in months:
+        copy = os.path.join(target, name)
+        backup_sqlite(copy, path=os.path.join(source, name), **options)
+        copies.append(copy)
+    return copies
 
 
 # ---------- Extra seeders ----------
@@ -192,43 +861,38 @@ def seed_popular_ap_ts(conn):
         ('APSRTC Garuda', 'Nellore', 'Tirupati', '2025-11-05 06:30', '2025-11-05 09:00', 45, 300),
         ('SVKDT Travels', 'Vijayawada', 'Hyderabad', '2025-11-07 22:00', '2025-11-08 04:30', 40, 700)
     ]
-    if is_mysql_enabled():
-        cur = conn.cursor()
-        for bus in buses:
-            cur.execute(
-                "SELECT COUNT(*) FROM buses WHERE name=%s AND from_city=%s AND to_city=%s AND depart_time=%s",
-                (bus[0], bus[1], bus[2], bus[3])
-            )
-            (count,) = cur.fetchone()
-            if count == 0:
-                cur.execute(
-                    "INSERT INTO buses (name, from_city, to_city, depart_time, arrive_time, seats_total, fare) VALUES (%s,%s,%s,%s,%s,%s,%s)",
-                    bus
-                )
-        conn.commit()
-        cur.close()
-    else:
-        cur = conn.cursor()
-        for bus in buses:
-            cur.execute(
-                "SELECT COUNT(1) FROM buses WHERE name=? AND from_city=? AND to_city=? AND depart_time=?",
-                (bus[0], bus[1], bus[2], bus[3])
-            )
-            (count,) = cur.fetchone()
-            if count == 0:
-                cur.execute(
-                    "INSERT INTO buses (name, from_city, to_city, depart_time, arrive_time, seats_total, fare) VALUES (?,?,?,?,?,?,?)",
-                    bus
-                )
-        conn.commit()
+    insert_buses(conn, buses)
+
 
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Set up the database, or back it up')
+    sub = parser.add_subparsers(dest='command')
+    backup_p = sub.add_parser('backup', help='online backup (SQLite file copy or MySQL dump)')
+    backup_p.add_argument('dest', help='file to write, or a directory for a timestamped file')
+    backup_p.add_argument('--pages', type=int, default=BACKUP_PAGES, help='SQLite pages copied per step')
+    backup_p.add_argument('--sleep-ms', type=float, default=BACKUP_SLEEP_MS, help='pause between steps / batches')
+    backup_p.add_argument('--no-verify', action='store_true', help='skip the integrity check of a SQLite copy')
+    args = parser.parse_args(argv)
+
+    if args.command == 'backup':
+        try:
+            if is_mysql_enabled():
+                stats = backup(args.dest, sleep_ms=args.sleep_ms)
+            else:
+                stats = backup(args.dest, pages=args.pages, sleep_ms=args.sleep_ms, verify=not args.no_verify)
+        except BackupError as e:
+            sys.exit(f'Backup failed: {e}')
+        print(f"{stats['path']}: {stats['bytes']} bytes in {stats['seconds']:.2f}s")
+        for path in stats.get('archives', ()):
+            print(f'  + {path}')
+        return
 
-def main():
     conn = get_conn()
     try:
         setup_schema(conn)
         seed_if_empty(conn)
         seed_popular_ap_ts(conn)
+        bump_data_versions(conn, 'buses')
         print("✅ Database ready. Sample data ensured (no data loss).")
     finally:
         conn.close()
@@ -0,0 +1,124 @@
+import os
+import json
+import time
+import threading
+from datetime import datetime
+
+import database as dbmod
+
+# ---------- Booking event log ----------
+# Every booking state change appends a row to `events` in the same transaction
+# as the change itself. The rows are never updated or deleted, and triggers
+# reject any attempt. Downstream systems read them with GET /admin/events?after=<id>
+# and pass back the returned cursor, so each sync moves only the changes since
+# the last one instead of a whole export. With wait=N the request long-polls
+# until an event arrives or N seconds pass. Writers in this process wake the
+# poller at once; writers in other workers are noticed within POLL_SECONDS.
+#
+# Ids only ever grow. On SQLite, transactions commit in id order, so a cursor
+# never skips an event. On MySQL, two transactions can commit out of id order.
+# There the feed holds back events younger than SETTLE_SECONDS, so a slower
+# commit can land before a consumer's cursor moves past it. `ts` is stamped
+# when the rows are inserted, just before the commit, so the window only has
+# to cover the insert-to-commit gap. It is a heuristic, not a guarantee: a
+# commit that stalls for longer than the window can still be passed over.
+#
+# Kinds: booking.created (also for waitlist promotions, data.source =
+# 'waitlist'), booking.paid, booking.payment_changed, booking.status_changed,
+# booking.cancelled, booking.seats_released.
+
+PAGE_LIMIT = 1000
+MAX_WAIT_SECONDS = 30
+POLL_SECONDS = 0.5
+INSERT_SQL = 'INSERT INTO events (kind, booking_id, actor_id, data, ts, created_at) VALUES (?, ?, ?, ?, ?, ?)'
+PAGE_QUERY = '''
+    SELECT id, kind, booking_id, actor_id, data, created_at FROM events
+    WHERE id > ? AND ts <= ? ORDER BY id LIMIT ?
+'''
+
+
+def settle_seconds():
+    default = '1' if dbmod.is_mysql_enabled() else '0'
+    return float(os.getenv('EVENTS_SETTLE_SECONDS') or default)
+
+
+def schema_statements(mysql_on):
+    """Re-runnable DDL: once applied, statements fail only as "already exists" (see app.run_ddl)."""
+    if mysql_on:
+        return [
+            '''
+            CREATE TABLE IF NOT EXISTS events (
+                id BIGINT AUTO_INCREMENT PRIMARY KEY,
+                kind VARCHAR(32) NOT NULL,
+                booking_id INT,
+                actor_id INT,
+                data TEXT,
+                ts DOUBLE NOT NULL,
+                created_at DATETIME,
+                INDEX idx_events_booking (booking_id)
+            )''',
+            "CREATE TRIGGER events_no_update BEFORE UPDATE ON events FOR EACH ROW "
+            "SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = 'events are append-only'",
+            "CREATE TRIGGER events_no_delete BEFORE DELETE ON events FOR EACH ROW "
+            "SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = 'events are append-only'",
+        ]
+    return [
+        '''
+        CREATE TABLE IF NOT EXISTS events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            booking_id INTEGER,
+            actor_id INTEGER,
+            data TEXT,
+            ts REAL NOT NULL,
+            created_at TEXT
+        )''',
+        "CREATE INDEX IF NOT EXISTS idx_events_booking ON events (booking_id)",
+        "CREATE TRIGGER IF NOT EXISTS events_no_update BEFORE UPDATE ON events "
+        "BEGIN SELECT RAISE(ABORT, 'events are append-only'); END",
+        "CREATE TRIGGER IF NOT EXISTS events_no_delete BEFORE DELETE ON events "
+        "BEGIN SELECT RAISE(ABORT, 'events are append-only'); END",
+    ]
+
+
+def event_row(kind, booking_id, actor_id, data):
+    """An event recorded during a transaction; stamped() turns it into INSERT_SQL parameters."""
+    return (kind, booking_id, actor_id, json.dumps(data, sort_keys=True, default=str))
+
+
+def stamped(rows):
+    """INSERT_SQL parameters for event rows, timestamped now; call just before committing."""
+    ts, created_at = time.time(), datetime.now()
+    return [row + (ts, created_at) for row in rows]
+
+
+def to_json(row):
+    return {
+        'id': row['id'],
+        'kind': row['kind'],
+        'booking_id': row['booking_id'],
+        'actor_id': row['actor_id'],
+        'created_at': str(row['created_at']),
+        'data': json.loads(row['data']) if row['data'] else {},
+    }
+
+
+class Signal:
+    """Wakes long-polling feed requests in this process when events are committed."""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self.seq = 0
+
+    def notify(self):
+        with self._cond:
+            self.seq += 1
+            self._cond.notify_all()
+
+    def wait(self, seq, timeout):
+        """Block until notify() is called after `seq` was read, or timeout."""
+        with self._cond:
+            return self._cond.wait_for(lambda: self.seq != seq, timeout)
+
+
+signal = Signal()
@@ -0,0 +1,155 @@
+import io
+import os
+import csv
+import sys
+import argparse
+from datetime import datetime
+from itertools import groupby
+
+import database as dbmod
+
+# ---------- Boarding manifests ----------
+# One pass over an indexed join gives every seat held on every departure of a
+# day: trips by idx_trips_date, their seats by the (bus_id, journey_date,
+# seat_no) unique index, bookings by primary key and passengers by
+# idx_bp_booking. Rows come back in index order (trip id, then seat), so there
+# is no sort over the whole day. They are read in batches and grouped one
+# departure at a time, so memory is bounded by a single bus, not by the fleet.
+# The app streams the result as CSV or printable HTML (templates/manifest.html);
+# `python manifest.py DATE...` writes the same files in bulk.
+
+FETCH_BATCH = 500
+CSV_COLUMNS = ['journey_date', 'trip_id', 'bus_name', 'from_city', 'to_city', 'depart', 'seat_no',
+               'passenger_name', 'phone', 'age', 'gender', 'booking_id', 'payment_status']
+TEMPLATE = 'manifest.html'
+
+MANIFEST_QUERY = '''
+    SELECT t.id AS trip_id, t.journey_date, s.name AS bus_name, s.from_city, s.to_city, s.depart_clock,
+           bs.seat_no, b.id AS booking_id, b.status, b.payment_status,
+           b.passenger_name AS booking_name, b.passenger_phone AS booking_phone,
+           p.name AS passenger_name, p.phone AS passenger_phone, p.age, p.gender
+    FROM trips t
+    JOIN services s ON s.id = t.service_id
+    LEFT JOIN booked_seats bs ON bs.bus_id = t.id AND bs.journey_date = t.journey_date
+    LEFT JOIN bookings b ON b.id = bs.booking_id
+    LEFT JOIN bookings_passengers p ON p.booking_id = b.id AND p.seat_no = bs.seat_no
+    WHERE t.journey_date = ? {trip_filter}
+    ORDER BY t.id, bs.seat_no
+'''
+
+
+def parse_date(value):
+    """YYYY-MM-DD or ValueError."""
+    return datetime.strptime(value, '%Y-%m-%d').strftime('%Y-%m-%d')
+
+
+def query(journey_date, bus_id=None):
+    if bus_id is None:
+        return MANIFEST_QUERY.format(trip_filter=''), (journey_date,)
+    return MANIFEST_QUERY.format(trip_filter='AND t.id = ?'), (journey_date, bus_id)
+
+
+def stream_rows(conn, mysql_on, journey_date, bus_id=None, batch=FETCH_BATCH):
+    """Yield manifest rows from an open connection, FETCH_BATCH at a time."""
+    sql, params = query(journey_date, bus_id)
+    if mysql_on:
+        cur = conn.cursor(dictionary=True)
+        cur.execute(sql.replace('?', '%s'), params)
+    else:
+        cur = conn.cursor()
+        cur.execute(sql, params)
+    try:
+        while True:
+            rows = cur.fetchmany(batch)
+            if not rows:
+                return
+            yield from rows
+    finally:
+        cur.close()
+
+
+def _seat_key(row):
+    seat = str(row['seat_no'])
+    return (0, int(seat), '') if seat.isdigit() else (1, 0, seat)
+
+
+def departures(rows):
+    """Group rows into (departure, [seat rows]) per trip; seats in numeric order, cancelled holds dropped."""
+    for trip_id, group in groupby(rows, key=lambda r: r['trip_id']):
+        seats, trip = [], None
+        for r in group:
+            if trip is None:
+                trip = {'trip_id': trip_id, 'journey_date': r['journey_date'], 'bus_name': r['bus_name'],
+                        'from_city': r['from_city'], 'to_city': r['to_city'], 'depart': r['depart_clock']}
+            if r['seat_no'] is None or r['status'] == 'cancelled':
+                continue
+            seats.append({
+                'seat_no': r['seat_no'],
+                'passenger_name': r['passenger_name'] or r['booking_name'],
+                'phone': r['passenger_phone'] or r['booking_phone'],
+                'age': r['age'],
+                'gender': r['gender'],
+                'booking_id': r['booking_id'],
+                'payment_status': r['payment_status'],
+            })
+        seats.sort(key=_seat_key)
+        yield trip, seats
+
+
+def csv_chunks(groups):
+    """CSV text, one chunk per departure (header first)."""
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(CSV_COLUMNS)
+    for trip, seats in groups:
+        for seat in seats:
+            writer.writerow([trip['journey_date'], trip['trip_id'], trip['bus_name'], trip['from_city'],
+                             trip['to_city'], trip['depart']] + [seat[c] for c in CSV_COLUMNS[6:]])
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+    if buf.tell():
+        yield buf.getvalue()
+
+
+def template_env():
+    import jinja2
+    templates = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')
+    return jinja2.Environment(loader=jinja2.FileSystemLoader(templates), autoescape=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Write boarding manifests for every departure of the given days')
+    parser.add_argument('dates', nargs='+', help='journey dates, YYYY-MM-DD')
+    parser.add_argument('--bus-id', type=int, help='only this trip')
+    parser.add_argument('--format', choices=('csv', 'html'), default='csv')
+    parser.add_argument('--out-dir', default='.', help="directory for manifest-DATE.FORMAT files, or - for stdout")
+    args = parser.parse_args(argv)
+    try:
+        dates = [parse_date(d) for d in args.dates]
+    except ValueError as e:
+        parser.error(str(e))
+
+    mysql_on = bool(dbmod.is_mysql_enabled())
+    template = template_env().get_template(TEMPLATE) if args.format == 'html' else None
+    conn = dbmod.get_conn()
+    try:
+        for journey_date in dates:
+            groups = departures(stream_rows(conn, mysql_on, journey_date, args.bus_id))
+            if template is not None:
+                chunks = template.generate(departures=groups, journey_date=journey_date)
+            else:
+                chunks = csv_chunks(groups)
+            if args.out_dir == '-':
+                sys.stdout.writelines(chunks)
+                continue
+            path = os.path.join(args.out_dir, f'manifest-{journey_date}.{args.format}')
+            with open(path, 'w', encoding='utf-8', newline='') as f:
+                f.writelines(chunks)
+            print(path)
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
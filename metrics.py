@@ -0,0 +1,232 @@
+import os
+import re
+import time
+import logging
+import functools
+import threading
+import contextvars
+from collections import deque
+
+# ---------- Request & query instrumentation ----------
+# Per-endpoint latency histograms, per-request DB query counts/time and a slow
+# query log, rendered in Prometheus text format. Request stats live in a
+# contextvar, so queries run through asyncio.to_thread are still attributed to
+# the request that issued them; queries outside any request count as '-'.
+
+SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS') or 100)
+SLOW_QUERY_KEEP = 200
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100)
+
+log = logging.getLogger('bus_booking.slow_query')
+_current = contextvars.ContextVar('request_stats', default=None)
+
+
+# Callables(stats, status, seconds) run after each request, e.g. the query budget fixture in tests/
+listeners = []
+# Callables returning extra exposition lines for /admin/metrics
+collectors = []
+
+
+class RequestStats:
+    __slots__ = ('endpoint', 'method', 'started', 'queries', 'db_seconds', 'statements')
+
+    def __init__(self, endpoint, method):
+        self.endpoint = endpoint
+        self.method = method
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_seconds = 0.0
+        # SQL text is only kept while someone is listening
+        self.statements = [] if listeners else None
+
+
+class _Histogram:
+    __slots__ = ('buckets', 'counts', 'total', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.total += value
+        self.count += 1
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.latency = {}        # (endpoint, method, status) -> _Histogram
+        self.query_counts = {}   # endpoint -> _Histogram of queries per request
+        self.db_time = {}        # endpoint -> (queries, seconds)
+        self.slow = deque(maxlen=SLOW_QUERY_KEEP)
+
+    def observe_request(self, stats, status, seconds):
+        with self.lock:
+            key = (stats.endpoint, stats.method, str(status))
+            hist = self.latency.get(key)
+            if hist is None:
+                hist = self.latency[key] = _Histogram(LATENCY_BUCKETS)
+            hist.observe(seconds)
+            qhist = self.query_counts.get(stats.endpoint)
+            if qhist is None:
+                qhist = self.query_counts[stats.endpoint] = _Histogram(QUERY_COUNT_BUCKETS)
+            qhist.observe(stats.queries)
+
+    def observe_query(self, endpoint, sql, params, seconds):
+        with self.lock:
+            n, total = self.db_time.get(endpoint, (0, 0.0))
+            self.db_time[endpoint] = (n + 1, total + seconds)
+            if seconds * 1000 >= SLOW_QUERY_MS:
+                entry = {
+                    'at': time.strftime('%Y-%m-%d %H:%M:%S'),
+                    'endpoint': endpoint,
+                    'ms': round(seconds * 1000, 2),
+                    'sql': normalize_sql(sql),
+                    'params': params_shape(params),
+                }
+                self.slow.append(entry)
+                log.warning('slow query %.1fms on %s: %s params=%s', entry['ms'], endpoint, entry['sql'], entry['params'])
+
+
+registry = Registry()
+
+
+def normalize_sql(sql):
+    return re.sub(r'\s+', ' ', sql or '').strip()
+
+
+def params_shape(params):
+    # Types only, never values: the log must not leak phone numbers or password hashes
+    if not params:
+        return '()'
+    return '(' + ', '.join(type(p).__name__ for p in params) + ')'
+
+
+# ---------------- Recording ----------------
+def begin(endpoint, method):
+    stats = RequestStats(endpoint, method)
+    return stats, _current.set(stats)
+
+
+def finish(stats, token, status):
+    seconds = time.perf_counter() - stats.started
+    try:
+        _current.reset(token)
+    except ValueError:
+        _current.set(None)  # finished from a different context than it began in
+    registry.observe_request(stats, status, seconds)
+    for listener in list(listeners):
+        listener(stats, status, seconds)
+    return seconds
+
+
+def current():
+    return _current.get()
+
+
+def record_query(sql, params, seconds):
+    stats = _current.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_seconds += seconds
+        if stats.statements is not None:
+            stats.statements.append(normalize_sql(sql))
+    registry.observe_query(stats.endpoint if stats is not None else '-', sql, params, seconds)
+
+
+def timed_query(func):
+    """Decorator for db helpers taking (query, params)."""
+    @functools.wraps(func)
+    def wrapper(query, params=()):
+        t0 = time.perf_counter()
+        try:
+            return func(query, params)
+        finally:
+            record_query(query, params, time.perf_counter() - t0)
+    return wrapper
+
+
+def init_app(app):
+    """Register the request hooks; call before any other before_request handler."""
+    from flask import request, g
+
+    @app.before_request
+    def _metrics_begin():
+        rule = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        g._metrics = begin(rule, request.method)
+
+    @app.after_request
+    def _metrics_header(response):
+        state = g.get('_metrics')
+        if state is not None:
+            stats = state[0]
+            app_ms = (time.perf_counter() - stats.started) * 1000
+            response.headers['Server-Timing'] = (
+                f'db;dur={stats.db_seconds * 1000:.1f};desc="{stats.queries} queries", app;dur={app_ms:.1f}'
+            )
+            g._metrics_status = response.status_code
+        return response
+
+    @app.teardown_request
+    def _metrics_finish(exc):
+        state = g.pop('_metrics', None)
+        if state is not None:
+            finish(state[0], state[1], g.pop('_metrics_status', 500))
+
+
+# ---------------- Exposition ----------------
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _histogram_lines(name, labels, hist, out):
+    cumulative = 0
+    for bound, count in zip(hist.buckets, hist.counts):
+        cumulative += count
+        out.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+    out.append(f'{name}_bucket{{{labels},le="+Inf"}} {hist.count}')
+    out.append(f'{name}_sum{{{labels}}} {hist.total:.6f}')
+    out.append(f'{name}_count{{{labels}}} {hist.count}')
+
+
+def render_prometheus():
+    out = []
+    with registry.lock:
+        out.append('# HELP http_request_duration_seconds Request latency by endpoint, method and status.')
+        out.append('# TYPE http_request_duration_seconds histogram')
+        for (endpoint, method, status), hist in sorted(registry.latency.items()):
+            labels = f'endpoint="{_label(endpoint)}",method="{method}",status="{status}"'
+            _histogram_lines('http_request_duration_seconds', labels, hist, out)
+        out.append('# HELP db_queries_per_request Number of DB queries issued per request.')
+        out.append('# TYPE db_queries_per_request histogram')
+        for endpoint, hist in sorted(registry.query_counts.items()):
+            _histogram_lines('db_queries_per_request', f'endpoint="{_label(endpoint)}"', hist, out)
+        out.append('# HELP db_queries_total DB queries by endpoint.')
+        out.append('# TYPE db_queries_total counter')
+        for endpoint, (n, _) in sorted(registry.db_time.items()):
+            out.append(f'db_queries_total{{endpoint="{_label(endpoint)}"}} {n}')
+        out.append('# HELP db_query_seconds_total Time spent in DB queries by endpoint.')
+        out.append('# TYPE db_query_seconds_total counter')
+        for endpoint, (_, seconds) in sorted(registry.db_time.items()):
+            out.append(f'db_query_seconds_total{{endpoint="{_label(endpoint)}"}} {seconds:.6f}')
+        out.append('# HELP db_slow_queries_logged Slow queries currently held in the log.')
+        out.append('# TYPE db_slow_queries_logged gauge')
+        out.append(f'db_slow_queries_logged {len(registry.slow)}')
+    for collect in list(collectors):
+        out.extend(collect())
+    return '\n'.join(out) + '\n'
+
+
+def slow_queries():
+    with registry.lock:
+        return list(reversed(registry.slow))
@@ -0,0 +1,81 @@
+import os
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.security import generate_password_hash, check_password_hash
+
+# ---------- Password hashing service ----------
+# Method string is passed straight to werkzeug, e.g. 'scrypt', 'scrypt:16384:8:1'
+# or 'pbkdf2:sha256:600000'. Changing it upgrades stored hashes on next login.
+HASH_METHOD = os.getenv('PASSWORD_HASH_METHOD', 'scrypt')
+# hashlib's scrypt/pbkdf2 release the GIL, so a small pool gives real parallelism
+# while capping how many CPU-heavy hashes run at once.
+HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS') or 0) or min(4, os.cpu_count() or 1)
+
+_executor = None
+_executor_lock = threading.Lock()
+_method_prefixes = {}
+
+
+def configure(method=None, workers=None):
+    """Change hashing parameters at runtime (used by tests and benchmarks)."""
+    global HASH_METHOD, HASH_WORKERS, _executor
+    if method:
+        HASH_METHOD = method
+    if workers and workers != HASH_WORKERS:
+        HASH_WORKERS = int(workers)
+        with _executor_lock:
+            old, _executor = _executor, None
+        if old is not None:
+            old.shutdown(wait=True)
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix='pwhash')
+    return _executor
+
+
+def _method_prefix(method):
+    # Werkzeug expands defaults ('scrypt' -> 'scrypt:32768:8:1'); hash once to learn the stored prefix
+    prefix = _method_prefixes.get(method)
+    if prefix is None:
+        prefix = generate_password_hash('', method=method).split('$', 1)[0]
+        _method_prefixes[method] = prefix
+    return prefix
+
+
+def hash_password(password: str) -> str:
+    return _get_executor().submit(generate_password_hash, password, HASH_METHOD).result()
+
+
+def verify_password(pwd_hash: str, password: str) -> bool:
+    if not pwd_hash:
+        return False
+    return _get_executor().submit(check_password_hash, pwd_hash, password).result()
+
+
+def needs_rehash(pwd_hash: str) -> bool:
+    return (pwd_hash or '').split('$', 1)[0] != _method_prefix(HASH_METHOD)
+
+
+def verify_and_upgrade(pwd_hash: str, password: str):
+    """Return (ok, new_hash). new_hash is set when the stored hash uses outdated parameters."""
+    if not verify_password(pwd_hash, password):
+        return False, None
+    if needs_rehash(pwd_hash):
+        return True, hash_password(password)
+    return True, None
+
+
+async def hash_password_async(password: str) -> str:
+    return await asyncio.wrap_future(_get_executor().submit(generate_password_hash, password, HASH_METHOD))
+
+
+async def verify_password_async(pwd_hash: str, password: str) -> bool:
+    if not pwd_hash:
+        return False
+    return await asyncio.wrap_future(_get_executor().submit(check_password_hash, pwd_hash, password))
@@ -0,0 +1,169 @@
+import io
+import os
+import re
+import json
+import time
+import pstats
+import random
+import cProfile
+import tempfile
+import threading
+import itertools
+
+import metrics
+
+# ---------- On-demand request profiler ----------
+# Profiles single requests under cProfile. It is off unless asked for: an admin sends
+# an `X-Profile: 1` header or adds `?_profile=1`, or PROFILE_SAMPLE_RATE (for example
+# 0.01) picks that fraction of all requests. When off, a request costs one header
+# and query-arg lookup, plus a random() draw if sampling is configured.
+#
+# Each profile is saved to PROFILE_DIR, which every worker shares, as two files:
+#   <id>.prof - raw pstats data for snakeviz or `python -m pstats`
+#   <id>.json - a summary that splits wall time into SQL (from the metrics
+#               counters), template rendering and the rest, which is Python,
+#               plus the top functions by cumulative time
+# Only the newest PROFILE_KEEP profiles are kept. /admin/profiles lists them.
+# A worker profiles one request at a time; requests that arrive meanwhile run
+# unprofiled, and an explicit request is told so with `X-Profile: busy`.
+
+SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE') or 0)
+PROFILE_DIR = os.getenv('PROFILE_DIR') or os.path.join(tempfile.gettempdir(), 'bus_booking_profiles')
+KEEP = int(os.getenv('PROFILE_KEEP') or 50)
+HEADER = 'X-Profile'
+QUERY_FLAG = '_profile'
+TOP_FUNCTIONS = 30
+SKIP_PREFIXES = ('/static/', '/admin/profiles')
+TEMPLATE_FUNCTIONS = {('templating.py', '_render'), ('templating.py', '_stream')}
+
+_ID_RE = re.compile(r'^[0-9]+-[0-9]+-[0-9]+$')
+_busy = threading.Lock()
+_seq = itertools.count(1)
+
+
+def requested(headers, args, is_admin):
+    """'explicit', 'sampled' or None for this request."""
+    if is_admin and (headers.get(HEADER) == '1' or args.get(QUERY_FLAG) == '1'):
+        return 'explicit'
+    if SAMPLE_RATE > 0 and random.random() < SAMPLE_RATE:
+        return 'sampled'
+    return None
+
+
+def _template_seconds(stats):
+    total = 0.0
+    for (filename, _, name), (_, _, _, cumtime, _) in stats.stats.items():
+        if (os.path.basename(filename), name) in TEMPLATE_FUNCTIONS and 'flask' in filename:
+            total += cumtime
+    return total
+
+
+def summarize(profile, info, wall_seconds, db_seconds, queries):
+    stats = pstats.Stats(profile)
+    template_seconds = _template_seconds(stats)
+    out = io.StringIO()
+    stats.stream = out
+    stats.sort_stats('cumulative').print_stats(TOP_FUNCTIONS)
+    return dict(info, seconds=round(wall_seconds, 6), sql_seconds=round(db_seconds, 6), queries=queries,
+                template_seconds=round(template_seconds, 6),
+                python_seconds=round(max(0.0, wall_seconds - db_seconds - template_seconds), 6),
+                report=out.getvalue())
+
+
+def save(profile, summary):
+    """Write <id>.prof and <id>.json to PROFILE_DIR and prune old ones; returns the id."""
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    profile_id = f'{int(time.time() * 1000)}-{os.getpid()}-{next(_seq)}'
+    profile.dump_stats(os.path.join(PROFILE_DIR, f'{profile_id}.prof'))
+    with open(os.path.join(PROFILE_DIR, f'{profile_id}.json'), 'w', encoding='utf-8') as f:
+        json.dump(dict(summary, id=profile_id), f)
+    for stale in list_ids()[KEEP:]:
+        for ext in ('.prof', '.json'):
+            try:
+                os.remove(os.path.join(PROFILE_DIR, stale + ext))
+            except OSError:
+                pass
+    return profile_id
+
+
+def list_ids():
+    """Saved profile ids, newest first."""
+    try:
+        names = os.listdir(PROFILE_DIR)
+    except OSError:
+        return []
+    ids = [n[:-5] for n in names if n.endswith('.json') and _ID_RE.match(n[:-5])]
+    return sorted(ids, key=lambda i: tuple(int(x) for x in i.split('-')), reverse=True)
+
+
+def path_for(profile_id, ext):
+    """File of a saved profile, or None for unknown or malformed ids."""
+    if not _ID_RE.match(profile_id or ''):
+        return None
+    path = os.path.join(PROFILE_DIR, f'{profile_id}{ext}')
+    return path if os.path.exists(path) else None
+
+
+def load(profile_id):
+    path = path_for(profile_id, '.json')
+    if path is None:
+        return None
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None  # pruned or half-written by another worker
+
+
+def init_app(app):
+    """Register the profiling hooks; call right after metrics.init_app so the rest of the request is covered."""
+    from flask import request, session, g
+
+    @app.before_request
+    def _profile_begin():
+        if request.path.startswith(SKIP_PREFIXES):
+            return
+        trigger = requested(request.headers, request.args, session.get('role') == 'admin')
+        if trigger is None:
+            return
+        if not _busy.acquire(blocking=False):
+            g._profile_busy = trigger == 'explicit'
+            return
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            _busy.release()  # another profiler (a debugger, Python 3.12 monitoring) owns this thread
+            g._profile_busy = trigger == 'explicit'
+            return
+        g._profile = (profile, trigger, time.perf_counter())
+
+    @app.after_request
+    def _profile_end(response):
+        state = g.pop('_profile', None)
+        if state is None:
+            if g.pop('_profile_busy', False):
+                response.headers[HEADER] = 'busy'
+            return response
+        profile, trigger, started = state
+        try:
+            profile.disable()
+            wall = time.perf_counter() - started
+            stats = metrics.current()
+            info = {'method': request.method, 'path': request.full_path.rstrip('?'),
+                    'endpoint': request.url_rule.rule if request.url_rule is not None else 'unmatched',
+                    'status': response.status_code, 'trigger': trigger, 'user_id': session.get('user_id'),
+                    'at': time.strftime('%Y-%m-%d %H:%M:%S')}
+            summary = summarize(profile, info, wall, stats.db_seconds if stats else 0.0, stats.queries if stats else 0)
+            response.headers[HEADER + '-Id'] = save(profile, summary)
+        finally:
+            _busy.release()
+        return response
+
+    @app.teardown_request
+    def _profile_abandon(exc):
+        # after_request did not run (the view raised past the error handlers)
+        state = g.pop('_profile', None)
+        if state is not None:
+            state[0].disable()
+            _busy.release()
@@ -0,0 +1,110 @@
+import os
+import time
+import threading
+
+import database as dbmod
+
+# ---------- Read replicas ----------
+# MYSQL_REPLICAS=host1[:port],host2[:port]   same database/user/password as the primary
+# SQLITE_REPLICAS=replica1.db,replica2.db      local stand-ins (opened read-only) for testing
+# Replicas are used round-robin; one that fails to connect or to answer is skipped
+# for an exponentially growing back-off (REPLICA_RETRY_SECONDS .. 60s) and the
+# read goes to the next replica, or to the primary when none is healthy.
+
+RETRY_SECONDS = float(os.getenv('REPLICA_RETRY_SECONDS') or 2)
+MAX_RETRY_SECONDS = 60.0
+
+
+class Replica:
+    def __init__(self, name, connect):
+        self.name = name
+        self.connect = connect
+        self.failures = 0
+        self.retry_at = 0.0
+        self.reads = 0
+
+    @property
+    def healthy(self):
+        return self.retry_at <= time.monotonic()
+
+
+class ReplicaPool:
+    def __init__(self, replicas):
+        self.replicas = list(replicas)
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def __bool__(self):
+        return bool(self.replicas)
+
+    def _rotation(self):
+        with self._lock:
+            start = self._next
+            self._next = (self._next + 1) % len(self.replicas)
+        return [self.replicas[(start + i) % len(self.replicas)] for i in range(len(self.replicas))]
+
+    def connect(self):
+        """Return (replica, connection) for the next healthy replica, or (None, None)."""
+        for replica in self._rotation():
+            if not replica.healthy:
+                continue
+            try:
+                conn = replica.connect()
+            except Exception:
+                self.mark_failed(replica)
+                continue
+            replica.reads += 1
+            return replica, conn
+        return None, None
+
+    def mark_failed(self, replica):
+        with self._lock:
+            replica.failures += 1
+            backoff = min(MAX_RETRY_SECONDS, RETRY_SECONDS * (2 ** (replica.failures - 1)))
+            replica.retry_at = time.monotonic() + backoff
+
+    def mark_ok(self, replica):
+        if replica.failures:
+            with self._lock:
+                replica.failures = 0
+                replica.retry_at = 0.0
+
+    def status(self):
+        return [{'name': r.name, 'healthy': r.healthy, 'failures': r.failures, 'reads': r.reads} for r in self.replicas]
+
+
+def _sqlite_connect(path):
+    def connect():
+        return dbmod.connect_sqlite(path, readonly=True)
+    return connect
+
+
+def _mysql_connect(host, port):
+    def connect():
+        return dbmod.load_mysql().connect(
+            host=host,
+            port=port,
+            database=os.getenv('MYSQL_DB'),
+            user=os.getenv('MYSQL_USER'),
+            password=os.getenv('MYSQL_PASSWORD', ''),
+            autocommit=True,
+            connection_timeout=3,
+        )
+    return connect
+
+
+def from_env(mysql_enabled=False):
+    replicas = []
+    if mysql_enabled:
+        for entry in (os.getenv('MYSQL_REPLICAS') or '').split(','):
+            entry = entry.strip()
+            if not entry:
+                continue
+            host, _, port = entry.partition(':')
+            replicas.append(Replica(entry, _mysql_connect(host, int(port or 3306))))
+    else:
+        for path in (os.getenv('SQLITE_REPLICAS') or '').split(','):
+            path = path.strip()
+            if path:
+                replicas.append(Replica(path, _sqlite_connect(path)))
+    return ReplicaPool(replicas)
@@ -0,0 +1,142 @@
+import heapq
+import time
+from bisect import bisect_left
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+# ---------- Multi-leg connection search ----------
+# The graph is built once from trip rows and kept in memory; searches are a
+# time-dependent best-first walk (earliest arrival first) with Pareto pruning on
+# (arrival, departure, legs, fare), so no itinerary returned is beaten on all four.
+
+EPOCH = datetime(2000, 1, 1)
+
+Connection = namedtuple('Connection', 'depart arrive trip_id name from_city to_city fare')
+
+
+def _minutes(value):
+    if isinstance(value, datetime):
+        dt = value
+    else:
+        dt = datetime.strptime(str(value).strip()[:16].replace('T', ' '), '%Y-%m-%d %H:%M')
+    return int((dt - EPOCH).total_seconds() // 60)
+
+
+def _fmt(minutes):
+    return (EPOCH + timedelta(minutes=minutes)).strftime('%Y-%m-%d %H:%M')
+
+
+class RouteGraph:
+    """Departures per city, sorted by time, with a parallel list of times for bisect."""
+
+    def __init__(self):
+        self.departures = {}
+        self.times = {}
+        self.cities = {}
+        self.size = 0
+
+    def add(self, conn):
+        self.departures.setdefault(conn.from_city, []).append(conn)
+        self.size += 1
+
+    def finish(self):
+        for city, conns in self.departures.items():
+            conns.sort()
+            self.times[city] = [c.depart for c in conns]
+        return self
+
+
+def build_graph(rows):
+    """rows: dict-likes with id, name, from_city, to_city, depart_time, arrive_time, fare."""
+    graph = RouteGraph()
+    for r in rows:
+        try:
+            depart = _minutes(r['depart_time'])
+            arrive = _minutes(r['arrive_time'])
+        except (TypeError, ValueError):
+            continue  # free-text times can't be scheduled against
+        if arrive < depart:
+            continue
+        from_key = (r['from_city'] or '').strip().lower()
+        to_key = (r['to_city'] or '').strip().lower()
+        graph.cities.setdefault(from_key, r['from_city'])
+        graph.cities.setdefault(to_key, r['to_city'])
+        graph.add(Connection(depart, arrive, r['id'], r['name'], from_key, to_key, float(r['fare'] or 0)))
+    return graph.finish()
+
+
+def search(graph, origin, destination, depart_after=None, depart_before=None,
+           max_legs=3, min_transfer=30, max_wait=24 * 60, limit=5, budget_ms=250):
+    """Return (itineraries, complete). Times are datetimes; min_transfer/max_wait are minutes."""
+    origin = (origin or '').strip().lower()
+    destination = (destination or '').strip().lower()
+    if origin not in graph.departures or destination not in graph.cities or origin == destination:
+        return [], True
+    start = _minutes(depart_after) if depart_after else 0
+    first_latest = _minutes(depart_before) if depart_before else None
+    deadline = time.perf_counter() + budget_ms / 1000.0
+
+    heap = [(start, 0, 0.0, 0, origin, ())]
+    labels = {}
+    results = []
+    counter = 1
+    complete = True
+    pops = 0
+    while heap:
+        pops += 1
+        if pops % 256 == 0 and time.perf_counter() > deadline:
+            complete = False
+            break
+        arrive, legs, fare, _, city, path = heapq.heappop(heap)
+        # Popped in arrival order, so a label survives only if it leaves later, needs fewer legs or costs less
+        dep = path[0].depart if path else start
+        seen = labels.setdefault(city, [])
+        if any(l <= legs and f <= fare and d >= dep for l, f, d in seen):
+            continue
+        seen.append((legs, fare, dep))
+        if city == destination:
+            results.append(path)
+            if len(results) >= limit:
+                break
+            continue
+        if legs >= max_legs:
+            continue
+        conns = graph.departures.get(city)
+        if not conns:
+            continue
+        if legs == 0:
+            earliest, latest = start, first_latest
+        else:
+            earliest, latest = arrive + min_transfer, arrive + min_transfer + max_wait
+        visited = {origin}.union(c.to_city for c in path)
+        for i in range(bisect_left(graph.times[city], earliest), len(conns)):
+            c = conns[i]
+            if latest is not None and c.depart > latest:
+                break
+            if c.to_city in visited:
+                continue
+            heapq.heappush(heap, (c.arrive, legs + 1, fare + c.fare, counter, c.to_city, path + (c,)))
+            counter += 1
+    return [_itinerary(graph, p) for p in results], complete
+
+
+def _itinerary(graph, path):
+    first, last = path[0], path[-1]
+    return {
+        'depart_time': _fmt(first.depart),
+        'arrive_time': _fmt(last.arrive),
+        'duration_minutes': last.arrive - first.depart,
+        'transfers': len(path) - 1,
+        'total_fare': round(sum(c.fare for c in path), 2),
+        'legs': [
+            {
+                'id': c.trip_id,
+                'name': c.name,
+                'from_city': graph.cities.get(c.from_city, c.from_city),
+                'to_city': graph.cities.get(c.to_city, c.to_city),
+                'depart_time': _fmt(c.depart),
+                'arrive_time': _fmt(c.arrive),
+                'fare': c.fare,
+            } for c in path
+        ],
+    }
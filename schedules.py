@@ -0,0 +1,137 @@
+import csv
+import io
+import sys
+import time
+import argparse
+from datetime import datetime, timedelta
+
+import database as dbmod
+
+# ---------- Bulk schedule import ----------
+# Two CSV shapes are accepted (header row required):
+#   one-off trips  : name,from_city,to_city,depart_time,arrive_time,seats_total,fare
+#                    (same columns as /admin/export/buses.csv; an id column is ignored)
+#   recurring      : name,from_city,to_city,depart_time,arrive_time,seats_total,fare,start_date,end_date[,days]
+#                    depart_time/arrive_time are HH:MM; an arrival earlier than the
+#                    departure lands on the next day. days = daily | weekdays | weekends | Mon,Wed,Fri
+
+WEEKDAYS = {'mon': 0, 'tue': 1, 'wed': 2, 'thu': 3, 'fri': 4, 'sat': 5, 'sun': 6}
+
+
+def parse_days(spec: str):
+    spec = (spec or 'daily').strip().lower()
+    if spec in ('', 'daily', 'all'):
+        return set(range(7))
+    if spec == 'weekdays':
+        return {0, 1, 2, 3, 4}
+    if spec == 'weekends':
+        return {5, 6}
+    days = set()
+    for part in spec.replace(' ', ',').split(','):
+        part = part.strip()[:3]
+        if not part:
+            continue
+        if part not in WEEKDAYS:
+            raise ValueError(f'Unknown weekday: {part}')
+        days.add(WEEKDAYS[part])
+    return days
+
+
+def expand_schedule(defn):
+    """Yield one bus row per matching date of a recurring service definition."""
+    start = datetime.strptime(defn['start_date'].strip(), '%Y-%m-%d').date()
+    end = datetime.strptime(defn['end_date'].strip(), '%Y-%m-%d').date()
+    depart = datetime.strptime(defn['depart_time'].strip(), '%H:%M').time()
+    arrive = datetime.strptime(defn['arrive_time'].strip(), '%H:%M').time()
+    days = parse_days(defn.get('days'))
+    day_offset = 1 if arrive <= depart else 0
+    seats_total = int(defn.get('seats_total') or 40)
+    fare = float(defn.get('fare') or 0)
+    d = start
+    while d <= end:
+        if d.weekday() in days:
+            dep = datetime.combine(d, depart)
+            arr = datetime.combine(d + timedelta(days=day_offset), arrive)
+            yield (
+                defn['name'].strip(), defn['from_city'].strip(), defn['to_city'].strip(),
+                dep.strftime('%Y-%m-%d %H:%M'), arr.strftime('%Y-%m-%d %H:%M'),
+                seats_total, fare,
+            )
+        d += timedelta(days=1)
+
+
+def iter_csv_rows(text_stream):
+    """Yield bus rows from either CSV shape, expanding recurring definitions lazily."""
+    reader = csv.DictReader(text_stream)
+    for line_no, rec in enumerate(reader, start=2):
+        rec = {(k or '').strip().lower(): (v or '') for k, v in rec.items()}
+        try:
+            if rec.get('start_date') and rec.get('end_date'):
+                yield from expand_schedule(rec)
+            else:
+                row = (
+                    rec['name'].strip(), rec['from_city'].strip(), rec['to_city'].strip(),
+                    rec['depart_time'].strip(), rec['arrive_time'].strip(),
+                    int(rec.get('seats_total') or 40), float(rec.get('fare') or 0),
+                )
+                dbmod.split_bus_times(row[3], row[4])  # report bad times with their line number
+                yield row
+        except (KeyError, ValueError) as e:
+            raise ValueError(f'Line {line_no}: {e}')
+
+
+def import_rows(conn, rows, batch_size=1000):
+    """Insert rows with dedup and return a report dict (rows, inserted, skipped, seconds, rows_per_sec)."""
+    counted = {'rows': 0}
+
+    def counting(it):
+        for r in it:
+            counted['rows'] += 1
+            yield r
+
+    started = time.perf_counter()
+    inserted = dbmod.insert_buses(conn, counting(rows), batch_size=batch_size)
+    seconds = time.perf_counter() - started
+    total = counted['rows']
+    return {
+        'rows': total,
+        'inserted': inserted,
+        'skipped': total - inserted,
+        'seconds': round(seconds, 3),
+        'rows_per_sec': round(total / seconds, 1) if seconds > 0 else float(total),
+    }
+
+
+def import_csv(conn, data, batch_size=1000):
+    if isinstance(data, bytes):
+        data = data.decode('utf-8-sig')
+    if isinstance(data, str):
+        data = io.StringIO(data)
+    return import_rows(conn, iter_csv_rows(data), batch_size=batch_size)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Bulk import bus trips or recurring schedules from CSV.')
+    parser.add_argument('csv_file', help="CSV path, or '-' for stdin")
+    parser.add_argument('--batch-size', type=int, default=1000)
+    args = parser.parse_args(argv)
+    conn = dbmod.get_conn()
+    try:
+        dbmod.setup_schema(conn)
+        try:
+            if args.csv_file == '-':
+                report = import_rows(conn, iter_csv_rows(sys.stdin), batch_size=args.batch_size)
+            else:
+                with open(args.csv_file, newline='', encoding='utf-8-sig') as f:
+                    report = import_rows(conn, iter_csv_rows(f), batch_size=args.batch_size)
+        finally:
+            # Even a failed import may have committed some batches
+            dbmod.bump_data_versions(conn, 'buses')
+    finally:
+        conn.close()
+    print(f"Imported {report['inserted']} of {report['rows']} rows "
+          f"({report['skipped']} duplicates) in {report['seconds']}s – {report['rows_per_sec']} rows/sec")
+
+
+if __name__ == '__main__':
+    main()
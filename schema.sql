@@ -1,16 +1,37 @@
-DROP TABLE IF EXISTS buses;
+DROP VIEW IF EXISTS buses;
+DROP TABLE IF EXISTS trips;
+DROP TABLE IF EXISTS services;
 DROP TABLE IF EXISTS bookings;
 
-CREATE TABLE buses (
+CREATE TABLE services (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     name TEXT NOT NULL,
     from_city TEXT NOT NULL,
     to_city TEXT NOT NULL,
-    depart_time TEXT NOT NULL,
-    arrive_time TEXT NOT NULL,
-    seats_total INTEGER,
-    fare REAL
+    depart_clock TEXT NOT NULL,
+    arrive_clock TEXT NOT NULL,
+    arrive_day_offset INTEGER NOT NULL DEFAULT 0,
+    seats_total INTEGER NOT NULL DEFAULT 40,
+    fare REAL NOT NULL DEFAULT 0,
+    UNIQUE (name, from_city, to_city, depart_clock, arrive_clock, arrive_day_offset, seats_total, fare)
 );
+CREATE INDEX idx_services_route ON services (from_city, to_city);
+
+CREATE TABLE trips (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    service_id INTEGER NOT NULL,
+    journey_date TEXT NOT NULL,
+    UNIQUE (service_id, journey_date),
+    FOREIGN KEY (service_id) REFERENCES services (id)
+);
+CREATE INDEX idx_trips_date ON trips (journey_date);
+
+CREATE VIEW buses AS
+SELECT t.id, s.name, s.from_city, s.to_city,
+       t.journey_date || ' ' || s.depart_clock AS depart_time,
+       date(t.journey_date, '+' || s.arrive_day_offset || ' day') || ' ' || s.arrive_clock AS arrive_time,
+       s.seats_total, s.fare, t.service_id, t.journey_date
+FROM trips t JOIN services s ON s.id = t.service_id;
 
 CREATE TABLE bookings (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -19,5 +40,5 @@ CREATE TABLE bookings (
     passenger_phone TEXT NOT NULL,
     seats_booked INTEGER NOT NULL,
     booked_at TEXT NOT NULL,
-    FOREIGN KEY (bus_id) REFERENCES buses (id)
+    FOREIGN KEY (bus_id) REFERENCES trips (id)
 );
@@ -0,0 +1,149 @@
+import json
+import time
+import asyncio
+import threading
+from collections import deque
+
+# ---------- Seat-map pub/sub ----------
+# One channel per (bus_id, journey_date). Each channel keeps a short history of
+# numbered events so a subscriber only holds a cursor: publishing is O(1) in the
+# number of idle subscribers. Threads (Flask SSE) wait on a Condition; asyncio
+# subscribers (asgi.py) on the same loop share a single future per channel, so a
+# broadcast costs one call_soon_threadsafe per event loop, not per client.
+#
+# A channel with no subscribers and no activity for IDLE_SECONDS is dropped (checked
+# at most every IDLE_SECONDS / 4, when a channel is used). A channel created later
+# for the same trip numbers its events after every dropped one, so a client still
+# holding an old cursor is told to resync rather than waiting for the count to
+# catch up.
+
+HISTORY = 64
+HEARTBEAT_SECONDS = 15
+IDLE_SECONDS = 300
+
+
+class _Channel:
+    __slots__ = ('seq', 'events', 'cond', 'loop_futures', 'subscribers', 'touched')
+
+    def __init__(self, seq, now):
+        self.seq = seq
+        self.events = deque(maxlen=HISTORY)
+        self.cond = threading.Condition()
+        self.loop_futures = {}
+        self.subscribers = 0
+        self.touched = now
+
+
+def _wake(fut):
+    if not fut.done():
+        fut.set_result(None)
+
+
+class SeatBroadcaster:
+    def __init__(self, clock=time.monotonic):
+        self._lock = threading.Lock()
+        self._channels = {}
+        self._clock = clock
+        self._swept = clock()
+        self._dropped_seq = 0  # highest seq of any dropped channel
+
+    def _channel(self, key):
+        ch = self._channels.get(key)
+        if ch is None:
+            now = self._clock()
+            with self._lock:
+                ch = self._channels.get(key)
+                if ch is None:
+                    ch = self._channels[key] = _Channel(self._dropped_seq, now)
+            self._sweep(now)
+        return ch
+
+    def _sweep(self, now):
+        if now - self._swept < IDLE_SECONDS / 4:
+            return
+        with self._lock:
+            self._swept = now
+            for key, ch in list(self._channels.items()):
+                with ch.cond:
+                    if ch.subscribers == 0 and now - ch.touched > IDLE_SECONDS:
+                        del self._channels[key]
+                        self._dropped_seq = max(self._dropped_seq, ch.seq)
+
+    def publish(self, bus_id, journey_date, kind, seats, booking_id=None):
+        ch = self._channel((int(bus_id), str(journey_date)))
+        now = self._clock()
+        with ch.cond:
+            ch.touched = now
+            ch.seq += 1
+            ch.events.append((ch.seq, {'kind': kind, 'seats': [str(s) for s in seats], 'booking_id': booking_id}))
+            ch.cond.notify_all()
+            futures, ch.loop_futures = ch.loop_futures, {}
+        for loop, fut in futures.items():
+            try:
+                loop.call_soon_threadsafe(_wake, fut)
+            except RuntimeError:
+                pass  # loop already closed
+        self._sweep(now)
+
+    def cursor(self, key):
+        return self._channel(key).seq
+
+    def _since(self, ch, cursor):
+        """Return (events, new_cursor, lost) where lost means history no longer reaches cursor."""
+        if ch.seq <= cursor:
+            return [], ch.seq, False
+        lost = not ch.events or ch.events[0][0] > cursor + 1
+        return [e for e in ch.events if e[0] > cursor], ch.seq, lost
+
+    def wait(self, key, cursor, timeout=HEARTBEAT_SECONDS):
+        ch = self._channel(key)
+        with ch.cond:
+            if ch.seq <= cursor:
+                ch.subscribers += 1
+                try:
+                    ch.cond.wait(timeout)
+                finally:
+                    ch.subscribers -= 1
+                    ch.touched = self._clock()
+            return self._since(ch, cursor)
+
+    async def wait_async(self, key, cursor, timeout=HEARTBEAT_SECONDS):
+        ch = self._channel(key)
+        loop = asyncio.get_running_loop()
+        with ch.cond:
+            if ch.seq > cursor:
+                return self._since(ch, cursor)
+            fut = ch.loop_futures.get(loop)
+            if fut is None or fut.done():
+                # The heartbeat timer is shared too: one timer per channel and loop, not per client
+                fut = ch.loop_futures[loop] = loop.create_future()
+                loop.call_later(timeout, _wake, fut)
+            ch.subscribers += 1
+        try:
+            await asyncio.shield(fut)
+        finally:
+            with ch.cond:
+                ch.subscribers -= 1
+                ch.touched = self._clock()
+        with ch.cond:
+            return self._since(ch, cursor)
+
+    def stats(self):
+        with self._lock:
+            channels = list(self._channels.values())
+        return {'channels': len(channels), 'subscribers': sum(c.subscribers for c in channels)}
+
+
+broadcaster = SeatBroadcaster()
+
+
+def format_sse(events, lost):
+    """Render events as text/event-stream frames; 'resync' tells the client to refetch the seat map."""
+    out = []
+    if lost:
+        seq = events[-1][0] if events else 0
+        out.append(f"id: {seq}\nevent: resync\ndata: {{}}\n\n")
+        return ''.join(out)
+    for seq, payload in events:
+        out.append(f"id: {seq}\nevent: {payload['kind']}\ndata: {json.dumps(payload, separators=(',', ':'))}\n\n")
+    return ''.join(out)
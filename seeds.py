@@ -1,9 +1,9 @@
 import os
 from datetime import datetime
-from werkzeug.security import generate_password_hash
 
 # Reuse DB helpers from database.py to avoid importing Flask app
 import database as dbmod
+import passwords
 
 def seed_users():
     conn = dbmod.get_conn()
@@ -20,7 +20,7 @@ def seed_users():
         if row is None:
             cur.execute(
                 "INSERT INTO users (email, password_hash, created_at, role, name, phone) VALUES (?,?,?,?,?,?)",
-                (admin_email, generate_password_hash(admin_pwd), datetime.now().isoformat(), 'admin', 'Admin', None)
+                (admin_email, passwords.hash_password(admin_pwd), datetime.now().isoformat(), 'admin', 'Admin', None)
             )
             print(f"Seeded admin: {admin_email} / {admin_pwd}")
         else:
@@ -35,7 +35,7 @@ def seed_users():
         if row is None:
             cur.execute(
                 "INSERT INTO users (email, password_hash, created_at, role, name, phone) VALUES (?,?,?,?,?,?)",
-                (cust_email, generate_password_hash(cust_pwd), datetime.now().isoformat(), 'customer', 'Customer', '9000000000')
+                (cust_email, passwords.hash_password(cust_pwd), datetime.now().isoformat(), 'customer', 'Customer', '9000000000')
             )
             print(f"Seeded customer: {cust_email} / {cust_pwd}")
         else:
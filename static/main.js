@@ -23,6 +23,8 @@ let appliedCoupon = null;
 let debounceTimer = null;
 let hasSearched = false;
 let lastResults = [];
+let seatStream = null;
+let seatStreamQueue = null;
 
 async function searchBuses() {
     const from = document.getElementById('fromCity').value.trim();
@@ -84,10 +86,18 @@ function renderPassengerForms() {
     }
 }
 
+// appliedCoupon is the rule returned by /api/coupons/<code>; the server re-checks it on booking
+function couponDiscount(base) {
+    if (!appliedCoupon || base <= 0) return 0;
+    let amount = appliedCoupon.kind === 'percent' ? Math.round(base * appliedCoupon.amount) / 100 : appliedCoupon.amount;
+    if (appliedCoupon.kind === 'percent' && appliedCoupon.max_discount != null) amount = Math.min(amount, appliedCoupon.max_discount);
+    return Math.min(amount, base);
+}
+
 function updateFareTotal() {
     const seatCount = selectedSeats.length;
     const base = (seatCount * (currentSeatFare || 0));
-    const discount = appliedCoupon === 'TRIP100' ? 100 : 0;
+    const discount = couponDiscount(base);
     const total = Math.max(0, base - discount);
     const el = document.getElementById('fareTotal');
     if (el) el.textContent = String(total);
@@ -138,6 +148,66 @@ function renderSeatMap(data) {
     seatMap.appendChild(container);
 }
 
+// Live seat updates: open the stream before fetching the map so nothing published
+// in between is missed; events that arrive before the map renders are queued.
+function applySeatEvent(kind, data) {
+    if (seatStreamQueue) { seatStreamQueue.push([kind, data]); return; }
+    const taken = [];
+    (data.seats || []).forEach(label => {
+        const seat = document.querySelector(`#seatMap .seat[data-label="${label}"]`);
+        if (!seat) return;
+        if (kind === 'booked') {
+            seat.classList.remove('available');
+            seat.classList.add('booked');
+            const i = selectedSeats.indexOf(label);
+            if (i >= 0) { selectedSeats.splice(i, 1); seat.classList.remove('selected'); taken.push(label); }
+        } else if (kind === 'released') {
+            seat.classList.remove('booked');
+            seat.classList.add('available');
+        }
+    });
+    if (taken.length) {
+        showToast(`Seat(s) ${taken.join(', ')} just got booked`, 'warning');
+        updateFareTotal();
+        renderPassengerForms();
+    }
+}
+
+function openSeatStream(busId) {
+    closeSeatStream();
+    if (!window.EventSource) return;
+    seatStreamQueue = [];
+    seatStream = new EventSource(`/api/buses/${busId}/seats/stream`);
+    seatStream.addEventListener('booked', e => applySeatEvent('booked', JSON.parse(e.data)));
+    seatStream.addEventListener('released', e => applySeatEvent('released', JSON.parse(e.data)));
+    seatStream.addEventListener('resync', () => refreshSeatMap(busId));
+}
+
+function flushSeatStream() {
+    const queued = seatStreamQueue || [];
+    seatStreamQueue = null;
+    queued.forEach(([kind, data]) => applySeatEvent(kind, data));
+}
+
+function closeSeatStream() {
+    if (seatStream) seatStream.close();
+    seatStream = null;
+    seatStreamQueue = null;
+}
+
+async function refreshSeatMap(busId) {
+    try {
+        const res = await fetch(`/api/buses/${busId}/seats`);
+        const data = await res.json();
+        const keep = selectedSeats.filter(l => !(data.booked || []).includes(l));
+        renderSeatMap(data);
+        selectedSeats = keep;
+        keep.forEach(l => document.querySelector(`#seatMap .seat[data-label="${l}"]`)?.classList.add('selected'));
+        updateFareTotal();
+        renderPassengerForms();
+    } catch (e) { /* next event or reopen will retry */ }
+}
+
 function renderResults(buses) {
     const list = document.getElementById('bus-list');
     const empty = document.getElementById('no-results');
@@ -212,15 +282,18 @@ async function openBookingModal(busId, buses) {
     seatMap.innerHTML = '';
     // fetch seats for date
     const date = document.getElementById('travelDate')?.value || '';
+    openSeatStream(busId);
     try {
         const res = await fetch(`/api/buses/${busId}/seats?date=${encodeURIComponent(date)}`);
         const data = await res.json();
         currentSeatFare = Number(data.fare || selectedBus?.fare || 0);
         renderSeatMap(data);
+        flushSeatStream();
         updateFareTotal();
         renderPassengerForms();
     } catch (e) {
         renderSeatMap({ layout: '2x2', booked: [], seats_total: 40, seats: Array.from({length:40}, (_,i)=>String(i+1)) });
+        flushSeatStream();
         updateFareTotal();
         renderPassengerForms();
     }
@@ -236,6 +309,7 @@ async function openBookingModal(busId, buses) {
 }
 
 function closeBookingModal() {
+    closeSeatStream();
     const modal = document.getElementById('bookingModal');
     modal.classList.remove('open');
     modal.setAttribute('aria-hidden', 'true');
@@ -269,7 +343,7 @@ async function confirmBooking() {
                 seats,
                 seat_numbers: selectedSeats,
                 date: document.getElementById('travelDate')?.value || '',
-                coupon_code: appliedCoupon || '',
+                coupon_code: appliedCoupon ? appliedCoupon.code : '',
                 passengers
             })
         });
@@ -370,19 +444,29 @@ window.addEventListener('DOMContentLoaded', () => {
         }
     });
     if (confirmBtn) confirmBtn.addEventListener('click', confirmBooking);
-    if (applyCouponBtn) applyCouponBtn.addEventListener('click', () => {
+    if (applyCouponBtn) applyCouponBtn.addEventListener('click', async () => {
         const code = (document.getElementById('couponCode')?.value || '').trim().toUpperCase();
         const note = document.getElementById('discountNote');
-        if (code === 'TRIP100') {
-            appliedCoupon = 'TRIP100';
+        let data = { status: 'error', message: 'Invalid coupon' };
+        if (code && selectedBus) {
+            try {
+                const params = new URLSearchParams({ bus_id: selectedBus.id, seats: Math.max(1, selectedSeats.length) });
+                data = await (await fetch(`/api/coupons/${encodeURIComponent(code)}?${params.toString()}`)).json();
+            } catch (e) {
+                data = { status: 'error', message: 'Network error' };
+            }
+        }
+        if (data.status === 'success') {
+            appliedCoupon = data;
             updateFareTotal();
-            if (note) { note.style.display = 'block'; note.textContent = 'Coupon TRIP100 applied: ₹100 off on total.'; }
+            const off = data.kind === 'percent' ? `${data.amount}% off` : `₹${data.amount} off`;
+            if (note) { note.style.display = 'block'; note.textContent = `Coupon ${data.code} applied: ${off} on total.`; }
             showToast('Coupon applied', 'success');
         } else {
             appliedCoupon = null;
             updateFareTotal();
-            if (note) { note.style.display = 'block'; note.textContent = 'Invalid coupon'; }
-            showToast('Invalid coupon', 'warning');
+            if (note) { note.style.display = 'block'; note.textContent = data.message || 'Invalid coupon'; }
+            showToast(data.message || 'Invalid coupon', 'warning');
         }
     });
     // Recalculate total if user edits Seats input directly
@@ -0,0 +1,108 @@
+import os
+import sys
+import shutil
+import tempfile
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def pytest_configure(config):
+    # Run the suite against a throwaway copy and leave the committed database untouched
+    workdir = tempfile.mkdtemp(prefix='bus_booking_tests_')
+    os.environ['SQLITE_PATH'] = shutil.copy(os.path.join(ROOT, 'bus_booking.db'), workdir)
+    config.addinivalue_line(
+        'markers',
+        "max_queries(ceilings): fail if a request issues more DB queries than allowed, "
+        "e.g. @pytest.mark.max_queries({'POST /api/bookings': 4})",
+    )
+
+
+class QueryBudget:
+    """Collects DB query counts per request (via metrics.listeners) and checks ceilings."""
+
+    def __init__(self):
+        self.requests = []
+        self.ceilings = {}
+
+    def __call__(self, stats, status, seconds):
+        self.requests.append({
+            'key': f'{stats.method} {stats.endpoint}',
+            'status': status,
+            'queries': stats.queries,
+            'statements': list(stats.statements or []),
+        })
+
+    def limit(self, key, max_queries):
+        self.ceilings[key] = max_queries
+
+    def last(self, key=None):
+        matching = [r for r in self.requests if key is None or r['key'] == key]
+        return matching[-1] if matching else None
+
+    def violations(self):
+        problems = []
+        for r in self.requests:
+            ceiling = self.ceilings.get(r['key'])
+            if ceiling is not None and r['queries'] > ceiling:
+                listing = '\n'.join(f'    {i + 1}. {sql}' for i, sql in enumerate(r['statements']))
+                problems.append(f"{r['key']} ({r['status']}) issued {r['queries']} queries, ceiling is {ceiling}:\n{listing}")
+        return problems
+
+
+@pytest.fixture
+def query_budget(request):
+    import metrics
+    budget = QueryBudget()
+    marker = request.node.get_closest_marker('max_queries')
+    if marker:
+        for key, ceiling in marker.args[0].items():
+            budget.limit(key, ceiling)
+    metrics.listeners.append(budget)
+    try:
+        yield budget
+    finally:
+        metrics.listeners.remove(budget)
+    problems = budget.violations()
+    if problems:
+        pytest.fail('\n'.join(problems), pytrace=False)
+
+
+@pytest.fixture(scope='session', autouse=True)
+def initialized_app():
+    # Schema setup once up front, so it never lands inside a test's query budget
+    import app as webapp
+    return webapp.create_app()
+
+
+@pytest.fixture
+def user_client():
+    from app import app
+    app.config['TESTING'] = True
+    with app.test_client() as c:
+        with c.session_transaction() as sess:
+            sess['user_id'] = 1
+            sess['user_email'] = 'admin@example.com'
+            sess['role'] = 'admin'
+        yield c
+
+
+@pytest.fixture
+def make_trip():
+    """Factory: create a trip through /admin/buses/new and return its id.
+
+    Names get a random suffix unless ``name`` is given, so test services never collide.
+    """
+    import uuid
+    import app as webapp
+    admin = webapp.app.test_client()
+    with admin.session_transaction() as sess:
+        sess['user_id'] = 1
+        sess['role'] = 'admin'
+
+    def make(prefix='Trip', name=None, **fields):
+        name = name or f'{prefix} {uuid.uuid4().hex[:8]}'
+        admin.post('/admin/buses/new', data={'name': name, **{k: str(v) for k, v in fields.items()}})
+        return webapp.db_fetch_one('SELECT t.id FROM trips t JOIN services s ON s.id = t.service_id WHERE s.name = ?', (name,))['id']
+    return make
@@ -0,0 +1,112 @@
+import os
+import shutil
+from datetime import date
+
+import app as webapp
+import archive
+import database as dbmod
+
+
+def _live_count(table, booking_id):
+    key = 'id' if table == 'bookings' else 'booking_id'
+    return webapp.db_fetch_one(f'SELECT COUNT(*) AS n FROM {table} WHERE {key} = ?', (booking_id,))['n']
+
+
+def test_archived_month_leaves_live_tables_and_ticket_still_renders(user_client, tmp_path, monkeypatch):
+    monkeypatch.setenv('SQLITE_PATH', shutil.copy(dbmod.sqlite_path(), str(tmp_path / 'bus_booking.db')))
+    trip = webapp.db_fetch_one('SELECT id, journey_date FROM trips ORDER BY journey_date LIMIT 1')
+    month = trip['journey_date'][:7]
+    resp = user_client.post('/api/bookings', json={
+        'bus_id': trip['id'], 'name': 'Archie', 'phone': '9000000003', 'seat_numbers': ['37'],
+        'passengers': [{'name': 'Archie Passenger'}],
+    })
+    booking_id = resp.get_json()['booking_id']
+
+    conn = dbmod.connect_sqlite()
+    try:
+        assert month in archive.archivable_months(conn, keep_days=0, today=date(2099, 1, 1))
+        assert month not in archive.archivable_months(conn, keep_days=0, today=date(int(month[:4]), int(month[5:]), 15))
+        assert archive.run(conn, keep_days=0, log=lambda *_: None) > 0
+        assert archive.run(conn, keep_days=0, log=lambda *_: None) == 0
+    finally:
+        conn.close()
+
+    assert os.path.exists(archive.archive_path(month))
+    assert [_live_count(t, booking_id) for t in archive.ARCHIVED_TABLES] == [0, 0, 0]
+    assert webapp.archived_booking_month(booking_id) == month
+
+    resp = user_client.get(f'/ticket/{booking_id}')
+    assert resp.status_code == 200
+    assert b'Archie Passenger' in resp.data and b'37' in resp.data
+
+
+def test_schema_changes_reach_existing_archive_files(tmp_path, monkeypatch):
+    monkeypatch.setenv('SQLITE_PATH', shutil.copy(dbmod.sqlite_path(), str(tmp_path / 'bus_booking.db')))
+    conn = dbmod.connect_sqlite()
+    try:
+        months = archive.archivable_months(conn, keep_days=0)
+        archive.archive_month(conn, months[0])
+        conn.execute('ALTER TABLE bookings ADD COLUMN channel TEXT')
+        conn.commit()
+        archive.archive_month(conn, months[0])
+        conn.execute('ATTACH DATABASE ? AS arc', (archive.archive_path(months[0]),))
+        assert 'channel' in [r[1] for r in conn.execute('PRAGMA arc.table_info(bookings)')]
+    finally:
+        conn.close()
+
+
+
+class _FakeMysql:
+    """Just the catalogue _archive_month_mysql looks at: partitions, tables, and which ones hold rows."""
+
+    def __init__(self, partitions, tables, filled):
+        self.partitions, self.tables, self.filled, self.sql = partitions, tables, filled, []
+
+    def cursor(self):
+        return self
+
+    def execute(self, sql, params=()):
+        self.sql.append(sql)
+        words = sql.split()
+        self.result = []
+        if 'information_schema.PARTITIONS' in sql:
+            self.result = [(p,) for p in self.partitions.get(params[0], ())]
+        elif 'information_schema.TABLES' in sql:
+            self.result = [(1,)] if params[0] in self.tables else []
+        elif sql.startswith('SELECT 1 FROM'):
+            source = f'{words[3]} {words[5]}' if 'PARTITION' in sql else words[3]
+            self.result = [(1,)] if source in self.filled else []
+        elif 'DROP PARTITION' in sql:
+            self.partitions[words[2]].discard(words[5])
+        elif 'REMOVE PARTITIONING' in sql:
+            self.partitions.pop(words[2], None)
+        elif 'EXCHANGE PARTITION' in sql:
+            raise AssertionError(f'exchanged again: {sql}')
+
+    def fetchall(self):
+        return self.result
+
+    def commit(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def test_mysql_archive_resumes_each_table_on_its_own(monkeypatch):
+    monkeypatch.setattr(dbmod, 'is_mysql_enabled', lambda: True)
+    # An earlier run swapped bookings out, and exchanged booked_seats but died before its DROP PARTITION
+    db = _FakeMysql(
+        partitions={'bookings': {'p2024_07', 'pmax'}, 'booked_seats': {'p2024_06', 'p2024_07', 'pmax'}},
+        tables={'bookings_2024_06', 'booked_seats_2024_06', 'bookings_passengers_2024_06'},
+        filled={'bookings_2024_06', 'booked_seats_2024_06'},
+    )
+    assert archive.archive_month(db, '2024-06') == 0
+    assert [s for s in db.sql if s.startswith('ALTER')] == [
+        'ALTER TABLE booked_seats DROP PARTITION p2024_06', 'ALTER TABLE booked_seats_2024_06 ROW_FORMAT=COMPRESSED']
+    assert not any('archived_bookings (booking_id' in s for s in db.sql)
+    assert db.partitions['booked_seats'] == {'p2024_07', 'pmax'}
+
+    # Never partitioned and never started: nothing to do
+    db = _FakeMysql(partitions={}, tables=set(), filled=set())
+    assert archive.archive_month(db, '2024-06') == 0 and not any(s.startswith(('ALTER', 'CREATE', 'DELETE')) for s in db.sql)
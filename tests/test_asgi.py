@@ -0,0 +1,100 @@
+import asyncio
+
+import pytest
+
+import app as webapp
+import asgi
+
+pytest.importorskip('aiosqlite')
+
+
+def _call(application, path, cookie=None, headers=(), query=b''):
+    """One GET through an ASGI app; returns (status, headers, body)."""
+    sent = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        sent.append(message)
+
+    async def scenario():
+        extra = [(b'cookie', f'session={cookie}'.encode())] if cookie else []
+        scope = {'type': 'http', 'http_version': '1.1', 'method': 'GET', 'scheme': 'http', 'path': path,
+                 'raw_path': path.encode(), 'query_string': query, 'root_path': '', 'server': ('testserver', 80),
+                 'client': ('127.0.0.1', 50000), 'headers': extra + list(headers)}
+        try:
+            await application(scope, receive, send)
+        finally:
+            await asgi.close_pools()
+
+    asyncio.run(scenario())
+    body = b''.join(m.get('body', b'') for m in sent[1:])
+    return sent[0]['status'], dict(sent[0]['headers']), body
+
+
+def _lifespan(application):
+    messages = iter([{'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}])
+    sent = []
+
+    async def receive():
+        return next(messages)
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(application({'type': 'lifespan'}, receive, send))
+    return sent
+
+
+def test_async_routes_need_the_flask_session(user_client):
+    trip = user_client.get('/api/buses').get_json()[0]['id']
+    for path in ('/api/buses', '/api/locations', f'/api/buses/{trip}/seats', f'/api/buses/{trip}/seats/stream'):
+        status, headers, _ = _call(asgi.api, path)
+        assert (status, headers[b'location']) == (302, b'/login'), path
+        assert _call(asgi.api, path, cookie='forged.cookie.value')[0] == 302
+    cookie = user_client.get_cookie('session').value
+    assert _call(asgi.api, f'/api/buses/{trip}/seats', cookie)[0] == 200
+
+
+def test_locations_etag_matches_flask_and_answers_304(user_client):
+    cookie = user_client.get_cookie('session').value
+    flask_etag = user_client.get('/api/locations?q=hy').headers['ETag']
+    status, headers, body = _call(asgi.api, '/api/locations', cookie, query=b'q=hy')
+    assert status == 200 and body and headers[b'etag'].decode() == flask_etag
+    status, _, body = _call(asgi.api, '/api/locations', cookie, [(b'if-none-match', flask_etag.encode())], query=b'q=hy')
+    assert (status, body) == (304, b'')
+    # Another query string is another tag
+    assert _call(asgi.api, '/api/locations', cookie, [(b'if-none-match', flask_etag.encode())], query=b'q=vi')[0] == 200
+
+
+def test_other_routes_fall_back_to_flask(user_client):
+    pytest.importorskip('asgiref')
+    cookie = user_client.get_cookie('session').value
+    status, _, body = _call(asgi.application, '/help', cookie)
+    assert status == 200 and b'<html' in body.lower()
+    status, headers, _ = _call(asgi.application, '/help')
+    assert (status, headers[b'location']) == (302, b'/login')  # Flask's own login gate
+    assert _call(asgi.api, '/help', cookie)[0] == 404
+    assert [m['type'] for m in _lifespan(asgi.application)] == ['lifespan.startup.complete', 'lifespan.shutdown.complete']
+
+
+def test_missing_asgiref_fails_startup_instead_of_404ing(user_client, monkeypatch):
+    monkeypatch.setattr(asgi, 'WsgiToAsgi', None)
+    application = asgi.AsyncAPI(webapp.app)
+    [failed] = _lifespan(application)
+    assert failed['type'] == 'lifespan.startup.failed' and 'asgiref' in failed['message']
+    status, _, body = _call(application, '/help', user_client.get_cookie('session').value)
+    assert status == 500 and b'asgiref' in body
+    assert [m['type'] for m in _lifespan(asgi.AsyncAPI())][0] == 'lifespan.startup.complete'  # asgi:api needs no asgiref
+
+
+def test_bus_search_sql_survives_percent_formatting(user_client):
+    # aiomysql interpolates with `sql % args`, so the only '%' may be the placeholders'
+    for bus_type in webapp.BUS_TYPE_KEYWORDS:
+        query, params = webapp.build_bus_search({'type': bus_type, 'from': 'Hyd'})
+        sql = webapp.to_mysql_placeholders(query)
+        assert sql.count('%') == sql.count('%s') == len(params)
+        sql % tuple(repr(p) for p in params)  # a stray literal '%' raises here, as it did on MySQL
+    names = [b['name'].lower() for b in user_client.get('/api/buses?type=luxury').get_json()]
+    assert names and all(any(k in n for k in webapp.BUS_TYPE_KEYWORDS['luxury']) for n in names)
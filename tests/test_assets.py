@@ -0,0 +1,75 @@
+import os
+import re
+import gzip
+import shutil
+
+import assets
+
+STATIC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'static')
+
+
+def _page_view(client, path, accept_encoding):
+    """(bytes transferred, responses) for one uncached view of path: HTML, linked assets and CSS images."""
+    headers = {'Accept-Encoding': accept_encoding} if accept_encoding else {}
+    page = client.get(path, headers=headers)
+    html = gzip.decompress(page.data) if page.headers.get('Content-Encoding') == 'gzip' else page.data
+    urls = re.findall(r'(?:href|src)="(/static/[^"]+)"', html.decode())
+    responses = []
+    for url in urls:
+        resp = client.get(url, headers=headers)
+        responses.append(resp)
+        if url.endswith('.css'):
+            css = gzip.decompress(resp.data) if resp.headers.get('Content-Encoding') == 'gzip' else resp.data
+            for img in dict.fromkeys(re.findall(r'url\("?(/static/[^")]+)"?\)', css.decode())):
+                responses.append(client.get(img, headers=headers))
+    return len(page.data) + sum(len(r.data) for r in responses), responses
+
+
+def test_page_view_bytes_and_immutable_assets(user_client):
+    plain = sum(os.path.getsize(os.path.join(STATIC, name)) for name in ('style.css', 'main.js', 'bus-bg.jpg'))
+    sent, responses = _page_view(user_client, '/', 'gzip, br')
+    assert {r.status_code for r in responses} == {200}
+    assert len(responses) >= 3
+    for r in responses:
+        assert r.headers['Cache-Control'] == assets.IMMUTABLE
+        assert r.request.path.startswith('/static/dist/')
+    text = [r for r in responses if r.mimetype in ('text/css', 'text/javascript', 'application/javascript')]
+    assert text and all(r.headers.get('Content-Encoding') in ('gzip', 'br') for r in text)
+    # CSS and JS go out at a third of their size or less; with Pillow the background shrinks too
+    text_plain = os.path.getsize(os.path.join(STATIC, 'style.css')) + os.path.getsize(os.path.join(STATIC, 'main.js'))
+    assert sum(len(r.data) for r in text) * 3 < text_plain
+    assert sent < plain
+
+    # A client without gzip still gets identity bytes that match the hashed file
+    _, identity = _page_view(user_client, '/', None)
+    assert all('Content-Encoding' not in r.headers for r in identity)
+
+
+def test_hashed_names_follow_content(tmp_path):
+    static = tmp_path / 'static'
+    shutil.copytree(STATIC, static, ignore=shutil.ignore_patterns(assets.DIST))
+    first = assets.load(str(static))
+    assert assets.load(str(static)) == first
+    with open(static / 'main.js', 'a') as f:
+        f.write('\n// changed\n')
+    second = assets.load(str(static))
+    assert second['files']['main.js'] != first['files']['main.js']
+    assert second['files']['style.css'] == first['files']['style.css']
+    assert assets.prune(str(static), second) == 2  # the old main.js and its .gz
+
+
+def test_background_variants_rewrite_css():
+    manifest = {
+        'files': {'bus-bg.jpg': 'dist/bus-bg.aaa.jpg'},
+        'images': {'bus-bg.jpg': [
+            {'width': 1920, 'jpeg': 'dist/bus-bg-1920.b.jpg', 'webp': 'dist/bus-bg-1920.c.webp'},
+            {'width': 768, 'jpeg': 'dist/bus-bg-768.d.jpg', 'webp': 'dist/bus-bg-768.e.webp'},
+        ]},
+    }
+    css = '/* page */\nbody {\n    background-image: url("/static/bus-bg.jpg"); /* bg */\n}\n.logo { background: url(/static/bus-bg.jpg); }\n'
+    out = assets.rewrite_css(css, manifest)
+    assert 'background-image: url("/static/dist/bus-bg-1920.b.jpg"); background-image: image-set(' in out
+    assert 'url("/static/dist/bus-bg-1920.c.webp") type("image/webp")' in out
+    assert '@media (max-width: 768px) {\n    body { background-image: url("/static/dist/bus-bg-768.d.jpg");' in out
+    assert '.logo { background: url("/static/dist/bus-bg.aaa.jpg"); }' in out
+    assert '/static/bus-bg.jpg' not in out
@@ -0,0 +1,166 @@
+import io
+import os
+import sqlite3
+import threading
+
+import pytest
+
+import database as dbmod
+
+
+@pytest.fixture
+def filler():
+    # ~12 MB of extra pages so the backup takes a few hundred steps
+    conn = dbmod.connect_sqlite()
+    conn.execute('CREATE TABLE IF NOT EXISTS backup_filler (id INTEGER PRIMARY KEY, blob BLOB)')
+    conn.executemany('INSERT INTO backup_filler (blob) VALUES (randomblob(3000))', [()] * 4000)
+    conn.commit()
+    conn.close()
+    yield
+    conn = dbmod.connect_sqlite()
+    conn.execute('DROP TABLE backup_filler')
+    conn.commit()
+    conn.close()
+
+
+def _book(client, trip, seat):
+    # A write that waited out the busy timeout fails here with "database is locked"
+    resp = client.post('/api/bookings', json={'bus_id': trip, 'name': 'Backup', 'phone': '9000000050', 'seat_numbers': [str(seat)]})
+    assert resp.status_code == 200, resp.get_json()
+    return resp.get_json()['booking_id']
+
+
+def test_bookings_keep_working_during_backup(user_client, make_trip, filler, tmp_path):
+    trip = make_trip('Backup', from_city='Khammam', to_city='Hyderabad', depart_time='2031-08-01 06:20',
+                     arrive_time='2031-08-01 10:05', seats_total=40, fare=330)
+    before = [_book(user_client, trip, seat) for seat in range(1, 11)]
+    dest = tmp_path / 'snapshot.db'
+    result, failure = {}, []
+
+    def run():
+        try:
+            result.update(dbmod.backup_sqlite(str(dest), pages=16, sleep_ms=2))
+        except Exception as e:
+            failure.append(e)
+
+    worker = threading.Thread(target=run)
+    worker.start()
+    during = []
+    seat = 11
+    while worker.is_alive() and seat <= 40:
+        during.append(_book(user_client, trip, seat))
+        seat += 1
+    worker.join()
+    assert not failure, failure
+    assert during  # latency against the baseline: benchmarks/bench_backup.py
+
+    assert result['bytes'] > 10 * 1024 * 1024 and not (tmp_path / 'snapshot.db.partial').exists()
+    copy = sqlite3.connect(dest)
+    assert copy.execute('PRAGMA integrity_check').fetchone()[0] == 'ok'
+    held = {r[0] for r in copy.execute('SELECT booking_id FROM booked_seats WHERE bus_id = ?', (trip,))}
+    copy.close()
+    assert set(before) <= held
+
+
+def test_backup_cli_writes_a_timestamped_verified_copy(tmp_path, capsys):
+    dbmod.main(['backup', str(tmp_path), '--sleep-ms', '0'])
+    [copy] = tmp_path.glob('bus_booking-*.db')
+    assert str(copy) in capsys.readouterr().out
+    conn = sqlite3.connect(copy)
+    assert conn.execute('SELECT COUNT(*) FROM trips').fetchone()[0] > 0
+    conn.close()
+
+
+def test_damaged_copy_fails_verification_and_is_not_kept(tmp_path, monkeypatch):
+    good = tmp_path / 'good.db'
+    dbmod.backup_sqlite(str(good), sleep_ms=0)
+    damaged = tmp_path / 'damaged.db'
+    data = bytearray(good.read_bytes())
+    data[4096 * 2:4096 * 2 + 64] = b'\xff' * 64  # scribble over the start of page 3
+    damaged.write_bytes(bytes(data))
+    with pytest.raises(dbmod.BackupError, match='integrity check failed'):
+        dbmod.verify_sqlite(str(damaged))
+
+    def reject(path):
+        raise dbmod.BackupError(f'integrity check failed on {path}')
+
+    monkeypatch.setattr(dbmod, 'verify_sqlite', reject)
+    with pytest.raises(dbmod.BackupError):
+        dbmod.backup_sqlite(str(tmp_path / 'bad.db'), sleep_ms=0)
+    assert not (tmp_path / 'bad.db').exists() and not (tmp_path / 'bad.db.partial').exists()
+
+
+def test_backup_includes_archived_months(tmp_path, monkeypatch):
+    archive_dir = tmp_path / 'archive'
+    archive_dir.mkdir()
+    monkeypatch.setenv('SQLITE_ARCHIVE_DIR', str(archive_dir))
+    month = sqlite3.connect(archive_dir / 'bookings_2024_06.db')
+    month.execute('CREATE TABLE bookings (id INTEGER PRIMARY KEY, passenger_name TEXT)')
+    month.execute("INSERT INTO bookings VALUES (7, 'Archived')")
+    month.commit()
+    month.close()
+
+    out = tmp_path / 'out'
+    out.mkdir()
+    stats = dbmod.backup(str(out), sleep_ms=0)
+    [copy] = stats['archives']
+    assert copy == os.path.join(os.path.splitext(stats['path'])[0] + '.archive', 'bookings_2024_06.db')
+    conn = sqlite3.connect(copy)
+    assert conn.execute('SELECT passenger_name FROM bookings WHERE id = 7').fetchone()[0] == 'Archived'
+    conn.close()
+
+
+class _FakeCursor:
+    """Just enough of a MySQL cursor for dump_mysql: one table with a trigger, and a view."""
+
+    def __init__(self):
+        self.rows, self.description = [], [('id',)]
+
+    def execute(self, sql, params=None):
+        self.rows = {
+            "SHOW FULL TABLES WHERE Table_type = 'VIEW'": [('buses', 'VIEW')],
+            'SHOW CREATE VIEW `buses`': [(
+                'buses', "CREATE ALGORITHM=UNDEFINED DEFINER=`app`@`%` SQL SECURITY DEFINER VIEW `buses` AS "
+                "select `t`.`id` AS `id` from `trips` `t`", 'utf8mb4', 'utf8mb4_0900_ai_ci')],
+            'SHOW TRIGGERS': [('events_no_delete', 'DELETE', 'events')],
+            'SHOW CREATE TRIGGER `events_no_delete`': [(
+                'events_no_delete', '', "CREATE DEFINER=`app`@`%` TRIGGER events_no_delete BEFORE DELETE ON events "
+                "FOR EACH ROW SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = 'events are append-only'")],
+            'SHOW CREATE TABLE `events`': [('events', 'CREATE TABLE `events` (`id` bigint)')],
+            'SELECT COUNT(*) FROM `events`': [(1,)],
+            'SELECT * FROM `events`': [(1,)],
+        }.get(sql, [])
+
+    def fetchall(self):
+        return self.rows
+
+    def fetchmany(self, n):
+        rows, self.rows = self.rows[:n], self.rows[n:]
+        return rows
+
+    def close(self):
+        pass
+
+
+def test_mysql_dump_keeps_triggers_and_views():
+    conn = type('Conn', (), {'cursor': lambda self: _FakeCursor(), 'rollback': lambda self: None})()
+    out = io.StringIO()
+    dbmod.dump_mysql(out, conn, tables=['events'], sleep_ms=0)
+    text = out.getvalue()
+    assert text.index('INSERT INTO `events`') < text.index('DROP TRIGGER IF EXISTS `events_no_delete`')
+    assert ("DELIMITER ;;\nCREATE TRIGGER events_no_delete BEFORE DELETE ON events FOR EACH ROW "
+            "SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = 'events are append-only';;\nDELIMITER ;\n") in text
+    # The view comes after every table it could select from, without the dumping account as definer
+    assert text.index('DELIMITER ;\n') < text.index('DROP VIEW IF EXISTS `buses`;\n'
+                                                     'CREATE ALGORITHM=UNDEFINED SQL SECURITY DEFINER VIEW `buses` AS '
+                                                     'select `t`.`id` AS `id` from `trips` `t`;\n') < text.index('-- Dump completed')
+
+
+def test_read_only_paths_with_uri_characters(tmp_path):
+    odd = tmp_path / 'night #2 ?50% off'
+    odd.mkdir()
+    path = str(odd / 'copy.db')
+    dbmod.backup_sqlite(path, sleep_ms=0)  # verify_sqlite opens the copy read-only
+    conn = dbmod.connect_sqlite(path, readonly=True)
+    assert conn.execute('SELECT COUNT(*) FROM trips').fetchone()[0] > 0
+    conn.close()
@@ -0,0 +1,32 @@
+import uuid
+
+
+def _days(client, route):
+    resp = client.get(f"/api/calendar?from={route['from_city']}&to={route['to_city']}&month=2031-09")
+    assert resp.status_code == 200
+    return {d['date']: (d['min_fare'], d['seats_left'], d['trips']) for d in resp.get_json()['days']}
+
+
+def test_calendar_rolls_up_days_and_follows_bookings_and_edits(user_client, make_trip, query_budget):
+    route = {'from_city': f'Origin {uuid.uuid4().hex[:6]}', 'to_city': 'Srisailam'}
+    cheap = make_trip('Calendar', depart_time='2031-09-03 06:00', arrive_time='2031-09-03 23:30', seats_total=2, fare=350, **route)
+    make_trip('Calendar', depart_time='2031-09-03 09:30', arrive_time='2031-09-03 23:30', seats_total=3, fare=500, **route)
+    later_bus = dict(route, name=f'Calendar {uuid.uuid4().hex[:6]}', depart_time='2031-09-05 07:15',
+                     arrive_time='2031-09-05 23:30', seats_total='4', fare='420')
+    later = make_trip(**later_bus)
+
+    days = _days(user_client, route)
+    assert len(days) == 30 and days['2031-09-01'] == (None, 0, 0)
+    assert days['2031-09-03'] == (350.0, 5, 2)
+    assert days['2031-09-05'] == (420.0, 4, 1)
+    assert _days(user_client, route) == days
+    assert query_budget.last('GET /api/calendar')['queries'] == 0  # served from _CALENDAR_CACHE
+
+    # Selling out the cheap trip: its fare no longer counts as the day's lowest
+    user_client.post('/api/bookings', json={'bus_id': cheap, 'name': 'Full', 'phone': '9000000070', 'seat_numbers': ['1', '2']})
+    assert _days(user_client, route)['2031-09-03'] == (500.0, 3, 2)
+    assert query_budget.last('GET /api/calendar')['queries'] == 1
+
+    # A fare edit on the admin page reaches the calendar too
+    user_client.post(f'/admin/buses/{later}/edit', data=dict(later_bus, fare='390'))
+    assert _days(user_client, route)['2031-09-05'] == (390.0, 4, 1)
@@ -0,0 +1,102 @@
+import gzip
+import json
+import asyncio
+import threading
+
+import pytest
+
+import app as webapp
+
+
+@pytest.mark.max_queries({'GET /api/buses': 1})
+def test_if_none_match_is_answered_before_any_query(user_client, query_budget):
+    first = user_client.get('/api/buses', headers={'Accept-Encoding': 'gzip'})
+    assert first.status_code == 200
+    assert first.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in first.headers['Vary']
+    etag = first.headers['ETag']
+    assert etag.startswith('W/"')
+    assert json.loads(gzip.decompress(first.data)) == user_client.get('/api/buses').get_json()
+
+    again = user_client.get('/api/buses', headers={'If-None-Match': etag})
+    assert again.status_code == 304 and again.data == b''
+    assert query_budget.last('GET /api/buses')['queries'] == 0
+
+    # Another search is another representation; a bus change invalidates every tag
+    assert user_client.get('/api/buses?from=Hyd', headers={'If-None-Match': etag}).status_code == 200
+    webapp.bump_data_version('buses')
+    assert user_client.get('/api/buses', headers={'If-None-Match': etag}).status_code == 200
+
+
+def test_small_and_streamed_responses_stay_uncompressed(user_client):
+    small = user_client.get('/api/locations?q=zzzz', headers={'Accept-Encoding': 'gzip'})
+    assert small.get_json() == [] and 'Content-Encoding' not in small.headers
+    trip = user_client.get('/api/buses').get_json()[0]['id']
+    stream = user_client.get(f'/api/buses/{trip}/seats/stream', headers={'Accept-Encoding': 'gzip'}, buffered=False)
+    assert 'Content-Encoding' not in stream.headers
+    stream.close()
+
+
+def test_asgi_api_shares_etags_and_compression(user_client):
+    pytest.importorskip('aiosqlite')
+    import asgi
+    cookie = user_client.get_cookie('session').value
+    flask_etag = user_client.get('/api/buses').headers['ETag']
+
+    async def get(path, extra=()):
+        sent = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def send(message):
+            sent.append(message)
+
+        headers = [(b'cookie', f'session={cookie}'.encode()), (b'accept-encoding', b'gzip')] + list(extra)
+        await asgi.api({'type': 'http', 'method': 'GET', 'path': path, 'query_string': b'', 'headers': headers}, receive, send)
+        return sent[0]['status'], dict(sent[0]['headers']), sent[1]['body']
+
+    async def scenario():
+        try:
+            status, headers, body = await get('/api/buses')
+            assert status == 200 and headers[b'content-encoding'] == b'gzip'
+            assert headers[b'etag'].decode() == flask_etag
+            status, _, body = await get('/api/buses', [(b'if-none-match', headers[b'etag'])])
+            assert status == 304 and body == b''
+        finally:
+            await asgi.close_pools()
+
+    asyncio.run(scenario())
+
+
+def test_asgi_etag_reads_one_snapshot_off_the_event_loop(user_client, monkeypatch):
+    pytest.importorskip('aiosqlite')
+    import asgi
+    import data_versions
+    cookie = user_client.get_cookie('session').value
+    real, calls = data_versions.shared.snapshot, []
+
+    def snapshot():
+        calls.append(threading.current_thread())
+        return real()
+
+    monkeypatch.setattr(data_versions.shared, 'snapshot', snapshot)
+
+    async def scenario():
+        sent = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def send(message):
+            sent.append(message)
+
+        try:
+            headers = [(b'cookie', f'session={cookie}'.encode())]
+            await asgi.api({'type': 'http', 'method': 'GET', 'path': '/api/buses', 'query_string': b'', 'headers': headers}, receive, send)
+        finally:
+            await asgi.close_pools()
+        return sent[0]['status']
+
+    assert asyncio.run(scenario()) == 200
+    assert len(calls) == 1 and calls[0] is not threading.main_thread()
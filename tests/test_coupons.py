@@ -0,0 +1,137 @@
+import threading
+from datetime import datetime
+
+import pytest
+
+import app as webapp
+import coupons
+
+
+@pytest.fixture(autouse=True)
+def quiet_notifications(monkeypatch):
+    monkeypatch.setattr(webapp, 'notify_booking', lambda event, booking_id: None)
+
+
+def _client(user_id):
+    client = webapp.app.test_client()
+    with client.session_transaction() as sess:
+        sess['user_id'] = user_id
+        sess['role'] = 'customer'
+    return client
+
+
+def _trip():
+    return webapp.db_fetch_one('''
+        SELECT t.id, s.fare, s.from_city, s.to_city FROM trips t JOIN services s ON s.id = t.service_id
+        WHERE s.fare > 0 ORDER BY t.id LIMIT 1
+    ''')
+
+
+def _book(client, trip_id, seat, code):
+    return client.post('/api/bookings', json={
+        'bus_id': trip_id, 'name': 'Coupon', 'phone': '9000000010', 'seat_numbers': [seat], 'coupon_code': code,
+    })
+
+
+def _discount(booking_id):
+    return float(webapp.db_fetch_one('SELECT discount_amount FROM bookings WHERE id = ?', (booking_id,))['discount_amount'])
+
+
+def test_seeded_trip100_and_admin_rules(user_client):
+    trip = _trip()
+    resp = _book(_client(501), trip['id'], 'K1', 'trip100')
+    assert resp.status_code == 200
+    assert _discount(resp.get_json()['booking_id']) == min(100.0, float(trip['fare']))
+
+    resp = user_client.post('/admin/coupons', data={
+        'code': 'HALF', 'kind': 'percent', 'amount': '50', 'max_discount': '1',
+        'from_city': trip['from_city'], 'per_user_limit': '1',
+    })
+    assert resp.status_code == 302
+    assert b'HALF' in user_client.get('/admin/coupons').data
+
+    preview = _client(502).get(f"/api/coupons/half?bus_id={trip['id']}&seats=2").get_json()
+    assert preview['status'] == 'success' and preview['discount'] == 1.0
+    assert _book(_client(502), trip['id'], 'K2', 'HALF').status_code == 200
+    again = _book(_client(502), trip['id'], 'K3', 'HALF')
+    assert again.status_code == 400 and 'already used' in again.get_json()['message']
+
+    user_client.post('/admin/coupons/HALF/toggle')
+    assert _book(_client(503), trip['id'], 'K4', 'HALF').get_json()['message'] == 'Invalid coupon'
+    assert _book(_client(503), trip['id'], 'K4', 'NOSUCH').status_code == 400
+
+
+def test_rule_checks():
+    rule = coupons.rule_from_form({'code': 'r1', 'kind': 'flat', 'amount': '80', 'to_city': 'Vizag',
+                                   'min_fare': '500', 'valid_until': '2030-01-31'})
+    assert rule['valid_until'] == '2030-01-31 23:59:59'
+    assert coupons.check(rule, 600, 'Hyd', 'vizag', now=datetime(2030, 1, 31, 12)) == 80
+    for args, message in [((600, 'Hyd', 'Vizag', datetime(2030, 2, 1)), 'expired'),
+                          ((600, 'Hyd', 'Goa', None), 'only valid to'),
+                          ((400, 'Hyd', 'Vizag', None), 'at least')]:
+        with pytest.raises(coupons.CouponError, match=message):
+            coupons.check(rule, *args[:3], now=args[3] or datetime(2030, 1, 1))
+    with pytest.raises(coupons.CouponError):
+        coupons.rule_from_form({'code': 'X', 'kind': 'percent', 'amount': '120'})
+
+
+def test_cap_holds_under_concurrent_redemptions():
+    assert coupons.shard_quotas(5) == [1] * 5
+    assert sum(coupons.shard_quotas(1000)) == 1000 and len(coupons.shard_quotas(1000)) == coupons.COUNTER_SHARDS
+    webapp.save_coupon_rule(coupons.rule_from_form({'code': 'FLASH', 'kind': 'flat', 'amount': '10', 'usage_cap': '5'}))
+    trip = _trip()
+    start = threading.Barrier(12)
+    results = []
+
+    def redeem(i):
+        client = _client(600 + i)
+        start.wait()
+        results.append(_book(client, trip['id'], f'F{i}', 'FLASH').status_code)
+
+    threads = [threading.Thread(target=redeem, args=(i,)) for i in range(12)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert results.count(200) == 5
+    assert set(results) <= {200, 400, 409}
+    used = webapp.db_fetch_one("SELECT SUM(used) AS n FROM coupon_counters WHERE code = 'FLASH'")['n']
+    redeemed = webapp.db_fetch_one("SELECT COUNT(*) AS n FROM coupon_redemptions WHERE code = 'FLASH'")['n']
+    assert used == redeemed == 5
+    # Seats of rejected redemptions were rolled back with them
+    assert webapp.db_fetch_one("SELECT COUNT(*) AS n FROM booked_seats WHERE seat_no LIKE 'F%' AND bus_id = ?", (trip['id'],))['n'] == 5
+
+    # Raising the cap keeps the uses already counted
+    webapp.save_coupon_rule(coupons.rule_from_form({'code': 'FLASH', 'kind': 'flat', 'amount': '10', 'usage_cap': '40'}))
+    rows = webapp.db_fetch_all("SELECT used, quota FROM coupon_counters WHERE code = 'FLASH'")
+    assert sum(r['used'] for r in rows) == 5 and sum(r['quota'] for r in rows) == 40
+    assert _book(_client(700), trip['id'], 'F99', 'FLASH').status_code == 200
+
+
+def test_per_user_limit_holds_under_concurrent_bookings(monkeypatch):
+    webapp.save_coupon_rule(coupons.rule_from_form({'code': 'ONCE', 'kind': 'flat', 'amount': '5', 'per_user_limit': '1'}))
+    trip = _trip()
+    quoted = threading.Barrier(6)
+    quote = webapp.quote_coupon
+
+    def quote_then_wait(*args):
+        result = quote(*args)
+        quoted.wait()  # every request has passed the pre-check before any of them books
+        return result
+
+    monkeypatch.setattr(webapp, 'quote_coupon', quote_then_wait)
+    results = []
+
+    def book(i):
+        client = _client(710)  # one customer, six tabs
+        results.append(_book(client, trip['id'], f'U{i}', 'ONCE').status_code)
+
+    threads = [threading.Thread(target=book, args=(i,)) for i in range(6)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert results.count(200) == 1 and set(results) <= {200, 400, 409}
+    assert webapp.db_fetch_one("SELECT COUNT(*) AS n FROM coupon_redemptions WHERE code = 'ONCE' AND user_id = 710")['n'] == 1
@@ -0,0 +1,87 @@
+import os
+import subprocess
+import sys
+import uuid
+
+import app as webapp
+import data_versions
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _worker(code):
+    """Run code in a fresh interpreter against the same database, like another gunicorn worker."""
+    done = subprocess.run([sys.executable, '-c', code], cwd=ROOT, env=dict(os.environ), capture_output=True, text=True, timeout=60)
+    assert done.returncode == 0, done.stderr
+    return done.stdout
+
+
+def test_bump_in_another_process_is_seen_without_rereading_otherwise():
+    before = webapp.get_data_version('buses')
+    reloads = data_versions.shared.reloads
+    for _ in range(5):
+        assert webapp.get_data_version('buses') == before
+    # Nothing committed since: every check above was just the pragma
+    assert data_versions.shared.reloads == reloads
+
+    _worker("import data_versions; data_versions.shared.bump('buses', 'coupons')")
+    assert webapp.get_data_version('buses') == before + 1
+    assert data_versions.shared.reloads == reloads + 1
+
+
+def test_concurrent_bumps_from_several_processes_all_count():
+    before = webapp.get_data_version('bookings')
+    code = "import data_versions\nfor _ in range(25): data_versions.shared.bump('bookings')"
+    workers = [subprocess.Popen([sys.executable, '-c', code], cwd=ROOT, env=dict(os.environ), stderr=subprocess.PIPE)
+               for _ in range(4)]
+    for w in workers:
+        assert w.wait(timeout=60) == 0, w.stderr.read()
+    assert webapp.get_data_version('bookings') == before + 100
+
+
+def test_edit_on_another_worker_invalidates_page_cache_and_etags(user_client):
+    name = f'Coherent {uuid.uuid4().hex[:6]}'
+    page = user_client.get('/admin/buses').data  # cached in this process
+    etag = user_client.get('/api/buses').headers['ETag']
+    assert name.encode() not in page
+
+    _worker(f'''
+import app as webapp
+webapp.create_app()
+client = webapp.app.test_client()
+with client.session_transaction() as sess:
+    sess['user_id'] = 1
+    sess['role'] = 'admin'
+client.post('/admin/buses/new', data={{
+    'name': {name!r}, 'from_city': 'Kurnool', 'to_city': 'Anantapur', 'depart_time': '2031-07-01 05:10',
+    'arrive_time': '2031-07-01 08:40', 'seats_total': '36', 'fare': '240'}})
+''')
+    assert name.encode() in user_client.get('/admin/buses').data
+    assert user_client.get('/api/buses', headers={'If-None-Match': etag}).status_code == 200
+
+
+def test_a_request_keeps_one_snapshot_until_it_bumps():
+    with webapp.app.test_request_context('/'):
+        before = webapp.get_data_version('coupons')
+        data_versions.shared.bump('coupons')  # as another worker would
+        assert webapp.get_data_version('coupons') == before
+        webapp.bump_data_version('coupons')
+        assert webapp.get_data_version('coupons') == before + 2
+
+
+def test_scripts_and_failed_imports_still_bump(user_client, tmp_path, monkeypatch):
+    import schedules
+    before = webapp.get_data_version('buses')
+    csv_path = tmp_path / 'trips.csv'
+    csv_path.write_text('name,from_city,to_city,depart_time,arrive_time,seats_total,fare\n'
+                        f'Script {uuid.uuid4().hex[:6]},Ongole,Nellore,2031-08-01 06:00,2031-08-01 08:30,33,180\n')
+    schedules.main([str(csv_path)])
+    assert webapp.get_data_version('buses') == before + 1
+
+    def half_done(conn, data):
+        raise ValueError('Line 1002: bad fare')  # after the first batch went in
+
+    monkeypatch.setattr(schedules, 'import_csv', half_done)
+    resp = user_client.post('/admin/buses/import', data={'csv_text': 'name\nx\n'})
+    assert 'Import failed' in resp.get_data(as_text=True)
+    assert webapp.get_data_version('buses') == before + 2
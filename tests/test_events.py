@@ -0,0 +1,119 @@
+import threading
+import time
+
+import pytest
+
+import app as webapp
+
+
+ROUTE = {'from_city': 'Guntur', 'to_city': 'Ongole', 'depart_time': '2031-06-01 07:45', 'arrive_time': '2031-06-01 09:30', 'fare': 180}
+
+
+def _head(client):
+    # Cursor at the end of the feed, whatever earlier tests wrote
+    cursor = 0
+    while True:
+        page = client.get(f'/admin/events?after={cursor}&limit=1000').get_json()
+        cursor = page['cursor']
+        if not page['more']:
+            return cursor
+
+
+def _drain(client, cursor, limit=100):
+    events = []
+    while True:
+        page = client.get(f'/admin/events?after={cursor}&limit={limit}').get_json()
+        events += page['events']
+        cursor = page['cursor']
+        if not page['more']:
+            return events, cursor
+
+
+def test_every_booking_change_is_logged_in_order(user_client, make_trip):
+    cursor = _head(user_client)
+    trip = make_trip('Events', seats_total=2, **ROUTE)
+    first = user_client.post('/api/bookings', json={
+        'bus_id': trip, 'name': 'Feed', 'phone': '9000000040', 'seat_numbers': ['1', '2']}).get_json()['booking_id']
+    waiter = user_client.post(f'/api/buses/{trip}/waitlist', json={'name': 'Next', 'phone': '9000000041', 'seats': 1}).get_json()
+    user_client.post(f'/api/bookings/{first}/pay')
+    user_client.post(f'/admin/bookings/{first}/payment', json={'payment_status': 'refunded'})
+    user_client.post(f'/api/bookings/{first}/cancel')
+    promoted = user_client.get(f"/api/waitlist/{waiter['waitlist_id']}").get_json()['booking_id']
+    user_client.post(f'/admin/bookings/{promoted}/release-seats')
+    user_client.post(f'/admin/bookings/{promoted}/status', json={'status': 'confirmed'})
+
+    events, _ = _drain(user_client, cursor, limit=2)
+    assert [(e['kind'], e['booking_id']) for e in events] == [
+        ('booking.created', first),
+        ('booking.paid', first),
+        ('booking.payment_changed', first),
+        ('booking.cancelled', first),
+        ('booking.seats_released', first),
+        ('booking.created', promoted),
+        ('booking.seats_released', promoted),
+        ('booking.status_changed', promoted),
+    ]
+    ids = [e['id'] for e in events]
+    assert ids == sorted(ids) and len(set(ids)) == len(ids)
+    created, paid = events[0], events[1]
+    assert created['data']['seats'] == ['1', '2'] and created['data']['bus_id'] == trip and created['actor_id'] == 1
+    assert paid['data']['payment_ref'].startswith('TXN')
+    assert events[2]['data'] == {'payment_status': 'refunded', 'payment_ref': None}
+    assert events[4]['data']['seats'] == ['1', '2']
+    assert events[5]['data']['source'] == 'waitlist' and events[5]['data']['waitlist_id'] == waiter['waitlist_id']
+    assert events[7]['data'] == {'status': 'confirmed'}
+
+
+def test_rolled_back_booking_leaves_no_event(user_client, make_trip):
+    trip = make_trip('Events', seats_total=3, **ROUTE)
+    user_client.post('/api/bookings', json={'bus_id': trip, 'name': 'One', 'phone': '9000000042', 'seat_numbers': ['3']})
+    cursor = _head(user_client)
+    assert user_client.post('/api/bookings', json={
+        'bus_id': trip, 'name': 'Two', 'phone': '9000000043', 'seat_numbers': ['3']}).status_code == 409
+    assert user_client.post('/api/bookings/999999999/pay').status_code == 200
+    assert _drain(user_client, cursor)[0] == []
+
+
+def test_events_cannot_be_rewritten():
+    with pytest.raises(Exception, match='append-only'):
+        webapp.db_execute("UPDATE events SET kind = 'booking.paid'")
+    with pytest.raises(Exception, match='append-only'):
+        webapp.db_execute('DELETE FROM events')
+
+
+def test_long_poll_wakes_on_commit(user_client, make_trip):
+    trip = make_trip('Events', seats_total=4, **ROUTE)
+    cursor = _head(user_client)
+    booker = webapp.app.test_client()
+    with booker.session_transaction() as sess:
+        sess['user_id'] = 901
+    timer = threading.Timer(0.3, lambda: booker.post('/api/bookings', json={
+        'bus_id': trip, 'name': 'Later', 'phone': '9000000044', 'seat_numbers': ['1']}))
+    timer.start()
+    t0 = time.monotonic()
+    page = user_client.get(f'/admin/events?after={cursor}&wait=10').get_json()
+    elapsed = time.monotonic() - t0
+    timer.join()
+    assert [e['kind'] for e in page['events']] == ['booking.created'] and page['events'][0]['actor_id'] == 901
+    assert 0.2 < elapsed < 5
+    # Nothing new: an empty page with the same cursor once the wait runs out
+    empty = user_client.get(f"/admin/events?after={page['cursor']}&wait=0.2").get_json()
+    assert empty == {'events': [], 'cursor': page['cursor'], 'more': False}
+
+
+def test_feed_access(user_client, monkeypatch):
+    anonymous = webapp.app.test_client()
+    assert anonymous.get('/admin/events').status_code == 403
+    monkeypatch.setenv('EVENTS_TOKEN', 'feed-secret')
+    assert anonymous.get('/admin/events', headers={'Authorization': 'Bearer feed-secret'}).status_code == 200
+    assert anonymous.get('/admin/events', headers={'Authorization': 'Bearer wrong'}).status_code == 403
+    assert user_client.get('/admin/events?after=x').status_code == 400
+
+
+def test_events_are_stamped_when_flushed_not_when_recorded():
+    with webapp.db_transaction() as tx:
+        tx.record_event('booking.paid', 0, note='slow transaction')
+        time.sleep(0.2)
+        flushed_after = time.time()
+    row = webapp.db_fetch_one("SELECT ts FROM events WHERE kind = 'booking.paid' AND booking_id = 0 ORDER BY id DESC LIMIT 1")
+    assert row['ts'] >= flushed_after
@@ -0,0 +1,82 @@
+import threading
+import time
+import uuid
+
+import pytest
+
+import app as webapp
+
+
+@pytest.fixture
+def notified(monkeypatch):
+    # Slow enough that duplicates arrive while the first request is still running
+    calls = []
+    def slow_notify(event, booking_id):
+        time.sleep(0.2)
+        calls.append((event, booking_id))
+    monkeypatch.setattr(webapp, 'notify_booking', slow_notify)
+    return calls
+
+
+def _client():
+    client = webapp.app.test_client()
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+        sess['role'] = 'admin'
+    return client
+
+
+def _free_trip():
+    return webapp.db_fetch_one('SELECT id FROM trips ORDER BY id DESC LIMIT 1')['id']
+
+
+def test_simultaneous_duplicates_book_once(notified):
+    key = str(uuid.uuid4())
+    body = {'bus_id': _free_trip(), 'name': 'Retry', 'phone': '9000000004', 'seat_numbers': ['36']}
+    start = threading.Barrier(6)
+    responses = []
+
+    def post():
+        client = _client()
+        start.wait()
+        responses.append(client.post('/api/bookings', json=body, headers={'Idempotency-Key': key}))
+
+    threads = [threading.Thread(target=post) for _ in range(6)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert [r.status_code for r in responses] == [200] * 6
+    assert len({r.get_json()['booking_id'] for r in responses}) == 1
+    assert sum(r.headers.get('Idempotent-Replayed') == 'true' for r in responses) == 5
+    assert notified == [('created', responses[0].get_json()['booking_id'])]
+
+
+def test_replay_returns_stored_response_and_other_body_is_rejected(notified):
+    client = _client()
+    key = {'Idempotency-Key': str(uuid.uuid4())}
+    body = {'bus_id': _free_trip(), 'name': 'Retry', 'phone': '9000000004', 'seat_numbers': ['35']}
+    first = client.post('/api/bookings', json=body, headers=key)
+    booking_id = first.get_json()['booking_id']
+
+    pay = client.post(f'/api/bookings/{booking_id}/pay', headers=key)
+    again = client.post(f'/api/bookings/{booking_id}/pay', headers=key)
+    assert again.headers.get('Idempotent-Replayed') == 'true'
+    assert again.get_json()['payment_ref'] == pay.get_json()['payment_ref']
+    assert [e for e, _ in notified] == ['created', 'paid']
+
+    other = client.post('/api/bookings', json=dict(body, seat_numbers=['34']), headers=key)
+    assert other.status_code == 422
+
+
+def test_server_errors_are_not_stored(monkeypatch):
+    client = _client()
+    key = {'Idempotency-Key': str(uuid.uuid4())}
+    monkeypatch.setattr(webapp, 'db_transaction', None)  # save_booking fails with a 500
+    body = {'bus_id': _free_trip(), 'name': 'Retry', 'phone': '9000000004', 'seat_numbers': ['33']}
+    assert client.post('/api/bookings', json=body, headers=key).status_code == 500
+    monkeypatch.undo()
+    monkeypatch.setattr(webapp, 'notify_booking', lambda *a: None)
+    resp = client.post('/api/bookings', json=body, headers=key)
+    assert resp.status_code == 200 and 'Idempotent-Replayed' not in resp.headers
@@ -0,0 +1,58 @@
+import csv
+import io
+import uuid
+from itertools import count, islice
+
+import manifest
+
+DATE = '2031-05-04'
+ROUTE = {'from_city': 'Vijayawada', 'to_city': 'Tirupati', 'arrive_time': '2031-05-05 06:00', 'seats_total': 40, 'fare': 650}
+
+
+def test_day_manifest_streams_csv_and_html(user_client, make_trip, tmp_path):
+    name = f'Manifest {uuid.uuid4().hex[:6]}'
+    trip = make_trip(name=name, depart_time=f'{DATE} 21:30', **ROUTE)
+    empty = make_trip(name=name + ' Empty', depart_time=f'{DATE} 22:15', **ROUTE)
+    family = user_client.post('/api/bookings', json={
+        'bus_id': trip, 'name': 'Lead', 'phone': '9000000030', 'seat_numbers': ['10', '2'],
+        'passengers': [{'name': 'Ravi', 'phone': '9000000031', 'age': 41, 'gender': 'Male'},
+                       {'name': 'Sita', 'age': 39, 'gender': 'Female'}],
+    }).get_json()['booking_id']
+    solo = user_client.post('/api/bookings', json={
+        'bus_id': trip, 'name': 'Kiran', 'phone': '9000000032', 'seat_numbers': ['7']}).get_json()['booking_id']
+
+    resp = user_client.get(f'/admin/manifests/{DATE}.csv')
+    assert resp.status_code == 200 and resp.is_streamed
+    rows = list(csv.DictReader(io.StringIO(resp.get_data(as_text=True))))
+    mine = [(r['seat_no'], r['passenger_name'], r['phone'], r['booking_id']) for r in rows if r['bus_name'] == name]
+    assert mine == [('2', 'Sita', '9000000030', str(family)), ('7', 'Kiran', '9000000032', str(solo)),
+                    ('10', 'Ravi', '9000000031', str(family))]
+
+    only = user_client.get(f'/admin/manifests/{DATE}.csv?bus_id={empty}').get_data(as_text=True)
+    assert only.strip() == ','.join(manifest.CSV_COLUMNS)
+
+    html = user_client.get(f'/admin/manifests/{DATE}.html').get_data(as_text=True)
+    assert html.count('class="departure"') >= 2
+    assert f'{name}: Vijayawada → Tirupati' in html and 'Ee departure ki bookings levu.' in html
+
+    assert user_client.get('/admin/manifests/2031-13-01.csv').status_code == 400
+    with user_client.session_transaction() as sess:
+        sess['role'] = 'customer'
+    assert user_client.get(f'/admin/manifests/{DATE}.csv').status_code == 403
+
+    manifest.main([DATE, '--format', 'html', '--out-dir', str(tmp_path)])
+    assert name in (tmp_path / f'manifest-{DATE}.html').read_text(encoding='utf-8')
+
+
+def test_departures_are_grouped_lazily():
+    # An endless feed: only the rows of the departures taken are ever read
+    def rows():
+        for i in count():
+            yield {'trip_id': i // 3, 'journey_date': DATE, 'bus_name': 'B', 'from_city': 'X', 'to_city': 'Y',
+                   'depart_clock': '06:00', 'seat_no': str(3 - i % 3), 'status': 'confirmed', 'payment_status': 'paid',
+                   'booking_id': i, 'booking_name': 'N', 'booking_phone': 'P', 'passenger_name': None,
+                   'passenger_phone': None, 'age': None, 'gender': None}
+
+    taken = list(islice(manifest.departures(rows()), 2))
+    assert [trip['trip_id'] for trip, _ in taken] == [0, 1]
+    assert [s['seat_no'] for s in taken[1][1]] == ['1', '2', '3']
@@ -0,0 +1,37 @@
+import pytest
+import metrics
+from app import app
+
+
+@pytest.fixture
+def client(monkeypatch):
+    app.config['TESTING'] = True
+    metrics.registry.reset()
+    monkeypatch.setattr(metrics, 'SLOW_QUERY_MS', 0)
+    with app.test_client() as c:
+        with c.session_transaction() as sess:
+            sess['user_id'] = 1
+            sess['role'] = 'admin'
+        yield c
+
+
+def test_request_timings_query_counts_and_slow_log(client):
+    resp = client.get('/api/buses?from=Hyd')
+    assert resp.status_code == 200
+    assert 'desc="1 queries"' in resp.headers['Server-Timing']
+
+    text = client.get('/admin/metrics').get_data(as_text=True)
+    assert 'http_request_duration_seconds_count{endpoint="/api/buses",method="GET",status="200"} 1' in text
+    assert 'db_queries_total{endpoint="/api/buses"} 1' in text
+
+    slow = client.get('/admin/metrics/slow-queries').get_json()['queries']
+    entry = next(q for q in slow if q['endpoint'] == '/api/buses')
+    assert entry['sql'].startswith('SELECT') and '\n' not in entry['sql']
+    assert entry['params'] == '(str)'
+
+
+def test_metrics_requires_admin_or_token(monkeypatch):
+    monkeypatch.setenv('METRICS_TOKEN', 's3cret')
+    c = app.test_client()
+    assert c.get('/admin/metrics').status_code == 403
+    assert c.get('/admin/metrics', headers={'Authorization': 'Bearer s3cret'}).status_code == 200
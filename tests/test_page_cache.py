@@ -0,0 +1,33 @@
+import app as webapp
+
+
+def test_admin_buses_renders_once_per_data_version(user_client, query_budget):
+    webapp.bump_data_version('buses')
+    first = user_client.get('/admin/buses')
+    assert query_budget.last('GET /admin/buses')['queries'] == 1
+    again = user_client.get('/admin/buses')
+    assert query_budget.last('GET /admin/buses')['queries'] == 0
+    assert again.data == first.data
+
+    resp = user_client.post('/admin/buses/new', data={
+        'name': 'Cache Buster Travels', 'from_city': 'Nizamabad', 'to_city': 'Hyderabad',
+        'depart_time': '2025-12-01 06:00', 'arrive_time': '2025-12-01 09:00', 'seats_total': '40', 'fare': '300',
+    })
+    assert resp.status_code == 302
+    # The redirect target shows the flash, so it bypasses the cache...
+    page = user_client.get('/admin/buses')
+    assert b'Bus created successfully' in page.data and b'Cache Buster Travels' in page.data
+    # ...and the next plain view is rendered from the new data, without the message
+    page = user_client.get('/admin/buses')
+    assert b'Cache Buster Travels' in page.data and b'Bus created successfully' not in page.data
+
+
+def test_cached_pages_vary_by_viewer(user_client):
+    admin_page = user_client.get('/help').data
+    with user_client.session_transaction() as sess:
+        sess['role'] = 'customer'
+        sess.pop('user_email')
+    customer_page = user_client.get('/help').data
+    assert customer_page != admin_page
+    assert b'Login' in customer_page and b'Logout' in admin_page
+    assert len({k[1:] for k in webapp._PAGE_CACHE if k[0] == 'help.html'}) == 2
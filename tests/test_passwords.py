@@ -0,0 +1,31 @@
+import uuid
+from datetime import datetime
+
+from werkzeug.security import generate_password_hash
+
+import app as webapp
+import passwords
+
+
+def _stored(email):
+    return webapp.db_fetch_one('SELECT password_hash FROM users WHERE email = ?', (email,))['password_hash']
+
+
+def test_login_upgrades_a_legacy_hash():
+    email = f'legacy-{uuid.uuid4().hex[:6]}@example.com'
+    legacy = generate_password_hash('old-secret', method='pbkdf2:sha256:1000')
+    webapp.db_execute('INSERT INTO users (email, password_hash, created_at, role) VALUES (?, ?, ?, ?)',
+                      (email, legacy, datetime.now().isoformat(), 'customer'))
+    client = webapp.app.test_client()
+
+    assert b'Invalid email or password' in client.post('/login', data={'email': email, 'password': 'wrong'}).data
+    assert _stored(email) == legacy
+
+    assert client.post('/login', data={'email': email, 'password': 'old-secret'}).status_code == 302
+    upgraded = _stored(email)
+    assert upgraded != legacy and not passwords.needs_rehash(upgraded)
+    assert upgraded.startswith(passwords._method_prefix(passwords.HASH_METHOD) + '$')
+
+    # Logging in again checks against the new hash and leaves it alone
+    assert webapp.app.test_client().post('/login', data={'email': email, 'password': 'old-secret'}).status_code == 302
+    assert _stored(email) == upgraded
@@ -0,0 +1,63 @@
+import pstats
+
+import pytest
+
+import profiling
+
+
+@pytest.fixture
+def profile_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiling, 'PROFILE_DIR', str(tmp_path))
+    return tmp_path
+
+
+def test_admin_flag_profiles_one_request(user_client, profile_dir):
+    assert 'X-Profile-Id' not in user_client.get('/admin/dashboard').headers
+    resp = user_client.get('/admin/dashboard?_profile=1')
+    assert resp.status_code == 200
+    profile_id = resp.headers['X-Profile-Id']
+    assert profiling.list_ids() == [profile_id]
+
+    summary = profiling.load(profile_id)
+    assert (summary['method'], summary['path'], summary['status'], summary['trigger']) == ('GET', '/admin/dashboard?_profile=1', 200, 'explicit')
+    assert summary['queries'] > 0 and summary['sql_seconds'] > 0 and summary['template_seconds'] > 0
+    assert summary['sql_seconds'] + summary['template_seconds'] <= summary['seconds']
+
+    page = user_client.get('/admin/profiles').get_data(as_text=True)
+    assert 'GET /admin/dashboard?_profile=1' in page
+    assert 'admin_dashboard' in user_client.get(f'/admin/profiles/{profile_id}.txt').get_data(as_text=True)
+    download = user_client.get(f'/admin/profiles/{profile_id}.prof')
+    assert download.headers['Content-Disposition'].startswith('attachment')
+    download.close()
+    assert pstats.Stats(str(profile_dir / f'{profile_id}.prof')).total_calls > 0
+
+    header = user_client.get('/api/buses', headers={'X-Profile': '1'})
+    assert profiling.load(header.headers['X-Profile-Id'])['endpoint'] == '/api/buses'
+
+
+def test_flag_is_ignored_for_customers(user_client, profile_dir):
+    with user_client.session_transaction() as sess:
+        sess['role'] = 'customer'
+    assert 'X-Profile-Id' not in user_client.get('/bookings?_profile=1', headers={'X-Profile': '1'}).headers
+    assert profiling.list_ids() == []
+    assert user_client.get('/admin/profiles').status_code == 302
+    assert user_client.get('/admin/profiles/1-1-1.prof').status_code == 403
+
+
+def test_sampling_and_retention(user_client, profile_dir, monkeypatch):
+    monkeypatch.setattr(profiling, 'SAMPLE_RATE', 1.0)
+    monkeypatch.setattr(profiling, 'KEEP', 2)
+    ids = [user_client.get('/api/buses').headers['X-Profile-Id'] for _ in range(3)]
+    assert profiling.list_ids() == ids[:0:-1]  # the oldest was pruned
+    assert profiling.load(ids[-1])['trigger'] == 'sampled'
+    assert 'X-Profile-Id' not in user_client.get('/admin/profiles').headers
+
+
+def test_one_profile_at_a_time_and_unknown_ids(user_client, profile_dir):
+    with profiling._busy:
+        resp = user_client.get('/api/buses?_profile=1')
+    assert resp.status_code == 200 and resp.headers['X-Profile'] == 'busy'
+    assert profiling.list_ids() == []
+    assert user_client.get('/admin/profiles/1-1-1.txt').status_code == 404
+    assert user_client.get('/admin/profiles/..%2Fsecret.prof').status_code == 404
+    assert profiling.path_for('../../etc/passwd', '.prof') is None
@@ -0,0 +1,48 @@
+import pytest
+
+
+def _first_trip(client):
+    return client.get('/api/buses').get_json()[0]['id']
+
+
+@pytest.mark.max_queries({
+    'GET /api/buses': 1,
+    'GET /api/buses/<int:bus_id>/seats': 2,
+    'POST /api/bookings': 5,
+    'GET /bookings': 1,
+    'GET /ticket/<int:booking_id>': 3,
+    'POST /api/bookings/<int:booking_id>/pay': 2,  # the update and its event
+    'POST /api/bookings/<int:booking_id>/cancel': 6,  # owner check, cancel, read + free the seats, check the waitlist, events
+})
+def test_booking_flow_stays_within_query_ceilings(user_client, query_budget):
+    bus_id = _first_trip(user_client)
+    assert user_client.get(f'/api/buses/{bus_id}/seats').status_code == 200
+
+    resp = user_client.post('/api/bookings', json={
+        'bus_id': bus_id, 'name': 'Budget', 'phone': '9000000000',
+        'seat_numbers': ['37', '38'], 'passengers': [{'name': 'Budget'}, {'name': 'Budget Two'}],
+    })
+    assert resp.status_code == 200
+    booking_id = resp.get_json()['booking_id']
+    # Seats, passengers and events go in as one executemany each, not one insert per row
+    assert query_budget.last('POST /api/bookings')['queries'] == 5
+
+    resp = user_client.post('/api/bookings', json={
+        'bus_id': bus_id, 'name': 'Late', 'phone': '9000000001', 'seat_numbers': ['38'],
+    })
+    assert resp.status_code == 409
+
+    assert user_client.get('/bookings').status_code == 200
+    assert user_client.get(f'/ticket/{booking_id}').status_code == 200
+    assert user_client.post(f'/api/bookings/{booking_id}/pay').status_code == 200
+    assert user_client.post(f'/api/bookings/{booking_id}/cancel').status_code == 200
+
+
+def test_budget_reports_offending_statements(user_client, query_budget):
+    query_budget.limit('GET /api/buses', 0)
+    user_client.get('/api/buses')
+    problems = query_budget.violations()
+    query_budget.requests.clear()
+    assert len(problems) == 1
+    assert 'GET /api/buses (200) issued 1 queries, ceiling is 0' in problems[0]
+    assert '1. SELECT t.id' in problems[0]
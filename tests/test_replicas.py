@@ -0,0 +1,52 @@
+import shutil
+import sqlite3
+import pytest
+
+import app as webapp
+import database as dbmod
+import replicas
+
+
+def _replica(tmp_path, label):
+    path = str(tmp_path / f'{label}.db')
+    shutil.copy(dbmod.sqlite_path(), path)
+    conn = sqlite3.connect(path)
+    conn.execute('UPDATE services SET name = ?', (label,))
+    conn.commit()
+    conn.close()
+    return replicas.Replica(label, replicas._sqlite_connect(path))
+
+
+def _served_by(client):
+    return {b['name'] for b in client.get('/api/buses').get_json()}
+
+
+@pytest.fixture
+def pool(tmp_path, monkeypatch):
+    pool = replicas.ReplicaPool([_replica(tmp_path, 'replica-a'), _replica(tmp_path, 'replica-b')])
+    monkeypatch.setattr(webapp, 'REPLICAS', pool)
+    return pool
+
+
+def test_reads_round_robin_and_writes_stick_to_primary(user_client, pool, monkeypatch):
+    assert [_served_by(user_client) for _ in range(4)] == [{'replica-a'}, {'replica-b'}] * 2
+
+    bus_id = webapp.db_fetch_one('SELECT id FROM trips ORDER BY id LIMIT 1')['id']
+    resp = user_client.post('/api/bookings', json={'bus_id': bus_id, 'name': 'Sticky', 'phone': '9000000002', 'seat_numbers': ['39']})
+    assert resp.status_code == 200
+    # Read-your-writes: the session that just booked reads from the primary
+    primary_names = _served_by(user_client)
+    assert not primary_names & {'replica-a', 'replica-b'}
+
+    monkeypatch.setattr(webapp, 'REPLICA_STICKY_SECONDS', 0)
+    assert _served_by(user_client) <= {'replica-a', 'replica-b'}
+
+
+def test_unhealthy_replica_is_skipped_then_primary_used(user_client, pool, tmp_path):
+    pool.replicas[0] = replicas.Replica('gone', replicas._sqlite_connect(str(tmp_path / 'missing.db')))
+    assert [_served_by(user_client) for _ in range(3)] == [{'replica-b'}] * 3
+    gone = pool.status()[0]
+    assert gone['failures'] == 1 and not gone['healthy']
+
+    pool.mark_failed(pool.replicas[1])
+    assert not _served_by(user_client) & {'replica-b'}
@@ -0,0 +1,26 @@
+from datetime import datetime
+import routing
+
+
+def _trip(i, a, b, dep, arr, fare):
+    return {'id': i, 'name': f'Bus{i}', 'from_city': a, 'to_city': b,
+            'depart_time': dep, 'arrive_time': arr, 'fare': fare}
+
+
+def test_connection_respects_min_transfer_and_ranks_by_arrival():
+    graph = routing.build_graph([
+        _trip(1, 'Tirupati', 'Hyderabad', '2025-11-04 20:30', '2025-11-05 07:00', 900),
+        # Leaves 10 minutes after arrival: too tight for a 30 minute transfer
+        _trip(2, 'Hyderabad', 'Visakhapatnam', '2025-11-05 07:10', '2025-11-05 17:00', 1000),
+        _trip(3, 'Hyderabad', 'Vijayawada', '2025-11-05 08:00', '2025-11-05 13:00', 600),
+        _trip(4, 'Vijayawada', 'Visakhapatnam', '2025-11-05 14:00', '2025-11-05 19:00', 550),
+        _trip(5, 'Hyderabad', 'Visakhapatnam', '2025-11-05 09:00', '2025-11-05 20:00', 1100),
+    ])
+    itineraries, complete = routing.search(
+        graph, 'tirupati', 'Visakhapatnam',
+        depart_after=datetime(2025, 11, 4), depart_before=datetime(2025, 11, 4, 23, 59),
+    )
+    assert complete
+    assert [[leg['id'] for leg in it['legs']] for it in itineraries] == [[1, 3, 4], [1, 5]]
+    assert itineraries[0]['transfers'] == 2
+    assert itineraries[0]['total_fare'] == 2050
@@ -0,0 +1,66 @@
+import io
+import uuid
+
+import pytest
+
+import app as webapp
+import database as dbmod
+import schedules
+
+HEADER = 'name,from_city,to_city,depart_time,arrive_time,seats_total,fare'
+RECURRING = HEADER + ',start_date,end_date,days'
+
+
+def test_csv_rows_in_both_shapes():
+    text = (f'{RECURRING}\n'
+            'Night Rider,Hyderabad,Chennai,22:30,06:15,30,1200,2030-06-02,2030-06-08,weekends\n'
+            'Day Liner,Hyderabad,Warangal,2030-06-03 08:00,2030-06-03 11:00,,\n')
+    rows = list(schedules.iter_csv_rows(io.StringIO(text)))
+    # 2030-06-02 is a Sunday and 06-08 a Saturday; arrivals before departure land the next day
+    assert rows == [
+        ('Night Rider', 'Hyderabad', 'Chennai', '2030-06-02 22:30', '2030-06-03 06:15', 30, 1200.0),
+        ('Night Rider', 'Hyderabad', 'Chennai', '2030-06-08 22:30', '2030-06-09 06:15', 30, 1200.0),
+        ('Day Liner', 'Hyderabad', 'Warangal', '2030-06-03 08:00', '2030-06-03 11:00', 40, 0.0),
+    ]
+    assert schedules.parse_days('Mon, Wed,fri') == {0, 2, 4}
+    with pytest.raises(ValueError, match='Unknown weekday: xyz'):
+        schedules.parse_days('mon,xyz')
+    with pytest.raises(ValueError, match='Line 3'):
+        list(schedules.iter_csv_rows(io.StringIO(f'{HEADER}\nA,B,C,2030-06-03 08:00,2030-06-03 11:00,40,100\n'
+                                                 'A,B,C,tomorrow,2030-06-03 11:00,40,100\n')))
+
+
+def test_import_dedups_and_a_bad_row_commits_nothing(tmp_path):
+    conn = dbmod.connect_sqlite(str(tmp_path / 'import.db'))
+    dbmod.setup_schema(conn)
+    text = (f'{RECURRING}\n'
+            'Shuttle,Guntur,Tenali,07:00,07:45,20,60,2030-06-01,2030-06-10,daily\n'
+            'Shuttle,Guntur,Tenali,07:00,07:45,20,60,2030-06-05,2030-06-14,daily\n')
+    report = schedules.import_csv(conn, text, batch_size=3)
+    assert (report['rows'], report['inserted'], report['skipped']) == (20, 14, 6)
+    assert conn.execute('SELECT COUNT(*) FROM services').fetchone()[0] == 1
+
+    good = [('Late', 'Guntur', 'Tenali', f'2030-07-{d:02d} 22:00', f'2030-07-{d:02d} 22:45', 20, 60) for d in range(1, 6)]
+    with pytest.raises(ValueError, match='Row 6'):
+        dbmod.insert_buses(conn, good + [('Late', 'Guntur', 'Tenali', 'soon', 'later', 20, 60)], batch_size=2)
+    assert conn.execute('SELECT COUNT(*) FROM trips').fetchone()[0] == 14
+    conn.close()
+
+
+def test_admin_import_view(user_client):
+    name = f'Import {uuid.uuid4().hex[:6]}'
+    trips = 'SELECT COUNT(*) AS n FROM trips t JOIN services s ON s.id = t.service_id WHERE s.name = ?'
+    bad = f'{HEADER}\n{name},Nellore,Kavali,2030-06-03 09:00,2030-06-03 10:10,41,90\n{name},Nellore,Kavali,noon,,41,90\n'
+    page = user_client.post('/admin/buses/import', data={'csv_text': bad}).get_data(as_text=True)
+    assert 'no trips were imported' in page and 'Line 3' in page
+    assert webapp.db_fetch_one(trips, (name,))['n'] == 0
+
+    text = f'{RECURRING}\n{name},Nellore,Kavali,09:00,10:10,41,90,2030-06-03,2030-06-09,weekdays\n'
+    resp = user_client.post('/admin/buses/import', data={'csv_text': text})
+    assert resp.status_code == 302
+    assert webapp.db_fetch_one(trips, (name,))['n'] == 5
+    assert f'{name}' in user_client.get('/admin/buses').get_data(as_text=True)
+
+    with user_client.session_transaction() as sess:
+        sess['role'] = 'customer'
+    assert user_client.post('/admin/buses/import', data={'csv_text': text}).status_code == 302
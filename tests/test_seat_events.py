@@ -0,0 +1,54 @@
+import asyncio
+import seat_events
+
+
+def test_async_subscribers_share_one_wakeup_and_resync_after_overflow():
+    broadcaster = seat_events.SeatBroadcaster()
+    key = (7, '2025-11-06')
+
+    async def scenario():
+        waiters = [asyncio.ensure_future(broadcaster.wait_async(key, 0, timeout=5)) for _ in range(50)]
+        await asyncio.sleep(0)
+        assert broadcaster.stats()['subscribers'] == 50
+        broadcaster.publish(7, '2025-11-06', 'booked', [3, 4], booking_id=11)
+        return await asyncio.gather(*waiters)
+
+    results = asyncio.run(scenario())
+    assert all(r == ([(1, {'kind': 'booked', 'seats': ['3', '4'], 'booking_id': 11})], 1, False) for r in results)
+    assert broadcaster.stats()['subscribers'] == 0
+
+    for i in range(seat_events.HISTORY + 1):
+        broadcaster.publish(7, '2025-11-06', 'released', [i])
+    events, cursor, lost = broadcaster.wait(key, 1, timeout=0)
+    assert lost and cursor == seat_events.HISTORY + 2
+    assert 'event: resync' in seat_events.format_sse(events, lost)
+
+
+def test_idle_channels_are_dropped_and_old_cursors_resync():
+    now = [0.0]
+    broadcaster = seat_events.SeatBroadcaster(clock=lambda: now[0])
+    old, busy = (7, '2025-11-06'), (8, '2025-11-06')
+    for seat in (1, 2, 3):
+        broadcaster.publish(*old, 'booked', [seat])
+    for seat in range(1, 9):
+        broadcaster.publish(6, '2025-11-06', 'booked', [seat])
+    cursor = broadcaster.cursor(old)
+
+    async def listen():
+        return await broadcaster.wait_async(busy, broadcaster.cursor(busy), timeout=5)
+
+    async def scenario():
+        listener = asyncio.ensure_future(listen())
+        await asyncio.sleep(0)
+        now[0] += seat_events.IDLE_SECONDS + 1
+        broadcaster.publish(9, '2025-11-06', 'booked', [1])  # any use may sweep
+        assert broadcaster.stats() == {'channels': 2, 'subscribers': 1}  # the listened-to channel stays
+        broadcaster.publish(*busy, 'booked', [5])
+        return await listener
+
+    assert asyncio.run(scenario())[0][0][1]['seats'] == ['5']
+
+    # A dropped trip starts again above every old cursor, so a client that slept through it resyncs
+    broadcaster.publish(*old, 'released', [1])
+    events, new_cursor, lost = broadcaster.wait(old, cursor, timeout=0)
+    assert lost and new_cursor == 9
@@ -0,0 +1,61 @@
+import os
+import sys
+import shutil
+import sqlite3
+import subprocess
+
+import pytest
+
+import app as webapp
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_import_touches_no_database(tmp_path):
+    probe = "import sys, app; print(app._initialized[0], 'smtplib' in sys.modules, 'mysql.connector' in sys.modules)"
+    env = dict(os.environ, SQLITE_PATH=str(tmp_path / 'nowhere.db'))
+    out = subprocess.run([sys.executable, '-c', probe], cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+    assert out.stdout.split() == ['False', 'False', 'False']
+    assert not (tmp_path / 'nowhere.db').exists()
+
+
+def test_schema_steps_skip_when_stamp_is_current(tmp_path, monkeypatch):
+    calls = []
+    monkeypatch.setattr(webapp, 'INIT_STEPS', [lambda: calls.append('step')])
+    monkeypatch.setattr(webapp, '_initialized', [False])
+    webapp.ensure_initialized()
+    assert calls == []  # the session fixture already stamped the test database
+
+    # A database that has never been stamped gets the full schema run once
+    monkeypatch.setenv('SQLITE_PATH', shutil.copy(os.path.join(ROOT, 'bus_booking.db'), tmp_path))
+    monkeypatch.setattr(webapp, '_initialized', [False])
+    webapp.ensure_initialized()
+    webapp.ensure_initialized()
+    assert calls == ['step']
+    assert webapp.schema_stamp() == str(webapp.SCHEMA_VERSION)
+
+
+def test_failed_step_leaves_the_schema_unstamped(tmp_path, monkeypatch):
+    monkeypatch.setenv('SQLITE_PATH', shutil.copy(os.path.join(ROOT, 'bus_booking.db'), tmp_path))
+    monkeypatch.setattr(webapp, '_initialized', [False])
+    ran = []
+
+    def locked():
+        raise sqlite3.OperationalError('database is locked')
+
+    monkeypatch.setattr(webapp, 'INIT_STEPS', [locked, lambda: ran.append('later step')])
+    with pytest.raises(webapp.SchemaInitError, match='locked: database is locked'):
+        webapp.ensure_initialized()
+    assert ran == ['later step'] and webapp.schema_stamp() is None and not webapp._initialized[0]
+
+    # Fixed: the next attempt runs everything again and only then stamps
+    monkeypatch.setattr(webapp, 'INIT_STEPS', [lambda: ran.append('retry')])
+    webapp.ensure_initialized()
+    assert ran[-1] == 'retry' and webapp.schema_stamp() == str(webapp.SCHEMA_VERSION)
+
+
+def test_run_ddl_only_tolerates_already_applied_statements():
+    webapp.run_ddl("ALTER TABLE bookings ADD COLUMN status TEXT",  # there since the first migration
+                   "CREATE TABLE IF NOT EXISTS app_meta (name TEXT PRIMARY KEY, value TEXT)")
+    with pytest.raises(sqlite3.OperationalError):
+        webapp.run_ddl("ALTER TABLE no_such_table ADD COLUMN x TEXT")
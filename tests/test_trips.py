@@ -0,0 +1,101 @@
+import uuid
+
+import app as webapp
+import database as dbmod
+
+LEGACY = [
+    (3, 'Garuda', 'Hyderabad', 'Tirupati', '2030-05-01 21:00', '2030-05-02 07:30', 36, 900),
+    (4, 'Garuda', 'Hyderabad', 'Tirupati', '2030-05-02 21:00', '2030-05-03 07:30', 36, 900),
+    (5, 'Garuda', 'Hyderabad', 'Tirupati', '2030-05-01 21:00', '2030-05-02 07:30', 36, 900),  # same departure as 3
+    (9, 'Rajadhani', 'Vijayawada', 'Guntur', '2030-05-01 06:00', '07:10', 40, 120),
+]
+
+
+def _legacy_db(path):
+    conn = dbmod.connect_sqlite(str(path))
+    conn.executescript('''
+        CREATE TABLE buses (id INTEGER PRIMARY KEY, name TEXT, from_city TEXT, to_city TEXT,
+                            depart_time TEXT, arrive_time TEXT, seats_total INTEGER, fare REAL);
+        CREATE TABLE bookings (id INTEGER PRIMARY KEY, bus_id INTEGER, passenger_name TEXT, passenger_phone TEXT,
+                               seats_booked INTEGER, booked_at TEXT);
+        CREATE TABLE booked_seats (id INTEGER PRIMARY KEY, bus_id INTEGER, journey_date TEXT, seat_no TEXT, booking_id INTEGER,
+                                   UNIQUE (bus_id, journey_date, seat_no));
+    ''')
+    conn.executemany('INSERT INTO buses VALUES (?, ?, ?, ?, ?, ?, ?, ?)', LEGACY)
+    conn.executemany("INSERT INTO bookings VALUES (?, ?, 'Old', '9000000060', 1, '2030-04-01')", [(1, 3), (2, 5), (3, 9)])
+    conn.executemany('INSERT INTO booked_seats (bus_id, journey_date, seat_no, booking_id) VALUES (?, ?, ?, ?)',
+                     [(3, '2030-05-01', '1', 1), (5, '2030-05-01', '2', 2), (9, '2030-05-01', '1', 3)])
+    conn.commit()
+    return conn
+
+
+def test_legacy_buses_fold_into_trips_keeping_ids(tmp_path):
+    conn = _legacy_db(tmp_path / 'legacy.db')
+    dbmod.setup_schema(conn)
+
+    assert conn.execute("SELECT type FROM sqlite_master WHERE name = 'buses'").fetchone()[0] == 'view'
+    assert [r[0] for r in conn.execute('SELECT id FROM trips ORDER BY id')] == [3, 4, 9]
+    assert conn.execute('SELECT COUNT(*) FROM services').fetchone()[0] == 2
+    # The view gives back the legacy rows, with a bare HH:MM arrival resolved to a date
+    rows = [tuple(r) for r in conn.execute(
+        'SELECT id, name, from_city, to_city, depart_time, arrive_time, seats_total, fare FROM buses ORDER BY id')]
+    assert rows == [LEGACY[0], LEGACY[1], LEGACY[3][:5] + ('2030-05-01 07:10', 40, 120)]
+
+    # The duplicate departure's booking and seat now point at the surviving trip
+    assert [tuple(r) for r in conn.execute('SELECT id, bus_id FROM bookings ORDER BY id')] == [(1, 3), (2, 3), (3, 9)]
+    assert [tuple(r) for r in conn.execute('SELECT booking_id, bus_id, seat_no FROM booked_seats ORDER BY id')] == [
+        (1, 3, '1'), (2, 3, '2'), (3, 9, '1')]
+
+    dbmod.setup_schema(conn)  # already migrated: nothing changes
+    assert conn.execute('SELECT COUNT(*) FROM trips').fetchone()[0] == 3
+    conn.close()
+
+
+def test_duplicate_departures_that_sold_the_same_seat_stay_apart(tmp_path, caplog):
+    conn = _legacy_db(tmp_path / 'clash.db')
+    conn.execute('INSERT INTO buses VALUES (?, ?, ?, ?, ?, ?, ?, ?)', (6,) + LEGACY[0][1:])
+    conn.execute("INSERT INTO bookings VALUES (4, 6, 'Twin', '9000000061', 1, '2030-04-02')")
+    conn.execute("INSERT INTO booked_seats (bus_id, journey_date, seat_no, booking_id) VALUES (6, '2030-05-01', '1', 4)")
+    conn.commit()
+    dbmod.setup_schema(conn)
+
+    # 5 had no overlap with 3 and folds in; 6 sold seat 1 again, so it keeps its own trip and seat
+    assert [r[0] for r in conn.execute('SELECT id FROM trips ORDER BY id')] == [3, 4, 6, 9]
+    assert tuple(conn.execute('SELECT name, depart_time FROM buses WHERE id = 6').fetchone()) == ('Garuda #6', '2030-05-01 21:00')
+    assert [tuple(r) for r in conn.execute('SELECT booking_id, bus_id, seat_no FROM booked_seats ORDER BY booking_id')] == [
+        (1, 3, '1'), (2, 3, '2'), (3, 9, '1'), (4, 6, '1')]
+    assert 'buses 3 and 6' in caplog.text and 'seats 1' in caplog.text
+    conn.close()
+
+
+def test_insert_buses_skips_existing_services_and_trips(tmp_path):
+    conn = dbmod.connect_sqlite(str(tmp_path / 'fresh.db'))
+    dbmod.setup_schema(conn)
+    garuda = LEGACY[0][1:]
+    assert dbmod.insert_buses(conn, [garuda, LEGACY[1][1:], garuda], batch_size=2) == 2
+    assert dbmod.insert_buses(conn, [garuda, LEGACY[3][1:]]) == 1
+    assert conn.execute('SELECT COUNT(*) FROM services').fetchone()[0] == 2
+    assert conn.execute('SELECT COUNT(*) FROM trips').fetchone()[0] == 3
+    conn.close()
+
+
+def test_editing_a_trip_date_moves_its_bookings(user_client, make_trip):
+    bus = {'name': f'Moved {uuid.uuid4().hex[:6]}', 'from_city': 'Nellore', 'to_city': 'Kadapa', 'depart_time': '2031-10-01 08:00',
+           'arrive_time': '2031-10-01 12:00', 'seats_total': '10', 'fare': '260'}
+    trip = make_trip(**bus)
+    booking = user_client.post('/api/bookings', json={
+        'bus_id': trip, 'name': 'Mover', 'phone': '9000000080', 'seat_numbers': ['3', '4']}).get_json()['booking_id']
+
+    user_client.post(f'/admin/buses/{trip}/edit', data=dict(bus, depart_time='2031-10-02 08:00', arrive_time='2031-10-02 12:00'))
+    seats = user_client.get(f'/api/buses/{trip}/seats').get_json()
+    assert (seats['date'], seats['booked']) == ('2031-10-02', ['3', '4'])
+    assert webapp.db_fetch_one('SELECT journey_date FROM bookings WHERE id = ?', (booking,))['journey_date'] == '2031-10-02'
+    again = user_client.post('/api/bookings', json={'bus_id': trip, 'name': 'Twice', 'phone': '9000000081', 'seat_numbers': ['3']})
+    assert again.status_code == 409
+
+    # A stale hold on the target date blocks the move and leaves everything where it was
+    webapp.db_execute('INSERT INTO booked_seats (bus_id, journey_date, seat_no) VALUES (?, ?, ?)', (trip, '2031-10-03', '4'))
+    user_client.post(f'/admin/buses/{trip}/edit', data=dict(bus, depart_time='2031-10-03 08:00', arrive_time='2031-10-03 12:00'))
+    assert user_client.get(f'/api/buses/{trip}/seats').get_json()['date'] == '2031-10-02'
+    held = webapp.db_fetch_all('SELECT journey_date FROM booked_seats WHERE booking_id = ?', (booking,))
+    assert {r['journey_date'] for r in held} == {'2031-10-02'}
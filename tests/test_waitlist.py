@@ -0,0 +1,167 @@
+import threading
+
+import pytest
+
+import app as webapp
+import waitlist
+
+
+@pytest.fixture
+def notified(monkeypatch):
+    calls = []
+    monkeypatch.setattr(webapp, 'smtp_configured', lambda: True)
+    monkeypatch.setattr(webapp, 'notify_booking', lambda event, booking_id, base_url=None: calls.append((event, booking_id)))
+    yield calls
+    webapp.NOTIFY_QUEUE.join()
+
+
+def _client(user_id, role='customer'):
+    client = webapp.app.test_client()
+    with client.session_transaction() as sess:
+        sess['user_id'] = user_id
+        sess['role'] = role
+    return client
+
+
+ROUTE = {'from_city': 'Hyderabad', 'to_city': 'Warangal', 'depart_time': '2031-03-01 08:00', 'arrive_time': '2031-03-01 11:00', 'fare': 300}
+
+
+def _book(client, trip_id, seats):
+    resp = client.post('/api/bookings', json={'bus_id': trip_id, 'name': 'Full', 'phone': '9000000020', 'seat_numbers': seats})
+    assert resp.status_code == 200, resp.get_json()
+    return resp.get_json()['booking_id']
+
+
+def _join(client, trip_id, seats):
+    return client.post(f'/api/buses/{trip_id}/waitlist', json={'name': 'Waiting', 'phone': '9000000021', 'seats': seats})
+
+
+def test_cancellation_promotes_queue_in_fifo_order(notified, make_trip):
+    trip = make_trip('Waitlist', seats_total=3, **ROUTE)
+    owner, first, second = _client(801), _client(802), _client(803)
+    assert _join(first, trip, 1).status_code == 409  # seats still free: book directly
+    pair = _book(owner, trip, ['1', '2'])
+    single = _book(owner, trip, ['3'])
+
+    head = _join(first, trip, 2).get_json()
+    behind = _join(second, trip, 1).get_json()
+    assert (head['state'], head['position'], behind['position']) == ('waiting', 1, 2)
+
+    # One free seat: the head wants two, so the one-seat entry behind it does not jump ahead
+    assert owner.post(f'/api/bookings/{single}/cancel').get_json()['promoted'] == 0
+    assert second.get(f"/api/waitlist/{behind['waitlist_id']}").get_json()['state'] == 'waiting'
+
+    assert owner.post(f'/api/bookings/{pair}/cancel').get_json()['promoted'] == 2
+    head = first.get(f"/api/waitlist/{head['waitlist_id']}").get_json()
+    behind = second.get(f"/api/waitlist/{behind['waitlist_id']}").get_json()
+    assert head['state'] == behind['state'] == 'promoted'
+    held = webapp.db_fetch_all('SELECT booking_id, seat_no FROM booked_seats WHERE bus_id = ? ORDER BY seat_no', (trip,))
+    assert [(r['booking_id'], r['seat_no']) for r in held] == [
+        (head['booking_id'], '1'), (head['booking_id'], '2'), (behind['booking_id'], '3')]
+    assert first.get(f"/ticket/{head['booking_id']}").status_code == 200
+    assert first.get(f"/api/waitlist/{behind['waitlist_id']}").status_code == 404  # someone else's entry
+
+    webapp.NOTIFY_QUEUE.join()
+    assert sorted(n for n in notified if n[0] != 'created') == sorted([('cancelled', single), ('cancelled', pair),
+                                       ('promoted', head['booking_id']), ('promoted', behind['booking_id'])])
+
+
+def test_leaving_the_queue_and_admin_release(notified, make_trip):
+    trip = make_trip('Waitlist', seats_total=1, **ROUTE)
+    booking = _book(_client(811), trip, ['1'])
+    gone = _join(_client(812), trip, 1).get_json()
+    stays = _join(_client(813), trip, 1).get_json()
+    assert _client(812).post(f"/api/waitlist/{gone['waitlist_id']}/cancel").status_code == 200
+    assert _client(1, 'admin').post(f'/admin/bookings/{booking}/release-seats').status_code == 200
+    assert _client(813).get(f"/api/waitlist/{stays['waitlist_id']}").get_json()['state'] == 'promoted'
+    assert _client(812).get(f"/api/waitlist/{gone['waitlist_id']}").get_json()['state'] == 'left'
+
+
+def test_cancelled_booking_cannot_be_confirmed_again(notified, make_trip):
+    trip = make_trip('Waitlist', seats_total=2, **ROUTE)
+    admin = _client(1, 'admin')
+    booking = _book(_client(831), trip, ['1', '2'])
+    assert admin.post(f'/admin/bookings/{booking}/status', json={'status': 'cancelled'}).status_code == 200
+    retaken = _book(_client(832), trip, ['1'])
+    # Confirming it again would leave it with no seats (or double-book seat 1)
+    assert admin.post(f'/admin/bookings/{booking}/status', json={'status': 'confirmed'}).status_code == 409
+    assert webapp.db_fetch_one('SELECT status FROM bookings WHERE id = ?', (booking,))['status'] == 'cancelled'
+    held = webapp.db_fetch_all('SELECT booking_id, seat_no FROM booked_seats WHERE bus_id = ?', (trip,))
+    assert [(r['booking_id'], r['seat_no']) for r in held] == [(retaken, '1')]
+    assert admin.post('/admin/bookings/999999999/status', json={'status': 'confirmed'}).status_code == 404
+    assert admin.post(f'/admin/bookings/{retaken}/status', json={'status': 'confirmed'}).status_code == 200
+
+
+def test_only_the_owner_or_an_admin_cancels(notified, make_trip):
+    trip = make_trip('Waitlist', seats_total=2, **ROUTE)
+    owner, stranger = _client(841), _client(842)
+    booking = _book(owner, trip, ['1'])
+    assert stranger.post(f'/api/bookings/{booking}/cancel').status_code == 404
+    assert stranger.post('/api/bookings/999999999/cancel').status_code == 404
+    assert webapp.db_fetch_one('SELECT status FROM bookings WHERE id = ?', (booking,))['status'] != 'cancelled'
+    assert owner.post(f'/api/bookings/{booking}/cancel').status_code == 200
+    other = _book(stranger, trip, ['2'])
+    assert _client(1, 'admin').post(f'/api/bookings/{other}/cancel').status_code == 200
+
+
+def test_a_phone_matched_user_sees_opens_and_cancels_the_booking(notified, make_trip):
+    # A booking made by phone before signing in belongs to the account with that phone, everywhere
+    trip = make_trip('Waitlist', seats_total=2, **ROUTE)
+    booking = _book(_client(None), trip, ['1'])
+    webapp.db_execute('INSERT INTO users (email, password_hash, created_at, role, phone) VALUES (?, ?, ?, ?, ?)',
+                      (f'phone-{booking}@example.com', 'x', '2031-01-01', 'customer', '9000000020'))
+    user_id = webapp.db_fetch_one('SELECT id FROM users WHERE email = ?', (f'phone-{booking}@example.com',))['id']
+    client = _client(user_id)
+    assert client.get(f'/ticket/{booking}').status_code == 200
+    assert client.post(f'/api/bookings/{booking}/cancel').status_code == 200
+    assert f'/ticket/{booking}' in client.get('/bookings').get_data(as_text=True)
+
+
+def test_cancelling_twice_logs_and_notifies_once(notified, make_trip):
+    trip = make_trip('Waitlist', seats_total=2, **ROUTE)
+    owner = _client(851)
+    booking = _book(owner, trip, ['1'])
+    first = owner.post(f'/api/bookings/{booking}/cancel').get_json()
+    again = owner.post(f'/api/bookings/{booking}/cancel').get_json()
+    assert (first['released'], again['status'], again['released']) == (1, 'success', 0)
+    admin = _client(1, 'admin')
+    assert admin.post(f'/admin/bookings/{booking}/status', json={'status': 'cancelled'}).status_code == 200
+    kinds = [r['kind'] for r in webapp.db_fetch_all('SELECT kind FROM events WHERE booking_id = ? ORDER BY id', (booking,))]
+    assert kinds.count('booking.cancelled') == 1
+    webapp.NOTIFY_QUEUE.join()
+    assert notified.count(('cancelled', booking)) == 1
+
+
+def test_mass_cancellation_keeps_inventory_consistent(notified, make_trip):
+    trip = make_trip('Waitlist', seats_total=12, **ROUTE)
+    owner = _client(821)
+    bookings = [_book(owner, trip, [str(n)]) for n in range(1, 13)]
+    entries = [_join(_client(900 + i), trip, 1 + i % 2).get_json()['waitlist_id'] for i in range(10)]
+    start = threading.Barrier(len(bookings))
+    statuses = []
+
+    def cancel(booking_id):
+        client = _client(821)
+        start.wait()
+        statuses.append(client.post(f'/api/bookings/{booking_id}/cancel').status_code)
+
+    threads = [threading.Thread(target=cancel, args=(b,)) for b in bookings]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert statuses == [200] * len(bookings)
+    rows = webapp.db_fetch_all('SELECT id, status, booking_id FROM waitlist WHERE bus_id = ? ORDER BY id', (trip,))
+    promoted = [r for r in rows if r['status'] == 'promoted']
+    # 12 seats for requests of 1,2,1,2,...: the first eight entries (12 seats) get in, in order
+    assert [r['id'] for r in promoted] == entries[:8]
+    assert [r['booking_id'] for r in promoted] == sorted(r['booking_id'] for r in promoted)
+    held = webapp.db_fetch_all('SELECT seat_no FROM booked_seats WHERE bus_id = ?', (trip,))
+    assert sorted(int(r['seat_no']) for r in held) == list(range(1, 13))
+
+
+def test_allocate_is_strict_fifo():
+    entries = [{'id': 1, 'seats': 2}, {'id': 2, 'seats': 3}, {'id': 3, 'seats': 1}]
+    assert [(e['id'], s) for e, s in waitlist.allocate(['10', '2', '9'], entries)] == [(1, ['2', '9'])]
+    assert waitlist.free_seats(4, ['2', 3]) == ['1', '4']
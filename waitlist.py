@@ -0,0 +1,76 @@
+import os
+
+# ---------- Waitlist ----------
+# One queue per trip (bus_id + journey_date): customers who found too few free
+# seats wait in `waitlist` in arrival order (id). When a cancellation frees
+# seats, the same transaction books them for the queue, oldest entry first.
+# The queue is strict FIFO: if the head wants 3 seats and 2 are free, nobody
+# behind it jumps ahead. Each promoted entry becomes an ordinary confirmed,
+# unpaid booking and the customer is notified through the app's background
+# notification queue.
+
+MAX_SEATS = int(os.getenv('WAITLIST_MAX_SEATS') or 6)
+PROMOTE_BATCH = 64  # queue entries read per round; a round books at most the free seats
+
+
+def schema_statements(mysql_on):
+    """Re-runnable DDL: once applied, statements fail only as "already exists" (see app.run_ddl)."""
+    if mysql_on:
+        return ['''
+            CREATE TABLE IF NOT EXISTS waitlist (
+                id INT AUTO_INCREMENT PRIMARY KEY,
+                bus_id INT NOT NULL,
+                journey_date VARCHAR(10) NOT NULL,
+                user_id INT,
+                passenger_name VARCHAR(255),
+                passenger_phone VARCHAR(32),
+                seats INT NOT NULL,
+                status VARCHAR(16) NOT NULL DEFAULT 'waiting',
+                booking_id INT,
+                created_at DATETIME,
+                promoted_at DATETIME,
+                INDEX idx_waitlist_queue (bus_id, journey_date, status, id),
+                INDEX idx_waitlist_user (user_id)
+            )''']
+    return [
+        '''
+        CREATE TABLE IF NOT EXISTS waitlist (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            bus_id INTEGER NOT NULL,
+            journey_date TEXT NOT NULL,
+            user_id INTEGER,
+            passenger_name TEXT,
+            passenger_phone TEXT,
+            seats INTEGER NOT NULL,
+            status TEXT NOT NULL DEFAULT 'waiting',
+            booking_id INTEGER,
+            created_at TEXT,
+            promoted_at TEXT
+        )''',
+        "CREATE INDEX IF NOT EXISTS idx_waitlist_queue ON waitlist (bus_id, journey_date, status, id)",
+        "CREATE INDEX IF NOT EXISTS idx_waitlist_user ON waitlist (user_id)",
+    ]
+
+
+def _seat_key(seat):
+    seat = str(seat)
+    return (0, int(seat), '') if seat.isdigit() else (1, 0, seat)
+
+
+def free_seats(seats_total, taken):
+    """Unbooked seat numbers of a trip, lowest first (seat maps number seats 1..seats_total)."""
+    taken = {str(s) for s in taken}
+    return [str(n) for n in range(1, int(seats_total or 0) + 1) if str(n) not in taken]
+
+
+def allocate(free, entries):
+    """[(entry, seats)] for queue entries (oldest first) that fit in `free`, stopping at the first that does not."""
+    free = sorted(free, key=_seat_key)
+    allocations = []
+    for entry in entries:
+        wanted = int(entry['seats'])
+        if wanted > len(free):
+            break
+        allocations.append((entry, free[:wanted]))
+        free = free[wanted:]
+    return allocations